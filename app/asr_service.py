@@ -6,13 +6,25 @@ to text using the Zhipu AI GLM-ASR-2512 API.
 Requirements: 2.1, 2.2, 2.3, 2.4, 9.2, 9.5
 """
 
+import asyncio
+import json
 import logging
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 import httpx
 
+from app.audio_chunking import join_transcripts, split_audio
+from app.singleflight import SingleFlight, make_key
+
 
 logger = logging.getLogger(__name__)
 
+# 进行中的转写（跨服务实例共享），相同音频的并发请求只转写一次
+_inflight = SingleFlight()
+
+# 分段转写时单个分段的重试次数及首次重试前的等待（秒，之后翻倍）
+CHUNK_RETRIES = 2
+CHUNK_RETRY_DELAY = 0.5
+
 
 class ASRServiceError(Exception):
     """Exception raised when ASR service operations fail.
@@ -45,17 +57,20 @@ class ASRService:
         client: Async HTTP client for making API requests
         api_url: Zhipu AI ASR API endpoint URL
         model: ASR model identifier
+        max_concurrency: Chunks of one recording transcribed at a time
     
     Requirements: 2.1, 2.2, 2.3, 2.4, 9.2, 9.5
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrency: int = 4):
         """Initialize the ASR service.
         
         Args:
             api_key: Zhipu AI API key for authentication
+            max_concurrency: Chunks of one recording transcribed at a time
         """
         self.api_key = api_key
+        self.max_concurrency = max_concurrency
         self.client = httpx.AsyncClient(timeout=30.0)
         self.api_url = "https://api.z.ai/api/paas/v4/audio/transcriptions"
         self.model = "glm-asr-2512"
@@ -68,12 +83,83 @@ class ASRService:
         """
         await self.client.aclose()
     
+    def _build_request(
+        self, audio_file: bytes, filename: str, stream: bool
+    ) -> Tuple[Dict[str, str], Dict[str, tuple], Dict[str, str]]:
+        """Build the headers, multipart files and form fields of an ASR request."""
+        # Prepare request headers
+        headers = {
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # Prepare multipart form data
+        files = {
+            "file": (filename, audio_file, "audio/mpeg")
+        }
+        
+        data = {
+            "model": self.model,
+            "stream": "true" if stream else "false"
+        }
+        return headers, files, data
+    
     async def transcribe(self, audio_file: bytes, filename: str = "audio.mp3") -> str:
         """Transcribe audio file to text using Zhipu ASR API.
         
-        This method sends the audio file to the Zhipu AI ASR API and returns
-        the transcribed text. It handles API errors, empty recognition results,
-        and logs all errors with timestamps and stack traces.
+        Long WAV/MP3 recordings are split at pauses into chunks that are
+        transcribed concurrently (at most ``max_concurrency`` requests at a
+        time); a failed chunk is retried on its own and the transcripts are
+        joined in order. Short or other recordings are sent in one request.
+        Concurrent calls with the same audio share one transcription.
+        
+        Args:
+            audio_file: Audio file content as bytes
+            filename: Name of the audio file (the extension selects the format)
+        
+        Returns:
+            Transcribed text content. Returns empty string if audio cannot
+            be recognized (empty recognition result).
+        
+        Raises:
+            ASRServiceError: If API call fails (for a chunk: after all retries)
+        
+        Requirements: 2.1, 2.2, 2.3, 2.4, 9.2, 9.5
+        """
+        suffix = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        key = make_key(self.model, suffix, audio_file)
+        return await _inflight.do(key, lambda: self._transcribe_chunked(audio_file, filename))
+    
+    async def _transcribe_chunked(self, audio_file: bytes, filename: str) -> str:
+        """Transcribe a recording, in concurrent chunks if it is long."""
+        chunks = await asyncio.to_thread(split_audio, audio_file, filename)
+        if len(chunks) == 1:
+            return await self._transcribe_once(audio_file, filename)
+        
+        logger.info(f"Transcribing {filename} in {len(chunks)} chunks")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def transcribe_chunk(chunk: bytes, chunk_name: str) -> str:
+            for attempt in range(CHUNK_RETRIES + 1):
+                try:
+                    async with semaphore:
+                        return await self._transcribe_once(chunk, chunk_name)
+                except ASRServiceError as e:
+                    if attempt == CHUNK_RETRIES:
+                        raise
+                    # 只重试失败的分段，退避后再试
+                    logger.warning(f"Retrying chunk {chunk_name} after error: {e.message}")
+                    await asyncio.sleep(CHUNK_RETRY_DELAY * 2 ** attempt)
+        
+        parts = await asyncio.gather(*(transcribe_chunk(chunk, name) for chunk, name in chunks))
+        return join_transcripts(parts)
+    
+    async def _transcribe_once(self, audio_file: bytes, filename: str) -> str:
+        """Transcribe audio file to text using Zhipu ASR API.
+        
+        This method sends the audio file to the Zhipu AI ASR API in a single
+        request and returns the transcribed text. It handles API errors,
+        empty recognition results, and logs all errors with timestamps and
+        stack traces.
         
         Args:
             audio_file: Audio file content as bytes
@@ -89,20 +175,7 @@ class ASRService:
         Requirements: 2.1, 2.2, 2.3, 2.4, 9.2, 9.5
         """
         try:
-            # Prepare request headers
-            headers = {
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # Prepare multipart form data
-            files = {
-                "file": (filename, audio_file, "audio/mpeg")
-            }
-            
-            data = {
-                "model": self.model,
-                "stream": "false"
-            }
+            headers, files, data = self._build_request(audio_file, filename, stream=False)
             
             logger.info(f"Calling Zhipu ASR API for file: {filename}")
             
@@ -200,3 +273,92 @@ class ASRService:
                 ).created}
             )
             raise ASRServiceError(f"语音识别服务不可用: {str(e)}")
+    
+    async def transcribe_stream(
+        self, audio_file: bytes, filename: str = "audio.mp3"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Transcribe audio file to text, yielding partial transcripts.
+        
+        The ASR API is called in streaming mode and its server-sent events
+        are consumed as they arrive. Each text delta produces an update with
+        the transcript so far; the last update has ``final`` set and carries
+        the complete transcript (empty string if the audio could not be
+        recognized).
+        
+        Args:
+            audio_file: Audio file content as bytes
+            filename: Name of the audio file (for API request)
+        
+        Yields:
+            Dicts with ``text`` (transcript so far) and ``final``
+        
+        Raises:
+            ASRServiceError: If API call fails or returns invalid response
+        """
+        try:
+            headers, files, data = self._build_request(audio_file, filename, stream=True)
+            logger.info(f"Calling Zhipu ASR API (streaming) for file: {filename}")
+            
+            text = ""
+            final_text = None
+            async with self.client.stream(
+                "POST", self.api_url, headers=headers, files=files, data=data
+            ) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    error_msg = f"ASR API returned status {response.status_code}: {body}"
+                    logger.error(f"ASR API call failed: {error_msg}")
+                    raise ASRServiceError(f"语音识别服务不可用: {error_msg}")
+                
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(payload)
+                    except ValueError:
+                        logger.warning(f"Skipping malformed ASR stream event: {payload[:200]}")
+                        continue
+                    
+                    # 增量事件携带 delta；结束事件（type 以 .done 结尾）携带完整文本
+                    delta = event.get("delta")
+                    if isinstance(delta, str) and delta:
+                        text += delta
+                        yield {"text": text, "final": False}
+                    if str(event.get("type", "")).endswith(".done") or (
+                        "text" in event and not delta
+                    ):
+                        final_text = event.get("text") or text
+                        break
+            
+            final_text = text if final_text is None else final_text
+            if not final_text.strip():
+                logger.warning(
+                    f"ASR returned empty text for file: {filename}. "
+                    "Audio content may be unrecognizable."
+                )
+                final_text = ""
+            else:
+                logger.info(
+                    f"ASR streaming transcription successful for {filename}. "
+                    f"Text length: {len(final_text)} characters"
+                )
+            yield {"text": final_text, "final": True}
+        
+        except ASRServiceError:
+            raise
+        
+        except httpx.TimeoutException as e:
+            logger.error(f"ASR API request timeout: {str(e)}", exc_info=True)
+            raise ASRServiceError("语音识别服务不可用: 请求超时")
+        
+        except httpx.RequestError as e:
+            logger.error(f"ASR API request failed: {str(e)}", exc_info=True)
+            raise ASRServiceError(f"语音识别服务不可用: 网络错误")
+        
+        except Exception as e:
+            logger.error(f"Unexpected error in ASR service: {str(e)}", exc_info=True)
+            raise ASRServiceError(f"语音识别服务不可用: {str(e)}")
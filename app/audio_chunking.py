@@ -0,0 +1,256 @@
+"""Splitting long recordings into chunks for parallel transcription.
+
+A long voice memo sent to the ASR API as one request takes time linear in
+its duration, and a single failure loses the whole transcript. This module
+cuts WAV and MP3 recordings into chunks of at most ``max_seconds`` so they
+can be transcribed concurrently and retried individually. Everything here is
+plain CPU code on the raw bytes (no decoder, no network), so it can be
+tested offline.
+
+- WAV (PCM): cuts are placed at the quietest window (lowest mean amplitude)
+  in the second half of each chunk's allowed range, i.e. on pauses between
+  words where there are any. Each chunk is re-wrapped as a standalone WAV.
+- MP3: the file is split on frame boundaries without decoding. Since
+  silence cannot be measured without a decoder, the cut is placed at the
+  frame with the lowest bitrate (VBR encoders spend few bits on silence);
+  for CBR files this degrades to cutting at the maximum length.
+
+Other formats (and files that cannot be parsed) are returned as one chunk.
+"""
+
+import io
+import logging
+import wave
+from array import array
+from typing import List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# 每段的最大/最小时长（秒）：最大值需低于 ASR 接口的单次时长上限
+MAX_CHUNK_SECONDS = 25.0
+MIN_CHUNK_SECONDS = 10.0
+
+# 计算音量的窗口长度（秒）
+_WINDOW_SECONDS = 0.05
+
+# 计算音量时的采样步长（只看部分采样点，足以找到停顿）
+_SAMPLE_STEP = 4
+
+_ARRAY_TYPES = {1: "b", 2: "h", 4: "i"}
+
+
+def split_audio(
+    audio: bytes,
+    filename: str,
+    max_seconds: float = MAX_CHUNK_SECONDS,
+    min_seconds: float = MIN_CHUNK_SECONDS
+) -> List[Tuple[bytes, str]]:
+    """Split a recording into chunks of at most ``max_seconds``.
+
+    Args:
+        audio: Audio file content
+        filename: File name (the extension selects the format)
+        max_seconds: Maximum chunk duration
+        min_seconds: Minimum chunk duration (except for the last chunk)
+
+    Returns:
+        List of (chunk content, chunk file name) in playback order; a single
+        item with the original content if it is short or not splittable
+    """
+    suffix = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    try:
+        if suffix == "wav":
+            chunks = split_wav(audio, max_seconds, min_seconds)
+        elif suffix == "mp3":
+            chunks = split_mp3(audio, max_seconds, min_seconds)
+        else:
+            chunks = None
+    except (wave.Error, EOFError, ValueError) as e:
+        logger.warning(f"Cannot split {filename}, transcribing it as a whole: {e}")
+        chunks = None
+
+    if not chunks or len(chunks) == 1:
+        return [(audio, filename)]
+    stem = filename.rsplit(".", 1)[0]
+    return [(chunk, f"{stem}.part{i}.{suffix}") for i, chunk in enumerate(chunks)]
+
+
+def _choose_cuts(costs: List[float], unit_seconds: float, max_seconds: float, min_seconds: float) -> List[int]:
+    """Pick cut positions in a sequence of per-unit costs.
+
+    Each chunk ends at the lowest-cost unit between ``max(min_seconds,
+    max_seconds / 2)`` and ``max_seconds`` after its start.
+
+    Returns:
+        Unit indexes where new chunks start
+    """
+    total = len(costs)
+    max_units = max(1, int(max_seconds / unit_seconds))
+    min_units = min(max_units, max(1, int(max(min_seconds, max_seconds / 2) / unit_seconds)))
+    cuts = []
+    start = 0
+    while total - start > max_units:
+        lo = start + min_units
+        hi = min(start + max_units, total - 1)
+        # 在允许范围内选代价最低的位置；相同时取最靠后的，使分段尽量长
+        cut = min(range(lo, hi + 1), key=lambda i: (costs[i], -i))
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def split_wav(audio: bytes, max_seconds: float, min_seconds: float) -> Optional[List[bytes]]:
+    """Split a PCM WAV file at pauses.
+
+    Args:
+        audio: WAV file content
+        max_seconds: Maximum chunk duration
+        min_seconds: Minimum chunk duration
+
+    Returns:
+        Standalone WAV files, or None if the format is not supported
+    """
+    with wave.open(io.BytesIO(audio), "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(params.nframes)
+    if params.comptype != "NONE" or params.sampwidth not in _ARRAY_TYPES:
+        return None
+    duration = params.nframes / params.framerate
+    if duration <= max_seconds:
+        return [audio]
+
+    # 计算每个窗口的平均振幅（多声道时各声道混在一起，不影响找停顿）
+    samples = array(_ARRAY_TYPES[params.sampwidth], frames[:len(frames) - len(frames) % params.sampwidth])
+    if params.sampwidth == 1:
+        # 8 位 WAV 为无符号采样，以 128 为零点
+        samples = array("b", (s ^ -128 for s in samples))
+    window_frames = max(1, int(params.framerate * _WINDOW_SECONDS))
+    window_samples = window_frames * params.nchannels
+    energies = []
+    for offset in range(0, len(samples), window_samples):
+        window = samples[offset:offset + window_samples:_SAMPLE_STEP]
+        energies.append(sum(map(abs, window)) / max(1, len(window)))
+
+    cuts = _choose_cuts(energies, window_frames / params.framerate, max_seconds, min_seconds)
+    bounds = [0] + [cut * window_frames for cut in cuts] + [params.nframes]
+    frame_size = params.sampwidth * params.nchannels
+
+    chunks = []
+    for begin, end in zip(bounds, bounds[1:]):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as writer:
+            writer.setnchannels(params.nchannels)
+            writer.setsampwidth(params.sampwidth)
+            writer.setframerate(params.framerate)
+            writer.writeframes(frames[begin * frame_size:end * frame_size])
+        chunks.append(buffer.getvalue())
+    return chunks
+
+
+# MPEG 音频帧头查表（仅支持 Layer III）
+_MP3_BITRATES = {
+    "1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {
+    "1": (44100, 48000, 32000),
+    "2": (22050, 24000, 16000),
+    "2.5": (11025, 12000, 8000),
+}
+_MP3_VERSIONS = {0b00: "2.5", 0b10: "2", 0b11: "1"}
+
+
+def _parse_mp3_header(header: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """Parse a Layer III frame header.
+
+    Returns:
+        (frame length in bytes, samples per frame, sample rate, bitrate in
+        kbps), or None if the bytes are not a valid Layer III header
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = _MP3_VERSIONS.get((header[1] >> 3) & 0b11)
+    layer = (header[1] >> 1) & 0b11
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0b11
+    padding = (header[2] >> 1) & 1
+    if version is None or layer != 0b01 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES["1" if version == "1" else "2"][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == "1" else 576
+    length = (samples // 8) * bitrate * 1000 // sample_rate + padding
+    return length, samples, sample_rate, bitrate
+
+
+def _skip_id3(audio: bytes) -> int:
+    """Get the offset of the first byte after a leading ID3v2 tag."""
+    if len(audio) >= 10 and audio[:3] == b"ID3":
+        size = 0
+        for byte in audio[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if audio[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def split_mp3(audio: bytes, max_seconds: float, min_seconds: float) -> Optional[List[bytes]]:
+    """Split an MP3 file on frame boundaries.
+
+    Args:
+        audio: MP3 file content
+        max_seconds: Maximum chunk duration
+        min_seconds: Minimum chunk duration
+
+    Returns:
+        MP3 byte ranges (each starting with a frame header), or None if no
+        Layer III frames were found
+    """
+    offset = _skip_id3(audio)
+    frames: List[Tuple[int, int]] = []  # (偏移, 码率)
+    frame_seconds = None
+    while offset + 4 <= len(audio):
+        parsed = _parse_mp3_header(audio[offset:offset + 4])
+        if parsed is None:
+            if frames:
+                # 帧序列之后的数据（如 ID3v1 标签）不属于音频
+                break
+            offset += 1
+            continue
+        length, samples, sample_rate, bitrate = parsed
+        frame_seconds = samples / sample_rate
+        frames.append((offset, bitrate))
+        offset += length
+    if not frames:
+        return None
+    if len(frames) * frame_seconds <= max_seconds:
+        return [audio]
+
+    end = min(offset, len(audio))
+    cuts = _choose_cuts([bitrate for _, bitrate in frames], frame_seconds, max_seconds, min_seconds)
+    bounds = [frames[0][0]] + [frames[cut][0] for cut in cuts] + [end]
+    return [audio[begin:stop] for begin, stop in zip(bounds, bounds[1:])]
+
+
+def join_transcripts(parts: List[str]) -> str:
+    """Join chunk transcripts in order.
+
+    Chinese text is concatenated directly; a space is inserted only between
+    two parts that meet with Latin letters or digits.
+
+    Args:
+        parts: Transcripts of consecutive chunks
+
+    Returns:
+        The combined transcript
+    """
+    text = ""
+    for part in (p.strip() for p in parts):
+        if not part:
+            continue
+        if text and text[-1].isascii() and text[-1].isalnum() and part[0].isascii() and part[0].isalnum():
+            text += " "
+        text += part
+    return text
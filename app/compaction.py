@@ -0,0 +1,130 @@
+"""Background compaction of user data partitions.
+
+With the storage journal enabled, appends only add lines to each
+collection's tail log. The compactor periodically folds those tails back
+into compact JSON snapshots (see ``StorageService.compact``) for every user
+partition on every data root, so cold starts and snapshot parses stay
+proportional to the live data. It runs in a worker thread off the request
+path; the per-partition write lock keeps it consistent with request
+handlers and other workers.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Union
+
+from app.sharding import USERS_SUBDIR
+from app.storage import StorageService, StorageError
+
+
+logger = logging.getLogger(__name__)
+
+
+def iter_partitions(
+    data_dir: Union[str, Path],
+    roots: Sequence[Union[str, Path]] = ()
+) -> Iterator[Path]:
+    """Iterate over all existing data partitions.
+
+    Args:
+        data_dir: Primary data directory (the default user's partition)
+        roots: Data roots holding other users' partitions (data_dir if empty)
+
+    Yields:
+        Partition directories, each one once
+    """
+    data_dir = Path(data_dir)
+    candidates = [data_dir]
+    for root in roots or [data_dir]:
+        users_dir = Path(root) / USERS_SUBDIR
+        if users_dir.is_dir():
+            candidates.extend(sorted(users_dir.iterdir()))
+
+    seen = set()
+    for partition in candidates:
+        # 跳过重平衡过程中的临时目录（.xxx.moving）
+        if partition.name.startswith(".") or not partition.is_dir():
+            continue
+        resolved = partition.resolve()
+        if resolved in seen:
+            continue
+        seen.add(resolved)
+        yield partition
+
+
+class Compactor:
+    """Periodic background compactor for all data partitions.
+
+    Attributes:
+        data_dir: Primary data directory
+        roots: Data roots holding user partitions
+        interval: Seconds between runs
+        min_tail_bytes: Minimum tail size for a collection to be compacted
+    """
+
+    def __init__(
+        self,
+        data_dir: Union[str, Path],
+        roots: Sequence[Union[str, Path]] = (),
+        interval: float = 300,
+        min_tail_bytes: int = 64 * 1024
+    ):
+        """Initialize the compactor.
+
+        Args:
+            data_dir: Primary data directory
+            roots: Data roots holding user partitions (data_dir if empty)
+            interval: Seconds between runs
+            min_tail_bytes: Minimum tail size for a collection to be compacted
+        """
+        self.data_dir = Path(data_dir)
+        self.roots = [Path(root) for root in roots]
+        self.interval = interval
+        self.min_tail_bytes = min_tail_bytes
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self) -> List[Path]:
+        """Compact every partition once (blocking).
+
+        Returns:
+            Partition directories in which at least one collection was rewritten
+        """
+        compacted = []
+        for partition in iter_partitions(self.data_dir, self.roots):
+            # 只处理已有数据文件的分区，避免为空分区创建默认文件
+            if not (partition / "records.json").exists():
+                continue
+            try:
+                storage = StorageService(str(partition))
+                if storage.compact(self.min_tail_bytes):
+                    compacted.append(partition)
+            except StorageError as e:
+                logger.error(f"Compaction of {partition} failed: {e}")
+        return compacted
+
+    async def _run(self) -> None:
+        """Run compaction every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Background compaction failed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """Start the background compaction task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Background compaction every {self.interval}s started")
+
+    async def stop(self) -> None:
+        """Stop the background compaction task."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
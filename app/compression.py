@@ -0,0 +1,234 @@
+"""Response compression for Voice Text Processor.
+
+The list endpoints return large JSON arrays of Chinese text, which gzip and
+brotli shrink to a fraction of their size. ``CompressionMiddleware``
+compresses complete (non-streaming) responses of compressible types above a
+size threshold, using brotli when the client accepts it and the ``brotli``
+package is installed, gzip otherwise.
+
+Responses carrying an ETag (derived from the storage version, see
+``app.main.not_modified``) are compressed once per version and encoding and
+served from an in-process cache afterwards. Large payloads are compressed
+in a small dedicated thread pool, so compression never blocks the event loop
+and its CPU use stays bounded.
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+    HAS_BROTLI = False
+
+
+logger = logging.getLogger(__name__)
+
+
+# 小于该大小的响应不压缩（压缩收益抵不过开销）
+MINIMUM_SIZE = 1024
+
+# 大于该大小的响应在线程池中压缩，避免阻塞事件循环
+OFFLOAD_SIZE = 64 * 1024
+
+# 压缩级别：兼顾 CPU 开销与中文 JSON 的压缩率
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# 可压缩的内容类型（图片等已压缩的格式除外）
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+# 已压缩响应缓存：(ETag, 编码) -> 压缩后的内容
+_CACHE_MAX_ENTRIES = 256
+_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_cache_guard = threading.Lock()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_guard = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Get the compression thread pool, creating it on first use."""
+    global _executor
+    with _executor_guard:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, min(2, os.cpu_count() or 1)),
+                thread_name_prefix="compression"
+            )
+        return _executor
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the response encoding for an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        ``br``, ``gzip`` or None if the client accepts neither
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding)
+    if HAS_BROTLI and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a response body.
+
+    Args:
+        body: Uncompressed body
+        encoding: ``br`` or ``gzip``
+
+    Returns:
+        Compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 使相同内容的压缩结果一致
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _cache_get(key: Tuple[str, str]) -> Optional[bytes]:
+    """Get a cached compressed body and mark it as recently used."""
+    with _cache_guard:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+        return body
+
+
+def _cache_put(key: Tuple[str, str], body: bytes) -> None:
+    """Cache a compressed body, evicting the least recently used ones."""
+    with _cache_guard:
+        _cache[key] = body
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses with brotli or gzip.
+
+    Streaming responses (event streams, files) are passed through unchanged.
+
+    Attributes:
+        app: Wrapped ASGI application
+        minimum_size: Smallest body that is compressed
+        offload_size: Smallest body compressed in the thread pool
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE, offload_size: int = OFFLOAD_SIZE):
+        """Initialize the middleware.
+
+        Args:
+            app: Wrapped ASGI application
+            minimum_size: Smallest body that is compressed
+            offload_size: Smallest body compressed in the thread pool
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(_COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # 等待响应体，决定是否压缩
+                    start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # 流式响应（如 SSE）不缓冲：原样转发
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            body = b"".join(chunks)
+            await self._send_complete(start, body, encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_complete(self, start: Message, body: bytes, encoding: str, send: Send) -> None:
+        """Send a buffered response, compressed if it is large enough."""
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if len(body) < self.minimum_size or start["status"] in (204, 304):
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        key = (etag, encoding) if etag else None
+        compressed = _cache_get(key) if key else None
+        if compressed is None:
+            if len(body) >= self.offload_size:
+                loop = asyncio.get_running_loop()
+                compressed = await loop.run_in_executor(_get_executor(), compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            if key:
+                # ETag 由存储版本决定：同一版本的内容相同，压缩结果可复用
+                _cache_put(key, compressed)
+
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(compressed))
+        await send(start)
+        await send({"type": "http.response.body", "body": compressed})
@@ -9,7 +9,7 @@ Requirements: 10.1, 10.2, 10.3, 10.4, 10.5
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
 
@@ -39,6 +39,65 @@ class Config(BaseModel):
         description="Directory for storing JSON data files"
     )
     
+    data_roots: List[Path] = Field(
+        default_factory=list,
+        description=(
+            "Data root directories that user partitions are sharded across "
+            "with a consistent-hash ring (empty means data_dir only)"
+        )
+    )
+    
+    # Storage journal and background compaction
+    storage_journal: bool = Field(
+        default=False,
+        description=(
+            "Append new rows to per-collection tail logs instead of "
+            "rewriting the JSON snapshots on every write"
+        )
+    )
+    
+    compaction_interval: int = Field(
+        default=300,
+        description=(
+            "Seconds between background compaction runs (0 disables; "
+            "only used with storage_journal)"
+        )
+    )
+    
+    compaction_min_tail_bytes: int = Field(
+        default=64 * 1024,
+        description="Only compact collections whose tail log reached this size"
+    )
+    
+    # Background image generation jobs
+    image_job_concurrency: int = Field(
+        default=2,
+        description="Image generation jobs running at the same time per worker"
+    )
+    
+    image_jobs_per_user: int = Field(
+        default=2,
+        description="Unfinished image generation jobs one user may have"
+    )
+    
+    # Audio preprocessing before transcription
+    audio_preprocessing: bool = Field(
+        default=True,
+        description=(
+            "Downmix, resample to 16 kHz and trim silence of WAV uploads "
+            "before sending them to the ASR API (requires NumPy)"
+        )
+    )
+    
+    # Local fast-path parsing
+    fast_path_threshold: Optional[float] = Field(
+        default=None,
+        description=(
+            "Skip the GLM-4-Flash call for inputs the local rule-based parser "
+            "recognizes with at least this confidence (unset disables it)"
+        )
+    )
+    
     # File size limits (in bytes)
     max_audio_size: int = Field(
         default=10 * 1024 * 1024,  # 10 MB default
@@ -85,6 +144,30 @@ class Config(BaseModel):
             raise ValueError("max_audio_size must be positive")
         return v
     
+    @field_validator("image_job_concurrency", "image_jobs_per_user")
+    @classmethod
+    def validate_job_limits(cls, v: int) -> int:
+        """Validate job limits are positive."""
+        if v <= 0:
+            raise ValueError("image job limits must be positive")
+        return v
+    
+    @field_validator("compaction_interval", "compaction_min_tail_bytes")
+    @classmethod
+    def validate_non_negative(cls, v: int) -> int:
+        """Validate compaction settings are not negative."""
+        if v < 0:
+            raise ValueError("compaction settings must not be negative")
+        return v
+    
+    @field_validator("fast_path_threshold")
+    @classmethod
+    def validate_fast_path_threshold(cls, v: Optional[float]) -> Optional[float]:
+        """Validate the fast-path threshold is a confidence in [0, 1]."""
+        if v is not None and not 0 <= v <= 1:
+            raise ValueError("fast_path_threshold must be between 0 and 1")
+        return v
+    
     @field_validator("data_dir", "log_file")
     @classmethod
     def convert_to_path(cls, v) -> Path:
@@ -93,11 +176,29 @@ class Config(BaseModel):
             return Path(v)
         return v
     
+    @property
+    def partition_roots(self) -> List[Path]:
+        """Data roots that hold user partitions (data_dir if none configured)."""
+        return list(self.data_roots) or [self.data_dir]
+    
     class Config:
         """Pydantic configuration."""
         frozen = True  # Make config immutable
 
 
+def parse_data_roots(value: str) -> List[str]:
+    """Parse a comma-separated list of data root directories.
+    
+    Args:
+        value: Raw DATA_ROOTS value
+        
+    Returns:
+        List of non-empty, de-duplicated paths in their original order
+    """
+    roots = [part.strip() for part in value.split(",")]
+    return list(dict.fromkeys(root for root in roots if root))
+
+
 def load_config() -> Config:
     """Load configuration from environment variables.
     
@@ -112,6 +213,22 @@ def load_config() -> Config:
         MINIMAX_API_KEY: Optional. API key for MiniMax image generation
         MINIMAX_GROUP_ID: Optional. MiniMax Group ID
         DATA_DIR: Optional. Directory for data storage (default: data/)
+        DATA_ROOTS: Optional. Comma-separated data roots to shard user
+            partitions across (default: DATA_DIR only)
+        STORAGE_JOURNAL: Optional. Append to tail logs instead of rewriting
+            snapshots (default: false)
+        COMPACTION_INTERVAL: Optional. Seconds between background
+            compactions in journal mode, 0 disables (default: 300)
+        COMPACTION_MIN_TAIL_BYTES: Optional. Minimum tail log size to
+            compact (default: 64KB)
+        IMAGE_JOB_CONCURRENCY: Optional. Image generation jobs running at
+            once per worker (default: 2)
+        IMAGE_JOBS_PER_USER: Optional. Unfinished image generation jobs per
+            user (default: 2)
+        AUDIO_PREPROCESSING: Optional. Shrink WAV uploads before
+            transcription (default: true)
+        FAST_PATH_THRESHOLD: Optional. Confidence (0-1) above which short
+            inputs are parsed locally without the API (default: disabled)
         MAX_AUDIO_SIZE: Optional. Max audio file size in bytes (default: 10MB)
         LOG_LEVEL: Optional. Logging level (default: INFO)
         LOG_FILE: Optional. Log file path (default: logs/app.log)
@@ -127,6 +244,14 @@ def load_config() -> Config:
         "minimax_api_key": os.getenv("MINIMAX_API_KEY"),
         "minimax_group_id": os.getenv("MINIMAX_GROUP_ID"),
         "data_dir": os.getenv("DATA_DIR", "data"),
+        "data_roots": parse_data_roots(os.getenv("DATA_ROOTS", "")),
+        "storage_journal": os.getenv("STORAGE_JOURNAL", "false").lower() in ("1", "true", "yes"),
+        "compaction_interval": int(os.getenv("COMPACTION_INTERVAL", "300")),
+        "compaction_min_tail_bytes": int(os.getenv("COMPACTION_MIN_TAIL_BYTES", str(64 * 1024))),
+        "image_job_concurrency": int(os.getenv("IMAGE_JOB_CONCURRENCY", "2")),
+        "image_jobs_per_user": int(os.getenv("IMAGE_JOBS_PER_USER", "2")),
+        "audio_preprocessing": os.getenv("AUDIO_PREPROCESSING", "true").lower() in ("1", "true", "yes"),
+        "fast_path_threshold": float(os.environ["FAST_PATH_THRESHOLD"]) if os.getenv("FAST_PATH_THRESHOLD") else None,
         "max_audio_size": int(os.getenv("MAX_AUDIO_SIZE", str(10 * 1024 * 1024))),
         "log_level": os.getenv("LOG_LEVEL", "INFO"),
         "log_file": os.getenv("LOG_FILE", "logs/app.log"),
@@ -147,8 +272,10 @@ def load_config() -> Config:
     except Exception as e:
         raise ValueError(f"Configuration validation failed: {e}")
     
-    # Ensure data directory exists
+    # Ensure data directories exist
     config.data_dir.mkdir(parents=True, exist_ok=True)
+    for root in config.data_roots:
+        root.mkdir(parents=True, exist_ok=True)
     
     # Ensure log directory exists
     if config.log_file:
@@ -173,6 +300,14 @@ def validate_config(config: Config) -> None:
             "Please check permissions."
         )
     
+    # Check every data root is writable
+    for root in config.data_roots:
+        if not os.access(root, os.W_OK):
+            raise ValueError(
+                f"Data root {root} is not writable. "
+                "Please check permissions."
+            )
+    
     # Check log directory is writable
     if config.log_file and not os.access(config.log_file.parent, os.W_OK):
         raise ValueError(
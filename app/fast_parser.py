@@ -0,0 +1,182 @@
+"""Offline rule-based parser for short, simple inputs.
+
+Many inputs are a few characters long ("明天买牛奶", "好累"), yet an LLM
+round trip takes seconds. ``fast_parse`` recognizes such inputs locally with
+keyword lexicons (mood words, time expressions, todo verbs) and returns a
+``ParsedData`` together with a confidence score in [0, 1].
+``SemanticParserService`` skips the GLM-4-Flash call when the confidence
+reaches the configured threshold (``FAST_PATH_THRESHOLD``).
+
+The parser is deliberately conservative: the input is split into clauses,
+and the confidence is high only if every clause is clearly a mood, a todo or
+filler (e.g. "今天"). Negations, inspirations (which need summarizing), long
+inputs and clauses matching nothing send the input to the API.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from app.models import MoodData, ParsedData, TodoData
+
+
+# 超过该长度的输入交给大模型
+MAX_LENGTH = 40
+
+# 所有分句都被识别时的置信度（短输入 / 较长输入）
+CONFIDENCE_SHORT = 0.95
+CONFIDENCE_LONG = 0.85
+SHORT_LENGTH = 15
+
+# 情绪词 -> (情绪类型, 基础强度)；匹配时优先取最长的词
+MOOD_LEXICON = {
+    "开心": ("开心", 7), "高兴": ("开心", 7), "快乐": ("开心", 7), "愉快": ("开心", 7),
+    "心情好": ("开心", 7), "心情很好": ("开心", 8), "心情不错": ("开心", 6), "不错": ("开心", 6),
+    "很好": ("开心", 7), "很棒": ("开心", 7), "满足": ("满足", 6), "感动": ("感动", 7),
+    "兴奋": ("兴奋", 8), "激动": ("兴奋", 8), "期待": ("期待", 6),
+    "平静": ("平静", 4), "放松": ("平静", 4), "轻松": ("平静", 4),
+    "累": ("疲惫", 5), "疲惫": ("疲惫", 6), "困": ("疲惫", 4), "好困": ("疲惫", 5),
+    "焦虑": ("焦虑", 7), "紧张": ("焦虑", 6), "压力大": ("焦虑", 7), "压力好大": ("焦虑", 8),
+    "担心": ("忧虑", 6), "害怕": ("忧虑", 7),
+    "烦": ("烦躁", 5), "烦躁": ("烦躁", 6), "生气": ("愤怒", 7), "气死": ("愤怒", 8),
+    "难过": ("悲伤", 6), "伤心": ("悲伤", 7), "失落": ("悲伤", 5), "郁闷": ("低落", 5),
+    "孤独": ("孤独", 6), "无聊": ("无聊", 4),
+}
+
+# 程度副词对强度的修正
+INTENSIFIERS = {
+    "非常": 2, "特别": 2, "超级": 2, "太": 2, "超": 2, "好": 1, "很": 1, "真": 1,
+    "有点": -1, "有些": -1, "稍微": -1,
+}
+
+NEGATIONS = ("不", "没", "别", "未")
+
+# 包含情绪字但不表示情绪的词（如"困难"中的"困"）
+NON_MOOD_WORDS = ("困难", "麻烦", "烦请", "累计", "积累")
+
+# 待办动词（分句去掉时间和情态词后以这些词开头即视为待办）。
+# 单字动词歧义大（"去死吧"、"买不起"），只在有时间或情态词时才算待办；
+# "还/给/看/带/发/做"多用于非待办的固定搭配（"还好"、"给力"、"看来"），不收录
+TODO_VERBS = (
+    "打电话", "提交", "完成", "准备", "预约", "复习", "整理", "联系", "参加", "报名",
+    "收拾", "打扫", "回复", "充值", "开会", "加班", "交", "买", "去", "写", "取",
+    "寄", "洗", "约", "缴", "修", "订",
+)
+
+MODALS = ("别忘了", "记得", "需要", "必须", "打算", "还要", "还得", "要", "得")
+
+# 灵感需要由大模型提炼，出现这些词时不走快速路径
+INSPIRATION_CUES = ("想到", "灵感", "点子", "创意", "想法", "主意", "如果", "也许可以")
+
+LOCATION_SUFFIXES = (
+    "办公室", "公司", "超市", "医院", "学校", "银行", "公园", "商场", "食堂", "图书馆",
+    "健身房", "菜市场", "机场", "车站", "家",
+)
+
+_TIME_PATTERN = re.compile(
+    r"(?:今天|明天|后天|今晚|明早|明晚|今早|早上|上午|中午|下午|傍晚|晚上|周末|月底|月初|年底"
+    r"|(?:这|下|本)?(?:周|星期|礼拜)[一二三四五六日天]"
+    r"|下个?(?:周|星期|礼拜|月)"
+    r"|\d{1,2}[:：]\d{2}|[\d一二三四五六七八九十两]{1,3}点(?:半|\d{1,2}分)?"
+    r"|\d{1,2}月\d{1,2}[日号])+"
+)
+_LOCATION_PATTERN = re.compile(
+    r"(?:去|到|在)(\w{0,6}?(?:" + "|".join(LOCATION_SUFFIXES) + r"))"
+)
+_CLAUSE_SEPARATORS = re.compile(r"[，,。.！!？?；;、\s]+")
+_FILLERS = re.compile(r"^(?:我|我们|今天|现在|真的|感觉|觉得|有点|啊|呀|哦|呢|吧|了|哈+|唉)*$")
+
+_MOOD_WORDS = sorted(MOOD_LEXICON, key=len, reverse=True)
+_INTENSIFIER_WORDS = sorted(INTENSIFIERS, key=len, reverse=True)
+
+
+def _match_mood(clause: str) -> Optional[Tuple[MoodData, bool]]:
+    """Find a mood word in a clause.
+
+    Returns:
+        (mood, whether it is negated), or None if there is no mood word
+    """
+    if any(word in clause for word in NON_MOOD_WORDS):
+        return None
+    for word in _MOOD_WORDS:
+        start = clause.find(word)
+        if start < 0:
+            continue
+        mood_type, intensity = MOOD_LEXICON[word]
+        before = clause[:start]
+        # 否定词可能隔着一个程度副词（如"不太开心"）
+        negated = any(n in before[-2:] for n in NEGATIONS) and not word.startswith(NEGATIONS)
+        for modifier in _INTENSIFIER_WORDS:
+            if before.endswith(modifier):
+                intensity += INTENSIFIERS[modifier]
+                break
+        mood = MoodData(type=mood_type, intensity=min(10, max(1, intensity)), keywords=[word])
+        return mood, negated
+    return None
+
+
+def _match_todo(clause: str, time: Optional[str]) -> Optional[TodoData]:
+    """Recognize a todo clause (time already removed)."""
+    rest = clause.lstrip("我").lstrip("们")
+    has_modal = False
+    for modal in MODALS:
+        if rest.startswith(modal):
+            rest = rest[len(modal):]
+            has_modal = True
+            break
+    verb = next((verb for verb in TODO_VERBS if rest.startswith(verb)), None)
+    if verb is None or any(n in rest for n in NEGATIONS):
+        return None
+    if time is None and not has_modal:
+        # 没有时间也没有情态词时，只有多字动词开头的短句才算待办（如"整理房间"）
+        if len(verb) == 1 or len(rest) > 8:
+            return None
+    location = _LOCATION_PATTERN.search(rest)
+    return TodoData(task=rest, time=time, location=location.group(1) if location else None)
+
+
+def fast_parse(text: str) -> Tuple[ParsedData, float]:
+    """Parse a short input without calling the LLM.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Tuple of (parsed data, confidence in [0, 1]); the parsed data should
+        only be used when the confidence is high
+    """
+    text = text.strip()
+    if not text or len(text) > MAX_LENGTH or any(cue in text for cue in INSPIRATION_CUES):
+        return ParsedData(), 0.0
+
+    mood: Optional[MoodData] = None
+    todos: List[TodoData] = []
+    clauses = [clause for clause in _CLAUSE_SEPARATORS.split(text) if clause]
+    recognized = 0
+    for clause in clauses:
+        time_match = _TIME_PATTERN.search(clause)
+        time = time_match.group(0) if time_match else None
+        rest = _TIME_PATTERN.sub("", clause)
+
+        todo = _match_todo(rest, time)
+        mood_match = _match_mood(rest)
+        if todo is not None and mood_match is None:
+            todos.append(todo)
+            recognized += 1
+        elif mood_match is not None and todo is None:
+            clause_mood, negated = mood_match
+            if negated or (mood is not None and mood.type != clause_mood.type):
+                # 否定（"不开心"）或相互矛盾的情绪交给大模型判断
+                continue
+            if mood is None or (clause_mood.intensity or 0) > (mood.intensity or 0):
+                mood = clause_mood
+            recognized += 1
+        elif todo is None and _FILLERS.match(rest):
+            recognized += 1
+
+    if mood is None and not todos:
+        return ParsedData(), 0.0
+    if recognized < len(clauses):
+        confidence = 0.5 * recognized / len(clauses)
+    else:
+        confidence = CONFIDENCE_SHORT if len(text) <= SHORT_LENGTH else CONFIDENCE_LONG
+    return ParsedData(mood=mood, todos=todos), confidence
@@ -0,0 +1,144 @@
+"""Cross-process file coordination for Voice Text Processor.
+
+This module provides the locking primitives used by the storage layer when
+the application runs under several uvicorn workers. Writers serialize their
+read-modify-write cycles through an advisory ``fcntl`` lock, and every file is
+replaced atomically so that readers never need to take a lock.
+
+Requirements: 7.6
+"""
+
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Dict, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+
+class FileLock:
+    """Re-entrant exclusive lock shared by threads and worker processes.
+
+    The lock combines a ``threading.RLock`` (for threads of one process) with
+    an ``fcntl.flock`` on a lock file (for other processes). The same thread
+    may acquire it several times; the file lock is only taken by the outermost
+    acquisition. On platforms without ``fcntl`` only the in-process part is
+    available.
+
+    Attributes:
+        path: Path of the lock file
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Initialize the lock.
+
+        Args:
+            path: Path of the lock file (created on first use)
+        """
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self) -> None:
+        """Acquire the lock, blocking until it is available."""
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX)
+                    except Exception:
+                        os.close(fd)
+                        raise
+                self._fd = fd
+            self._depth += 1
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self) -> None:
+        """Release one level of the lock."""
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+# 每个锁文件在进程内只对应一个 FileLock 实例，保证可重入
+_locks: Dict[str, FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def get_lock(path: Union[str, Path]) -> FileLock:
+    """Get the process-wide FileLock instance for a lock file path.
+
+    Args:
+        path: Path of the lock file
+
+    Returns:
+        The shared FileLock for that path
+    """
+    key = os.path.abspath(str(path))
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = FileLock(key)
+            _locks[key] = lock
+        return lock
+
+
+@contextmanager
+def atomic_open(
+    path: Union[str, Path], mode: str = "w", encoding: Optional[str] = "utf-8"
+) -> Iterator[IO]:
+    """Open a file for writing so that its content is replaced atomically.
+
+    The caller writes into a temporary file in the same directory which is
+    renamed over the target once the block exits without error, so concurrent
+    readers see either the old or the new content but never a partially
+    written file. On failure the temporary file is removed and the target is
+    left untouched.
+
+    Args:
+        path: Target file path
+        mode: Write mode ("w" or "wb")
+        encoding: Text encoding (ignored for binary mode)
+
+    Yields:
+        File object for the temporary file
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    if "b" in mode:
+        encoding = None
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
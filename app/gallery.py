@@ -0,0 +1,334 @@
+"""Character image gallery manifest for Voice Text Processor.
+
+Generated character images are recorded in a persisted manifest
+(``gallery.json`` in the data directory) instead of being discovered by
+globbing ``generated_images/`` and parsing file names on every request.
+The manifest is cached in-process and only parsed again when another
+worker has replaced it, so history listings are served from memory and can
+be paginated.
+
+Requirements: PRD - AI形象生成模块
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from app import serialization
+from app.file_lock import atomic_open, get_lock
+
+
+logger = logging.getLogger(__name__)
+
+
+# 历史形象图片的文件名格式: character_颜色_性格_时间戳.jpeg
+IMAGE_GLOB = "character_*.jpeg"
+
+# 进程内缓存：清单文件绝对路径 -> (文件标记, 按创建时间升序的条目, 文件名 -> 条目, 提示词哈希 -> 最新条目)
+# 每个用户分区一份清单，超过上限时淘汰最久未用的
+_CACHE_MAX_ENTRIES = 512
+_cache: "OrderedDict[str, Tuple[Optional[Tuple[int, int, int]], List[dict], Dict[str, dict], Dict[str, dict]]]" = OrderedDict()
+_cache_guard = threading.Lock()
+
+
+def _cache_put(key: str, cached: tuple) -> None:
+    """Store a parsed manifest, evicting the least recently used ones."""
+    with _cache_guard:
+        _cache[key] = cached
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _file_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Get a cheap change marker for a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def parse_image_filename(filename: str) -> Optional[Dict[str, str]]:
+    """Extract the preferences encoded in a generated image's file name.
+
+    Args:
+        filename: File name like ``character_薰衣草紫_温柔_20260101_120000.jpeg``
+
+    Returns:
+        Dict with color, personality and timestamp, or None if the name
+        does not follow the format
+    """
+    parts = Path(filename).stem.split("_")
+    if len(parts) < 4 or parts[0] != "character":
+        return None
+    return {
+        "color": parts[1],
+        "personality": parts[2],
+        "timestamp": "_".join(parts[3:])
+    }
+
+
+def prompt_hash(prompt: str) -> str:
+    """Get the cache key of an image generation prompt.
+
+    Args:
+        prompt: Complete prompt sent to the image generation API
+
+    Returns:
+        Hex SHA-256 digest of the prompt
+    """
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _indexes(entries: List[dict]) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """Build the filename and prompt-hash indexes of manifest entries."""
+    by_name = {}
+    by_prompt = {}
+    for entry in entries:
+        by_name[entry["filename"]] = entry
+        # 同一提示词有多张图片时保留最新的一张
+        if entry.get("prompt_hash"):
+            by_prompt[entry["prompt_hash"]] = entry
+    return by_name, by_prompt
+
+
+def _sha256(path: Path) -> str:
+    """Compute the content hash of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Gallery:
+    """Manifest of generated character images.
+
+    Entries are dicts with ``filename``, ``color``, ``personality``,
+    ``appearance``, ``role``, ``prompt``, ``prompt_hash``, ``timestamp``,
+    ``created_at`` (epoch seconds), ``size`` and ``sha256``. Returned entries
+    are shared with the cache and must not be mutated.
+
+    Since prompts are built deterministically from the preferences, the
+    prompt hash doubles as a cache key: ``find_by_prompt`` returns an image
+    previously generated for the same preferences.
+
+    Each user partition has its own manifest listing only that user's
+    images; the image files themselves share ``images_dir``. Writes hold a
+    dedicated lock file next to the manifest (not the partition's storage
+    lock) and rewrite the whole manifest, replaced atomically so readers
+    need no lock. A write is O(n) in the user's images, which stays small.
+
+    Attributes:
+        images_dir: Directory holding the image files
+        manifest_file: Path to the persisted manifest
+        scan_existing: Whether a missing manifest is built from the images
+            already in images_dir (only for the partition that owns them)
+    """
+
+    def __init__(
+        self,
+        images_dir: Union[str, Path] = "generated_images",
+        manifest_file: Union[str, Path] = "data/gallery.json",
+        scan_existing: bool = True
+    ):
+        """Initialize the gallery.
+
+        Args:
+            images_dir: Directory holding the image files
+            manifest_file: Path to the persisted manifest
+            scan_existing: Build a missing manifest from the images on disk
+                (otherwise it starts empty)
+        """
+        self.images_dir = Path(images_dir)
+        self.manifest_file = Path(manifest_file)
+        self.scan_existing = scan_existing
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = get_lock(self.manifest_file.with_suffix(".lock"))
+
+    def _load(self) -> Tuple[List[dict], Dict[str, dict]]:
+        """Get the cached manifest, building it from the image directory once."""
+        cached = self._load_cached()
+        return cached[1], cached[2]
+
+    def _load_cached(self) -> Tuple[Any, List[dict], Dict[str, dict], Dict[str, dict]]:
+        """Get the cache tuple of the manifest, reading the file if it changed."""
+        key = str(self.manifest_file.absolute())
+        stamp = _file_stamp(self.manifest_file)
+        with _cache_guard:
+            cached = _cache.get(key)
+            if cached is not None:
+                _cache.move_to_end(key)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached
+
+        if stamp is None:
+            # 首次使用：（仅对拥有这些图片的分区）扫描一次已有图片生成清单并持久化
+            with self._lock:
+                if _file_stamp(self.manifest_file) is None:
+                    return self._write(self._initial_entries())
+            stamp = _file_stamp(self.manifest_file)
+
+        try:
+            with open(self.manifest_file, "rb") as f:
+                entries = serialization.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read gallery manifest, rebuilding: {e}")
+            with self._lock:
+                return self._write(self._initial_entries())
+
+        cached = (stamp, entries, *_indexes(entries))
+        _cache_put(key, cached)
+        return cached
+
+    def _write(self, entries: List[dict]) -> tuple:
+        """Persist the manifest and prime the cache. Caller holds the lock.
+
+        Returns:
+            The new cache tuple (stamp, entries, by filename, by prompt hash)
+        """
+        with atomic_open(self.manifest_file, "wb") as f:
+            serialization.dump(entries, f)
+        cached = (_file_stamp(self.manifest_file), entries, *_indexes(entries))
+        _cache_put(str(self.manifest_file.absolute()), cached)
+        return cached
+
+    def _initial_entries(self) -> List[dict]:
+        """Get the entries of a new (or unreadable) manifest."""
+        return self._scan() if self.scan_existing else []
+
+    def _scan(self) -> List[dict]:
+        """Build manifest entries for the images currently on disk."""
+        entries = []
+        if not self.images_dir.exists():
+            return entries
+        for path in self.images_dir.glob(IMAGE_GLOB):
+            parsed = parse_image_filename(path.name)
+            if parsed is None:
+                continue
+            stat = path.stat()
+            entries.append({
+                "filename": path.name,
+                **parsed,
+                "appearance": None,
+                "role": None,
+                "prompt": None,
+                "prompt_hash": None,
+                "created_at": stat.st_ctime,
+                "size": stat.st_size,
+                "sha256": _sha256(path)
+            })
+        entries.sort(key=lambda entry: entry["created_at"])
+        return entries
+
+    def rebuild(self) -> Tuple[List[dict], Dict[str, dict]]:
+        """Rebuild the manifest from the image directory.
+
+        Returns:
+            Tuple of (entries oldest first, filename -> entry)
+        """
+        with self._lock:
+            cached = self._write(self._initial_entries())
+        return cached[1], cached[2]
+
+    def add(
+        self,
+        path: Union[str, Path],
+        preferences: Optional[Dict[str, Optional[str]]] = None,
+        prompt: Optional[str] = None
+    ) -> dict:
+        """Record an image file in the manifest (replacing an older entry).
+
+        Args:
+            path: Image file inside images_dir
+            preferences: color/personality/appearance/role of the image
+            prompt: Prompt the image was generated from
+
+        Returns:
+            The new manifest entry
+        """
+        path = Path(path)
+        preferences = preferences or {}
+        parsed = parse_image_filename(path.name) or {}
+        stat = path.stat()
+        entry = {
+            "filename": path.name,
+            "color": preferences.get("color", parsed.get("color")),
+            "personality": preferences.get("personality", parsed.get("personality")),
+            "timestamp": parsed.get("timestamp"),
+            "appearance": preferences.get("appearance"),
+            "role": preferences.get("role"),
+            "prompt": prompt,
+            "prompt_hash": prompt_hash(prompt) if prompt else None,
+            "created_at": stat.st_ctime,
+            "size": stat.st_size,
+            "sha256": _sha256(path)
+        }
+
+        with self._lock:
+            entries, _ = self._load()
+            entries = [e for e in entries if e["filename"] != path.name]
+            entries.append(entry)
+            self._write(entries)
+        return entry
+
+    def get(self, filename: str) -> Optional[dict]:
+        """Get the manifest entry of an image.
+
+        Args:
+            filename: Image file name
+
+        Returns:
+            The entry, or None if the image is not in the manifest
+        """
+        return self._load()[1].get(filename)
+
+    def find_by_prompt(self, prompt: str) -> Optional[dict]:
+        """Get the newest image generated from a prompt.
+
+        Args:
+            prompt: Complete prompt sent to the image generation API
+
+        Returns:
+            The entry, or None if no image for this prompt is on disk
+        """
+        entry = self._load_cached()[3].get(prompt_hash(prompt))
+        if entry is None or not (self.images_dir / entry["filename"]).is_file():
+            return None
+        return entry
+
+    def version(self) -> str:
+        """Get a token that changes whenever the manifest is replaced.
+
+        Returns:
+            Token derived from the manifest's inode, modification time and
+            size ("0" before the manifest exists)
+        """
+        stamp = _file_stamp(self.manifest_file)
+        return "0" if stamp is None else "{:x}-{:x}-{:x}".format(*stamp)
+
+    def latest(self) -> Optional[dict]:
+        """Get the most recently added image, or None if there is none."""
+        entries, _ = self._load()
+        return entries[-1] if entries else None
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+        """Get a page of images, newest first.
+
+        Args:
+            offset: Number of newest images to skip
+            limit: Maximum number of images to return (all if None)
+
+        Returns:
+            Tuple of (entries on the page, total number of images)
+        """
+        entries, _ = self._load()
+        total = len(entries)
+        end = total - max(offset, 0)
+        start = 0 if limit is None else max(end - limit, 0)
+        return entries[start:max(end, 0)][::-1], total
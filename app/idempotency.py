@@ -0,0 +1,292 @@
+"""Idempotency keys for endpoints that create data.
+
+A client that retries ``POST /api/process`` after a network error cannot
+know whether the first attempt went through. Without help, every retry runs
+ASR and parsing again and appends another record. The client sends the same
+``Idempotency-Key`` header with every attempt of one logical request, and
+``IdempotencyStore`` makes the retries free:
+
+- keys live in the user's storage partition (``idempotency.json``) and are
+  read and written under the partition's write lock, so a retry landing on
+  another worker process sees them too; since the whole file is rewritten,
+  this happens in a worker thread, not on the event loop
+- the first attempt claims the key; a completed attempt's response is kept
+  for ``ttl`` seconds (at most ``max_entries`` keys per partition) and
+  replayed to later attempts. Callers should keep responses compact (e.g.
+  without default values), as each claim rewrites all of them
+- attempts arriving while the first one is still running wait for it: in
+  the same worker through ``app.singleflight``, in other workers by polling
+  the claim (a claim older than ``lease`` seconds is considered abandoned)
+  for at most ``wait_timeout`` seconds, then ``IdempotencyPendingError``
+- every key is stored with a fingerprint of the request body; reusing a key
+  for a different body raises ``IdempotencyConflictError``
+
+Only successful responses are kept, so a retry after a failure runs again.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app import serialization
+from app.file_lock import atomic_open
+from app.singleflight import SingleFlight, make_key
+from app.storage import StorageError, StorageService
+
+
+logger = logging.getLogger(__name__)
+
+# 幂等键的最大长度（客户端通常使用 UUID）
+MAX_KEY_LENGTH = 255
+
+# 每个分区保存的键数量上限及保存时长（秒）；每次占用都会重写全部条目，上限不宜过大
+MAX_ENTRIES = 256
+TTL_SECONDS = 24 * 3600
+
+# 执行中的占位超过该时长视为已放弃（工作进程崩溃），可被重新占用
+LEASE_SECONDS = 300
+# 等待其他工作进程完成时的轮询间隔及最长等待时间（秒）
+POLL_INTERVAL = 0.2
+WAIT_TIMEOUT = 60
+
+IDEMPOTENCY_FILE = "idempotency.json"
+
+# 同一工作进程内的重复尝试直接等待首个尝试，无需轮询文件
+_inflight = SingleFlight()
+
+
+class IdempotencyKeyError(Exception):
+    """Exception raised for a malformed Idempotency-Key header."""
+
+    def __init__(self, message: str = "Idempotency-Key 无效"):
+        """Initialize the error.
+
+        Args:
+            message: Error message
+        """
+        self.message = message
+        super().__init__(self.message)
+
+
+class IdempotencyConflictError(Exception):
+    """Exception raised when a key is reused for a different request body."""
+
+    def __init__(self, message: str = "Idempotency-Key 已用于内容不同的请求"):
+        """Initialize the error.
+
+        Args:
+            message: Error message
+        """
+        self.message = message
+        super().__init__(self.message)
+
+
+class IdempotencyPendingError(Exception):
+    """Exception raised when another attempt with the key is still running."""
+
+    def __init__(self, message: str = "相同 Idempotency-Key 的请求仍在处理中，请稍后重试"):
+        """Initialize the error.
+
+        Args:
+            message: Error message
+        """
+        self.message = message
+        super().__init__(self.message)
+
+
+def validate_key(key: str) -> str:
+    """Check an Idempotency-Key header value.
+
+    Args:
+        key: Header value
+
+    Returns:
+        The stripped key
+
+    Raises:
+        IdempotencyKeyError: If the key is empty, too long or not printable ASCII
+    """
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not (key.isascii() and key.isprintable()):
+        raise IdempotencyKeyError(f"Idempotency-Key 必须是 1-{MAX_KEY_LENGTH} 个可打印 ASCII 字符")
+    return key
+
+
+class IdempotencyStore:
+    """Store of claimed keys and kept responses in one storage partition.
+
+    Attributes:
+        storage: Storage of the partition (provides the directory and lock)
+        path: Path to the partition's idempotency.json
+        max_entries: Keys kept at most (the oldest are dropped)
+        ttl: Seconds a response is replayed
+        lease: Seconds after which an unfinished claim may be taken over
+        poll_interval: Seconds between checks while another worker runs
+        wait_timeout: Seconds to wait for another worker's attempt at most
+    """
+
+    def __init__(
+        self,
+        storage: StorageService,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = TTL_SECONDS,
+        lease: float = LEASE_SECONDS,
+        poll_interval: float = POLL_INTERVAL,
+        wait_timeout: float = WAIT_TIMEOUT
+    ):
+        """Initialize the store of a partition.
+
+        Args:
+            storage: Storage of the user's partition
+            max_entries: Keys kept at most
+            ttl: Seconds a response is replayed
+            lease: Seconds after which an unfinished claim may be taken over
+            poll_interval: Seconds between checks while another worker runs
+            wait_timeout: Seconds to wait for another worker's attempt at most
+        """
+        self.storage = storage
+        self.path = storage.data_dir / IDEMPOTENCY_FILE
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+
+    def _load(self) -> Dict[str, dict]:
+        """Read the entries (call with the write lock held)."""
+        try:
+            with open(self.path, "rb") as f:
+                entries = serialization.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring corrupted {self.path}")
+            return {}
+        except Exception as e:
+            raise StorageError(f"Failed to read file {self.path}: {str(e)}")
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self, entries: Dict[str, dict]) -> None:
+        """Write the entries, dropping expired and surplus ones (call with the write lock held)."""
+        now = time.time()
+        kept = {
+            key: entry for key, entry in entries.items()
+            if now - entry.get("stored_at", 0) <= max(self.ttl, self.lease)
+        }
+        # 按写入顺序保留最新的 max_entries 个
+        for key in list(kept)[:max(0, len(kept) - self.max_entries)]:
+            del kept[key]
+        try:
+            with atomic_open(self.path, "wb") as f:
+                serialization.dump(kept, f)
+        except Exception as e:
+            raise StorageError(f"Failed to write file {self.path}: {str(e)}")
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[dict]]:
+        """Claim a key for running, or get its kept response.
+
+        Args:
+            key: Idempotency key
+            fingerprint: Hash of the request body
+
+        Returns:
+            ``("run", None)`` if the caller now holds the claim,
+            ``("done", response)`` for a completed attempt, or
+            ``("wait", None)`` while another attempt is running
+
+        Raises:
+            IdempotencyConflictError: If the key belongs to a different body
+            StorageError: If the file cannot be read or written
+        """
+        with self.storage.write_lock():
+            entries = self._load()
+            entry = entries.get(key)
+            now = time.time()
+            if entry is not None:
+                age = now - entry.get("stored_at", 0)
+                done = entry.get("response") is not None
+                if (done and age <= self.ttl) or (not done and age <= self.lease):
+                    if entry.get("fingerprint") != fingerprint:
+                        raise IdempotencyConflictError()
+                    return ("done", entry["response"]) if done else ("wait", None)
+                del entries[key]
+            entries[key] = {"fingerprint": fingerprint, "stored_at": now, "response": None}
+            self._save(entries)
+        return "run", None
+
+    def complete(self, key: str, fingerprint: str, response: Optional[dict]) -> None:
+        """Finish a claimed attempt.
+
+        Args:
+            key: Idempotency key
+            fingerprint: Hash of the request body
+            response: JSON response to replay, or None to release the claim
+                (a retry then runs again)
+
+        Raises:
+            StorageError: If the file cannot be read or written
+        """
+        with self.storage.write_lock():
+            entries = self._load()
+            entries.pop(key, None)
+            if response is not None:
+                entries[key] = {"fingerprint": fingerprint, "stored_at": time.time(), "response": response}
+            self._save(entries)
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        func: Callable[[], Awaitable[Any]],
+        to_json: Callable[[Any], Optional[dict]],
+        from_json: Callable[[dict], Any]
+    ) -> Tuple[Any, bool]:
+        """Run a request at most once per key.
+
+        Args:
+            key: Idempotency key
+            fingerprint: Hash of the request body
+            func: Coroutine function handling the request
+            to_json: JSON form of a response to keep, or None if it must
+                not be replayed (e.g. an error)
+            from_json: Rebuild a kept response
+
+        Returns:
+            Tuple of (response, whether it is a replay of an earlier attempt)
+
+        Raises:
+            IdempotencyConflictError: If the key belongs to a different body
+            IdempotencyPendingError: If another worker's attempt is still
+                running after wait_timeout seconds
+            StorageError: If the file cannot be read or written
+        """
+        ran = False
+
+        async def attempt() -> Tuple[Any, bool]:
+            nonlocal ran
+            ran = True
+            deadline = time.monotonic() + self.wait_timeout
+            while True:
+                # 读写整个文件并等待文件锁，在线程中执行
+                state, stored = await asyncio.to_thread(self.claim, key, fingerprint)
+                if state == "done":
+                    return from_json(stored), True
+                if state == "run":
+                    break
+                # 其他工作进程正在处理同一请求
+                if time.monotonic() >= deadline:
+                    raise IdempotencyPendingError()
+                await asyncio.sleep(self.poll_interval)
+
+            try:
+                value = await func()
+            except BaseException:
+                # 请求被取消时也要释放占用：在线程中完成，不受取消影响
+                await asyncio.shield(asyncio.to_thread(self.complete, key, fingerprint, None))
+                raise
+            await asyncio.to_thread(self.complete, key, fingerprint, to_json(value))
+            return value, False
+
+        value, replayed = await _inflight.do(make_key(str(self.path), key, fingerprint), attempt)
+        return value, replayed or not ran
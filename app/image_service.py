@@ -6,6 +6,7 @@ cat character images using the MiniMax Text-to-Image API.
 Requirements: PRD - AI形象生成模块
 """
 
+import asyncio
 import logging
 import httpx
 from typing import Optional, Dict, List
@@ -13,8 +14,17 @@ import time
 import json
 from pathlib import Path
 
+from app.file_lock import atomic_open
+from app.singleflight import SingleFlight, make_key
+
 logger = logging.getLogger(__name__)
 
+# 进行中的生成请求（跨服务实例共享），相同提示词的并发请求只调用一次 API
+_inflight = SingleFlight()
+
+# 下载图片时每次写入磁盘的块大小
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 
 class ImageGenerationError(Exception):
     """Exception raised when image generation operations fail.
@@ -97,16 +107,22 @@ class ImageGenerationService:
         "adorable and heartwarming"
     )
     
-    def __init__(self, api_key: str, group_id: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: str,
+        group_id: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ):
         """Initialize the image generation service.
         
         Args:
             api_key: MiniMax API key for authentication
             group_id: MiniMax group ID (optional, for compatibility)
+            client: HTTP client to use (optional, e.g. with a stub transport)
         """
         self.api_key = api_key
         self.group_id = group_id  # 保留但不使用
-        self.client = httpx.AsyncClient(timeout=120.0)  # 图像生成需要更长时间
+        self.client = client or httpx.AsyncClient(timeout=120.0)  # 图像生成需要更长时间
         self.api_url = "https://api.minimaxi.com/v1/image_generation"
         self.model = "image-01"
     
@@ -121,6 +137,11 @@ class ImageGenerationService:
     async def download_image(self, url: str, save_path: str) -> str:
         """Download image from URL and save to local file.
         
+        The image is streamed in chunks through the service's pooled HTTP
+        client into a temporary file next to ``save_path``, which is renamed
+        into place once complete. The image is never held in memory as a
+        whole, and readers never see a partially written file.
+        
         Args:
             url: Image URL to download
             save_path: Local file path to save the image
@@ -138,17 +159,16 @@ class ImageGenerationService:
             save_path_obj = Path(save_path)
             save_path_obj.parent.mkdir(parents=True, exist_ok=True)
             
-            # 下载图像
-            response = await self.client.get(url, timeout=60.0)
-            
-            if response.status_code != 200:
-                error_msg = f"Failed to download image: HTTP {response.status_code}"
-                logger.error(error_msg)
-                raise ImageGenerationError(error_msg)
-            
-            # 保存到文件
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
+            # 流式下载图像，写入临时文件后原子替换
+            async with self.client.stream("GET", url, timeout=60.0) as response:
+                if response.status_code != 200:
+                    error_msg = f"Failed to download image: HTTP {response.status_code}"
+                    logger.error(error_msg)
+                    raise ImageGenerationError(error_msg)
+                
+                with atomic_open(save_path_obj, "wb") as f:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
             
             abs_path = str(save_path_obj.absolute())
             logger.info(f"Image saved to: {abs_path}")
@@ -162,8 +182,9 @@ class ImageGenerationService:
             logger.error(error_msg)
             raise ImageGenerationError(error_msg)
     
+    @classmethod
     def build_prompt(
-        self,
+        cls,
         color: str = "温暖粉",
         personality: str = "温柔",
         appearance: str = "无配饰",
@@ -178,25 +199,26 @@ class ImageGenerationService:
             role: Character role (陪伴式朋友/温柔照顾型长辈等)
         
         Returns:
-            Complete prompt string for CogView API
+            Complete prompt string for CogView API. The prompt only depends
+            on the arguments, so it can be used as a cache key.
         """
         # 获取映射值，如果没有则使用默认值
-        color_desc = self.COLOR_MAPPING.get(color, self.COLOR_MAPPING["温暖粉"])
-        personality_desc = self.PERSONALITY_MAPPING.get(
+        color_desc = cls.COLOR_MAPPING.get(color, cls.COLOR_MAPPING["温暖粉"])
+        personality_desc = cls.PERSONALITY_MAPPING.get(
             personality, 
-            self.PERSONALITY_MAPPING["温柔"]
+            cls.PERSONALITY_MAPPING["温柔"]
         )
-        appearance_desc = self.APPEARANCE_MAPPING.get(
+        appearance_desc = cls.APPEARANCE_MAPPING.get(
             appearance, 
-            self.APPEARANCE_MAPPING["无配饰"]
+            cls.APPEARANCE_MAPPING["无配饰"]
         )
-        role_desc = self.ROLE_MAPPING.get(
+        role_desc = cls.ROLE_MAPPING.get(
             role, 
-            self.ROLE_MAPPING["陪伴式朋友"]
+            cls.ROLE_MAPPING["陪伴式朋友"]
         )
         
         # 构建完整提示词
-        prompt = self.BASE_PROMPT.format(
+        prompt = cls.BASE_PROMPT.format(
             color=color_desc,
             personality=personality_desc,
             appearance=appearance_desc,
@@ -214,12 +236,15 @@ class ImageGenerationService:
         role: str = "陪伴式朋友",
         aspect_ratio: str = "1:1",
         n: int = 1,
-        response_format: str = "url"
+        response_format: str = "url",
+        coalesce: bool = True
     ) -> Dict[str, str]:
         """Generate a cat character image using MiniMax API.
         
         This method sends a request to the MiniMax API with the constructed
-        prompt and returns the generated image URL or base64 data.
+        prompt and returns the generated image URL or base64 data. Unless
+        ``coalesce`` is False, concurrent calls with the same prompt share
+        one API request (and receive the same image).
         
         Args:
             color: Color preference
@@ -229,6 +254,8 @@ class ImageGenerationService:
             aspect_ratio: Image aspect ratio (1:1, 16:9, 9:16, 4:3, 3:4)
             n: Number of images to generate (1-4)
             response_format: Response format ("url" or "base64")
+            coalesce: Share the request with identical concurrent calls;
+                pass False when distinct candidates are wanted
         
         Returns:
             Dictionary containing:
@@ -240,6 +267,25 @@ class ImageGenerationService:
         Raises:
             ImageGenerationError: If API call fails or returns invalid response
         """
+        def generate():
+            return self._generate_once(color, personality, appearance, role, aspect_ratio, n)
+        
+        if not coalesce:
+            return await generate()
+        # 提示词由偏好唯一确定，以偏好作为键即相当于以提示词作为键
+        key = make_key(self.model, color, personality, appearance, role, aspect_ratio, str(n))
+        return await _inflight.do(key, generate)
+    
+    async def _generate_once(
+        self,
+        color: str,
+        personality: str,
+        appearance: str,
+        role: str,
+        aspect_ratio: str,
+        n: int
+    ) -> Dict[str, str]:
+        """Send one image generation request to the MiniMax API."""
         try:
             # 构建提示词
             prompt = self.build_prompt(color, personality, appearance, role)
@@ -392,7 +438,10 @@ class ImageGenerationService:
         """Generate multiple cat character images.
         
         This method generates multiple images with the same parameters,
-        allowing users to choose their favorite one.
+        allowing users to choose their favorite one. Each image is requested
+        with its own API call and the calls run concurrently, so the total
+        latency is that of the slowest single image rather than of one
+        ``n=count`` request.
         
         Args:
             color: Color preference
@@ -403,7 +452,7 @@ class ImageGenerationService:
             aspect_ratio: Image aspect ratio
         
         Returns:
-            List of dictionaries, each containing url, prompt, and task_id
+            List of dictionaries, each containing url, prompt, task_id and index
         
         Raises:
             ImageGenerationError: If any API call fails
@@ -412,29 +461,29 @@ class ImageGenerationService:
             raise ValueError("Count must be between 1 and 4")
         
         try:
-            # MiniMax 支持一次生成多张图像
-            result = await self.generate_image(
-                color=color,
-                personality=personality,
-                appearance=appearance,
-                role=role,
-                aspect_ratio=aspect_ratio,
-                n=count
-            )
+            # 每张图片单独请求并发执行，而不是一次 n=count 的请求
+            results = await asyncio.gather(*(
+                self.generate_image(
+                    color=color,
+                    personality=personality,
+                    appearance=appearance,
+                    role=role,
+                    aspect_ratio=aspect_ratio,
+                    n=1,
+                    coalesce=False
+                )
+                for _ in range(count)
+            ))
             
-            # 将结果转换为列表格式
-            urls = result['url'] if isinstance(result['url'], list) else [result['url']]
-            
-            images = []
-            for i, url in enumerate(urls):
-                images.append({
-                    "url": url,
+            return [
+                {
+                    "url": result['url'],
                     "prompt": result['prompt'],
                     "task_id": result['task_id'],
                     "index": i
-                })
-            
-            return images
+                }
+                for i, result in enumerate(results)
+            ]
             
         except ImageGenerationError as e:
             logger.error(f"Failed to generate images: {e.message}")
@@ -0,0 +1,340 @@
+"""Resized and re-encoded derivatives of generated character images.
+
+Full-size MiniMax JPEGs are large for a history grid or an avatar on a
+phone. After an image is generated, this module renders thumbnails in a few
+widths and WebP/AVIF encodings into ``generated_images/variants/`` using a
+process pool, off the request path. ``VariantStaticFiles`` serves
+``/generated_images`` and picks the best existing derivative per request:
+the ``w`` query parameter selects a width and the ``Accept`` header selects
+the encoding. If no derivative exists yet the original file is served.
+
+Pillow is optional. Without it no derivatives are generated and the
+originals are served unchanged.
+
+Requirements: PRD - AI形象生成模块
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.file_lock import atomic_open
+from app.gallery import parse_image_filename
+
+try:
+    from PIL import Image, features
+    HAS_PIL = True
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+    features = None
+    HAS_PIL = False
+
+
+logger = logging.getLogger(__name__)
+
+
+# 衍生图片目录（位于原图目录下）
+VARIANTS_SUBDIR = "variants"
+
+# 缩略图宽度（像素）
+VARIANT_WIDTHS = (128, 256, 512)
+
+# 按优先级排列的编码：(格式名, MIME 类型, Pillow 保存参数)
+_FORMATS = (
+    ("avif", "image/avif", {"quality": 55}),
+    ("webp", "image/webp", {"quality": 80, "method": 4}),
+)
+
+# 只为这些原图生成和协商衍生图片
+_SOURCE_SUFFIXES = {".jpeg", ".jpg", ".png"}
+
+# 生成的图片文件名带时间戳、写入后不再修改，衍生图片由原图唯一确定，
+# 因此同一 URL 的内容永不改变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 衍生图片尚未生成时暂时返回原图：短暂缓存，之后改为返回衍生图片
+PENDING_CACHE_CONTROL = "public, max-age=60"
+
+
+def supported_formats() -> List[str]:
+    """Get the derivative encodings this installation can produce.
+
+    Returns:
+        Format names in order of preference (empty without Pillow)
+    """
+    if not HAS_PIL:
+        return []
+    return [name for name, _, _ in _FORMATS if features.check(name)]
+
+
+def variant_path(
+    images_dir: Union[str, Path], filename: str, fmt: str, width: Optional[int] = None
+) -> Path:
+    """Get the path of one derivative of an image.
+
+    Args:
+        images_dir: Directory holding the original images
+        filename: Original image file name
+        fmt: Encoding (``webp`` or ``avif``)
+        width: Thumbnail width, or None for the full-size re-encoding
+
+    Returns:
+        Path like ``variants/<stem>.w256.webp``
+    """
+    stem = Path(filename).stem
+    suffix = f".w{width}" if width else ""
+    return Path(images_dir) / VARIANTS_SUBDIR / f"{stem}{suffix}.{fmt}"
+
+
+def generate_variants(source: str, images_dir: str) -> List[str]:
+    """Render all derivatives of one image (runs in a worker process).
+
+    Thumbnails are only produced for widths smaller than the original.
+    Existing derivatives are overwritten atomically.
+
+    Args:
+        source: Path of the original image
+        images_dir: Directory holding the original images
+
+    Returns:
+        Paths of the files written
+    """
+    formats = supported_formats()
+    if not formats:
+        return []
+
+    written = []
+    (Path(images_dir) / VARIANTS_SUBDIR).mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as original:
+        original = original.convert("RGB")
+        sizes: List[Tuple[Optional[int], "Image.Image"]] = [(None, original)]
+        for width in VARIANT_WIDTHS:
+            if width < original.width:
+                height = max(1, round(original.height * width / original.width))
+                sizes.append((width, original.resize((width, height), Image.LANCZOS)))
+
+        for width, image in sizes:
+            for name, _, options in _FORMATS:
+                if name not in formats:
+                    continue
+                target = variant_path(images_dir, Path(source).name, name, width)
+                with atomic_open(target, "wb") as f:
+                    image.save(f, format=name.upper(), **options)
+                written.append(str(target))
+    return written
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending: Set[asyncio.Future] = set()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, min(2, os.cpu_count() or 1)))
+    return _pool
+
+
+def _log_result(future: asyncio.Future) -> None:
+    """Log the outcome of a background derivative job."""
+    _pending.discard(future)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Failed to generate image variants: {error}")
+    else:
+        logger.info(f"Generated {len(future.result())} image variants")
+
+
+def schedule_variants(source: Union[str, Path], images_dir: Union[str, Path]) -> Optional[asyncio.Future]:
+    """Render the derivatives of an image in the background.
+
+    Must be called from the event loop. The request does not wait for the
+    result; until the derivatives exist the original is served.
+
+    Args:
+        source: Path of the original image
+        images_dir: Directory holding the original images
+
+    Returns:
+        Future of the background job, or None if derivatives are unsupported
+    """
+    if not supported_formats():
+        return None
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_pool(), generate_variants, str(source), str(images_dir))
+    # 保留引用，避免任务在完成前被回收
+    _pending.add(future)
+    future.add_done_callback(_log_result)
+    return future
+
+
+def shutdown_pool() -> None:
+    """Stop the process pool (pending jobs are abandoned)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _accepted_types(accept: str) -> Set[str]:
+    """Get the media types a client accepts (ignoring entries with q=0)."""
+    accepted = set()
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            accepted.add(media_type.lower())
+    return accepted
+
+
+def negotiate(
+    images_dir: Union[str, Path], filename: str, accept: str, width: Optional[int] = None
+) -> Optional[Tuple[Path, str]]:
+    """Pick the best existing derivative of an image for a request.
+
+    Args:
+        images_dir: Directory holding the original images
+        filename: Original image file name
+        accept: Value of the request's Accept header
+        width: Requested display width in pixels (optional)
+
+    Returns:
+        (path, media type) of the derivative, or None to serve the original
+    """
+    chosen = _negotiate(images_dir, filename, _accepted_types(accept), width)
+    return None if chosen is None else chosen[:2]
+
+
+def _negotiate(
+    images_dir: Union[str, Path], filename: str, accepted: Set[str], width: Optional[int]
+) -> Optional[Tuple[Path, str, Optional[int], str]]:
+    """Pick the best existing derivative; also return its width and format name."""
+    # 选择不小于请求宽度的最小缩略图；请求过大时使用全尺寸
+    widths: List[Optional[int]] = [None]
+    if width:
+        widths = [w for w in VARIANT_WIDTHS if w >= width] + [None]
+
+    for candidate_width in widths:
+        for name, media_type, _ in _FORMATS:
+            if media_type not in accepted:
+                continue
+            path = variant_path(images_dir, filename, name, candidate_width)
+            if path.is_file():
+                return path, media_type, candidate_width, name
+    return None
+
+
+def _source_width(path: Path) -> Optional[int]:
+    """Read the pixel width of an original image (header only), or None."""
+    if not HAS_PIL:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.width
+    except (OSError, ValueError):
+        return None
+
+
+def _is_final(
+    images_dir: Union[str, Path],
+    filename: str,
+    accepted: Set[str],
+    width: Optional[int],
+    chosen_width: Optional[int],
+    chosen_name: str
+) -> bool:
+    """Check whether a derivative is the one a finished render serves for a request.
+
+    ``generate_variants`` writes the full-size encodings first and skips
+    thumbnails at least as wide as the original, so a larger or full-size
+    file, or a less preferred encoding, may only be a stand-in.
+    """
+    names = [name for name, _, _ in _FORMATS]
+    best_name = next((
+        name for name, media_type, _ in _FORMATS
+        if name in supported_formats() and media_type in accepted
+    ), None)
+    if best_name is not None and names.index(chosen_name) > names.index(best_name):
+        return False
+
+    best_width = next((w for w in VARIANT_WIDTHS if w >= width), None) if width else None
+    if best_width is not None and chosen_width != best_width:
+        # 不小于原图宽度的缩略图不会生成，此时全尺寸即为最终结果
+        source_width = _source_width(Path(images_dir) / filename)
+        return chosen_width is None and source_width is not None and best_width >= source_width
+    return chosen_width == best_width
+
+
+class VariantStaticFiles(StaticFiles):
+    """StaticFiles that serves WebP/AVIF thumbnails when available."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """Serve a derivative of an original image, or fall back to the file."""
+        filename = Path(path).name
+        if (
+            self.directory is not None
+            and Path(path).parent == Path(".")
+            and Path(filename).suffix.lower() in _SOURCE_SUFFIXES
+        ):
+            headers = Headers(scope=scope)
+            try:
+                width = int(QueryParams(scope["query_string"]).get("w", "") or 0) or None
+            except ValueError:
+                width = None
+            accepted = _accepted_types(headers.get("accept", ""))
+            chosen = _negotiate(self.directory, filename, accepted, width)
+            if chosen is not None:
+                variant, media_type, chosen_width, chosen_name = chosen
+                response = FileResponse(
+                    variant, media_type=media_type, stat_result=os.stat(variant)
+                )
+                response.headers["Vary"] = "Accept"
+                # 请求的缩略图或更优的编码尚未生成时，返回的只是替代品，短暂缓存
+                final = _is_final(self.directory, filename, accepted, width, chosen_width, chosen_name)
+                response.headers["Cache-Control"] = (
+                    IMMUTABLE_CACHE_CONTROL if final else PENDING_CACHE_CONTROL
+                )
+                if self.is_not_modified(response.headers, headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+
+        response = await super().get_response(path, scope)
+        if Path(filename).suffix.lower() in _SOURCE_SUFFIXES:
+            response.headers["Vary"] = "Accept"
+            response.headers["Cache-Control"] = self._original_cache_control(path, scope)
+        return response
+
+    def _original_cache_control(self, path: str, scope: Scope) -> str:
+        """Get the Cache-Control header for an original image.
+
+        Generated images never change, but while a better derivative for
+        this request may still appear the original is only cached briefly.
+        Other files (e.g. the replaceable default image) are revalidated.
+        """
+        filename = Path(path).name
+        if Path(path).parent != Path(".") or parse_image_filename(filename) is None:
+            return "no-cache"
+        accepted = _accepted_types(Headers(scope=scope).get("accept", ""))
+        upgradable = [
+            name for name, media_type, _ in _FORMATS
+            if name in supported_formats() and media_type in accepted
+        ]
+        return PENDING_CACHE_CONTROL if upgradable else IMMUTABLE_CACHE_CONTROL
@@ -0,0 +1,440 @@
+"""Background jobs for long-running requests.
+
+Character image generation takes 30-120 seconds, longer than many reverse
+proxies (HF Spaces, ModelScope) keep an idle HTTP request open. Instead of
+holding the request, the endpoint submits a job and returns its id at once;
+the client polls the job for progress and the result, and may cancel it.
+
+Jobs run as asyncio tasks in the worker process that accepted them. When a
+state directory is configured, every status change is also written to
+``<user partition>/jobs/<job_id>.json`` so that polls reaching another
+uvicorn worker still find the job; cancelling from another worker leaves a
+``<job_id>.cancel`` marker that the owning worker picks up.
+
+A semaphore bounds how many image generations run at once (protecting the
+MiniMax quota) and a per-user limit stops one user from queueing many jobs.
+Both are per worker; requests that generate inline (``hold`` and ``slot``)
+share them with the background jobs.
+"""
+
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Set
+
+from app import serialization
+from app.file_lock import atomic_open
+
+
+logger = logging.getLogger(__name__)
+
+
+# 任务状态
+QUEUED = "queued"
+GENERATING = "generating"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# 任务 id 是 uuid4().hex，校验后才拼接进文件路径
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobLimitError(Exception):
+    """Exception raised when a user already has too many active jobs."""
+
+    def __init__(self, message: str = "进行中的任务过多，请稍后再试"):
+        """Initialize the error.
+
+        Args:
+            message: Error message
+        """
+        self.message = message
+        super().__init__(self.message)
+
+
+class Job:
+    """One background job and its progress.
+
+    Attributes:
+        job_id: Unique job id
+        user_id: Owner of the job
+        kind: What the job does (e.g. ``character_image``)
+        status: One of queued/generating/downloading/done/failed/cancelled
+        result: Result of a finished job (None until done)
+        error: Error message of a failed job
+        created_at: Submission time (epoch seconds)
+        updated_at: Time of the last status change (epoch seconds)
+    """
+
+    def __init__(self, user_id: str, kind: str):
+        """Initialize a queued job.
+
+        Args:
+            user_id: Owner of the job
+            kind: What the job does
+        """
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.task: Optional[asyncio.Task] = None
+        # 状态变化时的回调（由 JobManager 用于持久化）
+        self.on_change: Optional[Callable[["Job"], None]] = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job reached a final state."""
+        return self.status in FINISHED_STATES
+
+    def set_status(self, status: str) -> None:
+        """Record a progress step (ignored once the job has finished).
+
+        Args:
+            status: New status
+        """
+        if not self.finished:
+            self.status = status
+            self.updated_at = time.time()
+            if self.on_change is not None:
+                self.on_change(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the public representation of the job."""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, user_id: str, data: Dict[str, Any]) -> "Job":
+        """Rebuild a job persisted by another worker (without its task).
+
+        Args:
+            user_id: Owner of the job
+            data: The job as returned by ``to_dict``
+
+        Returns:
+            The job
+        """
+        job = cls(user_id, data["kind"])
+        job.job_id = data["job_id"]
+        job.status = data["status"]
+        job.result = data["result"]
+        job.error = data["error"]
+        job.created_at = data["created_at"]
+        job.updated_at = data["updated_at"]
+        return job
+
+
+JobFunc = Callable[[Job], Awaitable[Any]]
+
+
+class JobManager:
+    """Runs jobs in the background with bounded concurrency.
+
+    Attributes:
+        max_concurrent: Jobs running at the same time (others stay queued)
+        max_per_user: Unfinished jobs one user may have
+        ttl: Seconds a finished job stays available for polling
+        state_dir: Maps a user id to the directory persisting that user's
+            jobs (jobs are only kept in memory if None)
+        poll_interval: Seconds between checks for cancel markers
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 2,
+        max_per_user: int = 2,
+        ttl: float = 3600,
+        state_dir: Optional[Callable[[str], Path]] = None,
+        poll_interval: float = 1.0
+    ):
+        """Initialize the job manager.
+
+        Args:
+            max_concurrent: Jobs running at the same time
+            max_per_user: Unfinished jobs one user may have
+            ttl: Seconds a finished job stays available for polling
+            state_dir: Maps a user id to the directory persisting its jobs
+            poll_interval: Seconds between checks for cancel markers
+        """
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # 请求内直接生成（不经过后台任务）的用户 -> 进行中的数量
+        self._held: Dict[str, int] = {}
+        # 每个任务一个写锁，保证状态文件按顺序写入
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        self._pending_writes: Set[asyncio.Task] = set()
+
+    def _prune(self) -> None:
+        """Forget finished jobs older than the TTL (their state files too)."""
+        cutoff = time.time() - self.ttl
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished and job.updated_at < cutoff
+        ]
+        for job in expired:
+            del self._jobs[job.job_id]
+            self._write_locks.pop(job.job_id, None)
+            if self.state_dir is not None:
+                self._track(asyncio.to_thread(self._remove_state, self._state_file(job)))
+
+    def check_limit(self, user_id: str) -> None:
+        """Check that the user may start another job.
+
+        Args:
+            user_id: User about to start a job
+
+        Raises:
+            JobLimitError: If the user already has max_per_user unfinished jobs
+        """
+        self._prune()
+        active = sum(1 for job in self._jobs.values() if job.user_id == user_id and not job.finished)
+        if active + self._held.get(user_id, 0) >= self.max_per_user:
+            raise JobLimitError()
+
+    @contextmanager
+    def hold(self, user_id: str) -> Iterator[None]:
+        """Count work done inside a request against the user's job limit.
+
+        Must be used on the event loop.
+
+        Args:
+            user_id: User the work is done for
+
+        Raises:
+            JobLimitError: If the user already has max_per_user unfinished jobs
+        """
+        self.check_limit(user_id)
+        self._held[user_id] = self._held.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._held[user_id] -= 1
+            if not self._held[user_id]:
+                del self._held[user_id]
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for one of the max_concurrent slots shared with the jobs."""
+        async with self._semaphore:
+            yield
+
+    def _state_file(self, job: Job) -> Path:
+        """Get the path of a job's persisted state."""
+        return self.state_dir(job.user_id) / f"{job.job_id}.json"
+
+    def _track(self, coro: Awaitable[Any]) -> None:
+        """Run a state file write in the background, keeping a reference."""
+        task = asyncio.ensure_future(coro)
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    def _schedule_save(self, job: Job) -> None:
+        """Persist the job's current state without blocking the event loop."""
+        self._track(self._save(job))
+
+    async def _save(self, job: Job) -> None:
+        """Write the job's state; writes of one job happen in order."""
+        lock = self._write_locks.setdefault(job.job_id, asyncio.Lock())
+        async with lock:
+            # 在锁内取状态：后写入的总是较新的状态
+            data = job.to_dict()
+            try:
+                await asyncio.to_thread(self._write_state, self._state_file(job), data)
+            except OSError as e:
+                logger.error(f"Failed to persist job {job.job_id}: {e}")
+
+    @staticmethod
+    def _write_state(path: Path, data: Dict[str, Any]) -> None:
+        """Write a job state file (and drop its cancel marker once finished)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_open(path, "wb") as f:
+            serialization.dump(data, f)
+        if data["status"] in FINISHED_STATES:
+            path.with_suffix(".cancel").unlink(missing_ok=True)
+
+    @staticmethod
+    def _remove_state(path: Path) -> None:
+        """Delete an expired job's state file."""
+        path.unlink(missing_ok=True)
+        path.with_suffix(".cancel").unlink(missing_ok=True)
+
+    def _load_state(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Read a job persisted by another worker (None if missing or expired)."""
+        path = self.state_dir(user_id) / f"{job_id}.json"
+        try:
+            with open(path, "rb") as f:
+                job = Job.from_dict(user_id, serialization.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to read job {job_id}: {e}")
+            return None
+        if job.finished and job.updated_at < time.time() - self.ttl:
+            return None
+        return job
+
+    def submit(self, user_id: str, kind: str, func: JobFunc) -> Job:
+        """Start a job in the background.
+
+        Must be called from the event loop. ``func`` receives the job, reports
+        progress with ``job.set_status`` and returns the result.
+
+        Args:
+            user_id: Owner of the job
+            kind: What the job does
+            func: Coroutine function performing the work
+
+        Returns:
+            The queued job
+
+        Raises:
+            JobLimitError: If the user already has max_per_user unfinished jobs
+        """
+        self.check_limit(user_id)
+
+        job = Job(user_id, kind)
+        self._jobs[job.job_id] = job
+        if self.state_dir is not None:
+            job.on_change = self._schedule_save
+            self._schedule_save(job)
+        job.task = asyncio.create_task(self._run(job, func))
+        logger.info(f"Job {job.job_id} ({kind}) queued for user {user_id}")
+        return job
+
+    async def _run(self, job: Job, func: JobFunc) -> None:
+        """Run a job once a concurrency slot is free and record the outcome."""
+        watcher = asyncio.create_task(self._watch_cancel(job)) if self.state_dir is not None else None
+        try:
+            async with self._semaphore:
+                result = await func(job)
+        except asyncio.CancelledError:
+            job.set_status(CANCELLED)
+            logger.info(f"Job {job.job_id} cancelled")
+            return
+        except Exception as e:
+            job.error = getattr(e, "message", None) or str(e)
+            job.set_status(FAILED)
+            logger.error(f"Job {job.job_id} failed: {job.error}")
+            return
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+        job.result = result
+        job.set_status(DONE)
+        logger.info(f"Job {job.job_id} done")
+
+    async def _watch_cancel(self, job: Job) -> None:
+        """Cancel the job when another worker left a cancel marker for it."""
+        marker = self._state_file(job).with_suffix(".cancel")
+        while not job.finished:
+            await asyncio.sleep(self.poll_interval)
+            if await asyncio.to_thread(marker.exists):
+                logger.info(f"Job {job.job_id} cancelled by another worker")
+                job.task.cancel()
+                job.set_status(CANCELLED)
+                return
+
+    def get(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Get a job of a user.
+
+        Args:
+            job_id: Job id
+            user_id: User asking for the job
+
+        Returns:
+            The job, or None if it does not exist or belongs to another user
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def find(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Get a job of a user, including jobs run by other workers.
+
+        Args:
+            job_id: Job id
+            user_id: User asking for the job
+
+        Returns:
+            The job, or None if it does not exist or belongs to another user
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job if job.user_id == user_id else None
+        if self.state_dir is None or not _JOB_ID.fullmatch(job_id):
+            return None
+        return await asyncio.to_thread(self._load_state, job_id, user_id)
+
+    def cancel(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Cancel a queued or running job (no-op for finished jobs).
+
+        Args:
+            job_id: Job id
+            user_id: User cancelling the job
+
+        Returns:
+            The job, or None if it does not exist or belongs to another user
+        """
+        job = self.get(job_id, user_id)
+        if job is not None and not job.finished and job.task is not None:
+            job.task.cancel()
+            # 立即标记为已取消，轮询无需等待任务真正退出
+            job.set_status(CANCELLED)
+        return job
+
+    async def request_cancel(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Cancel a job, including jobs run by other workers.
+
+        A job of another worker is cancelled by that worker within
+        poll_interval seconds; the returned job already shows it cancelled.
+
+        Args:
+            job_id: Job id
+            user_id: User cancelling the job
+
+        Returns:
+            The job, or None if it does not exist or belongs to another user
+        """
+        if job_id in self._jobs:
+            return self.cancel(job_id, user_id)
+        job = await self.find(job_id, user_id)
+        if job is not None and not job.finished:
+            marker = self._state_file(job).with_suffix(".cancel")
+            await asyncio.to_thread(marker.touch)
+            job.status = CANCELLED
+        return job
+
+    async def shutdown(self) -> None:
+        """Cancel all unfinished jobs and wait for them to stop."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 等待已取消任务的状态写入完成
+        await asyncio.gather(*self._pending_writes, return_exceptions=True)
@@ -0,0 +1,169 @@
+"""Robust extraction of JSON from LLM output.
+
+Models asked for "JSON only" still wrap it in markdown fences, put a sentence
+before or after it, leave trailing commas, write Python literals (``None``)
+or get cut off at the token limit. Every such response used to fail the
+parse and cost a new upstream request. ``extract_json`` locates the outermost
+balanced JSON value (trying the span up to the last closing bracket first,
+then a scan that skips strings with a regex, so braces inside strings do not
+count), decodes it, and only if that fails applies local repairs:
+
+- trailing commas before ``}`` / ``]`` are removed
+- ``None`` / ``True`` / ``False`` become ``null`` / ``true`` / ``false``
+- full-width ``，`` and ``：`` outside strings become ``,`` and ``:``
+- ``//`` line comments are removed
+- truncated output is closed (open string, dangling ``,`` or ``:``, and all
+  open brackets)
+"""
+
+import re
+from typing import Any, List, Tuple
+
+from app import serialization
+
+
+# 单个响应最多尝试的候选起点数（避免病态输入导致反复扫描）
+MAX_CANDIDATES = 8
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# 结构字符：括号与字符串起点
+_STRUCTURE = re.compile(r'[{}\[\]"]')
+# 字符串剩余部分（起始引号之后），支持转义
+_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+# 修复时逐个匹配的记号；字符串整体匹配，因此字符串内容不会被改动
+_REPAIR_TOKEN = re.compile(
+    r'"(?:[^"\\]|\\.)*"'
+    r"|,(?=\s*[}\]])"
+    r"|\b(?:None|True|False)\b"
+    r"|[，：]"
+    r"|//[^\n]*",
+    re.S
+)
+_REPLACEMENTS = {"None": "null", "True": "true", "False": "false", "，": ",", "：": ":"}
+
+
+class JSONExtractError(ValueError):
+    """Exception raised when no JSON value can be extracted."""
+
+    def __init__(self, message: str = "响应中没有有效的 JSON"):
+        """Initialize the error.
+
+        Args:
+            message: Error message
+        """
+        self.message = message
+        super().__init__(self.message)
+
+
+def _scan(content: str, start: int) -> Tuple[int, List[str], bool]:
+    """Find the end of the bracketed value starting at ``start``.
+
+    Returns:
+        Tuple of (end index, closers still expected, whether the text ended
+        inside a string); the closers list is empty for a complete value
+
+    Raises:
+        JSONExtractError: If brackets are mismatched
+    """
+    expected = [_CLOSERS[content[start]]]
+    pos = start + 1
+    while True:
+        match = _STRUCTURE.search(content, pos)
+        if match is None:
+            return len(content), expected, False
+        char = match.group()
+        pos = match.end()
+        if char == '"':
+            rest = _STRING_REST.match(content, pos)
+            if rest is None:
+                return len(content), expected, True
+            pos = rest.end()
+        elif char in _CLOSERS:
+            expected.append(_CLOSERS[char])
+        elif char == expected[-1]:
+            expected.pop()
+            if not expected:
+                return pos, expected, False
+        else:
+            raise JSONExtractError(f"括号不匹配（位置 {match.start()}）")
+
+
+def repair(candidate: str) -> str:
+    """Fix common defects outside strings (trailing commas, Python literals,
+    full-width punctuation, line comments).
+
+    Args:
+        candidate: Bracketed JSON-like text
+
+    Returns:
+        The repaired text
+    """
+    def replace(match: "re.Match") -> str:
+        token = match.group()
+        if token.startswith('"'):
+            return token
+        if token == "," or token.startswith("//"):
+            return ""
+        return _REPLACEMENTS[token]
+
+    return _REPAIR_TOKEN.sub(replace, candidate)
+
+
+def _close(candidate: str, closers: List[str], in_string: bool) -> str:
+    """Complete a value cut off before its end."""
+    if in_string:
+        candidate += '"'
+    candidate = candidate.rstrip().rstrip(",").rstrip()
+    if candidate.endswith(":"):
+        candidate += "null"
+    return candidate + "".join(reversed(closers))
+
+
+def extract_json(content: str, opening: str = "{[") -> Any:
+    """Extract the first balanced JSON object or array from model output.
+
+    Args:
+        content: Model output (may contain fences, prose or defects)
+        opening: Characters a value may start with (``"{"`` for objects only)
+
+    Returns:
+        The decoded value
+
+    Raises:
+        JSONExtractError: If no candidate can be decoded, even after repairs
+    """
+    starts = re.compile("[" + re.escape(opening) + "]")
+    pos = 0
+    for _ in range(MAX_CANDIDATES):
+        match = starts.search(content, pos)
+        if match is None:
+            break
+        start = match.start()
+        pos = start + 1
+        # 常见情况：值一直延续到最后一个同类闭括号（纯 JSON、代码块、前后无括号的说明文字），
+        # 直接解码即可，无需逐个字符串扫描
+        last = content.rfind(_CLOSERS[content[start]])
+        if last > start:
+            try:
+                return serialization.loads(content[start:last + 1])
+            except ValueError:
+                pass
+        try:
+            end, closers, in_string = _scan(content, start)
+        except JSONExtractError:
+            continue
+        candidate = content[start:end]
+        if not closers:
+            try:
+                return serialization.loads(candidate)
+            except ValueError:
+                pass
+        else:
+            # 输出被截断：补全后尝试
+            candidate = _close(candidate, closers, in_string)
+        try:
+            return serialization.loads(repair(candidate))
+        except ValueError:
+            continue
+    raise JSONExtractError()
@@ -6,22 +6,38 @@ logging, and defines the application lifecycle.
 Requirements: 10.1, 10.2, 10.3, 10.4, 10.5
 """
 
+import asyncio
+import hashlib
 import logging
 import uuid
 from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from app.config import init_config, get_config
 from app.logging_config import setup_logging, set_request_id, clear_request_id
-from app.models import ProcessResponse, RecordData, ParsedData
-from app.storage import StorageService, StorageError
+from app.models import ProcessResponse, ParsedData, TodoUpdate
+from app.serialization import JSONResponse
+from app.storage import StorageService, StorageError, parsed_data_row
 from app.asr_service import ASRService, ASRServiceError
+from app.audio_preprocessing import preprocess_audio
 from app.semantic_parser import SemanticParserService, SemanticParserError
+from app.tenancy import DEFAULT_USER_ID, resolve_user_id, partition_dir, InvalidUserIdError
+from app.sharding import HashRing, ring_for_roots
+from app.compaction import Compactor
+from app.compression import CompressionMiddleware
+from app.gallery import Gallery
+from app.image_variants import VariantStaticFiles, schedule_variants, shutdown_pool
+from app.sse import EventStreamResponse, format_event
+from app.singleflight import SingleFlight, make_key, normalize_text
+from app.idempotency import (
+    IdempotencyStore, IdempotencyKeyError, IdempotencyConflictError, IdempotencyPendingError,
+    validate_key
+)
+from app import jobs
 
 
 logger = logging.getLogger(__name__)
@@ -53,8 +69,11 @@ async def lifespan(app: FastAPI):
         
         # Log configuration (without sensitive data)
         logger.info(f"Data directory: {config.data_dir}")
+        if config.data_roots:
+            logger.info(f"Data roots: {', '.join(str(r) for r in config.data_roots)}")
         logger.info(f"Max audio size: {config.max_audio_size} bytes")
         logger.info(f"Log level: {config.log_level}")
+        logger.info(f"Storage journal: {config.storage_journal}")
         
     except ValueError as e:
         # Configuration validation failed - refuse to start
@@ -65,12 +84,32 @@ async def lifespan(app: FastAPI):
         logger.error(f"Unexpected error during startup: {e}", exc_info=True)
         raise RuntimeError(f"Startup error: {e}") from e
     
+    # 后台压缩：定期把追加日志合并进快照，不占用请求路径。
+    # 只在 journal 模式下运行：否则没有追加日志可合并，而去掉派生心情行
+    # 只会让 moods.json 在两次读取之间发生变化
+    compactor = None
+    if config.storage_journal and config.compaction_interval > 0:
+        compactor = Compactor(
+            config.data_dir,
+            config.partition_roots,
+            interval=config.compaction_interval,
+            min_tail_bytes=config.compaction_min_tail_bytes
+        )
+        compactor.start()
+    
     logger.info("Application startup complete")
     
     yield
     
     # Shutdown
     logger.info("Shutting down Voice Text Processor application...")
+    if compactor is not None:
+        await compactor.stop()
+    global _job_manager
+    if _job_manager is not None:
+        await _job_manager.shutdown()
+        _job_manager = None
+    shutdown_pool()
     logger.info("Application shutdown complete")
 
 
@@ -79,9 +118,13 @@ app = FastAPI(
     title="Voice Text Processor",
     description="治愈系记录助手后端核心模块 - 语音和文本处理服务",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=JSONResponse
 )
 
+# 压缩大体积的 JSON 响应（brotli 可用时优先，否则 gzip）
+app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -98,11 +141,87 @@ app.add_middleware(
 
 # Mount static files for generated images
 from pathlib import Path
-from fastapi import Request
+from fastapi import Request, Response
 
 generated_images_dir = Path("generated_images")
 generated_images_dir.mkdir(exist_ok=True)
-app.mount("/generated_images", StaticFiles(directory="generated_images"), name="generated_images")
+# 所有用户共用的默认形象（不属于任何用户的图库）
+DEFAULT_CHARACTER_IMAGE = "default_character.jpeg"
+# 按 Accept 头和 ?w= 参数返回 WebP/AVIF 缩略图（存在时）
+app.mount("/generated_images", VariantStaticFiles(directory="generated_images"), name="generated_images")
+
+
+async def get_user_id(
+    x_user_id: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
+) -> str:
+    """Resolve the requesting user from the X-User-Id or Authorization header.
+    
+    Raises:
+        HTTPException: 400 if the supplied user id is invalid
+    """
+    try:
+        return resolve_user_id(x_user_id, authorization)
+    except InvalidUserIdError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
+@lru_cache(maxsize=8)
+def _get_ring(roots: Tuple[Path, ...]) -> HashRing:
+    """按数据根目录列表构建（并缓存）一致性哈希环"""
+    return ring_for_roots(roots)
+
+
+def get_user_data_dir(user_id: str) -> Path:
+    """获取用户的数据分区目录（每个用户的数据互相隔离，并按一致性哈希分布到各数据根目录）"""
+    config = get_config()
+    ring = _get_ring(tuple(config.partition_roots))
+    return partition_dir(config.data_dir, user_id, ring)
+
+
+def get_storage_service(user_id: str) -> StorageService:
+    """获取用户数据分区的存储服务（按配置决定是否启用追加日志）"""
+    return StorageService(
+        str(get_user_data_dir(user_id)),
+        journal=get_config().storage_journal
+    )
+
+
+def get_gallery(user_id: str) -> Gallery:
+    """获取用户的角色形象图库（清单保存在用户数据分区中，只列出该用户生成的图片）
+
+    图片文件统一存放在 generated_images 目录；默认用户的分区即数据目录本身，
+    首次使用时会把目录中已有的图片登记到它的清单里。
+    """
+    return Gallery(
+        generated_images_dir,
+        get_user_data_dir(user_id) / "gallery.json",
+        scan_existing=user_id == DEFAULT_USER_ID
+    )
+
+
+_job_manager: Optional[jobs.JobManager] = None
+
+# 进行中的聊天请求：重复提交的相同消息只调用一次 API
+_chat_inflight = SingleFlight()
+
+
+def _job_state_dir(user_id: str) -> Path:
+    """获取用户后台任务状态文件所在的目录（在用户数据分区中，供其他工作进程查询）"""
+    return get_user_data_dir(user_id) / "jobs"
+
+
+def get_job_manager() -> jobs.JobManager:
+    """获取后台任务管理器（每个工作进程一个，首次使用时按配置创建）"""
+    global _job_manager
+    if _job_manager is None:
+        config = get_config()
+        _job_manager = jobs.JobManager(
+            max_concurrent=config.image_job_concurrency,
+            max_per_user=config.image_jobs_per_user,
+            state_dir=_job_state_dir
+        )
+    return _job_manager
 
 
 def get_base_url(request: Request) -> str:
@@ -113,6 +232,44 @@ def get_base_url(request: Request) -> str:
     return f"{scheme}://{host}"
 
 
+def make_etag(*version_parts: str) -> str:
+    """Build a strong ETag from version tokens (and anything else the body depends on)."""
+    digest = hashlib.blake2b("|".join(version_parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request: Request, response: Response, *version_parts: str) -> Optional[Response]:
+    """Apply ETag validation to a read endpoint.
+    
+    The strong ETag is derived from storage version tokens, so it can be
+    checked before anything is read or serialized. Sets the ETag and
+    caching headers on ``response``.
+    
+    Args:
+        request: Incoming request (for If-None-Match)
+        response: Response whose headers are set
+        version_parts: Version tokens (and anything else the body depends on)
+    
+    Returns:
+        A 304 response if the client's copy is current, otherwise None
+    """
+    headers = {
+        "ETag": make_etag(*version_parts),
+        # 每次都向服务器验证；内容因用户而异，不能被共享缓存复用
+        "Cache-Control": "private, no-cache",
+        "Vary": "X-User-Id, Authorization"
+    }
+    response.headers.update(headers)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match 使用弱比较：忽略 W/ 前缀
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if headers["ETag"] in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
 @app.get("/api/status")
 async def root():
     """API status endpoint."""
@@ -159,28 +316,266 @@ class ValidationError(Exception):
 SUPPORTED_AUDIO_FORMATS = {".mp3", ".wav", ".m4a", ".webm"}
 
 
+async def read_audio_upload(audio: UploadFile, max_size: int) -> Tuple[bytes, str]:
+    """Validate and read an uploaded audio file.
+    
+    Args:
+        audio: Uploaded audio file
+        max_size: Maximum file size in bytes
+    
+    Returns:
+        Tuple of (audio content, file name)
+    
+    Raises:
+        ValidationError: If the format is unsupported or the file is too large
+    """
+    # Validate audio format
+    filename = audio.filename or "audio"
+    file_ext = "." + filename.split(".")[-1].lower() if "." in filename else ""
+    
+    if file_ext not in SUPPORTED_AUDIO_FORMATS:
+        raise ValidationError(
+            f"不支持的音频格式: {file_ext}. "
+            f"支持的格式: {', '.join(SUPPORTED_AUDIO_FORMATS)}"
+        )
+    
+    # Read audio file
+    audio_content = await audio.read()
+    
+    # Validate audio file size
+    if len(audio_content) > max_size:
+        raise ValidationError(
+            f"音频文件过大: {len(audio_content)} bytes. "
+            f"最大允许: {max_size} bytes"
+        )
+    
+    logger.info(
+        f"Audio file received: {filename}, "
+        f"size: {len(audio_content)} bytes"
+    )
+    return audio_content, filename
+
+
+async def prepare_audio(audio_content: bytes, filename: str) -> bytes:
+    """Shrink an uploaded recording for transcription (in a worker thread).
+    
+    Args:
+        audio_content: Uploaded audio file content
+        filename: Uploaded file name
+    
+    Returns:
+        The audio to send to the ASR API
+    """
+    if not get_config().audio_preprocessing:
+        return audio_content
+    audio_content, _ = await asyncio.to_thread(preprocess_audio, audio_content, filename)
+    return audio_content
+
+
+def save_parsed_record(
+    storage_service: StorageService,
+    input_type: str,
+    original_text: str,
+    parsed_data: ParsedData
+) -> ProcessResponse:
+    """Store a processed input with its mood, inspirations and todos.
+    
+    Args:
+        storage_service: Storage of the requesting user
+        input_type: ``audio`` or ``text``
+        original_text: Transcribed or submitted text
+        parsed_data: Result of semantic parsing
+    
+    Returns:
+        ProcessResponse describing the new record
+    
+    Raises:
+        StorageError: If saving fails
+    """
+    # Generate record ID and timestamp
+    record_id = str(uuid.uuid4())
+    record_timestamp = datetime.utcnow().isoformat() + "Z"
+    
+    # 直接由已校验的模型构建要写入的字典，不再经过 model_dump
+    parsed = parsed_data_row(parsed_data)
+    record = {
+        "record_id": record_id,
+        "timestamp": record_timestamp,
+        "input_type": input_type,
+        "original_text": original_text,
+        "parsed_data": parsed
+    }
+    
+    # Save to storage
+    try:
+        storage_service.save_record(record)
+        logger.info(f"Record saved: {record_id}")
+        
+        # Save mood if present
+        if parsed["mood"]:
+            storage_service.append_mood(
+                parsed["mood"],
+                record_id,
+                record_timestamp
+            )
+            logger.info(f"Mood data saved")
+        
+        # Save inspirations if present
+        if parsed["inspirations"]:
+            storage_service.append_inspirations(
+                parsed["inspirations"],
+                record_id,
+                record_timestamp
+            )
+            logger.info(
+                f"{len(parsed['inspirations'])} "
+                f"inspiration(s) saved"
+            )
+        
+        # Save todos if present
+        if parsed["todos"]:
+            storage_service.append_todos(
+                parsed["todos"],
+                record_id,
+                record_timestamp
+            )
+            logger.info(
+                f"{len(parsed['todos'])} "
+                f"todo(s) saved"
+            )
+        
+    except StorageError as e:
+        logger.error(
+            f"Storage error: {str(e)}",
+            exc_info=True
+        )
+        raise
+    
+    # Build success response
+    return ProcessResponse(
+        record_id=record_id,
+        timestamp=record_timestamp,
+        mood=parsed_data.mood,
+        inspirations=parsed_data.inspirations,
+        todos=parsed_data.todos
+    )
+
+
 @app.post("/api/process", response_model=ProcessResponse)
 async def process_input(
+    response: Response,
     audio: Optional[UploadFile] = File(None),
-    text: Optional[str] = Form(None)
+    text: Optional[str] = Form(None),
+    user_id: str = Depends(get_user_id),
+    idempotency_key: Optional[str] = Header(None)
 ) -> ProcessResponse:
     """Process user input (audio or text) and extract structured data.
     
     This endpoint accepts either an audio file or text content, performs
     speech recognition (if audio), semantic parsing, and stores the results.
     
+    With an ``Idempotency-Key`` header, retries of a request are free: the
+    response of the first successful attempt is replayed (with an
+    ``Idempotent-Replayed: true`` header) without calling the upstream APIs
+    or storing another record, and attempts arriving while the first one is
+    running wait for it, whichever worker they reach (409 if it is still
+    running after a minute). Reusing a key for a different text or audio
+    file is rejected with 422.
+    
     Args:
+        response: Response whose headers are set
         audio: Audio file (multipart/form-data) in mp3, wav, or m4a format
         text: Text content (application/json) in UTF-8 encoding
+        user_id: Requesting user, resolved from headers (selects the data partition)
+        idempotency_key: Client-chosen key shared by all attempts of one request
     
     Returns:
         ProcessResponse containing record_id, timestamp, mood, inspirations, todos
     
-    Raises:
-        HTTPException: With appropriate status code and error message
-    
     Requirements: 1.1, 1.2, 1.3, 7.7, 8.1, 8.2, 8.3, 8.4, 8.5, 8.6, 9.1, 9.2, 9.3, 9.4, 9.5
     """
+    if idempotency_key is None:
+        return await handle_process_input(audio, text, user_id)
+    
+    try:
+        key = validate_key(idempotency_key)
+    except IdempotencyKeyError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": e.message,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        )
+    
+    try:
+        result, replayed = await IdempotencyStore(get_storage_service(user_id)).run(
+            key,
+            await request_fingerprint(audio, text),
+            lambda: handle_process_input(audio, text, user_id),
+            # 只保存成功的结果（省略默认值以缩小幂等文件），失败后的重试会重新执行
+            to_json=lambda value: (
+                value.model_dump(exclude_defaults=True) if isinstance(value, ProcessResponse) else None
+            ),
+            from_json=ProcessResponse.model_validate
+        )
+    except IdempotencyConflictError as e:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "error": e.message,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        )
+    except IdempotencyPendingError as e:
+        return JSONResponse(
+            status_code=409,
+            content={
+                "error": e.message,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            },
+            headers={"Retry-After": "5"}
+        )
+    except StorageError as e:
+        logger.error(f"Idempotency store error: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": "数据存储失败",
+                "detail": str(e),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        )
+    if replayed and isinstance(result, ProcessResponse):
+        logger.info(f"Replaying response for Idempotency-Key {key}")
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def request_fingerprint(audio: Optional[UploadFile], text: Optional[str]) -> str:
+    """Hash the body of a /api/process request (text, or audio name and content)."""
+    if audio is None:
+        return make_key("text", text or "")
+    content = await audio.read()
+    await audio.seek(0)
+    return make_key("audio", audio.filename or "", content, text or "")
+
+
+async def handle_process_input(
+    audio: Optional[UploadFile],
+    text: Optional[str],
+    user_id: str
+):
+    """Run ASR (for audio), semantic parsing and storage for /api/process.
+    
+    Args:
+        audio: Uploaded audio file, if any
+        text: Text content, if any
+        user_id: Requesting user
+    
+    Returns:
+        ProcessResponse, or a JSONResponse with status 400/500 on errors
+    """
     request_id = str(uuid.uuid4())
     timestamp = datetime.utcnow().isoformat() + "Z"
     
@@ -201,9 +596,12 @@ async def process_input(
         config = get_config()
         
         # Initialize services
-        storage_service = StorageService(str(config.data_dir))
+        storage_service = get_storage_service(user_id)
         asr_service = ASRService(config.zhipu_api_key)
-        parser_service = SemanticParserService(config.zhipu_api_key)
+        parser_service = SemanticParserService(
+            config.zhipu_api_key,
+            fast_path_threshold=config.fast_path_threshold
+        )
         
         original_text = ""
         input_type = "text"
@@ -213,30 +611,8 @@ async def process_input(
             if audio is not None:
                 input_type = "audio"
                 
-                # Validate audio format
-                filename = audio.filename or "audio"
-                file_ext = "." + filename.split(".")[-1].lower() if "." in filename else ""
-                
-                if file_ext not in SUPPORTED_AUDIO_FORMATS:
-                    raise ValidationError(
-                        f"不支持的音频格式: {file_ext}. "
-                        f"支持的格式: {', '.join(SUPPORTED_AUDIO_FORMATS)}"
-                    )
-                
-                # Read audio file
-                audio_content = await audio.read()
-                
-                # Validate audio file size
-                if len(audio_content) > config.max_audio_size:
-                    raise ValidationError(
-                        f"音频文件过大: {len(audio_content)} bytes. "
-                        f"最大允许: {config.max_audio_size} bytes"
-                    )
-                
-                logger.info(
-                    f"Audio file received: {filename}, "
-                    f"size: {len(audio_content)} bytes"
-                )
+                audio_content, filename = await read_audio_upload(audio, config.max_audio_size)
+                audio_content = await prepare_audio(audio_content, filename)
                 
                 # Transcribe audio to text
                 try:
@@ -281,71 +657,9 @@ async def process_input(
                 )
                 raise
             
-            # Generate record ID and timestamp
-            record_id = str(uuid.uuid4())
-            record_timestamp = datetime.utcnow().isoformat() + "Z"
-            
-            # Create record data
-            record = RecordData(
-                record_id=record_id,
-                timestamp=record_timestamp,
-                input_type=input_type,
-                original_text=original_text,
-                parsed_data=parsed_data
-            )
-            
-            # Save to storage
-            try:
-                storage_service.save_record(record)
-                logger.info(f"Record saved: {record_id}")
-                
-                # Save mood if present
-                if parsed_data.mood:
-                    storage_service.append_mood(
-                        parsed_data.mood,
-                        record_id,
-                        record_timestamp
-                    )
-                    logger.info(f"Mood data saved")
-                
-                # Save inspirations if present
-                if parsed_data.inspirations:
-                    storage_service.append_inspirations(
-                        parsed_data.inspirations,
-                        record_id,
-                        record_timestamp
-                    )
-                    logger.info(
-                        f"{len(parsed_data.inspirations)} "
-                        f"inspiration(s) saved"
-                    )
-                
-                # Save todos if present
-                if parsed_data.todos:
-                    storage_service.append_todos(
-                        parsed_data.todos,
-                        record_id,
-                        record_timestamp
-                    )
-                    logger.info(
-                        f"{len(parsed_data.todos)} "
-                        f"todo(s) saved"
-                    )
-                
-            except StorageError as e:
-                logger.error(
-                    f"Storage error: {str(e)}",
-                    exc_info=True
-                )
-                raise
-            
-            # Build success response
-            response = ProcessResponse(
-                record_id=record_id,
-                timestamp=record_timestamp,
-                mood=parsed_data.mood,
-                inspirations=parsed_data.inspirations,
-                todos=parsed_data.todos
+            # 存储写入会等待文件锁，放到线程中执行，不阻塞事件循环
+            response = await asyncio.to_thread(
+                save_parsed_record, storage_service, input_type, original_text, parsed_data
             )
             
             logger.info(f"Request processed successfully")
@@ -439,13 +753,105 @@ async def process_input(
         )
 
 
+@app.post("/api/process/stream")
+async def process_input_stream(
+    audio: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    user_id: str = Depends(get_user_id)
+):
+    """Process user input like ``/api/process``, streaming progress as SSE.
+    
+    Audio is transcribed with the ASR API's streaming mode. The response is
+    a ``text/event-stream`` with these events:
+    
+    - ``transcript``: ``{"text", "final"}`` live captions (audio only); the
+      final transcript is parsed at once in the same request
+    - ``result``: the ProcessResponse of the stored record
+    - ``error``: ``{"error", "detail"}`` if transcription, parsing or
+      storage failed
+    
+    Args:
+        audio: Audio file in mp3, wav, m4a or webm format
+        text: Text content
+        user_id: Requesting user, resolved from headers
+    
+    Returns:
+        Event stream, or a JSON error (400) if the input is invalid
+    """
+    request_id = str(uuid.uuid4())
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    config = get_config()
+    
+    # 输入校验在开始推送之前完成，错误时直接返回 400
+    try:
+        if audio is None and text is None:
+            raise ValidationError("请提供音频文件或文本内容")
+        if audio is not None and text is not None:
+            raise ValidationError("请只提供音频文件或文本内容中的一种")
+        if audio is not None:
+            audio_content, filename = await read_audio_upload(audio, config.max_audio_size)
+        elif text == "":
+            raise ValidationError("文本内容不能为空")
+    except ValidationError as e:
+        logger.warning(f"Validation error: {e.message}")
+        return JSONResponse(status_code=400, content={"error": e.message, "timestamp": timestamp})
+    
+    async def events():
+        set_request_id(request_id)
+        storage_service = get_storage_service(user_id)
+        asr_service = ASRService(config.zhipu_api_key)
+        parser_service = SemanticParserService(
+            config.zhipu_api_key,
+            fast_path_threshold=config.fast_path_threshold
+        )
+        try:
+            original_text = text
+            input_type = "text"
+            if audio is not None:
+                input_type = "audio"
+                prepared = await prepare_audio(audio_content, filename)
+                async for update in asr_service.transcribe_stream(prepared, filename):
+                    yield format_event("transcript", update)
+                    original_text = update["text"]
+            
+            # 最后一段转写到达后立即解析，无需客户端再发起请求
+            parsed_data = await parser_service.parse(original_text)
+            response = await asyncio.to_thread(
+                save_parsed_record, storage_service, input_type, original_text, parsed_data
+            )
+            logger.info("Streaming request processed successfully")
+            yield format_event("result", response.model_dump())
+        
+        except ASRServiceError as e:
+            logger.error(f"ASR service unavailable: {e.message}")
+            yield format_event("error", {"error": "语音识别服务不可用", "detail": e.message, "timestamp": timestamp})
+        except SemanticParserError as e:
+            logger.error(f"Semantic parser unavailable: {e.message}")
+            yield format_event("error", {"error": "语义解析服务不可用", "detail": e.message, "timestamp": timestamp})
+        except StorageError as e:
+            logger.error(f"Storage error: {str(e)}")
+            yield format_event("error", {"error": "数据存储失败", "detail": str(e), "timestamp": timestamp})
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+            yield format_event("error", {"error": "服务器内部错误", "detail": str(e), "timestamp": timestamp})
+        finally:
+            await asr_service.close()
+            await parser_service.close()
+            clear_request_id()
+    
+    return EventStreamResponse(events())
+
+
 @app.get("/api/records")
-async def get_records():
-    """Get all records."""
+async def get_records(request: Request, response: Response, user_id: str = Depends(get_user_id)):
+    """Get all records of the requesting user (304 if unchanged)."""
     try:
-        config = get_config()
-        storage_service = StorageService(str(config.data_dir))
-        records = storage_service._read_json_file(storage_service.records_file)
+        storage_service = get_storage_service(user_id)
+        version = await asyncio.to_thread(storage_service.version, storage_service.records_file)
+        cached = not_modified(request, response, user_id, version)
+        if cached:
+            return cached
+        records = await asyncio.to_thread(storage_service.read_collection, storage_service.records_file)
         return {"records": records}
     except Exception as e:
         logger.error(f"Failed to get records: {e}")
@@ -456,58 +862,20 @@ async def get_records():
 
 
 @app.get("/api/moods")
-async def get_moods():
-    """Get all moods from both moods.json and records.json."""
+async def get_moods(request: Request, response: Response, user_id: str = Depends(get_user_id)):
+    """Get all moods from both moods.json and records.json (304 if unchanged)."""
     try:
-        config = get_config()
-        storage_service = StorageService(str(config.data_dir))
-        
-        # 1. 读取 moods.json
-        moods_from_file = storage_service._read_json_file(storage_service.moods_file)
-        logger.info(f"Loaded {len(moods_from_file)} moods from moods.json")
-        
-        # 2. 从 records.json 中提取心情数据
-        records = storage_service._read_json_file(storage_service.records_file)
-        moods_from_records = []
-        
-        for record in records:
-            # 检查 parsed_data 中是否有 mood
-            parsed_data = record.get("parsed_data", {})
-            mood_data = parsed_data.get("mood")
-            
-            if mood_data and mood_data.get("type"):
-                # 构造心情对象
-                mood_obj = {
-                    "record_id": record["record_id"],
-                    "timestamp": record["timestamp"],
-                    "type": mood_data.get("type"),
-                    "intensity": mood_data.get("intensity", 5),
-                    "keywords": mood_data.get("keywords", []),
-                    "original_text": record.get("original_text", "")  # 添加原文
-                }
-                moods_from_records.append(mood_obj)
-        
-        logger.info(f"Extracted {len(moods_from_records)} moods from records.json")
-        
-        # 3. 合并两个来源的心情数据（去重，优先使用 records 中的数据）
-        # 同时需要补充 moods.json 中缺失的 original_text
-        mood_dict = {}
-        
-        # 先添加 moods.json 中的数据
-        for mood in moods_from_file:
-            mood_dict[mood["record_id"]] = mood
-            # 如果没有 original_text，设置为空字符串
-            if "original_text" not in mood:
-                mood["original_text"] = ""
-        
-        # 再添加/覆盖 records.json 中的数据（包含 original_text）
-        for mood in moods_from_records:
-            mood_dict[mood["record_id"]] = mood
-        
-        # 转换为列表并按时间排序（最新的在前）
-        all_moods = list(mood_dict.values())
-        all_moods.sort(key=lambda x: x["timestamp"], reverse=True)
+        storage_service = get_storage_service(user_id)
+        version = await asyncio.to_thread(
+            storage_service.version, storage_service.records_file, storage_service.moods_file
+        )
+        cached = not_modified(request, response, user_id, version)
+        if cached:
+            return cached
         
+        # 合并 moods.json 与 records.json 中的心情（优先使用 records 中的数据），
+        # 合并结果在两个文件未变化时直接复用缓存
+        all_moods = await asyncio.to_thread(storage_service.get_mood_timeline)
         logger.info(f"Total unique moods: {len(all_moods)}")
         
         return {"moods": all_moods}
@@ -520,12 +888,15 @@ async def get_moods():
 
 
 @app.get("/api/inspirations")
-async def get_inspirations():
-    """Get all inspirations."""
+async def get_inspirations(request: Request, response: Response, user_id: str = Depends(get_user_id)):
+    """Get all inspirations of the requesting user (304 if unchanged)."""
     try:
-        config = get_config()
-        storage_service = StorageService(str(config.data_dir))
-        inspirations = storage_service._read_json_file(storage_service.inspirations_file)
+        storage_service = get_storage_service(user_id)
+        version = await asyncio.to_thread(storage_service.version, storage_service.inspirations_file)
+        cached = not_modified(request, response, user_id, version)
+        if cached:
+            return cached
+        inspirations = await asyncio.to_thread(storage_service.read_collection, storage_service.inspirations_file)
         return {"inspirations": inspirations}
     except Exception as e:
         logger.error(f"Failed to get inspirations: {e}")
@@ -536,12 +907,15 @@ async def get_inspirations():
 
 
 @app.get("/api/todos")
-async def get_todos():
-    """Get all todos."""
+async def get_todos(request: Request, response: Response, user_id: str = Depends(get_user_id)):
+    """Get all todos of the requesting user (304 if unchanged)."""
     try:
-        config = get_config()
-        storage_service = StorageService(str(config.data_dir))
-        todos = storage_service._read_json_file(storage_service.todos_file)
+        storage_service = get_storage_service(user_id)
+        version = await asyncio.to_thread(storage_service.version, storage_service.todos_file)
+        cached = not_modified(request, response, user_id, version)
+        if cached:
+            return cached
+        todos = await asyncio.to_thread(storage_service.read_collection, storage_service.todos_file)
         return {"todos": todos}
     except Exception as e:
         logger.error(f"Failed to get todos: {e}")
@@ -551,30 +925,131 @@ async def get_todos():
         )
 
 
-@app.patch("/api/todos/{todo_id}")
-async def update_todo(todo_id: str, status: str = Form(...)):
-    """Update todo status."""
+def _collect_changes(storage_service: StorageService, since: int) -> dict:
+    """Build the /api/sync response (reads storage, run in a thread)."""
+    seq, changes = storage_service.changes_since(since)
+
+    if changes is None or since == 0 or since > seq:
+        return {
+            "seq": seq,
+            "full": True,
+            "records": storage_service.read_collection(storage_service.records_file),
+            "moods": storage_service.get_mood_timeline(),
+            "inspirations": storage_service.read_collection(storage_service.inspirations_file),
+            "todos": storage_service.read_collection(storage_service.todos_file)
+        }
+
+    # 记录或心情变化时，返回该记录在心情时间线中的条目
+    changed_moods = {
+        row["record_id"]
+        for row in changes["records.json"] + changes["moods.json"]
+    }
+    moods = [
+        mood for mood in storage_service.get_mood_timeline()
+        if mood["record_id"] in changed_moods
+    ] if changed_moods else []
+    return {
+        "seq": seq,
+        "full": False,
+        "records": changes["records.json"],
+        "moods": moods,
+        "inspirations": changes["inspirations.json"],
+        "todos": changes["todos.json"]
+    }
+
+
+@app.get("/api/sync")
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    user_id: str = Depends(get_user_id)
+):
+    """Get the rows inserted or updated after a change sequence number.
+
+    Clients keep a local replica: they start with ``since=0`` (a full copy
+    of every collection, ``"full": true``), then pass the returned ``seq``
+    to get only the rows changed in between. Changed rows replace the
+    replica's rows with the same identity. A ``since`` ahead of the server
+    (e.g. after the data was reset) or older than the oldest change still
+    logged also yields a full copy.
+
+    Moods are returned as entries of the mood timeline (as ``/api/moods``).
+    """
     try:
-        config = get_config()
-        storage_service = StorageService(str(config.data_dir))
-        todos = storage_service._read_json_file(storage_service.todos_file)
+        storage_service = get_storage_service(user_id)
+        return await asyncio.to_thread(_collect_changes, storage_service, since)
+    except Exception as e:
+        logger.error(f"Failed to sync changes: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+@app.patch("/api/todos")
+async def update_todos(
+    updates: List[TodoUpdate],
+    user_id: str = Depends(get_user_id)
+):
+    """Apply a batch of todo changes in one storage write.
+    
+    The body is a JSON list of ``{"todo_id": ..., "status": ..., ...}``
+    objects. Either all changes are applied or, if a todo_id is unknown,
+    none of them (HTTP 404 listing the missing ids).
+    """
+    try:
+        storage_service = get_storage_service(user_id)
+        updated, missing = await asyncio.to_thread(
+            storage_service.update_todos,
+            [(update.todo_id, update.changes()) for update in updates]
+        )
         
-        # Find and update todo
-        updated = False
-        for todo in todos:
-            if todo.get("record_id") == todo_id or str(hash(todo.get("task", ""))) == todo_id:
-                todo["status"] = status
-                updated = True
+        if missing:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "Todo not found", "missing": missing}
+            )
+        return {"success": True, "todos": updated}
+    except Exception as e:
+        logger.error(f"Failed to update todos: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+def _update_todo_status(storage_service: StorageService, todo_id: str, status: str) -> Optional[dict]:
+    """Set the status of a todo addressed by todo_id or (legacy) record_id.
+
+    Returns:
+        The updated todo, or None if no todo matches
+    """
+    updated = storage_service.update_todo(todo_id, {"status": status})
+    if updated is None:
+        # 兼容旧客户端：按 record_id 定位该记录的第一个待办
+        for todo in storage_service.read_collection(storage_service.todos_file):
+            if todo.get("record_id") == todo_id:
+                updated = storage_service.update_todo(todo["todo_id"], {"status": status})
                 break
+    return updated
+
+
+@app.patch("/api/todos/{todo_id}")
+async def update_todo(
+    todo_id: str,
+    status: str = Form(...),
+    user_id: str = Depends(get_user_id)
+):
+    """Update the status of one todo, addressed by its todo_id."""
+    try:
+        storage_service = get_storage_service(user_id)
+        updated = await asyncio.to_thread(_update_todo_status, storage_service, todo_id, status)
         
-        if not updated:
+        if updated is None:
             return JSONResponse(
                 status_code=404,
                 content={"error": "Todo not found"}
             )
-        
-        storage_service._write_json_file(storage_service.todos_file, todos)
-        return {"success": True}
+        return {"success": True, "todo": updated}
     except Exception as e:
         logger.error(f"Failed to update todo: {e}")
         return JSONResponse(
@@ -584,7 +1059,7 @@ async def update_todo(todo_id: str, status: str = Form(...)):
 
 
 @app.post("/api/chat")
-async def chat_with_ai(text: str = Form(...)):
+async def chat_with_ai(text: str = Form(...), user_id: str = Depends(get_user_id)):
     """Chat with AI assistant using RAG with records.json as knowledge base.
     
     This endpoint provides conversational AI that has context about the user's
@@ -592,10 +1067,10 @@ async def chat_with_ai(text: str = Form(...)):
     """
     try:
         config = get_config()
-        storage_service = StorageService(str(config.data_dir))
+        storage_service = get_storage_service(user_id)
         
         # Load user's records as RAG knowledge base
-        records = storage_service._read_json_file(storage_service.records_file)
+        records = await asyncio.to_thread(storage_service.read_collection, storage_service.records_file)
         
         # Build context from recent records (last 10)
         recent_records = records[-10:] if len(records) > 10 else records
@@ -642,39 +1117,44 @@ async def chat_with_ai(text: str = Form(...)):
         try:
             import httpx
             
-            # 增加超时时间，添加重试逻辑
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://open.bigmodel.cn/api/paas/v4/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {config.zhipu_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "glm-4-flash",
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": system_prompt
-                            },
-                            {
-                                "role": "user",
-                                "content": text
-                            }
-                        ],
-                        "temperature": 0.8,
-                        "top_p": 0.9
-                    }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    ai_response = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    logger.info(f"AI chat successful with RAG context")
-                    return {"response": ai_response}
-                else:
-                    logger.error(f"AI chat failed: {response.status_code} {response.text}")
-                    return {"response": "抱歉，我现在有点累了，稍后再聊好吗？"}
+            async def ask() -> httpx.Response:
+                # 增加超时时间，添加重试逻辑
+                async with httpx.AsyncClient(timeout=60.0) as client:
+                    return await client.post(
+                        "https://open.bigmodel.cn/api/paas/v4/chat/completions",
+                        headers={
+                            "Authorization": f"Bearer {config.zhipu_api_key}",
+                            "Content-Type": "application/json"
+                        },
+                        json={
+                            "model": "glm-4-flash",
+                            "messages": [
+                                {
+                                    "role": "system",
+                                    "content": system_prompt
+                                },
+                                {
+                                    "role": "user",
+                                    "content": text
+                                }
+                            ],
+                            "temperature": 0.8,
+                            "top_p": 0.9
+                        }
+                    )
+            
+            # 系统提示词包含该用户的历史记录，因此相同的键只会来自同一用户的重复提交
+            key = make_key("glm-4-flash", system_prompt, normalize_text(text))
+            response = await _chat_inflight.do(key, ask)
+            
+            if response.status_code == 200:
+                result = response.json()
+                ai_response = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+                logger.info(f"AI chat successful with RAG context")
+                return {"response": ai_response}
+            else:
+                logger.error(f"AI chat failed: {response.status_code} {response.text}")
+                return {"response": "抱歉，我现在有点累了，稍后再聊好吗？"}
         
         except httpx.TimeoutException:
             logger.error(f"AI API timeout")
@@ -691,29 +1171,84 @@ async def chat_with_ai(text: str = Form(...)):
         return {"response": "抱歉，我现在有点累了，稍后再聊好吗？"}
 
 
+def _file_version(path: Path) -> str:
+    """Get a token that changes whenever a file is replaced ("0" if it does not exist)."""
+    try:
+        st = path.stat()
+    except OSError:
+        return "0"
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _local_character_image(image_url: Optional[str]) -> Optional[Path]:
+    """Find the local file of a configured character image.
+    
+    Args:
+        image_url: ``character.image_url`` of the user configuration
+    
+    Returns:
+        Path of the existing file, or None for remote URLs and missing files
+    """
+    if not image_url or image_url.startswith('http'):
+        return None
+    # 本地路径（处理 Windows 和 Unix 路径）；不存在时尝试只使用文件名
+    image_path = Path(image_url)
+    if image_path.exists():
+        return image_path
+    full_path = Path("generated_images") / image_path.name
+    return full_path if full_path.exists() else None
+
+
+def _load_user_config(user_config, default_image: Path) -> Tuple[dict, Tuple[str, ...]]:
+    """Load a user configuration with the version tokens its response depends on.
+    
+    Args:
+        user_config: UserConfig of the user
+        default_image: Default character image used while none is set
+    
+    Returns:
+        Tuple of (configuration, version tokens of the configuration file,
+        the gallery manifest and the character image file)
+    """
+    # 先取版本再读取内容：两者之间发生的修改只会让下一次请求重新返回内容
+    config_version = user_config.version()
+    gallery_version = get_gallery(user_config.user_id).version()
+    config = user_config.load_config()
+    image_url = config.get('character', {}).get('image_url')
+    image_file = _local_character_image(image_url) if image_url else default_image
+    image_version = f"{image_file}:{_file_version(image_file)}" if image_file else "0"
+    return config, (config_version, gallery_version, image_version)
+
+
 @app.get("/api/user/config")
-async def get_user_config(request: Request):
-    """Get user configuration including character image."""
+async def get_user_config(request: Request, response: Response, user_id: str = Depends(get_user_id)):
+    """Get user configuration including character image (304 if unchanged).
+    
+    The ETag covers everything the body depends on: the configuration file,
+    the gallery manifest (the latest image is used when none is set), the
+    image file the URL is built from (or the default image while none is
+    set) and the request's base URL.
+    """
     try:
         from app.user_config import UserConfig
-        from pathlib import Path
-        import os
-        
-        config = get_config()
-        user_config = UserConfig(str(config.data_dir))
-        user_data = user_config.load_config()
         
+        user_config = UserConfig(str(get_user_data_dir(user_id)), user_id)
+        generated_images_dir = Path("generated_images")
+        default_image = generated_images_dir / DEFAULT_CHARACTER_IMAGE
         base_url = get_base_url(request)
         
+        user_data, versions = await asyncio.to_thread(_load_user_config, user_config, default_image)
+        cached = not_modified(request, response, user_id, *versions, base_url)
+        if cached:
+            return cached
+        
         # 如果没有保存的图片，尝试加载默认形象或最新的本地图片
         if not user_data.get('character', {}).get('image_url'):
-            generated_images_dir = Path("generated_images")
-            default_image = generated_images_dir / "default_character.jpeg"
-            
             # 优先使用默认形象
             if default_image.exists():
                 logger.info("Loading default character image")
-                user_config.save_character_image(
+                await asyncio.to_thread(
+                    user_config.save_character_image,
                     image_url=str(default_image),
                     prompt="默认治愈系小猫形象",
                     preferences={
@@ -723,59 +1258,38 @@ async def get_user_config(request: Request):
                         "role": "陪伴式朋友"
                     }
                 )
-                user_data = user_config.load_config()
                 logger.info("Default character image loaded successfully")
             
-            # 如果没有默认形象，尝试加载最新的本地图片
-            elif generated_images_dir.exists():
-                # 获取所有图片文件
-                image_files = list(generated_images_dir.glob("character_*.jpeg"))
-                if image_files:
-                    # 按修改时间排序，获取最新的
-                    latest_image = max(image_files, key=lambda p: p.stat().st_mtime)
-                    
-                    # 构建 URL 路径（使用动态 base_url）
-                    image_url = f"{base_url}/generated_images/{latest_image.name}"
+            # 如果没有默认形象，尝试加载图库中最新的图片
+            else:
+                latest_image = await asyncio.to_thread(get_gallery(user_id).latest)
+                if latest_image:
+                    image_path = generated_images_dir / latest_image["filename"]
+                    color = latest_image["color"]
+                    personality = latest_image["personality"]
                     
-                    # 从文件名提取偏好设置
-                    # 格式: character_颜色_性格_时间戳.jpeg
-                    parts = latest_image.stem.split('_')
-                    if len(parts) >= 3:
-                        color = parts[1]
-                        personality = parts[2]
-                        
-                        # 更新配置
-                        user_config.save_character_image(
-                            image_url=str(latest_image),
-                            prompt=f"Character with {color} and {personality}",
-                            preferences={
-                                "color": color,
-                                "personality": personality,
-                                "appearance": "无配饰",
-                                "role": "陪伴式朋友"
-                            }
-                        )
-                        
-                        # 重新加载配置
-                        user_data = user_config.load_config()
-                        
-                        logger.info(f"Loaded latest local image: {latest_image.name}")
+                    # 更新配置
+                    await asyncio.to_thread(
+                        user_config.save_character_image,
+                        image_url=str(image_path),
+                        prompt=f"Character with {color} and {personality}",
+                        preferences={
+                            "color": color,
+                            "personality": personality,
+                            "appearance": latest_image.get("appearance") or "无配饰",
+                            "role": latest_image.get("role") or "陪伴式朋友"
+                        }
+                    )
+                    logger.info(f"Loaded latest local image: {latest_image['filename']}")
+            
+            # 配置可能刚被写入，重新读取并按写入后的版本计算 ETag
+            user_data, versions = await asyncio.to_thread(_load_user_config, user_config, default_image)
+            response.headers["ETag"] = make_etag(user_id, *versions, base_url)
         
-        # 如果 image_url 是本地路径，转换为 URL
-        image_url = user_data.get('character', {}).get('image_url')
-        if image_url and not image_url.startswith('http'):
-            # 本地路径，转换为 URL（处理 Windows 和 Unix 路径）
-            image_path = Path(image_url)
-            if image_path.exists():
-                # 使用正斜杠构建 URL（使用动态 base_url）
-                user_data['character']['image_url'] = f"{base_url}/generated_images/{image_path.name}"
-            else:
-                # 如果路径不存在，尝试只使用文件名
-                filename = image_path.name
-                full_path = Path("generated_images") / filename
-                if full_path.exists():
-                    user_data['character']['image_url'] = f"{base_url}/generated_images/{filename}"
-                    logger.info(f"Converted path to URL: {filename}")
+        # 如果 image_url 是本地路径，转换为 URL（使用动态 base_url）
+        image_file = _local_character_image(user_data.get('character', {}).get('image_url'))
+        if image_file:
+            user_data['character']['image_url'] = f"{base_url}/generated_images/{image_file.name}"
         
         return user_data
     except Exception as e:
@@ -786,149 +1300,232 @@ async def get_user_config(request: Request):
         )
 
 
+def _image_error_detail(message: str) -> str:
+    """Turn an image generation error into a user-friendly message."""
+    if "invalid api key" in message.lower():
+        return "API 密钥无效，请检查 MINIMAX_API_KEY 配置是否正确"
+    if "quota" in message.lower() or "配额" in message:
+        return "API 配额不足，请充值或等待配额恢复"
+    if "timeout" in message.lower() or "超时" in message:
+        return "请求超时，请检查网络连接后重试"
+    return message
+
+
+def _minimax_not_configured() -> JSONResponse:
+    """Build the error response for a missing MiniMax API key."""
+    logger.warning("MiniMax API key not configured")
+    return JSONResponse(
+        status_code=400,
+        content={
+            "error": "MiniMax API 未配置",
+            "detail": "请在 .env 文件中配置 MINIMAX_API_KEY。访问 https://platform.minimaxi.com/ 获取 API 密钥。"
+        }
+    )
+
+
+def _serve_cached_character(
+    base_url: str, user_id: str, preferences: dict, prompt: str, force_new: bool
+) -> Optional[dict]:
+    """Select an image already generated for the prompt, if there is one.
+    
+    Returns:
+        The generation result for the cached image, or None
+    """
+    from app.user_config import UserConfig
+    
+    cached_image = None if force_new else get_gallery(user_id).find_by_prompt(prompt)
+    if not cached_image:
+        return None
+    UserConfig(str(get_user_data_dir(user_id)), user_id).save_character_image(
+        image_url=str(generated_images_dir / cached_image["filename"]),
+        prompt=prompt,
+        preferences=preferences
+    )
+    logger.info(f"Serving cached character image: {cached_image['filename']}")
+    return {
+        "success": True,
+        "image_url": f"{base_url}/generated_images/{cached_image['filename']}",
+        "prompt": prompt,
+        "preferences": preferences,
+        "task_id": None,
+        "cached": True
+    }
+
+
+async def _create_character_image(
+    base_url: str,
+    user_id: str,
+    preferences: dict,
+    on_progress: Optional[Callable[[str], None]] = None
+) -> dict:
+    """Generate a character image, download it and make it the user's image.
+    
+    Args:
+        base_url: Base URL for the returned image URL
+        user_id: User whose configuration is updated
+        preferences: color/personality/appearance/role
+        on_progress: Called with ``generating`` and ``downloading``
+    
+    Returns:
+        JSON-serializable result with image_url, prompt and preferences
+    
+    Raises:
+        ImageGenerationError: If the image could not be generated
+    """
+    from app.image_service import ImageGenerationService
+    from app.user_config import UserConfig
+    
+    config = get_config()
+    image_service = ImageGenerationService(
+        api_key=config.minimax_api_key,
+        group_id=getattr(config, 'minimax_group_id', None)
+    )
+    user_config = UserConfig(str(get_user_data_dir(user_id)), user_id)
+    color = preferences["color"]
+    personality = preferences["personality"]
+    
+    try:
+        logger.info(
+            f"Generating character image: "
+            f"color={color}, personality={personality}, "
+            f"appearance={preferences['appearance']}, role={preferences['role']}"
+        )
+        if on_progress:
+            on_progress(jobs.GENERATING)
+        
+        # 生成图像
+        result = await image_service.generate_image(
+            **preferences,
+            aspect_ratio="1:1",
+            n=1
+        )
+        if on_progress:
+            on_progress(jobs.DOWNLOADING)
+        
+        # 下载图片到本地
+        generated_images_dir.mkdir(exist_ok=True)
+        
+        # 生成文件名：character_颜色_性格_时间戳.jpeg（精确到微秒，文件写入后不再被覆盖）
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"character_{color}_{personality}_{timestamp}.jpeg"
+        local_path = generated_images_dir / filename
+        
+        logger.info(f"Downloading image to: {local_path}")
+        
+        # 下载图片（复用服务的连接池，流式写入临时文件后原子替换）。
+        # 用户配置在下载结束后再保存：任务在下载中被取消时配置保持不变，
+        # 不会指向从未写入的文件
+        try:
+            await image_service.download_image(result['url'], str(local_path))
+        except Exception as e:
+            # 如果下载失败，仍然使用远程 URL
+            logger.error(f"Failed to download image: {e}")
+            local_path = None
+        
+        image_url = str(local_path) if local_path else result['url']
+        await asyncio.to_thread(
+            user_config.save_character_image,
+            image_url=image_url,
+            prompt=result['prompt'],
+            revised_prompt=result.get('metadata', {}).get('revised_prompt'),
+            preferences=preferences
+        )
+        if local_path:
+            # 登记到图库清单，并在进程池中生成缩略图和 WebP/AVIF 版本，不阻塞本次请求
+            await asyncio.to_thread(
+                get_gallery(user_id).add, local_path, preferences, result['prompt']
+            )
+            schedule_variants(local_path, generated_images_dir)
+        
+        logger.info(f"Character image generated and saved: {image_url}")
+        
+        # 返回 HTTP URL（使用动态 base_url）
+        if local_path:
+            http_url = f"{base_url}/generated_images/{local_path.name}"
+        else:
+            http_url = image_url
+        
+        return {
+            "success": True,
+            "image_url": http_url,
+            "prompt": result['prompt'],
+            "preferences": preferences,
+            "task_id": result.get('task_id'),
+            "cached": False
+        }
+    
+    finally:
+        await image_service.close()
+
+
 @app.post("/api/character/generate")
 async def generate_character(
     request: Request,
     color: str = Form(...),
     personality: str = Form(...),
     appearance: str = Form(...),
-    role: str = Form(...)
+    role: str = Form(...),
+    force_new: bool = Form(False),
+    user_id: str = Depends(get_user_id)
 ):
     """Generate AI character image based on preferences.
     
+    The prompt is fully determined by the preferences, so an image already
+    generated for the same prompt is returned immediately unless
+    ``force_new`` is set. This request stays open while the image is
+    generated; ``POST /api/character/jobs`` runs the same work in the
+    background instead. New images count against the same concurrency and
+    per-user limits as background jobs.
+    
     Args:
         color: Color preference (温暖粉/天空蓝/薄荷绿等)
         personality: Personality trait (活泼/温柔/聪明等)
         appearance: Appearance feature (戴眼镜/戴帽子等)
         role: Character role (陪伴式朋友/温柔照顾型长辈等)
+        force_new: Generate a new image even if one is cached
     
     Returns:
-        JSON with image_url, prompt, and preferences
+        JSON with image_url, prompt, preferences and whether it was cached,
+        or 429 if the user has too many active generations
     """
     try:
         from app.image_service import ImageGenerationService, ImageGenerationError
-        from app.user_config import UserConfig
-        from datetime import datetime
-        from pathlib import Path
-        import httpx
-        
-        config = get_config()
         
-        # 检查是否配置了 MiniMax API
-        minimax_api_key = getattr(config, 'minimax_api_key', None)
-        
-        if not minimax_api_key:
-            logger.warning("MiniMax API key not configured")
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "error": "MiniMax API 未配置",
-                    "detail": "请在 .env 文件中配置 MINIMAX_API_KEY。访问 https://platform.minimaxi.com/ 获取 API 密钥。"
-                }
-            )
+        preferences = {
+            "color": color,
+            "personality": personality,
+            "appearance": appearance,
+            "role": role
+        }
         
-        # 初始化服务
-        image_service = ImageGenerationService(
-            api_key=minimax_api_key,
-            group_id=getattr(config, 'minimax_group_id', None)
+        # 相同偏好生成的提示词相同：优先复用已生成的图片，避免 30-120 秒的生成等待
+        prompt = ImageGenerationService.build_prompt(color, personality, appearance, role)
+        cached = await asyncio.to_thread(
+            _serve_cached_character, get_base_url(request), user_id, preferences, prompt, force_new
         )
-        user_config = UserConfig(str(config.data_dir))
+        if cached:
+            return cached
         
-        try:
-            logger.info(
-                f"Generating character image: "
-                f"color={color}, personality={personality}, "
-                f"appearance={appearance}, role={role}"
-            )
-            
-            # 生成图像
-            result = await image_service.generate_image(
-                color=color,
-                personality=personality,
-                appearance=appearance,
-                role=role,
-                aspect_ratio="1:1",
-                n=1
-            )
-            
-            # 下载图片到本地
-            generated_images_dir = Path("generated_images")
-            generated_images_dir.mkdir(exist_ok=True)
-            
-            # 生成文件名：character_颜色_性格_时间戳.jpeg
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"character_{color}_{personality}_{timestamp}.jpeg"
-            local_path = generated_images_dir / filename
-            
-            logger.info(f"Downloading image to: {local_path}")
-            
-            # 下载图片
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.get(result['url'])
-                if response.status_code == 200:
-                    with open(local_path, 'wb') as f:
-                        f.write(response.content)
-                    logger.info(f"Image saved to: {local_path}")
-                else:
-                    logger.error(f"Failed to download image: HTTP {response.status_code}")
-                    # 如果下载失败，仍然使用远程 URL
-                    local_path = None
-            
-            # 保存到用户配置
-            preferences = {
-                "color": color,
-                "personality": personality,
-                "appearance": appearance,
-                "role": role
-            }
-            
-            # 使用本地路径（如果下载成功）
-            image_url = str(local_path) if local_path else result['url']
-            
-            user_config.save_character_image(
-                image_url=image_url,
-                prompt=result['prompt'],
-                revised_prompt=result.get('metadata', {}).get('revised_prompt'),
-                preferences=preferences
-            )
-            
-            logger.info(f"Character image generated and saved: {image_url}")
-            
-            # 返回 HTTP URL（使用动态 base_url）
-            base_url = get_base_url(request)
-            if local_path:
-                http_url = f"{base_url}/generated_images/{local_path.name}"
-            else:
-                http_url = image_url
-            
-            return {
-                "success": True,
-                "image_url": http_url,
-                "prompt": result['prompt'],
-                "preferences": preferences,
-                "task_id": result.get('task_id')
-            }
+        # 检查是否配置了 MiniMax API
+        if not getattr(get_config(), 'minimax_api_key', None):
+            return _minimax_not_configured()
         
-        finally:
-            await image_service.close()
+        # 与后台任务共用并发上限和每用户上限
+        manager = get_job_manager()
+        with manager.hold(user_id):
+            async with manager.slot():
+                return await _create_character_image(get_base_url(request), user_id, preferences)
+    
+    except jobs.JobLimitError as e:
+        return JSONResponse(status_code=429, content={"error": e.message})
     
     except ImageGenerationError as e:
         logger.error(f"Image generation error: {e.message}")
-        
-        # 提供更友好的错误信息
-        error_detail = e.message
-        if "invalid api key" in e.message.lower():
-            error_detail = "API 密钥无效，请检查 MINIMAX_API_KEY 配置是否正确"
-        elif "quota" in e.message.lower() or "配额" in e.message:
-            error_detail = "API 配额不足，请充值或等待配额恢复"
-        elif "timeout" in e.message.lower() or "超时" in e.message:
-            error_detail = "请求超时，请检查网络连接后重试"
-        
         return JSONResponse(
             status_code=500,
             content={
                 "error": "图像生成失败",
-                "detail": error_detail
+                "detail": _image_error_detail(e.message)
             }
         )
     
@@ -943,52 +1540,285 @@ async def generate_character(
         )
 
 
-@app.get("/api/character/history")
-async def get_character_history(request: Request):
-    """Get list of all generated character images.
+@app.post("/api/character/jobs", status_code=202)
+async def submit_character_job(
+    request: Request,
+    color: str = Form(...),
+    personality: str = Form(...),
+    appearance: str = Form(...),
+    role: str = Form(...),
+    force_new: bool = Form(False),
+    user_id: str = Depends(get_user_id)
+):
+    """Generate a character image in a background job.
+    
+    Returns at once with a job id; poll ``GET /api/character/jobs/{job_id}``
+    until the status is ``done`` (the result then has the same fields as
+    ``POST /api/character/generate``), ``failed`` or ``cancelled``. A cached
+    image produces a job that is already done.
+    
+    Args:
+        color: Color preference
+        personality: Personality trait
+        appearance: Appearance feature
+        role: Character role
+        force_new: Generate a new image even if one is cached
     
     Returns:
-        JSON with list of historical character images
+        The job (status 202), or 429 if the user has too many active jobs
     """
+    from app.image_service import ImageGenerationService, ImageGenerationError
+    
+    preferences = {
+        "color": color,
+        "personality": personality,
+        "appearance": appearance,
+        "role": role
+    }
+    base_url = get_base_url(request)
+    prompt = ImageGenerationService.build_prompt(color, personality, appearance, role)
+    
+    async def run(job: jobs.Job) -> dict:
+        cached = await asyncio.to_thread(
+            _serve_cached_character, base_url, user_id, preferences, prompt, force_new
+        )
+        if cached:
+            return cached
+        try:
+            return await _create_character_image(base_url, user_id, preferences, job.set_status)
+        except ImageGenerationError as e:
+            raise ImageGenerationError(_image_error_detail(e.message)) from e
+    
+    if force_new or get_gallery(user_id).find_by_prompt(prompt) is None:
+        if not getattr(get_config(), 'minimax_api_key', None):
+            return _minimax_not_configured()
+    
     try:
-        from pathlib import Path
-        import os
+        job = get_job_manager().submit(user_id, "character_image", run)
+    except jobs.JobLimitError as e:
+        return JSONResponse(status_code=429, content={"error": e.message})
+    return job.to_dict()
+
+
+@app.get("/api/character/jobs/{job_id}")
+async def get_character_job(job_id: str, user_id: str = Depends(get_user_id)):
+    """Get the status and result of a background job.
+    
+    Args:
+        job_id: Job id returned by ``POST /api/character/jobs``
+    
+    Returns:
+        The job with status, result and error
+    """
+    job = await get_job_manager().find(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.delete("/api/character/jobs/{job_id}")
+async def cancel_character_job(job_id: str, user_id: str = Depends(get_user_id)):
+    """Cancel a queued or running background job.
+    
+    Args:
+        job_id: Job id returned by ``POST /api/character/jobs``
+    
+    Returns:
+        The job after cancellation (finished jobs are left unchanged)
+    """
+    job = await get_job_manager().request_cancel(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.post("/api/character/generate/batch")
+async def generate_character_batch(
+    request: Request,
+    color: str = Form(...),
+    personality: str = Form(...),
+    appearance: str = Form(...),
+    role: str = Form(...),
+    count: int = Form(3),
+    user_id: str = Depends(get_user_id)
+):
+    """Generate several candidate character images, streamed as they finish.
+    
+    Each candidate is generated with its own MiniMax call and downloaded as
+    soon as it is ready. Candidates take the same concurrency slots as
+    background jobs, and the batch counts as one of the user's active jobs.
+    The response is a ``text/event-stream`` with these events:
+    
+    - ``start``: ``{"count", "prompt", "preferences"}``
+    - ``candidate``: one saved image (``index``, ``image_url``,
+      ``thumbnail_url``, ``filename``, ``prompt``, ``task_id``), sent as soon
+      as it is on disk so the user can pick it while others still render
+    - ``candidate_error``: ``{"index", "detail"}`` for a failed candidate
+    - ``done``: ``{"succeeded", "failed"}``
+    - ``error``: ``{"error"}`` if the user reached the job limit meanwhile
+    
+    Candidates are added to the user's gallery but not selected; the client
+    selects one with ``POST /api/character/select``.
+    
+    Args:
+        color: Color preference
+        personality: Personality trait
+        appearance: Appearance feature
+        role: Character role
+        count: Number of candidates (1-4)
+    
+    Returns:
+        Event stream of candidates, a JSON error if the request is invalid,
+        or 429 if the user has too many active jobs
+    """
+    from app.image_service import ImageGenerationService, ImageGenerationError
+    
+    if count < 1 or count > 4:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "候选数量无效", "detail": "count 必须在 1 到 4 之间"}
+        )
+    
+    config = get_config()
+    minimax_api_key = getattr(config, 'minimax_api_key', None)
+    if not minimax_api_key:
+        return _minimax_not_configured()
+    
+    manager = get_job_manager()
+    try:
+        # 先检查一次以便直接返回 429；事件流开始时再正式占用名额
+        manager.check_limit(user_id)
+    except jobs.JobLimitError as e:
+        return JSONResponse(status_code=429, content={"error": e.message})
+    
+    preferences = {
+        "color": color,
+        "personality": personality,
+        "appearance": appearance,
+        "role": role
+    }
+    prompt = ImageGenerationService.build_prompt(color, personality, appearance, role)
+    base_url = get_base_url(request)
+    
+    image_service = ImageGenerationService(
+        api_key=minimax_api_key,
+        group_id=getattr(config, 'minimax_group_id', None)
+    )
+    
+    async def make_candidate(index: int) -> Tuple[str, dict]:
+        """Generate, download and register one candidate."""
+        async with manager.slot():
+            return await generate_candidate(index)
+    
+    async def generate_candidate(index: int) -> Tuple[str, dict]:
+        """Generate, download and register one candidate (holding a slot)."""
+        try:
+            result = await image_service.generate_image(
+                color=color,
+                personality=personality,
+                appearance=appearance,
+                role=role,
+                aspect_ratio="1:1",
+                n=1,
+                # 每个候选都要是不同的图片，不能合并相同的请求
+                coalesce=False
+            )
+        except ImageGenerationError as e:
+            logger.error(f"Batch candidate {index} failed: {e.message}")
+            return "candidate_error", {"index": index, "detail": e.message}
         
-        base_url = get_base_url(request)
-        generated_images_dir = Path("generated_images")
+        candidate = {
+            "index": index,
+            "image_url": result['url'],
+            "thumbnail_url": result['url'],
+            "filename": None,
+            "prompt": result['prompt'],
+            "task_id": result.get('task_id')
+        }
         
-        if not generated_images_dir.exists():
-            return {"images": []}
+        # 同一秒内会保存多张候选图片，文件名带微秒和序号避免冲突
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        local_path = generated_images_dir / f"character_{color}_{personality}_{timestamp}_{index}.jpeg"
+        try:
+            await image_service.download_image(result['url'], str(local_path))
+        except Exception as e:
+            # 下载失败时返回远程 URL，候选仍可预览
+            logger.error(f"Failed to download batch candidate {index}: {e}")
+            return "candidate", candidate
         
-        # 获取所有图片文件
-        image_files = []
-        for file in generated_images_dir.glob("character_*.jpeg"):
-            # 解析文件名：character_颜色_性格_时间戳.jpeg
-            parts = file.stem.split("_")
-            if len(parts) >= 4:
-                color = parts[1]
-                personality = parts[2]
-                timestamp = "_".join(parts[3:])
-                
-                # 获取文件信息
-                stat = file.stat()
-                
-                image_files.append({
-                    "filename": file.name,
-                    "url": f"{base_url}/generated_images/{file.name}",
-                    "color": color,
-                    "personality": personality,
-                    "timestamp": timestamp,
-                    "created_at": stat.st_ctime,
-                    "size": stat.st_size
+        await asyncio.to_thread(get_gallery(user_id).add, local_path, preferences, result['prompt'])
+        schedule_variants(local_path, generated_images_dir)
+        candidate.update(
+            image_url=f"{base_url}/generated_images/{local_path.name}",
+            thumbnail_url=f"{base_url}/generated_images/{local_path.name}?w=256",
+            filename=local_path.name
+        )
+        return "candidate", candidate
+    
+    generated_images_dir.mkdir(exist_ok=True)
+    
+    async def events():
+        tasks = []
+        counts = {"candidate": 0, "candidate_error": 0}
+        try:
+            with manager.hold(user_id):
+                tasks = [asyncio.create_task(make_candidate(i)) for i in range(count)]
+                yield format_event("start", {"count": count, "prompt": prompt, "preferences": preferences})
+                # 按完成顺序推送，先生成好的候选先展示
+                for finished in asyncio.as_completed(tasks):
+                    event, data = await finished
+                    counts[event] += 1
+                    yield format_event(event, data)
+                yield format_event("done", {
+                    "succeeded": counts["candidate"],
+                    "failed": counts["candidate_error"]
                 })
+        except jobs.JobLimitError as e:
+            yield format_event("error", {"error": e.message})
+        finally:
+            # 客户端断开时取消仍在生成的候选
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await image_service.close()
+    
+    logger.info(f"Generating {count} character candidates: {preferences}")
+    return EventStreamResponse(events())
+
+
+@app.get("/api/character/history")
+async def get_character_history(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    user_id: str = Depends(get_user_id)
+):
+    """Get the character images generated by the user, newest first.
+    
+    Args:
+        offset: Number of newest images to skip
+        limit: Maximum number of images to return (all if omitted)
+    
+    Returns:
+        JSON with the page of historical character images and the total count
+    """
+    try:
+        base_url = get_base_url(request)
         
-        # 按创建时间倒序排列（最新的在前）
-        image_files.sort(key=lambda x: x["created_at"], reverse=True)
+        # 从用户的图库清单（内存缓存）中分页读取，不再扫描目录
+        entries, total = get_gallery(user_id).page(offset, limit)
+        image_files = [
+            {
+                **entry,
+                "url": f"{base_url}/generated_images/{entry['filename']}",
+                "thumbnail_url": f"{base_url}/generated_images/{entry['filename']}?w=256"
+            }
+            for entry in entries
+        ]
         
-        logger.info(f"Found {len(image_files)} historical character images")
+        logger.info(f"Returning {len(image_files)} of {total} historical character images")
         
-        return {"images": image_files}
+        return {"images": image_files, "total": total, "offset": offset, "limit": limit}
         
     except Exception as e:
         logger.error(f"Error getting character history: {e}", exc_info=True)
@@ -998,10 +1828,14 @@ async def get_character_history(request: Request):
 @app.post("/api/character/select")
 async def select_character(
     request: Request,
-    filename: str = Form(...)
+    filename: str = Form(...),
+    user_id: str = Depends(get_user_id)
 ):
     """Select a historical character image as current.
     
+    Only images in the user's own gallery (and the shared default image)
+    can be selected.
+    
     Args:
         filename: Filename of the character image to select
     
@@ -1012,32 +1846,28 @@ async def select_character(
         from app.user_config import UserConfig
         from pathlib import Path
         
-        config = get_config()
-        user_config = UserConfig(str(config.data_dir))
+        user_config = UserConfig(str(get_user_data_dir(user_id)), user_id)
         
-        # 验证文件存在
-        image_path = Path("generated_images") / filename
-        if not image_path.exists():
+        # 验证文件存在（只接受图库目录中的文件名）
+        image_path = generated_images_dir / filename
+        if Path(filename).name != filename or not image_path.exists():
             raise HTTPException(status_code=404, detail="图片文件不存在")
         
-        # 解析文件名获取偏好设置
-        parts = filename.replace(".jpeg", "").split("_")
-        if len(parts) >= 4:
-            color = parts[1]
-            personality = parts[2]
-            
-            preferences = {
-                "color": color,
-                "personality": personality,
-                "appearance": "未知",
-                "role": "未知"
-            }
-        else:
-            preferences = {}
+        # 从用户自己的图库清单获取偏好设置；其他用户生成的图片视为不存在
+        entry = await asyncio.to_thread(get_gallery(user_id).get, filename)
+        if entry is None and filename != DEFAULT_CHARACTER_IMAGE:
+            raise HTTPException(status_code=404, detail="图片文件不存在")
+        preferences = {
+            "color": entry["color"],
+            "personality": entry["personality"],
+            "appearance": entry.get("appearance") or "未知",
+            "role": entry.get("role") or "未知"
+        } if entry and entry["color"] else {}
         
         # 更新用户配置
         image_url = str(image_path)
-        user_config.save_character_image(
+        await asyncio.to_thread(
+            user_config.save_character_image,
             image_url=image_url,
             prompt=f"历史形象: {filename}",
             preferences=preferences
@@ -1068,7 +1898,8 @@ async def update_character_preferences(
     color: Optional[str] = Form(None),
     personality: Optional[str] = Form(None),
     appearance: Optional[str] = Form(None),
-    role: Optional[str] = Form(None)
+    role: Optional[str] = Form(None),
+    user_id: str = Depends(get_user_id)
 ):
     """Update character preferences without generating new image.
     
@@ -1084,8 +1915,7 @@ async def update_character_preferences(
     try:
         from app.user_config import UserConfig
         
-        config = get_config()
-        user_config = UserConfig(str(config.data_dir))
+        user_config = UserConfig(str(get_user_data_dir(user_id)), user_id)
         
         # 更新偏好设置
         user_config.update_character_preferences(
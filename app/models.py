@@ -116,3 +116,26 @@ class ProcessResponse(BaseModel):
     inspirations: List[InspirationData] = Field(default_factory=list)
     todos: List[TodoData] = Field(default_factory=list)
     error: Optional[str] = None
+
+
+class TodoUpdate(BaseModel):
+    """One change in a bulk todo update (PATCH /api/todos).
+    
+    Only the fields that are set are changed; ``todo_id`` selects the todo.
+    
+    Attributes:
+        todo_id: Id of the todo to change
+        task: New task description (optional)
+        time: New time information (optional)
+        location: New location information (optional)
+        status: New task status (optional)
+    """
+    todo_id: str
+    task: Optional[str] = None
+    time: Optional[str] = None
+    location: Optional[str] = None
+    status: Optional[str] = None
+    
+    def changes(self) -> dict:
+        """Get the fields to set on the todo."""
+        return self.model_dump(exclude_unset=True, exclude={"todo_id"})
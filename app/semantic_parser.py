@@ -6,16 +6,40 @@ into structured data (mood, inspirations, todos) using the GLM-4-Flash API.
 Requirements: 3.1, 3.2, 3.3, 3.4, 3.5, 9.2, 9.5
 """
 
+import asyncio
 import logging
 import json
-from typing import Optional
+from typing import List, Optional
 import httpx
+from pydantic import TypeAdapter, ValidationError
 
+from app.fast_parser import fast_parse
+from app.json_extract import JSONExtractError, extract_json
 from app.models import ParsedData, MoodData, InspirationData, TodoData
+from app.singleflight import SingleFlight, make_key, normalize_text
 
 
 logger = logging.getLogger(__name__)
 
+# 进行中的解析请求（跨服务实例共享），相同文本的并发请求只调用一次 API
+_inflight = SingleFlight()
+
+# 整个解析结果的校验器，模块加载时构建一次、所有请求共用
+_PARSED_DATA = TypeAdapter(ParsedData)
+
+# 批量解析：每次请求包含的文本数、同时进行的请求数、每段文本预留的输出 token 数
+BATCH_SIZE = 8
+BATCH_CONCURRENCY = 2
+BATCH_TOKENS_PER_TEXT = 400
+
+# 追加在系统提示词之后的批量模式说明
+BATCH_INSTRUCTIONS = (
+    "\n\n**批量模式**：用户消息是一个 JSON 数组，每个元素包含 index（序号）和 text（文本）。\n"
+    "请分别解析每一段文本，返回一个 JSON 数组，每个元素包含对应的 index 以及该段文本的 "
+    "mood、inspirations、todos（格式与上面的示例相同）。\n"
+    "数组长度必须与输入相同，不要合并或遗漏任何一段，直接返回 JSON 数组。"
+)
+
 
 class SemanticParserError(Exception):
     """Exception raised when semantic parsing operations fail.
@@ -36,6 +60,90 @@ class SemanticParserError(Exception):
         self.message = message
 
 
+def build_parsed_data(parsed_json: dict) -> ParsedData:
+    """Validate the JSON object returned by the model into ParsedData.
+    
+    A well-formed result is validated in a single call. Otherwise invalid
+    moods, inspirations and todos are logged and dropped, so one bad item
+    does not lose the rest of the result.
+    
+    Args:
+        parsed_json: Object with mood, inspirations and todos
+    
+    Returns:
+        ParsedData with the valid parts
+    """
+    if isinstance(parsed_json, dict):
+        try:
+            # 常见情况：整个结果一次校验，无需逐项构造模型
+            parsed_data = _PARSED_DATA.validate_python(parsed_json)
+        except ValidationError:
+            pass
+        else:
+            if not parsed_json.get("mood"):
+                # 与逐项校验一致：空的 mood 对象视为没有情绪
+                parsed_data.mood = None
+            return parsed_data
+    return _build_parsed_data_leniently(parsed_json)
+
+
+def _build_parsed_data_leniently(parsed_json: dict) -> ParsedData:
+    """Validate item by item, dropping (and logging) invalid items."""
+    # Extract and validate mood data
+    mood = None
+    if "mood" in parsed_json and parsed_json["mood"]:
+        try:
+            mood_data = parsed_json["mood"]
+            if isinstance(mood_data, dict):
+                mood = MoodData(
+                    type=mood_data.get("type"),
+                    intensity=mood_data.get("intensity"),
+                    keywords=mood_data.get("keywords", [])
+                )
+        except Exception as e:
+            logger.warning(f"Failed to parse mood data: {str(e)}")
+            mood = None
+    
+    # Extract and validate inspirations
+    inspirations = []
+    if "inspirations" in parsed_json and parsed_json["inspirations"]:
+        for insp_data in parsed_json["inspirations"]:
+            try:
+                if isinstance(insp_data, dict):
+                    inspiration = InspirationData(
+                        core_idea=insp_data.get("core_idea", ""),
+                        tags=insp_data.get("tags", []),
+                        category=insp_data.get("category", "生活")
+                    )
+                    inspirations.append(inspiration)
+            except Exception as e:
+                logger.warning(f"Failed to parse inspiration data: {str(e)}")
+                continue
+    
+    # Extract and validate todos
+    todos = []
+    if "todos" in parsed_json and parsed_json["todos"]:
+        for todo_data in parsed_json["todos"]:
+            try:
+                if isinstance(todo_data, dict):
+                    todo = TodoData(
+                        task=todo_data.get("task", ""),
+                        time=todo_data.get("time"),
+                        location=todo_data.get("location"),
+                        status=todo_data.get("status", "pending")
+                    )
+                    todos.append(todo)
+            except Exception as e:
+                logger.warning(f"Failed to parse todo data: {str(e)}")
+                continue
+    
+    return ParsedData(
+        mood=mood,
+        inspirations=inspirations,
+        todos=todos
+    )
+
+
 class SemanticParserService:
     """Service for parsing text into structured data using GLM-4-Flash API.
     
@@ -45,6 +153,7 @@ class SemanticParserService:
     
     Attributes:
         api_key: Zhipu AI API key for authentication
+        fast_path_threshold: Confidence above which the local parser answers
         client: Async HTTP client for making API requests
         api_url: GLM-4-Flash API endpoint URL
         model: Model identifier
@@ -53,15 +162,19 @@ class SemanticParserService:
     Requirements: 3.1, 3.2, 3.3, 3.4, 3.5, 9.2, 9.5
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, fast_path_threshold: Optional[float] = None):
         """Initialize the semantic parser service.
         
         Args:
             api_key: Zhipu AI API key for authentication
+            fast_path_threshold: Answer inputs that the local rule-based
+                parser recognizes with at least this confidence without
+                calling the API (None disables the fast path)
         
         Requirements: 3.1, 3.2
         """
         self.api_key = api_key
+        self.fast_path_threshold = fast_path_threshold
         self.client = httpx.AsyncClient(timeout=30.0)
         self.api_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
         self.model = "glm-4-flash"
@@ -107,6 +220,154 @@ class SemanticParserService:
     async def parse(self, text: str) -> ParsedData:
         """Parse text into structured data using GLM-4-Flash API.
         
+        Short, simple inputs recognized by the local rule-based parser with
+        enough confidence are answered without the API (see
+        ``app.fast_parser``). Concurrent calls with the same (normalized)
+        text share one API request, e.g. when a form is submitted twice.
+        
+        Args:
+            text: Text content to parse
+        
+        Returns:
+            ParsedData object containing mood (optional), inspirations (list),
+            and todos (list). Missing dimensions return null or empty arrays.
+        
+        Raises:
+            SemanticParserError: If API call fails or returns invalid response
+        """
+        parsed = self._fast_path(text)
+        if parsed is not None:
+            return parsed
+        
+        key = make_key(self.model, self.system_prompt, normalize_text(text))
+        return await _inflight.do(key, lambda: self._parse_once(text))
+    
+    def _fast_path(self, text: str) -> Optional[ParsedData]:
+        """Parse locally if the fast path is enabled and confident enough."""
+        if self.fast_path_threshold is None:
+            return None
+        parsed, confidence = fast_parse(text)
+        if confidence < self.fast_path_threshold:
+            return None
+        logger.info(f"Parsed locally (confidence {confidence:.2f}), skipping GLM-4-Flash call")
+        return parsed
+    
+    async def parse_many(self, texts: List[str], batch_size: int = BATCH_SIZE) -> List[ParsedData]:
+        """Parse many texts with few API calls (for imports and backfills).
+        
+        Texts are packed ``batch_size`` at a time into one completion
+        request, so the system prompt is sent once per batch instead of once
+        per text. Each result is validated separately; texts whose result is
+        missing or whose batch failed are parsed one by one with ``parse``.
+        
+        Args:
+            texts: Text contents to parse
+            batch_size: Texts per API request
+        
+        Returns:
+            ParsedData for each text, in the order of ``texts``
+        
+        Raises:
+            SemanticParserError: If a text cannot be parsed even on its own
+        """
+        results: List[Optional[ParsedData]] = [self._fast_path(text) for text in texts]
+        pending = [i for i, result in enumerate(results) if result is None]
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), max(1, batch_size))]
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        
+        async def run_batch(indexes: List[int]) -> None:
+            parsed: List[Optional[ParsedData]] = [None] * len(indexes)
+            if len(indexes) > 1:
+                try:
+                    async with semaphore:
+                        parsed = await self._parse_batch([texts[i] for i in indexes])
+                except SemanticParserError as e:
+                    logger.warning(f"Batch of {len(indexes)} texts failed ({e.message}), parsing them one by one")
+            
+            missing = [i for i, item in zip(indexes, parsed) if item is None]
+            if missing and len(missing) < len(indexes):
+                logger.warning(f"Batch result lacks {len(missing)} of {len(indexes)} texts, parsing them one by one")
+            for i, item in zip(indexes, parsed):
+                results[i] = item
+            fallback = await asyncio.gather(*(self.parse(texts[i]) for i in missing))
+            for i, item in zip(missing, fallback):
+                results[i] = item
+        
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return results
+    
+    async def _parse_batch(self, texts: List[str]) -> List[Optional[ParsedData]]:
+        """Parse several texts in one GLM-4-Flash request.
+        
+        Args:
+            texts: Text contents to parse
+        
+        Returns:
+            ParsedData for each text, None where the response has no valid
+            result for it
+        
+        Raises:
+            SemanticParserError: If the request fails or the response is not
+                a JSON array of results
+        """
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self.system_prompt + BATCH_INSTRUCTIONS
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps(
+                        [{"index": i, "text": text} for i, text in enumerate(texts)],
+                        ensure_ascii=False
+                    )
+                }
+            ],
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "max_tokens": BATCH_TOKENS_PER_TEXT * len(texts)
+        }
+        logger.info(f"Calling GLM-4-Flash API for batch parsing. Texts: {len(texts)}")
+        
+        try:
+            response = await self.client.post(
+                self.api_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=payload
+            )
+        except httpx.HTTPError as e:
+            raise SemanticParserError(f"语义解析服务不可用: {str(e)}")
+        if response.status_code != 200:
+            raise SemanticParserError(f"语义解析服务不可用: GLM-4-Flash API returned status {response.status_code}")
+        
+        try:
+            content = response.json()["choices"][0]["message"]["content"]
+            items = extract_json(content)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise SemanticParserError(f"语义解析服务不可用: 批量响应格式无效 ({str(e)})")
+        if isinstance(items, dict):
+            # 模型有时把数组包在对象中返回
+            items = next((value for value in items.values() if isinstance(value, list)), None)
+        if not isinstance(items, list):
+            raise SemanticParserError("语义解析服务不可用: 批量响应不是数组")
+        
+        results: List[Optional[ParsedData]] = [None] * len(texts)
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index", position)
+            if isinstance(index, int) and 0 <= index < len(texts) and results[index] is None:
+                results[index] = build_parsed_data(item)
+        return results
+    
+    async def _parse_once(self, text: str) -> ParsedData:
+        """Parse text into structured data using GLM-4-Flash API.
+        
         This method sends the text to the GLM-4-Flash API with the configured
         system prompt and returns structured data containing mood, inspirations,
         and todos. It handles API errors, missing dimensions, and logs all errors
@@ -205,18 +466,9 @@ class SemanticParserService:
             
             # Parse JSON from content
             try:
-                # Try to extract JSON from markdown code blocks if present
-                if "```json" in content:
-                    json_start = content.find("```json") + 7
-                    json_end = content.find("```", json_start)
-                    content = content[json_start:json_end].strip()
-                elif "```" in content:
-                    json_start = content.find("```") + 3
-                    json_end = content.find("```", json_start)
-                    content = content[json_start:json_end].strip()
-                
-                parsed_json = json.loads(content)
-            except json.JSONDecodeError as e:
+                # 容忍代码块、前后说明文字、尾逗号等常见瑕疵，避免因格式问题重新请求
+                parsed_json = extract_json(content, "{")
+            except JSONExtractError as e:
                 error_msg = f"Failed to parse JSON from API response: {str(e)}"
                 logger.error(
                     error_msg,
@@ -227,66 +479,16 @@ class SemanticParserService:
                 )
                 raise SemanticParserError(f"语义解析服务不可用: JSON 解析失败")
             
-            # Extract and validate mood data
-            mood = None
-            if "mood" in parsed_json and parsed_json["mood"]:
-                try:
-                    mood_data = parsed_json["mood"]
-                    if isinstance(mood_data, dict):
-                        mood = MoodData(
-                            type=mood_data.get("type"),
-                            intensity=mood_data.get("intensity"),
-                            keywords=mood_data.get("keywords", [])
-                        )
-                except Exception as e:
-                    logger.warning(f"Failed to parse mood data: {str(e)}")
-                    mood = None
-            
-            # Extract and validate inspirations
-            inspirations = []
-            if "inspirations" in parsed_json and parsed_json["inspirations"]:
-                for insp_data in parsed_json["inspirations"]:
-                    try:
-                        if isinstance(insp_data, dict):
-                            inspiration = InspirationData(
-                                core_idea=insp_data.get("core_idea", ""),
-                                tags=insp_data.get("tags", []),
-                                category=insp_data.get("category", "生活")
-                            )
-                            inspirations.append(inspiration)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse inspiration data: {str(e)}")
-                        continue
-            
-            # Extract and validate todos
-            todos = []
-            if "todos" in parsed_json and parsed_json["todos"]:
-                for todo_data in parsed_json["todos"]:
-                    try:
-                        if isinstance(todo_data, dict):
-                            todo = TodoData(
-                                task=todo_data.get("task", ""),
-                                time=todo_data.get("time"),
-                                location=todo_data.get("location"),
-                                status=todo_data.get("status", "pending")
-                            )
-                            todos.append(todo)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse todo data: {str(e)}")
-                        continue
+            parsed_data = build_parsed_data(parsed_json)
             
             logger.info(
                 f"Semantic parsing successful. "
-                f"Mood: {'present' if mood else 'none'}, "
-                f"Inspirations: {len(inspirations)}, "
-                f"Todos: {len(todos)}"
+                f"Mood: {'present' if parsed_data.mood else 'none'}, "
+                f"Inspirations: {len(parsed_data.inspirations)}, "
+                f"Todos: {len(parsed_data.todos)}"
             )
             
-            return ParsedData(
-                mood=mood,
-                inspirations=inspirations,
-                todos=todos
-            )
+            return parsed_data
             
         except SemanticParserError:
             # Re-raise SemanticParserError as-is
@@ -0,0 +1,91 @@
+"""JSON serialization layer for Voice Text Processor.
+
+This module centralizes JSON encoding and decoding for data files and API
+responses. Output is compact (no indentation, non-ASCII characters kept as
+UTF-8), which keeps CJK-heavy files small. When ``orjson`` is installed it is
+used for both directions; otherwise the standard library ``json`` module is
+used with equivalent settings.
+
+Requirements: 7.1, 7.6
+"""
+
+import json
+from typing import Any, BinaryIO, Union
+
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+HAS_ORJSON = orjson is not None
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode an object as compact UTF-8 JSON.
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        Encoded JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Decode JSON bytes or text.
+
+    Args:
+        data: JSON document
+
+    Returns:
+        Decoded Python object
+
+    Raises:
+        ValueError: If the document is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump(obj: Any, fp: BinaryIO) -> None:
+    """Encode an object as compact JSON into a binary file.
+
+    Args:
+        obj: JSON-serializable object
+        fp: File opened in binary write mode
+    """
+    fp.write(dumps(obj))
+
+
+def load(fp: BinaryIO) -> Any:
+    """Decode JSON from a binary file.
+
+    Args:
+        fp: File opened in binary read mode
+
+    Returns:
+        Decoded Python object
+    """
+    return loads(fp.read())
+
+
+class CompactJSONResponse(_StarletteJSONResponse):
+    """JSON response rendered through this module's compact encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as JSONResponse
+else:  # pragma: no cover - depends on the environment
+    JSONResponse = CompactJSONResponse
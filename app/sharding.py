@@ -0,0 +1,218 @@
+"""Consistent-hash sharding of user partitions across data roots.
+
+This module maps each user id to one of several data root directories
+(typically on different disks or volumes) with a consistent-hash ring, so
+that adding a root only moves a small fraction of users. It also provides
+the rebalancing routine used by ``scripts/rebalance_shards.py`` to move
+partitions after the list of roots has changed.
+"""
+
+import bisect
+import hashlib
+import logging
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from app.file_lock import get_lock
+
+
+logger = logging.getLogger(__name__)
+
+
+# 用户分区目录在每个数据根目录下的位置，与 tenancy.partition_dir 保持一致
+USERS_SUBDIR = "users"
+
+
+def _hash(key: str) -> int:
+    """Hash a key onto the ring (first 8 bytes of MD5, stable across processes)."""
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to nodes.
+
+    Every node is placed on the ring ``replicas`` times (virtual nodes) to
+    even out the distribution. A key belongs to the first virtual node at or
+    after its hash, wrapping around at the end of the ring.
+
+    Attributes:
+        nodes: Node names in the order they were given
+        replicas: Number of virtual nodes per node
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 160):
+        """Initialize the ring.
+
+        Args:
+            nodes: Node names (e.g. data root paths); must not be empty
+            replicas: Number of virtual nodes per node
+
+        Raises:
+            ValueError: If no nodes are given or replicas is not positive
+        """
+        self.nodes: List[str] = list(dict.fromkeys(nodes))
+        if not self.nodes:
+            raise ValueError("HashRing requires at least one node")
+        if replicas <= 0:
+            raise ValueError("replicas must be positive")
+        self.replicas = replicas
+
+        points: List[Tuple[int, str]] = []
+        for node in self.nodes:
+            for i in range(replicas):
+                points.append((_hash(f"{node}#{i}"), node))
+        points.sort()
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """Get the node that owns a key.
+
+        Args:
+            key: Key to place (a user id)
+
+        Returns:
+            Name of the owning node
+        """
+        index = bisect.bisect(self._hashes, _hash(key))
+        if index == len(self._hashes):
+            index = 0
+        return self._owners[index]
+
+
+def ring_for_roots(roots: Sequence[Union[str, Path]]) -> HashRing:
+    """Build a ring whose nodes are data root directories.
+
+    Nodes are the resolved absolute paths, so every process places users
+    the same way however a root is spelled (relative to a different working
+    directory, with ``..`` or through a symlink).
+
+    Args:
+        roots: Data root directories
+
+    Returns:
+        HashRing with one node per root (as a resolved string path)
+    """
+    return HashRing(str(Path(root).resolve()) for root in roots)
+
+
+def root_for_user(ring: HashRing, user_id: str) -> Path:
+    """Get the data root that stores a user's partition.
+
+    Args:
+        ring: Ring built by ring_for_roots
+        user_id: User id
+
+    Returns:
+        Data root directory
+    """
+    return Path(ring.node_for(user_id))
+
+
+def find_partitions(roots: Sequence[Union[str, Path]]) -> Dict[str, List[Path]]:
+    """Find existing user partitions on all data roots.
+
+    Args:
+        roots: Data root directories to scan
+
+    Returns:
+        Mapping from user id to the partition directories found for it
+    """
+    found: Dict[str, List[Path]] = {}
+    for root in roots:
+        # 与环上的节点一致使用解析后的路径，便于和目标目录比较
+        users_dir = Path(root).resolve() / USERS_SUBDIR
+        if not users_dir.is_dir():
+            continue
+        for partition in sorted(users_dir.iterdir()):
+            if partition.is_dir() and not partition.name.startswith("."):
+                found.setdefault(partition.name, []).append(partition)
+    return found
+
+
+def plan_rebalance(roots: Sequence[Union[str, Path]]) -> List[Tuple[str, Path, Path]]:
+    """Compute the partition moves needed for the given list of roots.
+
+    Args:
+        roots: New (complete) list of data roots
+
+    Returns:
+        List of (user_id, source_dir, target_dir) for misplaced partitions
+    """
+    ring = ring_for_roots(roots)
+    moves = []
+    for user_id, partitions in find_partitions(roots).items():
+        target = root_for_user(ring, user_id) / USERS_SUBDIR / user_id
+        for source in partitions:
+            if source != target:
+                moves.append((user_id, source, target))
+    return moves
+
+
+def move_partition(source: Path, target: Path) -> None:
+    """Move one user partition to another data root.
+
+    The partition is copied to a temporary directory next to the target and
+    renamed into place, so the target never exists in a half-copied state.
+    The source is removed only after the copy is complete. A lock file next
+    to the source partition (``<root>/users/.<user_id>.lock``) is held for
+    the whole move; it lives outside the partition so it is not deleted
+    together with the source while held.
+
+    Args:
+        source: Current partition directory
+        target: New partition directory (must not exist)
+
+    Raises:
+        FileExistsError: If the target partition already exists
+    """
+    if target.exists():
+        raise FileExistsError(f"Target partition already exists: {target}")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.with_name(f".{target.name}.moving")
+
+    with get_lock(source.parent / f".{source.name}.lock"):
+        # 等待锁期间可能已被另一次重平衡移走
+        if target.exists():
+            raise FileExistsError(f"Target partition already exists: {target}")
+        if staging.exists():
+            shutil.rmtree(staging)
+        shutil.copytree(
+            source, staging, ignore=shutil.ignore_patterns(".storage.lock")
+        )
+        staging.rename(target)
+        shutil.rmtree(source)
+
+
+def rebalance(
+    roots: Sequence[Union[str, Path]], dry_run: bool = False
+) -> List[Tuple[str, Path, Path]]:
+    """Move every partition to the root the ring assigns it to.
+
+    Run this while no application worker is serving requests, after the
+    list of data roots has changed. Partitions whose target already exists
+    are skipped and logged, so they can be merged by hand.
+
+    Args:
+        roots: New (complete) list of data roots
+        dry_run: Only report the moves without performing them
+
+    Returns:
+        List of (user_id, source_dir, target_dir) that were (or would be) moved
+    """
+    moved = []
+    for user_id, source, target in plan_rebalance(roots):
+        if dry_run:
+            moved.append((user_id, source, target))
+            continue
+        try:
+            move_partition(source, target)
+        except FileExistsError:
+            logger.warning(
+                f"Skipping partition {user_id}: both {source} and {target} exist"
+            )
+            continue
+        logger.info(f"Moved partition {user_id}: {source} -> {target}")
+        moved.append((user_id, source, target))
+    return moved
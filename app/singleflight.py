@@ -0,0 +1,121 @@
+"""Coalescing of identical concurrent upstream calls.
+
+A double-submitted form or several open tabs send the same text, audio or
+character preferences at the same moment, and each request would otherwise
+spend its own GLM/ASR/MiniMax call (and quota) on an identical answer.
+``SingleFlight`` lets the first caller for a key perform the call while
+concurrent callers with the same key await its outcome. Keys are hashes of
+the normalized input (see ``make_key``). Only calls that overlap in time are
+coalesced; nothing is cached once the call completes.
+
+The call runs in the first caller's task, using that caller's HTTP client.
+If that caller is cancelled (e.g. the client disconnected), the waiting
+callers do not inherit the cancellation: one of them performs the call
+again.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import unicodedata
+from typing import Awaitable, Callable, Dict, TypeVar, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so that trivially different inputs share a key.
+
+    Applies Unicode NFC normalization, strips the text and collapses runs
+    of whitespace into one space.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Normalized text
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def make_key(*parts: Union[str, bytes]) -> str:
+    """Hash the parts identifying an upstream call.
+
+    Args:
+        *parts: Strings or bytes (model, prompt, input, ...)
+
+    Returns:
+        Hex digest usable as a ``SingleFlight`` key
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        # 带长度前缀，避免 ("ab", "c") 与 ("a", "bc") 得到相同的键
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Group of in-flight calls, at most one per key.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        """Initialize an empty group."""
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for the key is currently running."""
+        return key in self._calls
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Run ``func`` unless a call for ``key`` is already running.
+
+        Args:
+            key: Identifies identical calls (see ``make_key``)
+            func: Coroutine function performing the call
+
+        Returns:
+            The result of ``func``, or of the running call with the same key
+
+        Raises:
+            Exception: Whatever ``func`` (or the running call) raised
+        """
+        while key in self._calls:
+            future = self._calls[key]
+            logger.debug(f"Joining in-flight call {key}")
+            try:
+                # shield：等待方被取消时不影响正在执行的调用
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行调用的请求被取消：重新发起（可能由本请求执行）
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待方时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
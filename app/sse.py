@@ -0,0 +1,49 @@
+"""Server-Sent Events helpers for Voice Text Processor.
+
+Long-running endpoints (such as batch character generation) report results
+progressively as ``text/event-stream`` instead of answering once everything
+is done. Each event has a name and a JSON payload encoded with the shared
+serialization layer.
+"""
+
+from typing import Any, AsyncIterator, Optional
+
+from starlette.responses import StreamingResponse
+
+from app import serialization
+
+
+def format_event(event: str, data: Any) -> bytes:
+    """Encode one Server-Sent Event.
+
+    Args:
+        event: Event name (``event:`` field)
+        data: JSON-serializable payload (``data:`` field)
+
+    Returns:
+        The encoded event, terminated by a blank line
+    """
+    # 紧凑 JSON 不含换行，可以放在单个 data 行中
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + serialization.dumps(data) + b"\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """Streaming response for an async iterator of encoded events."""
+
+    def __init__(self, events: AsyncIterator[bytes], headers: Optional[dict] = None):
+        """Initialize the response.
+
+        Args:
+            events: Async iterator yielding events from ``format_event``
+            headers: Additional response headers
+        """
+        super().__init__(
+            events,
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                # 禁止反向代理缓冲，事件产生后立即送达客户端
+                "X-Accel-Buffering": "no",
+                **(headers or {})
+            }
+        )
@@ -6,13 +6,25 @@ of records, moods, inspirations, and todos.
 Requirements: 7.1, 7.2, 7.3, 7.4, 7.5, 7.6, 7.7
 """
 
-import json
+import bisect
+import hashlib
+import logging
+import os
+import threading
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from datetime import datetime
 
-from app.models import RecordData, MoodData, InspirationData, TodoData
+from pydantic import BaseModel
+
+from app.models import RecordData, MoodData, InspirationData, TodoData, ParsedData
+from app.file_lock import FileLock, get_lock, atomic_open
+from app import serialization
+
+
+logger = logging.getLogger(__name__)
 
 
 class StorageError(Exception):
@@ -26,6 +38,176 @@ class StorageError(Exception):
     pass
 
 
+# 进程内读缓存，按文件绝对路径分区：每个用户分区的每个集合各占一项。
+# 快照文件总是被原子替换、追加日志只会追加或被删除，因此用
+# (inode, mtime, size) 就能可靠地判断缓存是否过期。
+_CACHE_MAX_ENTRIES = 512
+_cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+_cache_guard = threading.Lock()
+
+# 合并后的心情时间线视图：data_dir -> (records, moods, (两者的代数), timeline)，
+# 两个集合中任意一个被替换（对象不同）或被就地修改（代数不同）时失效
+_mood_views: "OrderedDict[str, Tuple[List, List, Tuple[int, int], List[dict]]]" = OrderedDict()
+
+# 追加日志（tail）文件后缀：records.json 的追加日志为 records.tail.jsonl
+TAIL_SUFFIX = ".tail.jsonl"
+
+# 用于去重的行标识字段。快照与追加日志短暂重叠时（压缩过程中或压缩中途崩溃），
+# 追加日志中与快照重复的行会被跳过。
+ROW_KEYS: Dict[str, Tuple[str, ...]] = {
+    "records.json": ("record_id",),
+    "moods.json": ("record_id",),
+    "inspirations.json": ("inspiration_id",),
+    "todos.json": ("todo_id",),
+    "changes.json": ("seq",),
+}
+
+# 变更日志中记录的集合（changes.json 自身不记录）
+SYNCED_FILES = ("records.json", "moods.json", "inspirations.json", "todos.json")
+
+# 变更日志总是追加到 changes.tail.jsonl（与 journal 设置无关）；追加日志达到该大小时
+# 就地合并进快照，合并后最多保留这么多条（更早的由"下限"标记代替，见 _fold_changes）
+CHANGE_LOG_FOLD_BYTES = 256 * 1024
+CHANGE_LOG_MAX_ENTRIES = 10000
+
+# 可被 update 操作定位的集合及其唯一标识字段
+ID_FIELDS: Dict[str, str] = {
+    "todos.json": "todo_id",
+}
+
+# 写入时生成唯一标识的集合（旧版本写入的行读取时补上稳定的标识）
+GENERATED_IDS: Dict[str, str] = {
+    "inspirations.json": "inspiration_id",
+    "todos.json": "todo_id",
+}
+
+
+class _CacheEntry:
+    """Parsed content of one collection (snapshot plus tail) and its indexes.
+    
+    New tail operations are applied to ``data``, ``positions`` and
+    ``indexes`` in place (under ``lock``), so replaying a tail line costs
+    the same whatever the size of the collection. ``generation`` counts
+    these in-place changes for views derived from ``data``.
+    """
+    
+    __slots__ = (
+        "stamp", "tail_stamp", "tail_offset", "snapshot_len",
+        "snapshot_keys", "data", "positions", "indexes", "generation", "lock"
+    )
+    
+    def __init__(
+        self,
+        stamp: Optional[Tuple[int, int, int]],
+        data: Any,
+        tail_stamp: Optional[Tuple[int, int, int]] = None,
+        tail_offset: int = 0
+    ):
+        self.stamp = stamp
+        self.tail_stamp = tail_stamp
+        self.tail_offset = tail_offset
+        self.snapshot_len = len(data)
+        # 快照中已有的行标识，首次回放追加日志时才收集
+        self.snapshot_keys: Optional[set] = None
+        self.data = data
+        # update 操作定位用的 行标识 -> 下标，遇到第一个 update 操作时才构建
+        self.positions: Optional[Dict[Any, int]] = None
+        # 索引名 -> (索引, 取键函数)
+        self.indexes: Dict[str, Tuple[Dict[Any, dict], Callable[[dict], Any]]] = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+
+
+def _file_stamp(file_path: Path) -> Optional[Tuple[int, int, int]]:
+    """Get a cheap change marker for a file, or None if it does not exist."""
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _cache_get(file_path: Path) -> Optional[_CacheEntry]:
+    """Get the cache entry of a collection (callers check its stamps)."""
+    key = str(file_path.absolute())
+    with _cache_guard:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+        return entry
+
+
+def _cache_generation(file_path: Path) -> int:
+    """Get the in-place change count of a cached collection (-1 if not cached)."""
+    entry = _cache_get(file_path)
+    return -1 if entry is None else entry.generation
+
+
+def _cache_put(file_path: Path, entry: _CacheEntry) -> _CacheEntry:
+    """Store a cache entry, evicting the least recently used ones."""
+    key = str(file_path.absolute())
+    with _cache_guard:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return entry
+
+
+def tail_path(file_path: Path) -> Path:
+    """Get the append-log (tail) path of a collection file."""
+    return file_path.with_name(file_path.stem + TAIL_SUFFIX)
+
+
+def legacy_row_id(record_id: str, ordinal: int) -> str:
+    """Get the stable id of a todo or inspiration written before they had ids.
+    
+    Args:
+        record_id: Record the row belongs to
+        ordinal: Position of the row among the record's id-less rows
+        
+    Returns:
+        Deterministic todo id of the form ``<record_id>-<ordinal>``
+    """
+    return f"{record_id}-{ordinal}"
+
+
+def row_key(file_name: str, row: Any) -> Optional[tuple]:
+    """Get the identity of a row used for de-duplication, if it has one."""
+    fields = ROW_KEYS.get(file_name)
+    if fields is None or not isinstance(row, dict):
+        return None
+    key = tuple(row.get(field) for field in fields)
+    # 缺少标识字段的行（旧版本写入）没有身份，不参与去重
+    return None if None in key else key
+
+
+def _as_row(item: Union[BaseModel, dict]) -> dict:
+    """Get the stored form of a model; dicts are taken as already validated."""
+    return item if isinstance(item, dict) else item.model_dump()
+
+
+def parsed_data_row(parsed_data: ParsedData) -> dict:
+    """Get the stored form of validated ParsedData without a dump round trip.
+    
+    Moods, inspirations and todos only hold plain values, so their field
+    dicts are already the stored form (equal to ``model_dump()``). The
+    copies are shallow: the rows share lists with the models.
+    
+    Args:
+        parsed_data: Validated parse result
+    
+    Returns:
+        Dict with mood, inspirations and todos as stored in records.json
+    """
+    mood = parsed_data.mood
+    return {
+        "mood": mood.__dict__.copy() if mood is not None else None,
+        "inspirations": [item.__dict__.copy() for item in parsed_data.inspirations],
+        "todos": [item.__dict__.copy() for item in parsed_data.todos]
+    }
+
+
 class StorageService:
     """Service for managing JSON file storage.
     
@@ -33,31 +215,78 @@ class StorageService:
     to separate JSON files. It ensures file initialization, generates unique IDs,
     and handles errors appropriately.
     
+    Every read-modify-write cycle runs under an exclusive lock on
+    ``.storage.lock`` in the data directory, so several uvicorn workers can
+    share one data directory without losing each other's writes. Files are
+    replaced atomically, which keeps readers lock-free.
+    
+    Parsed collections are cached in-process per file (and therefore per
+    user partition), so repeated reads only cost a ``stat`` call. Readers
+    get the cached list itself, and new tail operations are applied to it
+    in place under the cache entry's lock: appended rows extend the list
+    and updated rows replace the row at their position (row dicts are never
+    changed). Callers must not mutate the returned list or its rows, and
+    must not hold on to it across writes: a later read may extend it or
+    replace its rows, so take what is needed (or a copy) first. A rewritten
+    snapshot produces a new list.
+    
+    Each collection is a JSON snapshot (e.g. ``records.json``) plus an
+    optional append log (``records.tail.jsonl``, one operation per line).
+    In journal mode appends only write a line to the tail instead of
+    rewriting the snapshot; ``compact()`` folds the tail back into the
+    snapshot. Without journal mode every write rewrites the snapshot.
+    
+    Every appended or updated row is also given the next number of a
+    persistent, monotonically increasing change sequence (``changes.json``),
+    so clients can fetch only what changed with ``changes_since()``. Change
+    entries are always appended to the log's tail, in either mode, and the
+    tail is folded once it reaches ``CHANGE_LOG_FOLD_BYTES``.
+    
     Attributes:
         data_dir: Directory path for storing JSON files
         records_file: Path to records.json
         moods_file: Path to moods.json
         inspirations_file: Path to inspirations.json
         todos_file: Path to todos.json
+        changes_file: Path to changes.json, the log of change sequence numbers
+        lock_file: Path to the cross-process write lock file
+        journal: Whether appends go to the tail instead of rewriting snapshots
     
     Requirements: 7.1, 7.2, 7.3, 7.4, 7.5, 7.6, 7.7
     """
     
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, journal: bool = False):
         """Initialize the storage service.
         
         Args:
             data_dir: Directory path for storing JSON files
+            journal: Append new rows to the tail log instead of rewriting
+                the snapshot (requires periodic compaction)
         """
         self.data_dir = Path(data_dir)
+        self.journal = journal
         self.records_file = self.data_dir / "records.json"
         self.moods_file = self.data_dir / "moods.json"
         self.inspirations_file = self.data_dir / "inspirations.json"
         self.todos_file = self.data_dir / "todos.json"
+        self.changes_file = self.data_dir / "changes.json"
+        self.lock_file = self.data_dir / ".storage.lock"
         
         # Ensure data directory exists
         self.data_dir.mkdir(parents=True, exist_ok=True)
     
+    def write_lock(self) -> FileLock:
+        """Get the exclusive write lock for this data directory.
+        
+        The lock is re-entrant within a thread and shared across worker
+        processes. Hold it around any read-modify-write cycle on the
+        JSON files.
+        
+        Returns:
+            FileLock usable as a context manager
+        """
+        return get_lock(self.lock_file)
+    
     def _ensure_file_exists(self, file_path: Path) -> None:
         """Ensure a JSON file exists and is initialized with default data.
         
@@ -71,7 +300,12 @@ class StorageService:
             
         Requirements: 7.5
         """
-        if not file_path.exists():
+        if file_path.exists():
+            return
+        with self.write_lock():
+            # 加锁后再次检查，避免与其他进程重复初始化
+            if file_path.exists():
+                return
             try:
                 # 根据文件类型提供不同的默认数据
                 default_data = []
@@ -87,8 +321,8 @@ class StorageService:
                 elif file_path.name == 'user_config.json':
                     default_data = self._get_default_user_config()
                 
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(default_data, f, ensure_ascii=False, indent=2)
+                with atomic_open(file_path, "wb") as f:
+                    serialization.dump(default_data, f)
             except Exception as e:
                 raise StorageError(
                     f"Failed to initialize file {file_path}: {str(e)}"
@@ -347,16 +581,278 @@ class StorageService:
         """
         self._ensure_file_exists(file_path)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb') as f:
+                return serialization.load(f)
         except Exception as e:
             raise StorageError(
                 f"Failed to read file {file_path}: {str(e)}"
             )
     
+    def read_collection(self, file_path: Path) -> List:
+        """Read a collection (snapshot plus tail) through the in-process cache.
+        
+        The snapshot is only parsed again when it has been replaced on disk
+        (by this or any other process). When only the tail has grown, just
+        the new tail lines are parsed and applied to the cached list and
+        indexes in place.
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            
+        Returns:
+            Cached list of rows. Callers must not mutate it; later reads
+            may extend it or replace its rows once the tail grows.
+            
+        Raises:
+            StorageError: If file reading or parsing fails
+        """
+        self._ensure_file_exists(file_path)
+        tail = tail_path(file_path)
+        tail_stamp = _file_stamp(tail)
+        stamp = _file_stamp(file_path)
+        
+        entry = _cache_get(file_path)
+        if entry is not None and stamp is not None and entry.stamp == stamp:
+            with entry.lock:
+                if entry.tail_stamp == tail_stamp:
+                    return entry.data
+                if tail_stamp is not None and (
+                    entry.tail_stamp is None
+                    or (
+                        tail_stamp[0] == entry.tail_stamp[0]
+                        and tail_stamp[2] >= entry.tail_offset
+                    )
+                ):
+                    # 快照未变，追加日志只增长（或新建）：只解析新增的行并就地应用
+                    ops, consumed = self._read_tail(tail, entry.tail_offset)
+                    self._apply_tail(file_path, entry, ops)
+                    entry.tail_stamp = tail_stamp
+                    entry.tail_offset += consumed
+                    return entry.data
+        
+        # 先读追加日志再读快照：若压缩恰好发生在两者之间，
+        # 新快照已包含这些行，会在回放时按行标识去重
+        ops, consumed = self._read_tail(tail, 0) if tail_stamp is not None else ([], 0)
+        stamp = _file_stamp(file_path)
+        snapshot = self._read_json_file(file_path)
+        if not isinstance(snapshot, list):
+            return snapshot
+        entry = _CacheEntry(
+            stamp, self._normalize_rows(file_path, snapshot), tail_stamp, consumed
+        )
+        self._apply_tail(file_path, entry, ops)
+        if stamp is not None:
+            _cache_put(file_path, entry)
+        return entry.data
+    
+    def version(self, *file_paths: Path) -> str:
+        """Get a version token of one or more collections.
+        
+        The token is derived from the (inode, mtime, size) stamps of each
+        snapshot and tail, the same markers the read cache relies on: every
+        write replaces a snapshot or grows a tail, so the token changes with
+        any write by any process. Computing it costs only ``stat`` calls;
+        nothing is read or parsed.
+        
+        Args:
+            file_paths: Paths of the collections' JSON snapshots
+            
+        Returns:
+            Hex token, equal for unchanged collections
+            
+        Raises:
+            StorageError: If a missing collection cannot be initialized
+        """
+        stamps = []
+        for file_path in file_paths:
+            self._ensure_file_exists(file_path)
+            stamps.append((file_path.name, _file_stamp(file_path), _file_stamp(tail_path(file_path))))
+        return hashlib.blake2b(repr(stamps).encode("utf-8"), digest_size=12).hexdigest()
+    
+    def _normalize_rows(self, file_path: Path, rows: List) -> List:
+        """Fill in ids missing from rows written by older versions.
+        
+        Todos without ``todo_id`` and inspirations without
+        ``inspiration_id`` get ``legacy_row_id(record_id, n)``, where ``n``
+        counts the id-less rows of the same record in file order, so the
+        ids stay the same across reads, workers and restarts (and are
+        persisted by the next rewrite of the collection).
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            rows: Rows as parsed from the snapshot
+            
+        Returns:
+            ``rows`` itself, or a new list with copies of the amended rows
+        """
+        id_field = GENERATED_IDS.get(file_path.name)
+        if id_field is None:
+            return rows
+        if all(not isinstance(row, dict) or row.get(id_field) for row in rows):
+            return rows
+        
+        ordinals: Dict[Any, int] = {}
+        normalized = []
+        for row in rows:
+            if isinstance(row, dict) and not row.get(id_field):
+                record_id = row.get("record_id")
+                ordinal = ordinals.get(record_id, 0)
+                ordinals[record_id] = ordinal + 1
+                row = {**row, id_field: legacy_row_id(record_id, ordinal)}
+            normalized.append(row)
+        return normalized
+    
+    def _read_tail(self, tail: Path, offset: int) -> Tuple[List[dict], int]:
+        """Parse complete operation lines of a tail file from an offset.
+        
+        A trailing line without newline (a write in progress, or torn by a
+        crash) is left for a later read.
+        
+        Args:
+            tail: Path to the tail file
+            offset: Byte offset to start from
+            
+        Returns:
+            Tuple of (operations, number of bytes consumed)
+            
+        Raises:
+            StorageError: If the tail cannot be read
+        """
+        try:
+            with open(tail, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], 0
+        except Exception as e:
+            raise StorageError(f"Failed to read file {tail}: {str(e)}")
+        
+        end = chunk.rfind(b"\n") + 1
+        ops = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                ops.append(serialization.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping corrupted line in {tail}")
+        return ops, end
+    
+    def _snapshot_keys(self, file_path: Path, snapshot: List) -> set:
+        """Collect the row identities present in a snapshot."""
+        keys = set()
+        for row in snapshot:
+            key = row_key(file_path.name, row)
+            if key is not None:
+                keys.add(key)
+        return keys
+    
+    def _apply_tail(self, file_path: Path, entry: _CacheEntry, ops: List[dict]) -> None:
+        """Apply tail operations to a cache entry in place.
+        
+        Appended rows are added to the entry's rows and to every cached
+        index; updated rows are replaced at the position found through the
+        entry's id positions. Rows whose identity is already in the
+        snapshot are skipped. Must be called with ``entry.lock`` held (or
+        before the entry is shared).
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            entry: Cache entry whose ``data`` starts with the snapshot rows
+            ops: Operations parsed from the tail
+        """
+        if not ops:
+            return
+        if entry.snapshot_keys is None:
+            entry.snapshot_keys = self._snapshot_keys(file_path, entry.data[:entry.snapshot_len])
+        rows = entry.data
+        id_field = ID_FIELDS.get(file_path.name)
+        for op in ops:
+            if not isinstance(op, dict):
+                continue
+            kind = op.get("op")
+            if kind == "append":
+                row = op.get("row")
+                key = row_key(file_path.name, row)
+                if key is not None and key in entry.snapshot_keys:
+                    continue
+                rows.append(row)
+                if not isinstance(row, dict):
+                    continue
+                if entry.positions is not None:
+                    entry.positions[row.get(id_field)] = len(rows) - 1
+                # 同键的多行以最后一行为准，与完整构建的结果一致
+                for index, key_of in entry.indexes.values():
+                    index[key_of(row)] = row
+            elif kind == "update" and id_field is not None:
+                if entry.positions is None:
+                    entry.positions = {
+                        row.get(id_field): i
+                        for i, row in enumerate(rows)
+                        if isinstance(row, dict)
+                    }
+                position = entry.positions.get(op.get("id"))
+                if position is None:
+                    continue
+                old = rows[position]
+                new = {**old, **(op.get("set") or {})}
+                rows[position] = new
+                for name, (index, key_of) in list(entry.indexes.items()):
+                    if key_of(new) != key_of(old):
+                        # 修改了索引键：丢弃该索引，下次使用时重新构建
+                        del entry.indexes[name]
+                    elif index.get(key_of(old)) is old:
+                        index[key_of(old)] = new
+        entry.generation += 1
+    
+    def index_by(self, file_path: Path, key: str) -> Dict[Any, dict]:
+        """Get an index of a cached collection keyed by one field.
+        
+        The index is built once per collection version and shared with
+        other readers of the same partition. When several rows share a key
+        the last one wins.
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            key: Field name to index on
+            
+        Returns:
+            Mapping from field value to row. Callers must not mutate it.
+            
+        Raises:
+            StorageError: If file reading or parsing fails
+        """
+        return self._cached_index(file_path, key, lambda row: row.get(key))
+    
+    def _cached_index(
+        self,
+        file_path: Path,
+        name: str,
+        key_of: Callable[[dict], Any]
+    ) -> Dict[Any, dict]:
+        """Get an index keyed by ``key_of(row)``, built once per snapshot.
+        
+        Rows applied later from the tail update the index in place.
+        """
+        data = self.read_collection(file_path)
+        entry = _cache_get(file_path)
+        if entry is None or entry.data is not data:
+            # 集合在读取期间被替换，直接构建一次性索引
+            return {key_of(row): row for row in data if isinstance(row, dict)}
+        with entry.lock:
+            cached = entry.indexes.get(name)
+            if cached is None:
+                cached = ({key_of(row): row for row in data if isinstance(row, dict)}, key_of)
+                entry.indexes[name] = cached
+        return cached[0]
+    
     def _write_json_file(self, file_path: Path, data: List) -> None:
         """Write data to a JSON file.
         
+        The data is encoded as compact UTF-8 JSON and the file is replaced
+        atomically so that lock-free readers never observe a partially
+        written file.
+        
         Args:
             file_path: Path to the JSON file
             data: List of records to write
@@ -367,21 +863,229 @@ class StorageService:
         Requirements: 7.6
         """
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with atomic_open(file_path, "wb") as f:
+                serialization.dump(data, f)
+                f.flush()
+                # 在重命名前取临时文件的 stat，与替换后的目标文件一致
+                st = os.fstat(f.fileno())
         except Exception as e:
             raise StorageError(
                 f"Failed to write file {file_path}: {str(e)}"
             )
+        
+        # 写入的数据就是快照的最新内容，直接放入缓存，省去下一次解析；
+        # 若追加日志仍存在，下一次读取会在此基础上回放它
+        _cache_put(file_path, _CacheEntry(
+            (st.st_ino, st.st_mtime_ns, st.st_size),
+            self._normalize_rows(file_path, data)
+        ))
+    
+    def _write_collection(self, file_path: Path, data: List) -> None:
+        """Replace a whole collection with new rows.
+        
+        Writes the snapshot and then drops the tail, whose operations are
+        already contained in ``data``. Must be called with the write lock
+        held and ``data`` derived from ``read_collection``.
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            data: Complete list of rows
+            
+        Raises:
+            StorageError: If file writing fails
+        """
+        self._write_json_file(file_path, data)
+        tail = tail_path(file_path)
+        try:
+            os.unlink(tail)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            raise StorageError(f"Failed to remove file {tail}: {str(e)}")
+    
+    def _append_rows(self, file_path: Path, rows: List[dict]) -> None:
+        """Append rows to a collection.
+        
+        In journal mode the rows are written as ``append`` operations to the
+        tail (cost independent of collection size); otherwise the snapshot
+        is rewritten. The rows are then logged in the change sequence.
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            rows: Rows to append
+            
+        Raises:
+            StorageError: If file writing fails
+        """
+        with self.write_lock():
+            if not self.journal:
+                data = list(self.read_collection(file_path))
+                data.extend(rows)
+                self._write_collection(file_path, data)
+            else:
+                self._ensure_file_exists(file_path)
+                self._append_ops(file_path, [{"op": "append", "row": row} for row in rows])
+            
+            if file_path.name in SYNCED_FILES:
+                self._log_changes(file_path, [row_key(file_path.name, row) for row in rows])
+    
+    def _log_changes(self, file_path: Path, keys: List[Optional[tuple]]) -> None:
+        """Give changed rows the next numbers of the change sequence.
+        
+        Must be called with the write lock held, after the rows themselves
+        have been written: a reader that sees a sequence number then also
+        sees the row (a crash in between only loses the log entry).
+        
+        Args:
+            file_path: Path to the changed collection's JSON snapshot
+            keys: Identities (``row_key``) of the changed rows
+            
+        Raises:
+            StorageError: If file writing fails
+        """
+        seq = self.sequence()
+        ops = []
+        for key in keys:
+            if key is None:
+                continue
+            seq += 1
+            ops.append({"op": "append", "row": {
+                "seq": seq, "collection": file_path.name, "key": list(key)
+            }})
+        if not ops:
+            return
+        # 无论是否启用 journal 都只追加一行，写入成本与历史长度无关
+        self._ensure_file_exists(self.changes_file)
+        self._append_ops(self.changes_file, ops)
+        self._fold_changes(CHANGE_LOG_FOLD_BYTES)
+    
+    def _fold_changes(self, min_tail_bytes: int = 0) -> bool:
+        """Fold the change log's tail into its snapshot.
+        
+        Only the latest sequence number of each row is kept, and at most
+        ``CHANGE_LOG_MAX_ENTRIES`` entries. When older entries are dropped,
+        a floor marker (``"collection": None``) with the highest dropped
+        number is kept first: clients behind it need a full resync.
+        Must be called with the write lock held.
+        
+        Args:
+            min_tail_bytes: Skip folding while the tail is smaller than this
+            
+        Returns:
+            Whether the change log was rewritten
+            
+        Raises:
+            StorageError: If file reading or writing fails
+        """
+        tail_size = (_file_stamp(tail_path(self.changes_file)) or (0, 0, 0))[2]
+        if tail_size == 0 or tail_size < min_tail_bytes:
+            return False
+        
+        floor = None
+        latest: Dict[Any, dict] = {}
+        for change in self.read_collection(self.changes_file):
+            if change.get("collection") is None:
+                floor = change
+                continue
+            # 每一行只保留最新的变更序号，并按序号排列
+            key = (change["collection"], tuple(change["key"]))
+            latest.pop(key, None)
+            latest[key] = change
+        
+        changes = list(latest.values())
+        if len(changes) > CHANGE_LOG_MAX_ENTRIES:
+            dropped = changes[:-CHANGE_LOG_MAX_ENTRIES]
+            changes = changes[-CHANGE_LOG_MAX_ENTRIES:]
+            floor = {"seq": dropped[-1]["seq"], "collection": None, "key": []}
+        self._write_collection(self.changes_file, ([floor] if floor else []) + changes)
+        return True
+    
+    def sequence(self) -> int:
+        """Get the number of the latest change of this partition.
+        
+        Returns:
+            Latest sequence number (0 if nothing was changed yet)
+            
+        Raises:
+            StorageError: If file reading or parsing fails
+        """
+        changes = self.read_collection(self.changes_file)
+        return changes[-1]["seq"] if changes else 0
+    
+    def changes_since(self, since: int) -> Tuple[int, Optional[Dict[str, List[dict]]]]:
+        """Get the rows inserted or updated after a sequence number.
+        
+        Each changed row is returned once, in its current version. Rows
+        that predate the change log (e.g. the welcome data) have no
+        sequence number; clients load them with a full read first.
+        
+        Args:
+            since: Sequence number the client is up to date with
+            
+        Returns:
+            Tuple of (latest sequence number, changed rows per collection
+            file name); the rows are None when ``since`` is older than the
+            oldest kept entry of the log and the client must resync fully
+            
+        Raises:
+            StorageError: If file reading or parsing fails
+        """
+        # 先读变更日志再读集合：写入方先写行再写日志，因此日志中的每个序号都能找到对应的行
+        changes = self.read_collection(self.changes_file)
+        # 缓存的列表可能被并发读取就地追加，只处理此刻已有的条目
+        count = len(changes)
+        seq = changes[count - 1]["seq"] if count else 0
+        if count and changes[0].get("collection") is None and since < changes[0]["seq"]:
+            return seq, None
+        start = bisect.bisect_right(changes, since, hi=count, key=lambda change: change["seq"])
+        
+        keys: Dict[str, Dict[tuple, None]] = {name: {} for name in SYNCED_FILES}
+        for change in changes[start:count]:
+            keys[change["collection"]][tuple(change["key"])] = None
+        
+        rows: Dict[str, List[dict]] = {}
+        for name, changed in keys.items():
+            if not changed:
+                rows[name] = []
+                continue
+            index = self._cached_index(
+                self.data_dir / name, "#row_key",
+                lambda row, name=name: row_key(name, row)
+            )
+            rows[name] = [index[key] for key in changed if key in index]
+        return seq, rows
+    
+    def _append_ops(self, file_path: Path, ops: List[dict]) -> None:
+        """Durably append operation lines to a collection's tail.
+        
+        Must be called with the write lock held.
+        
+        Args:
+            file_path: Path to the collection's JSON snapshot
+            ops: Operations to append
+            
+        Raises:
+            StorageError: If file writing fails
+        """
+        tail = tail_path(file_path)
+        payload = b"".join(serialization.dumps(op) + b"\n" for op in ops)
+        try:
+            with open(tail, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            raise StorageError(f"Failed to write file {tail}: {str(e)}")
     
-    def save_record(self, record: RecordData) -> str:
+    def save_record(self, record: Union[RecordData, dict]) -> str:
         """Save a complete record to records.json.
         
         Generates a unique UUID for the record if not already set,
         and appends the record to the records.json file.
         
         Args:
-            record: RecordData object to save
+            record: RecordData object to save, or an already validated
+                record as a dict (stored as is)
             
         Returns:
             The unique record_id (UUID string)
@@ -391,26 +1095,23 @@ class StorageService:
             
         Requirements: 7.1, 7.7
         """
+        row = _as_row(record)
         # Generate unique UUID if not set
-        if not record.record_id:
-            record.record_id = str(uuid.uuid4())
-        
-        # Read existing records
-        records = self._read_json_file(self.records_file)
+        if not row.get("record_id"):
+            row["record_id"] = str(uuid.uuid4())
+            if isinstance(record, RecordData):
+                record.record_id = row["record_id"]
         
         # Append new record
-        records.append(record.model_dump())
-        
-        # Write back to file
-        self._write_json_file(self.records_file, records)
+        self._append_rows(self.records_file, [row])
         
-        return record.record_id
+        return row["record_id"]
     
-    def append_mood(self, mood: MoodData, record_id: str, timestamp: str) -> None:
+    def append_mood(self, mood: Union[MoodData, dict], record_id: str, timestamp: str) -> None:
         """Append mood data to moods.json.
         
         Args:
-            mood: MoodData object to append
+            mood: MoodData object (or validated dict) to append
             record_id: Associated record ID
             timestamp: ISO 8601 timestamp
             
@@ -419,90 +1120,273 @@ class StorageService:
             
         Requirements: 7.2
         """
-        # Read existing moods
-        moods = self._read_json_file(self.moods_file)
-        
         # Create mood entry with metadata
         mood_entry = {
             "record_id": record_id,
             "timestamp": timestamp,
-            **mood.model_dump()
+            **_as_row(mood)
         }
         
         # Append new mood
-        moods.append(mood_entry)
-        
-        # Write back to file
-        self._write_json_file(self.moods_file, moods)
+        self._append_rows(self.moods_file, [mood_entry])
     
     def append_inspirations(
         self, 
-        inspirations: List[InspirationData], 
+        inspirations: List[Union[InspirationData, dict]], 
         record_id: str, 
         timestamp: str
-    ) -> None:
+    ) -> List[str]:
         """Append inspiration data to inspirations.json.
         
+        Every inspiration gets its own unique ``inspiration_id``, so two
+        inspirations of one record with the same core idea stay distinct.
+        
         Args:
-            inspirations: List of InspirationData objects to append
+            inspirations: List of InspirationData objects (or validated dicts) to append
             record_id: Associated record ID
             timestamp: ISO 8601 timestamp
             
+        Returns:
+            The inspiration_ids of the appended inspirations
+            
         Raises:
             StorageError: If file writing fails
             
         Requirements: 7.3
         """
         if not inspirations:
-            return
-        
-        # Read existing inspirations
-        all_inspirations = self._read_json_file(self.inspirations_file)
+            return []
         
         # Create inspiration entries with metadata
-        for inspiration in inspirations:
-            inspiration_entry = {
+        entries = [
+            {
+                "inspiration_id": str(uuid.uuid4()),
                 "record_id": record_id,
                 "timestamp": timestamp,
-                **inspiration.model_dump()
+                **_as_row(inspiration)
             }
-            all_inspirations.append(inspiration_entry)
+            for inspiration in inspirations
+        ]
         
-        # Write back to file
-        self._write_json_file(self.inspirations_file, all_inspirations)
+        self._append_rows(self.inspirations_file, entries)
+        return [entry["inspiration_id"] for entry in entries]
     
     def append_todos(
         self, 
-        todos: List[TodoData], 
+        todos: List[Union[TodoData, dict]], 
         record_id: str, 
         timestamp: str
-    ) -> None:
+    ) -> List[str]:
         """Append todo data to todos.json.
         
+        Every todo gets its own unique ``todo_id``, so several todos of the
+        same record can be addressed individually.
+        
         Args:
-            todos: List of TodoData objects to append
+            todos: List of TodoData objects (or validated dicts) to append
             record_id: Associated record ID
             timestamp: ISO 8601 timestamp
             
+        Returns:
+            The todo_ids of the appended todos
+            
         Raises:
             StorageError: If file writing fails
             
         Requirements: 7.4
         """
         if not todos:
-            return
-        
-        # Read existing todos
-        all_todos = self._read_json_file(self.todos_file)
+            return []
         
         # Create todo entries with metadata
-        for todo in todos:
-            todo_entry = {
+        entries = [
+            {
+                "todo_id": str(uuid.uuid4()),
                 "record_id": record_id,
                 "timestamp": timestamp,
-                **todo.model_dump()
+                **_as_row(todo)
             }
-            all_todos.append(todo_entry)
+            for todo in todos
+        ]
+        
+        self._append_rows(self.todos_file, entries)
+        return [entry["todo_id"] for entry in entries]
+    
+    def update_todo(self, todo_id: str, changes: Dict[str, Any]) -> Optional[dict]:
+        """Update fields of one todo.
+        
+        Args:
+            todo_id: Id of the todo to update
+            changes: Fields to set (e.g. ``{"status": "done"}``)
+            
+        Returns:
+            The updated todo, or None if no todo has this id
+            
+        Raises:
+            StorageError: If file reading or writing fails
+        """
+        updated, missing = self.update_todos([(todo_id, changes)])
+        return None if missing else updated[0]
+    
+    def update_todos(
+        self, changes: List[Tuple[str, Dict[str, Any]]]
+    ) -> Tuple[List[dict], List[str]]:
+        """Apply several todo changes in one write.
+        
+        Todos are located through the cached todo_id index. All changes are
+        applied under one lock acquisition: in journal mode as one batch of
+        ``update`` lines in the tail (independent of the number of todos),
+        otherwise as a single rewrite of todos.json (proportional to it). If
+        any todo does not exist nothing is changed.
+        
+        Args:
+            changes: (todo_id, fields to set) pairs, applied in order
+            
+        Returns:
+            Tuple of (updated todos in first-mention order, unknown todo_ids)
+            
+        Raises:
+            StorageError: If file reading or writing fails
+        """
+        with self.write_lock():
+            index = self.index_by(self.todos_file, "todo_id")
+            missing = list(dict.fromkeys(
+                todo_id for todo_id, _ in changes if todo_id not in index
+            ))
+            if missing or not changes:
+                return [], missing
+            
+            # 同一待办的多次修改按顺序合并
+            updated: Dict[str, dict] = {}
+            for todo_id, fields in changes:
+                updated[todo_id] = {**updated.get(todo_id, index[todo_id]), **fields}
+            
+            if self.journal:
+                self._append_ops(self.todos_file, [
+                    {"op": "update", "id": todo_id, "set": fields}
+                    for todo_id, fields in changes
+                ])
+            else:
+                todos = [
+                    updated.get(row.get("todo_id"), row) if isinstance(row, dict) else row
+                    for row in self.read_collection(self.todos_file)
+                ]
+                self._write_collection(self.todos_file, todos)
+            self._log_changes(self.todos_file, [(todo_id,) for todo_id in updated])
+        return list(updated.values()), []
+    
+    def get_mood_timeline(self) -> List[dict]:
+        """Get all moods of this partition, newest first.
+        
+        Moods come from records.json (each record's ``parsed_data.mood``,
+        including its original text) and from moods.json for moods without
+        a matching record. The merged view is cached until either
+        collection changes.
+        
+        Returns:
+            List of mood dicts sorted by timestamp descending. Callers must
+            not mutate it.
+            
+        Raises:
+            StorageError: If file reading or parsing fails
+        """
+        moods = self.read_collection(self.moods_file)
+        records = self.read_collection(self.records_file)
+        # 代数在读取之后获取：计算期间发生的就地追加会使下一次读取重新计算
+        generations = (_cache_generation(self.records_file), _cache_generation(self.moods_file))
+        
+        key = str(self.data_dir.absolute())
+        with _cache_guard:
+            view = _mood_views.get(key)
+        if view is not None and view[0] is records and view[1] is moods and view[2] == generations:
+            return view[3]
+        
+        mood_dict = {}
+        # 先添加 moods.json 中的数据（缓存中的行是共享的，复制后再补充字段）
+        for mood in moods:
+            mood_dict[mood["record_id"]] = {"original_text": "", **mood}
+        
+        # 再添加/覆盖 records.json 中的数据（包含 original_text）
+        for record in records:
+            mood_data = record.get("parsed_data", {}).get("mood")
+            if mood_data and mood_data.get("type"):
+                mood_dict[record["record_id"]] = {
+                    "record_id": record["record_id"],
+                    "timestamp": record["timestamp"],
+                    "type": mood_data.get("type"),
+                    "intensity": mood_data.get("intensity", 5),
+                    "keywords": mood_data.get("keywords", []),
+                    "original_text": record.get("original_text", "")
+                }
+        
+        timeline = list(mood_dict.values())
+        timeline.sort(key=lambda x: x["timestamp"], reverse=True)
+        
+        with _cache_guard:
+            _mood_views[key] = (records, moods, generations, timeline)
+            _mood_views.move_to_end(key)
+            while len(_mood_views) > _CACHE_MAX_ENTRIES:
+                _mood_views.popitem(last=False)
+        return timeline
+    
+    def compact(self, min_tail_bytes: int = 0) -> List[str]:
+        """Fold append logs into compact snapshots and drop redundant rows.
+        
+        For every collection whose tail is at least ``min_tail_bytes`` long
+        (or that contains duplicate rows), the merged rows are written as a
+        new snapshot and the tail is removed. Rows with the same identity
+        are de-duplicated (first position, last content), moods that are
+        already carried by a record's ``parsed_data`` are dropped since
+        ``get_mood_timeline`` derives them from records.json, and the change
+        log is folded (see ``_fold_changes``).
+        
+        Args:
+            min_tail_bytes: Skip collections whose tail is smaller than this
+            
+        Returns:
+            Names of the collection files that were rewritten
+            
+        Raises:
+            StorageError: If file reading or writing fails
+        """
+        compacted = []
+        with self.write_lock():
+            records = self.read_collection(self.records_file)
+            # 已由 records.json 承载的心情是派生数据，压缩时从 moods.json 中去掉
+            derived_moods = {
+                (record.get("record_id"),)
+                for record in records
+                if isinstance(record, dict)
+                and ((record.get("parsed_data") or {}).get("mood") or {}).get("type")
+            }
+            
+            for file_path in (
+                self.records_file, self.moods_file,
+                self.inspirations_file, self.todos_file
+            ):
+                tail_size = (_file_stamp(tail_path(file_path)) or (0, 0, 0))[2]
+                rows = self.read_collection(file_path)
+                
+                merged: Dict[Any, Any] = {}
+                for position, row in enumerate(rows):
+                    key = row_key(file_path.name, row)
+                    if key is None:
+                        key = ("#", position)
+                    elif file_path == self.moods_file and key in derived_moods:
+                        continue
+                    merged[key] = row
+                
+                if len(merged) == len(rows) and (
+                    tail_size == 0 or tail_size < min_tail_bytes
+                ):
+                    continue
+                
+                self._write_collection(file_path, list(merged.values()))
+                compacted.append(file_path.name)
+            
+            if self._fold_changes(min_tail_bytes):
+                compacted.append(self.changes_file.name)
         
-        # Write back to file
-        self._write_json_file(self.todos_file, all_todos)
+        if compacted:
+            logger.info(f"Compacted {', '.join(compacted)} in {self.data_dir}")
+        return compacted
@@ -0,0 +1,122 @@
+"""Multi-tenant data partitioning for Voice Text Processor.
+
+This module resolves the user a request belongs to and maps every user to
+their own data partition, so that each request only touches one user's
+records, moods, inspirations, todos and configuration.
+
+The user is identified by the ``X-User-Id`` header, or by an opaque bearer
+token in the ``Authorization`` header (hashed, so tokens never end up on
+disk). Requests without either belong to ``default_user``, whose partition
+is the data directory itself to stay compatible with existing deployments.
+With several data roots configured, other users' partitions are spread over
+the roots by ``app.sharding``.
+"""
+
+import hashlib
+import re
+from pathlib import Path
+from typing import Optional, Union
+
+from app.sharding import HashRing, USERS_SUBDIR, root_for_user
+
+
+DEFAULT_USER_ID = "default_user"
+USER_ID_HEADER = "X-User-Id"
+
+# 用户 ID 直接作为目录名使用，只允许安全字符
+_USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class InvalidUserIdError(ValueError):
+    """Exception raised when a request carries an unusable user id."""
+
+    def __init__(self, message: str = "无效的用户标识"):
+        """Initialize InvalidUserIdError.
+
+        Args:
+            message: Error message describing the failure
+        """
+        super().__init__(message)
+        self.message = message
+
+
+def validate_user_id(user_id: str) -> str:
+    """Validate that a user id is safe to use as a directory name.
+
+    Args:
+        user_id: User id to validate
+
+    Returns:
+        The validated user id
+
+    Raises:
+        InvalidUserIdError: If the id is empty, too long or has unsafe characters
+    """
+    if not _USER_ID_PATTERN.match(user_id or ""):
+        raise InvalidUserIdError(
+            "无效的用户标识: 只允许 1-64 位字母、数字、下划线或连字符"
+        )
+    return user_id
+
+
+def user_id_from_token(token: str) -> str:
+    """Derive a stable partition key from an opaque bearer token.
+
+    Args:
+        token: Bearer token value
+
+    Returns:
+        User id of the form ``t_<hex digest>``
+    """
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+    return f"t_{digest}"
+
+
+def resolve_user_id(
+    user_id_header: Optional[str] = None,
+    authorization: Optional[str] = None
+) -> str:
+    """Resolve the user id of a request from its headers.
+
+    Args:
+        user_id_header: Value of the X-User-Id header (optional)
+        authorization: Value of the Authorization header (optional)
+
+    Returns:
+        The resolved user id, DEFAULT_USER_ID if none was supplied
+
+    Raises:
+        InvalidUserIdError: If the supplied user id is invalid
+    """
+    if user_id_header is not None and user_id_header.strip():
+        return validate_user_id(user_id_header.strip())
+
+    if authorization:
+        scheme, _, token = authorization.strip().partition(" ")
+        if scheme.lower() == "bearer" and token.strip():
+            return user_id_from_token(token.strip())
+
+    return DEFAULT_USER_ID
+
+
+def partition_dir(
+    data_dir: Union[str, Path],
+    user_id: str,
+    ring: Optional[HashRing] = None
+) -> Path:
+    """Get the data partition directory of a user.
+
+    Args:
+        data_dir: Primary data directory
+        user_id: Validated user id
+        ring: Consistent-hash ring over the data roots (optional). Without a
+            ring every partition lives under ``data_dir``.
+
+    Returns:
+        ``data_dir`` for the default user, ``<root>/users/<user_id>`` otherwise
+    """
+    data_dir = Path(data_dir)
+    if user_id == DEFAULT_USER_ID:
+        return data_dir
+    root = root_for_user(ring, user_id) if ring is not None else data_dir
+    return root / USERS_SUBDIR / validate_user_id(user_id)
@@ -6,12 +6,15 @@ the generated cat character image settings.
 Requirements: PRD - AI形象生成模块
 """
 
-import json
 import os
 from typing import Optional, Dict, List
 from datetime import datetime
 import logging
 
+from app.file_lock import get_lock, atomic_open
+from app import serialization
+from app.tenancy import DEFAULT_USER_ID
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,19 +24,27 @@ class UserConfig:
     This class manages user-specific settings, particularly
     the generated cat character image configuration.
     
+    Updates are serialized with the storage write lock of the same
+    directory and written atomically, so concurrent workers do not
+    overwrite each other's changes.
+    
     Attributes:
         config_dir: Directory for storing user configurations
         config_file: Path to the user config JSON file
+        user_id: Id of the user owning this configuration
     """
     
-    def __init__(self, config_dir: str = "data"):
+    def __init__(self, config_dir: str = "data", user_id: str = DEFAULT_USER_ID):
         """Initialize user configuration manager.
         
         Args:
-            config_dir: Directory for storing configurations
+            config_dir: Directory for storing configurations (the user's partition)
+            user_id: Id of the user owning this configuration
         """
         self.config_dir = config_dir
+        self.user_id = user_id
         self.config_file = os.path.join(config_dir, "user_config.json")
+        self._lock = get_lock(os.path.join(config_dir, ".storage.lock"))
         
         # 确保目录存在
         os.makedirs(config_dir, exist_ok=True)
@@ -45,7 +56,7 @@ class UserConfig:
     def _init_config_file(self):
         """Initialize the configuration file with default values."""
         default_config = {
-            "user_id": "default_user",
+            "user_id": self.user_id,
             "created_at": datetime.utcnow().isoformat() + "Z",
             "character": {
                 "image_url": "",  # 空字符串，前端会显示占位符
@@ -66,11 +77,23 @@ class UserConfig:
             }
         }
         
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, ensure_ascii=False, indent=2)
+        with self._lock, atomic_open(self.config_file, "wb") as f:
+            serialization.dump(default_config, f)
         
         logger.info(f"Initialized user config file: {self.config_file}")
     
+    def version(self) -> str:
+        """Get a token that changes whenever the configuration file is replaced.
+        
+        Returns:
+            Token derived from the file's inode, modification time and size
+        """
+        try:
+            st = os.stat(self.config_file)
+        except FileNotFoundError:
+            return "0"
+        return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+    
     def load_config(self) -> Dict:
         """Load user configuration from file.
         
@@ -78,8 +101,8 @@ class UserConfig:
             Dictionary containing user configuration
         """
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            with open(self.config_file, 'rb') as f:
+                config = serialization.load(f)
             return config
         except Exception as e:
             logger.error(f"Failed to load user config: {str(e)}")
@@ -94,8 +117,8 @@ class UserConfig:
             config: Configuration dictionary to save
         """
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            with self._lock, atomic_open(self.config_file, "wb") as f:
+                serialization.dump(config, f)
             logger.info("User config saved successfully")
         except Exception as e:
             logger.error(f"Failed to save user config: {str(e)}")
@@ -125,19 +148,20 @@ class UserConfig:
             revised_prompt: AI-revised prompt (optional)
             preferences: User preferences used (optional)
         """
-        config = self.load_config()
-        
-        # 更新角色配置
-        config["character"]["image_url"] = image_url
-        config["character"]["prompt"] = prompt
-        config["character"]["revised_prompt"] = revised_prompt or prompt
-        config["character"]["generated_at"] = datetime.utcnow().isoformat() + "Z"
-        config["character"]["generation_count"] += 1
-        
-        if preferences:
-            config["character"]["preferences"] = preferences
-        
-        self.save_config(config)
+        with self._lock:
+            config = self.load_config()
+            
+            # 更新角色配置
+            config["character"]["image_url"] = image_url
+            config["character"]["prompt"] = prompt
+            config["character"]["revised_prompt"] = revised_prompt or prompt
+            config["character"]["generated_at"] = datetime.utcnow().isoformat() + "Z"
+            config["character"]["generation_count"] += 1
+            
+            if preferences:
+                config["character"]["preferences"] = preferences
+            
+            self.save_config(config)
         logger.info(f"Character image saved: {image_url[:50]}...")
     
     def get_character_image_url(self) -> Optional[str]:
@@ -178,19 +202,20 @@ class UserConfig:
             appearance: Appearance feature (optional)
             role: Character role (optional)
         """
-        config = self.load_config()
-        preferences = config["character"]["preferences"]
-        
-        if color:
-            preferences["color"] = color
-        if personality:
-            preferences["personality"] = personality
-        if appearance:
-            preferences["appearance"] = appearance
-        if role:
-            preferences["role"] = role
-        
-        self.save_config(config)
+        with self._lock:
+            config = self.load_config()
+            preferences = config["character"]["preferences"]
+            
+            if color:
+                preferences["color"] = color
+            if personality:
+                preferences["personality"] = personality
+            if appearance:
+                preferences["appearance"] = appearance
+            if role:
+                preferences["role"] = role
+            
+            self.save_config(config)
         logger.info("Character preferences updated")
     
     def get_generation_count(self) -> int:
@@ -0,0 +1,144 @@
+"""Benchmark the rule-based fast-path parser against model results.
+
+Runs ``app.fast_parser.fast_parse`` on the input texts of
+tests/test_semantic_parser*.py, compared with their mocked GLM-4-Flash
+results, plus some common short inputs with hand-labelled expectations.
+Only inputs whose confidence reaches the threshold (i.e. that would skip the
+API in production) count towards the accuracy.
+
+Usage:
+    python benchmarks/bench_fast_parser.py [--threshold 0.9] [--verbose]
+"""
+
+import argparse
+import ast
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.fast_parser import fast_parse  # noqa: E402
+from app.models import ParsedData  # noqa: E402
+
+
+Case = Tuple[str, Dict[str, Any]]
+
+# 常见短输入及人工标注的预期结果
+SHORT_CASES: List[Case] = [
+    ("明天买牛奶", {"mood": None, "todos": [{"task": "买牛奶", "time": "明天"}]}),
+    ("好累", {"mood": {"type": "疲惫"}, "todos": []}),
+    ("今天好开心", {"mood": {"type": "开心"}, "todos": []}),
+    ("有点焦虑", {"mood": {"type": "焦虑"}, "todos": []}),
+    ("记得交房租", {"mood": None, "todos": [{"task": "交房租", "time": None}]}),
+    ("周五提交报告", {"mood": None, "todos": [{"task": "提交报告", "time": "周五"}]}),
+    ("下周三下午3点去医院复查", {"mood": None, "todos": [{"task": "去医院复查", "time": "下周三下午3点"}]}),
+    ("压力好大，明天还要加班", {"mood": {"type": "焦虑"}, "todos": [{"task": "加班", "time": "明天"}]}),
+    ("不太开心", {"mood": {"type": "低落"}, "todos": []}),
+    ("今天天气真好", {"mood": {"type": "开心"}, "todos": []}),
+]
+
+
+def load_test_fixtures(tests_dir: Path) -> List[Case]:
+    """Collect (input text, mocked API result) pairs from the parser tests."""
+    cases: List[Case] = []
+    for path in sorted(tests_dir.glob("test_semantic_parser*.py")):
+        tree = ast.parse(path.read_text(encoding="utf-8-sig"))
+        fixtures = {
+            node.name: node.body[-1].value.value
+            for node in tree.body
+            if isinstance(node, ast.FunctionDef)
+            and isinstance(node.body[-1], ast.Return)
+            and isinstance(node.body[-1].value, ast.Constant)
+            and isinstance(node.body[-1].value.value, str)
+        }
+        for node in tree.body:
+            if not isinstance(node, ast.AsyncFunctionDef):
+                continue
+            text = next((fixtures[arg.arg] for arg in node.args.args if arg.arg in fixtures), None)
+            expected = None
+            for child in ast.walk(node):
+                if (
+                    isinstance(child, ast.Assign)
+                    and any(isinstance(t, ast.Name) and t.id == "text" for t in child.targets)
+                    and isinstance(child.value, ast.Constant)
+                ):
+                    text = child.value.value
+                if (
+                    isinstance(child, ast.Call)
+                    and isinstance(child.func, ast.Attribute)
+                    and child.func.attr == "dumps"
+                    and child.args
+                    and isinstance(child.args[0], ast.Dict)
+                ):
+                    try:
+                        expected = ast.literal_eval(child.args[0])
+                    except ValueError:
+                        expected = None
+            if text and isinstance(expected, dict) and "todos" in expected:
+                cases.append((text, expected))
+    return cases
+
+
+def agrees(parsed: ParsedData, expected: Dict[str, Any]) -> bool:
+    """Compare the mood type, the number of todos and their times."""
+    expected_mood = (expected.get("mood") or {}).get("type")
+    if (parsed.mood.type if parsed.mood else None) != expected_mood:
+        return False
+    expected_todos = expected.get("todos") or []
+    if len(parsed.todos) != len(expected_todos):
+        return False
+    return all(todo.time == item.get("time") for todo, item in zip(parsed.todos, expected_todos))
+
+
+def benchmark(cases: List[Case], threshold: float, repeat: int, verbose: bool) -> Tuple[int, int, float]:
+    """Run the fast parser on every case.
+
+    Returns:
+        Tuple of (inputs answered locally, of which correct, mean µs per call)
+    """
+    local = correct = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _expected in cases:
+            fast_parse(text)
+    mean_us = (time.perf_counter() - started) / (repeat * len(cases)) * 1e6
+
+    for text, expected in cases:
+        parsed, confidence = fast_parse(text)
+        used = confidence >= threshold
+        ok: Optional[bool] = agrees(parsed, expected) if used else None
+        local += used
+        correct += bool(ok)
+        if verbose:
+            mark = "—" if ok is None else ("✅" if ok else "❌")
+            print(f"{mark} {confidence:.2f}  {text}")
+    return local, correct, mean_us
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=0.9, help="Confidence needed to skip the API")
+    parser.add_argument("--repeat", type=int, default=2000, help="Timing repetitions per input")
+    parser.add_argument("--verbose", action="store_true", help="Print the result of every input")
+    args = parser.parse_args()
+
+    tests_dir = Path(__file__).resolve().parent.parent / "tests"
+    suites = [("测试样例", load_test_fixtures(tests_dir)), ("常见短输入", SHORT_CASES)]
+    for name, cases in suites:
+        if not cases:
+            print(f"❌ {name}：没有样例")
+            continue
+        print(f"== {name}（{len(cases)} 条）==")
+        local, correct, mean_us = benchmark(cases, args.threshold, args.repeat, args.verbose)
+        accuracy = f"{correct / local:.0%}" if local else "-"
+        print(
+            f"本地解析 {local}/{len(cases)} 条，其中正确 {correct} 条（准确率 {accuracy}），"
+            f"平均耗时 {mean_us:.1f} µs/条"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
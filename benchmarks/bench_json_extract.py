@@ -0,0 +1,86 @@
+"""Benchmark JSON extraction from model output.
+
+Compares the previous approach (cut out the first code block, then
+``json.loads``) with ``app.json_extract.extract_json`` on samples of common
+model outputs. Every sample the previous approach fails on costs an extra
+API request in production.
+
+Usage:
+    python benchmarks/bench_json_extract.py [--repeat 5000]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.json_extract import extract_json  # noqa: E402
+
+
+RESULT = {
+    "mood": {"type": "焦虑", "intensity": 7, "keywords": ["压力", "疲惫", "放松"]},
+    "inspirations": [{"core_idea": "晚霞可以缓解压力", "tags": ["自然", "治愈"], "category": "生活"}],
+    "todos": [{"task": "整理文档", "time": "明天", "location": None, "status": "pending"}],
+}
+DOCUMENT = json.dumps(RESULT, ensure_ascii=False, indent=2)
+
+SAMPLES: List[Tuple[str, str]] = [
+    ("纯 JSON", DOCUMENT),
+    ("代码块", f"```json\n{DOCUMENT}\n```"),
+    ("前后说明文字", f"好的，以下是解析结果：\n{DOCUMENT}\n如需调整请告诉我。"),
+    ("尾逗号", DOCUMENT.replace('"pending"\n', '"pending",\n').replace("]\n}", "],\n}")),
+    ("Python 字面量", DOCUMENT.replace("null", "None")),
+    ("输出截断", DOCUMENT[:-40]),
+    ("批量结果（8 条）", json.dumps([dict(RESULT, index=i) for i in range(8)], ensure_ascii=False)),
+]
+
+
+def legacy_extract(content: str) -> Any:
+    """The previous approach: cut out the first code block, then json.loads."""
+    if "```json" in content:
+        json_start = content.find("```json") + 7
+        json_end = content.find("```", json_start)
+        content = content[json_start:json_end].strip()
+    elif "```" in content:
+        json_start = content.find("```") + 3
+        json_end = content.find("```", json_start)
+        content = content[json_start:json_end].strip()
+    return json.loads(content)
+
+
+def measure(func: Callable[[str], Any], content: str, repeat: int) -> Tuple[bool, float]:
+    """Run an extractor; return (succeeded, mean µs per call)."""
+    try:
+        func(content)
+    except ValueError:
+        return False, 0.0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(content)
+    return True, (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5000, help="Timing repetitions per sample")
+    args = parser.parse_args()
+
+    print(f"{'样例':<16}{'旧方法':>16}{'extract_json':>18}")
+    failures = 0
+    for name, content in SAMPLES:
+        cells = []
+        for func in (legacy_extract, extract_json):
+            ok, mean_us = measure(func, content, args.repeat)
+            cells.append(f"✅ {mean_us:7.1f} µs" if ok else "❌ 失败")
+            if func is extract_json and not ok:
+                failures += 1
+        print(f"{name:<16}{cells[0]:>16}{cells[1]:>18}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
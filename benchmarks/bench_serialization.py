@@ -0,0 +1,101 @@
+"""Benchmark JSON serialization of data files.
+
+Compares the previous writer (``json.dump(..., indent=2)``) with the compact
+serialization layer in ``app.serialization`` (stdlib fallback and orjson fast
+path) on synthetic CJK-heavy records.
+
+Usage:
+    python benchmarks/bench_serialization.py [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import serialization  # noqa: E402
+
+
+TEXTS = [
+    "今天天气真好，阳光洒在窗台上，心情也跟着明朗起来。决定下午去公园散散步。",
+    "刚看完一本很棒的书，书中的一句话让我印象深刻，给了我很多启发。",
+    "最近工作压力有点大，总是担心做不好，但要保持积极的心态，一步一步来。",
+]
+
+
+def make_records(count: int) -> list:
+    """Build ``count`` records shaped like records.json entries."""
+    records = []
+    for i in range(count):
+        records.append({
+            "record_id": f"00000000-0000-4000-8000-{i:012d}",
+            "timestamp": "2026-01-17T16:05:40.123456Z",
+            "input_type": "text",
+            "original_text": TEXTS[i % len(TEXTS)],
+            "parsed_data": {
+                "mood": {"type": "喜悦", "intensity": 1 + i % 10, "keywords": ["阳光", "明朗", "美好"]},
+                "inspirations": [
+                    {"core_idea": "享受自然的美好时光", "tags": ["自然", "散步", "放松"], "category": "生活"}
+                ],
+                "todos": [
+                    {"task": "去公园散步", "time": "下午", "location": "公园", "status": "pending"}
+                ],
+            },
+        })
+    return records
+
+
+def best_of(func, repeat: int) -> float:
+    """Return the best wall time of ``repeat`` runs in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(count: int, repeat: int) -> list:
+    """Run all encoders on ``count`` records and return result rows."""
+    records = make_records(count)
+    rows = []
+
+    def indent_dumps():
+        return json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def stdlib_compact_dumps():
+        return json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    encoders = [
+        ("json indent=2", indent_dumps, json.loads),
+        ("json compact", stdlib_compact_dumps, json.loads),
+    ]
+    if serialization.HAS_ORJSON:
+        encoders.append(("orjson compact", lambda: serialization.dumps(records), serialization.loads))
+
+    for name, encode, decode in encoders:
+        payload = encode()
+        encode_ms = best_of(encode, repeat)
+        decode_ms = best_of(lambda: decode(payload), repeat)
+        rows.append((count, name, encode_ms, decode_ms, len(payload)))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"orjson available: {serialization.HAS_ORJSON}")
+    print(f"{'records':>8}  {'encoder':<16} {'encode ms':>10} {'decode ms':>10} {'size KiB':>10}")
+    for count in args.sizes:
+        for count_, name, encode_ms, decode_ms, size in bench(count, args.repeat):
+            print(f"{count_:>8}  {name:<16} {encode_ms:>10.2f} {decode_ms:>10.2f} {size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
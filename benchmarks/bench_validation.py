@@ -0,0 +1,113 @@
+"""Benchmark validation of parse results and building the stored rows.
+
+The previous path constructs MoodData / InspirationData / TodoData one by
+one, then dumps the whole record and every mood, inspiration and todo again
+when saving. The current path validates the whole result as ParsedData in
+one call (through a cached TypeAdapter) and builds the stored rows from
+the validated models' fields without dumping them.
+
+Usage:
+    python benchmarks/bench_validation.py [--repeat 20000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models import ParsedData, RecordData  # noqa: E402
+from app.semantic_parser import _build_parsed_data_leniently, build_parsed_data  # noqa: E402
+from app.storage import parsed_data_row  # noqa: E402
+
+
+RESULT: Dict[str, Any] = {
+    "mood": {"type": "焦虑", "intensity": 7, "keywords": ["压力", "疲惫", "放松"]},
+    "inspirations": [
+        {"core_idea": "晚霞可以缓解压力", "tags": ["自然", "治愈"], "category": "生活"},
+        {"core_idea": "用番茄钟整理文档", "tags": ["效率"], "category": "工作"},
+    ],
+    "todos": [
+        {"task": "整理文档", "time": "明天", "location": None, "status": "pending"},
+        {"task": "去医院复查", "time": "下周三下午3点", "location": "医院", "status": "pending"},
+    ],
+}
+
+
+def legacy_rows(parsed: ParsedData) -> List[dict]:
+    """The previous storage path: dump the record, then every item again."""
+    record = RecordData(
+        record_id="id",
+        timestamp="2024-01-01T12:00:00Z",
+        input_type="text",
+        original_text="文本",
+        parsed_data=parsed
+    )
+    rows = [record.model_dump()]
+    if parsed.mood:
+        rows.append(parsed.mood.model_dump())
+    rows.extend(item.model_dump() for item in parsed.inspirations)
+    rows.extend(item.model_dump() for item in parsed.todos)
+    return rows
+
+
+def current_rows(parsed: ParsedData) -> List[dict]:
+    """The current storage path: rows built from the validated models' fields."""
+    data = parsed_data_row(parsed)
+    rows = [{
+        "record_id": "id",
+        "timestamp": "2024-01-01T12:00:00Z",
+        "input_type": "text",
+        "original_text": "文本",
+        "parsed_data": data
+    }]
+    if data["mood"]:
+        rows.append(dict(data["mood"]))
+    rows.extend(dict(item) for item in data["inspirations"])
+    rows.extend(dict(item) for item in data["todos"])
+    return rows
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """Return the mean µs per call."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000, help="Timing repetitions per path")
+    args = parser.parse_args()
+
+    parsed = build_parsed_data(RESULT)
+    if parsed != _build_parsed_data_leniently(RESULT):
+        print("❌ 两种校验路径的结果不一致")
+        return 1
+    if legacy_rows(parsed) != current_rows(parsed):
+        print("❌ 两种存储路径写入的行不一致")
+        return 1
+
+    cases = [
+        ("校验", lambda: _build_parsed_data_leniently(RESULT), lambda: build_parsed_data(RESULT)),
+        ("存储前导出", lambda: legacy_rows(parsed), lambda: current_rows(parsed)),
+        (
+            "合计",
+            lambda: legacy_rows(_build_parsed_data_leniently(RESULT)),
+            lambda: current_rows(build_parsed_data(RESULT))
+        ),
+    ]
+    print(f"{'路径':<12}{'旧':>12}{'新':>12}{'加速':>8}")
+    for name, legacy, current in cases:
+        legacy_us = measure(legacy, args.repeat)
+        current_us = measure(current, args.repeat)
+        print(f"{name:<12}{legacy_us:>9.1f} µs{current_us:>9.1f} µs{legacy_us / current_us:>7.1f}x")
+    print("✅ 结果一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,7 +25,7 @@ import {
   InspirationItem,
   TodoItem
 } from './types';
-import { apiService } from './services/api';
+import { apiService, replica } from './services/api';
 import { 
   transformRecord, 
   transformMood, 
@@ -603,30 +603,27 @@ export default function App() {
       setLoading(true);
       setError(null);
 
-      // Load all data in parallel
-      const [recordsRes, moodsRes, inspirationsRes, todosRes, userConfigRes] = await Promise.all([
-        apiService.getRecords().catch(() => ({ records: [] })),
-        apiService.getMoods().catch(() => ({ moods: [] })),
-        apiService.getInspirations().catch(() => ({ inspirations: [] })),
-        apiService.getTodos().catch(() => ({ todos: [] })),
+      // Load all data in parallel（集合通过增量同步获取，只传输变化的行）
+      const [collections, userConfigRes] = await Promise.all([
+        replica.refresh().catch(() => ({ records: [], moods: [], inspirations: [], todos: [] })),
         apiService.getUserConfig().catch(() => null)
       ]);
 
       // Transform and set data
-      if (recordsRes.records.length > 0) {
-        setRecords(recordsRes.records.map(transformRecord));
+      if (collections.records.length > 0) {
+        setRecords(collections.records.map(transformRecord));
       }
       
-      if (moodsRes.moods.length > 0) {
-        setMoods(moodsRes.moods.map((m, i) => transformMood(m, i)));
+      if (collections.moods.length > 0) {
+        setMoods(collections.moods.map((m, i) => transformMood(m, i)));
       }
       
-      if (inspirationsRes.inspirations.length > 0) {
-        setInspirations(inspirationsRes.inspirations.map(transformInspiration));
+      if (collections.inspirations.length > 0) {
+        setInspirations(collections.inspirations.map(transformInspiration));
       }
       
-      if (todosRes.todos.length > 0) {
-        setTodos(todosRes.todos.map(transformTodo));
+      if (collections.todos.length > 0) {
+        setTodos(collections.todos.map(transformTodo));
       }
 
       // Set character image
@@ -206,7 +206,7 @@ export const CharacterCustomizationDialog: React.FC<CharacterCustomizationDialog
               `}
             >
               <img
-                src={image.url}
+                src={image.thumbnail_url ?? image.url}
                 alt={`${image.color} ${image.personality}`}
                 className="w-full aspect-square rounded-xl object-cover mb-2"
               />
@@ -4,7 +4,7 @@ import { MoodItem } from '../types';
 import { SimpleMoodBubble, MoodData } from './SimpleMoodBubble';
 import { PageHeader } from './PageHeader';
 import { ChatDialog } from './ChatDialog';
-import { apiService } from '../services/api';
+import { replica } from '../services/api';
 
 interface MoodViewProps {
   items: MoodItem[];
@@ -42,7 +42,7 @@ export const MoodView: React.FC<MoodViewProps> = ({
     const loadMoodsData = async () => {
       try {
         console.log('🫧 开始加载心情数据...');
-        const response = await apiService.getMoods();
+        const response = await replica.refresh();
         console.log('📊 后端返回的心情数据:', response);
         
         // 显示最近30天的心情
@@ -36,6 +36,9 @@ const getApiBaseUrl = () => {
 
 const API_BASE_URL = getApiBaseUrl();
 
+// /api/process 在网络错误时的重试次数
+const PROCESS_RETRIES = 2;
+
 console.log('🔗 API Base URL:', API_BASE_URL);
 
 
@@ -87,6 +90,7 @@ export interface MoodResponse {
 
 export interface InspirationResponse {
   inspirations: Array<{
+    inspiration_id: string;
     record_id: string;
     timestamp: string;
     core_idea: string;
@@ -97,6 +101,7 @@ export interface InspirationResponse {
 
 export interface TodoResponse {
   todos: Array<{
+    todo_id: string;
     record_id: string;
     timestamp: string;
     task: string;
@@ -106,6 +111,15 @@ export interface TodoResponse {
   }>;
 }
 
+export interface SyncResponse {
+  seq: number;
+  full: boolean;
+  records: RecordResponse['records'];
+  moods: MoodResponse['moods'];
+  inspirations: InspirationResponse['inspirations'];
+  todos: TodoResponse['todos'];
+}
+
 export interface UserConfigResponse {
   user_id: string;
   created_at: string;
@@ -128,6 +142,23 @@ export interface UserConfigResponse {
   };
 }
 
+export interface CharacterJob {
+  job_id: string;
+  kind: string;
+  status: 'queued' | 'generating' | 'downloading' | 'done' | 'failed' | 'cancelled';
+  result: {
+    success: boolean;
+    image_url: string;
+    prompt: string;
+    preferences: any;
+    task_id?: string;
+    cached?: boolean;
+  } | null;
+  error: string | null;
+  created_at: number;
+  updated_at: number;
+}
+
 class APIService {
   private baseUrl: string;
 
@@ -152,13 +183,30 @@ class APIService {
         throw new Error('Either audio or text must be provided');
       }
 
-      const response = await fetch(`${this.baseUrl}/api/process`, {
-        method: 'POST',
-        body: formData,
-        mode: 'cors',
-        credentials: 'omit',
-        signal: AbortSignal.timeout(60000), // 60秒超时
-      });
+      // 同一次提交的所有尝试使用同一个幂等键：重试时后端直接返回首次结果，不会重复解析和保存
+      const idempotencyKey = crypto.randomUUID();
+      let response: Response;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          response = await fetch(`${this.baseUrl}/api/process`, {
+            method: 'POST',
+            body: formData,
+            headers: { 'Idempotency-Key': idempotencyKey },
+            mode: 'cors',
+            credentials: 'omit',
+            signal: AbortSignal.timeout(60000), // 60秒超时
+          });
+          break;
+        } catch (error) {
+          // 仅在网络错误或超时时重试
+          const retriable = error instanceof TypeError ||
+            (error instanceof DOMException && error.name === 'TimeoutError');
+          if (!retriable || attempt >= PROCESS_RETRIES) {
+            throw error;
+          }
+          console.warn(`⚠️ Process request failed, retrying (${attempt + 1}/${PROCESS_RETRIES})`, error);
+        }
+      }
 
       console.log('📡 Process response status:', response.status);
 
@@ -177,6 +225,48 @@ class APIService {
     }
   }
 
+  /**
+   * Process input via /api/process/stream, reporting live captions for audio
+   */
+  async processInputStream(
+    onTranscript: (text: string, final: boolean) => void,
+    audio?: File,
+    text?: string
+  ): Promise<ProcessResponse> {
+    const formData = new FormData();
+    if (audio) {
+      formData.append('audio', audio);
+    } else if (text) {
+      formData.append('text', text);
+    } else {
+      throw new Error('Either audio or text must be provided');
+    }
+
+    const response = await fetch(`${this.baseUrl}/api/process/stream`, {
+      method: 'POST',
+      body: formData,
+      mode: 'cors',
+      credentials: 'omit',
+    });
+
+    if (!response.ok || !response.body) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.error || 'Failed to process input');
+    }
+
+    let result: ProcessResponse | null = null;
+    let failure: string | null = null;
+    await this.readEventStream(response.body, (event, data) => {
+      if (event === 'transcript') onTranscript(data.text, data.final);
+      if (event === 'result') result = data;
+      if (event === 'error') failure = data.detail || data.error;
+    });
+    if (!result) {
+      throw new Error(failure || 'Failed to process input');
+    }
+    return result;
+  }
+
   /**
    * Get all records
    */
@@ -229,6 +319,19 @@ class APIService {
     return response.json();
   }
 
+  /**
+   * Get the rows changed after a change sequence number (0 for a full copy)
+   */
+  async syncChanges(since: number = 0): Promise<SyncResponse> {
+    const response = await fetch(`${this.baseUrl}/api/sync?since=${since}`);
+    
+    if (!response.ok) {
+      throw new Error('Failed to sync changes');
+    }
+
+    return response.json();
+  }
+
   /**
    * Update todo status
    */
@@ -248,6 +351,25 @@ class APIService {
     return response.json();
   }
 
+  /**
+   * Update several todos in one request
+   */
+  async updateTodos(
+    updates: Array<{ todo_id: string; status?: string; task?: string; time?: string; location?: string }>
+  ): Promise<{ success: boolean; todos: TodoResponse['todos'] }> {
+    const response = await fetch(`${this.baseUrl}/api/todos`, {
+      method: 'PATCH',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(updates),
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to update todos');
+    }
+
+    return response.json();
+  }
+
   /**
    * Get user configuration
    */
@@ -320,25 +442,28 @@ class APIService {
   }
 
   /**
-   * Generate character image
+   * Generate character image (reuses a cached image for the same preferences
+   * unless forceNew is set)
    */
   async generateCharacter(preferences: {
     color: string;
     personality: string;
     appearance: string;
     role: string;
-  }): Promise<{
+  }, forceNew: boolean = false): Promise<{
     success: boolean;
     image_url: string;
     prompt: string;
     preferences: any;
     task_id?: string;
+    cached?: boolean;
   }> {
     const formData = new FormData();
     formData.append('color', preferences.color);
     formData.append('personality', preferences.personality);
     formData.append('appearance', preferences.appearance);
     formData.append('role', preferences.role);
+    formData.append('force_new', String(forceNew));
 
     // 创建一个 AbortController 用于超时控制
     const controller = new AbortController();
@@ -372,6 +497,127 @@ class APIService {
     }
   }
 
+  /**
+   * Generate several character candidates, calling onCandidate as each one is saved
+   */
+  async generateCharacterBatch(
+    preferences: {
+      color: string;
+      personality: string;
+      appearance: string;
+      role: string;
+    },
+    onCandidate: (candidate: {
+      index: number;
+      image_url: string;
+      thumbnail_url: string;
+      filename: string | null;
+      prompt: string;
+      task_id?: string;
+    }) => void,
+    count: number = 3
+  ): Promise<{ succeeded: number; failed: number }> {
+    const formData = new FormData();
+    formData.append('color', preferences.color);
+    formData.append('personality', preferences.personality);
+    formData.append('appearance', preferences.appearance);
+    formData.append('role', preferences.role);
+    formData.append('count', String(count));
+
+    const response = await fetch(`${this.baseUrl}/api/character/generate/batch`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok || !response.body) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.detail || error.error || 'Failed to generate characters');
+    }
+
+    let summary = { succeeded: 0, failed: 0 };
+    await this.readEventStream(response.body, (event, data) => {
+      if (event === 'candidate') onCandidate(data);
+      if (event === 'done') summary = data;
+    });
+    return summary;
+  }
+
+  /**
+   * Parse a text/event-stream body (EventSource cannot POST)
+   */
+  private async readEventStream(
+    body: ReadableStream<Uint8Array>,
+    onEvent: (event: string, data: any) => void
+  ): Promise<void> {
+    const reader = body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      const events = buffer.split('\n\n');
+      buffer = events.pop() ?? '';
+      for (const raw of events) {
+        const event = raw.match(/^event: (.*)$/m)?.[1];
+        const data = raw.match(/^data: (.*)$/m)?.[1];
+        if (event && data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
+  /**
+   * Start character generation as a background job (poll with getCharacterJob)
+   */
+  async submitCharacterJob(preferences: {
+    color: string;
+    personality: string;
+    appearance: string;
+    role: string;
+  }, forceNew: boolean = false): Promise<CharacterJob> {
+    const formData = new FormData();
+    formData.append('color', preferences.color);
+    formData.append('personality', preferences.personality);
+    formData.append('appearance', preferences.appearance);
+    formData.append('role', preferences.role);
+    formData.append('force_new', String(forceNew));
+
+    const response = await fetch(`${this.baseUrl}/api/character/jobs`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || error.error || 'Failed to start character generation');
+    }
+
+    return response.json();
+  }
+
+  /**
+   * Get the status of a character generation job
+   */
+  async getCharacterJob(jobId: string): Promise<CharacterJob> {
+    const response = await fetch(`${this.baseUrl}/api/character/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error('Failed to get character job');
+    }
+    return response.json();
+  }
+
+  /**
+   * Cancel a character generation job
+   */
+  async cancelCharacterJob(jobId: string): Promise<CharacterJob> {
+    const response = await fetch(`${this.baseUrl}/api/character/jobs/${jobId}`, {
+      method: 'DELETE',
+    });
+    if (!response.ok) {
+      throw new Error('Failed to cancel character job');
+    }
+    return response.json();
+  }
+
   /**
    * Update character preferences
    */
@@ -406,6 +652,7 @@ class APIService {
     images: Array<{
       filename: string;
       url: string;
+      thumbnail_url?: string;
       color: string;
       personality: string;
       timestamp: string;
@@ -449,3 +696,56 @@ class APIService {
 }
 
 export const apiService = new APIService();
+
+type Collections = Omit<SyncResponse, 'seq' | 'full'>;
+
+/**
+ * Local copy of the user's records, moods, inspirations and todos.
+ * refresh() only transfers the rows changed since the previous refresh.
+ */
+class LocalReplica {
+  private seq = 0;
+  private records = new Map<string, RecordResponse['records'][number]>();
+  private moods = new Map<string, MoodResponse['moods'][number]>();
+  private inspirations = new Map<string, InspirationResponse['inspirations'][number]>();
+  private todos = new Map<string, TodoResponse['todos'][number]>();
+  private pending: Promise<Collections> | null = null;
+
+  /**
+   * Fetch the changes and return the updated collections
+   */
+  refresh(): Promise<Collections> {
+    // 同时发起的刷新共用一次请求
+    if (!this.pending) {
+      this.pending = this.sync().finally(() => {
+        this.pending = null;
+      });
+    }
+    return this.pending;
+  }
+
+  private async sync(): Promise<Collections> {
+    const changes = await apiService.syncChanges(this.seq);
+    if (changes.full) {
+      this.records.clear();
+      this.moods.clear();
+      this.inspirations.clear();
+      this.todos.clear();
+    }
+    // 变化的行按标识替换本地的旧版本，新行追加在末尾
+    changes.records.forEach(r => this.records.set(r.record_id, r));
+    changes.moods.forEach(m => this.moods.set(m.record_id, m));
+    changes.inspirations.forEach(i => this.inspirations.set(i.inspiration_id, i));
+    changes.todos.forEach(t => this.todos.set(t.todo_id, t));
+    this.seq = changes.seq;
+
+    return {
+      records: [...this.records.values()],
+      moods: [...this.moods.values()].sort((a, b) => b.timestamp.localeCompare(a.timestamp)),
+      inspirations: [...this.inspirations.values()],
+      todos: [...this.todos.values()],
+    };
+  }
+}
+
+export const replica = new LocalReplica();
@@ -71,7 +71,7 @@ export function transformMood(mood: any, index: number): MoodItem {
  */
 export function transformInspiration(inspiration: any): InspirationItem {
   return {
-    id: inspiration.record_id,
+    id: inspiration.inspiration_id ?? inspiration.record_id,
     content: inspiration.core_idea,
     createdAt: new Date(inspiration.timestamp).getTime(),
     tags: inspiration.tags || []
@@ -110,7 +110,7 @@ export function transformTodo(todo: any): TodoItem {
   }
 
   return {
-    id: todo.record_id,
+    id: todo.todo_id ?? todo.record_id,
     title: todo.task,
     createdAt,
     scheduledAt,
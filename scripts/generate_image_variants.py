@@ -0,0 +1,50 @@
+"""
+图片衍生版本生成脚本 - 为已有的角色形象图片补充缩略图和 WebP/AVIF 版本
+
+用法:
+    python scripts/generate_image_variants.py
+    python scripts/generate_image_variants.py --images-dir generated_images --force
+"""
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.gallery import IMAGE_GLOB
+from app.image_variants import generate_variants, supported_formats, variant_path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate thumbnails and WebP/AVIF variants of character images")
+    parser.add_argument("--images-dir", default="generated_images", help="Directory holding the original images")
+    parser.add_argument("--force", action="store_true", help="Regenerate variants that already exist")
+    args = parser.parse_args()
+
+    formats = supported_formats()
+    if not formats:
+        print("❌ 未安装 Pillow（或不支持 WebP/AVIF），无法生成衍生图片")
+        return 1
+
+    images_dir = Path(args.images_dir)
+    sources = [
+        path for path in sorted(images_dir.glob(IMAGE_GLOB))
+        if args.force or not variant_path(images_dir, path.name, formats[-1]).exists()
+    ]
+    print(f"支持的格式: {', '.join(formats)}；待处理图片: {len(sources)}")
+
+    with ProcessPoolExecutor() as pool:
+        futures = [pool.submit(generate_variants, str(path), str(images_dir)) for path in sources]
+        for path, future in zip(sources, futures):
+            try:
+                print(f"✅ {path.name}: {len(future.result())} 个衍生文件")
+            except Exception as e:
+                print(f"❌ {path.name}: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
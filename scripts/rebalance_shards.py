@@ -0,0 +1,57 @@
+"""
+数据分片重平衡脚本 - 增加或调整数据根目录后，把用户分区移动到一致性哈希环指定的位置
+
+用法:
+    python scripts/rebalance_shards.py --roots data,/mnt/vol2/data --dry-run
+    python scripts/rebalance_shards.py              # 使用环境变量 DATA_ROOTS
+
+请在所有应用 worker 停止后运行，完成后再用新的 DATA_ROOTS 启动服务。
+"""
+
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+
+from app.config import parse_data_roots
+from app.sharding import rebalance
+
+
+def main() -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Move user partitions to their consistent-hash data root")
+    parser.add_argument(
+        "--roots",
+        default=os.getenv("DATA_ROOTS") or os.getenv("DATA_DIR", "data"),
+        help="Comma-separated list of ALL data roots (default: DATA_ROOTS or DATA_DIR)"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    roots = [Path(root) for root in parse_data_roots(args.roots)]
+    if not roots:
+        print("❌ 未指定数据根目录")
+        return 1
+    for root in roots:
+        root.mkdir(parents=True, exist_ok=True)
+
+    moves = rebalance(roots, dry_run=args.dry_run)
+
+    action = "需要移动" if args.dry_run else "已移动"
+    for user_id, source, target in moves:
+        print(f"{action} {user_id}: {source} -> {target}")
+    print(f"✅ 共 {len(moves)} 个用户分区{action}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+角色形象缓存预热脚本 - 为常用偏好组合预先生成图片，之后相同偏好的生成请求可直接返回
+
+用法:
+    python scripts/warm_image_cache.py --stub            # 使用本地桩服务（不调用 MiniMax，不需要 API 密钥），写入临时目录
+    python scripts/warm_image_cache.py --limit 10        # 调用 MiniMax 生成前 10 个常用组合
+    python scripts/warm_image_cache.py --all --stub      # 全部 720 个组合
+
+默认的常用组合为 所有颜色 × 所有性格（配饰为"无配饰"，角色为"陪伴式朋友"）。
+已有缓存图片的组合会被跳过。
+
+--stub 生成的是纯色占位图，若写入真实的 generated_images/ 与图库清单，会被
+/api/character/generate 当作缓存命中返回给用户。因此 --stub 默认写入临时目录；
+显式指定 --images-dir / --gallery 时，不允许指向默认的真实路径。
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from dotenv import load_dotenv
+
+from app.gallery import Gallery
+from app.image_service import ImageGenerationService, ImageGenerationError
+
+
+Combination = Tuple[str, str, str, str]
+
+DEFAULT_IMAGES_DIR = Path("generated_images")
+
+
+def default_gallery_path() -> Path:
+    """Gallery manifest used by the server ($DATA_DIR/gallery.json)."""
+    return Path(os.getenv("DATA_DIR", "data")) / "gallery.json"
+
+
+def resolve_paths(
+    images_dir: Optional[str],
+    gallery_path: Optional[str],
+    stub: bool
+) -> Optional[Tuple[Path, Path]]:
+    """Choose where images and the gallery manifest are written.
+
+    Returns:
+        Tuple of (images dir, gallery path), or None if a stub run would
+        write to the server's real paths
+    """
+    if not stub:
+        return (
+            Path(images_dir) if images_dir else DEFAULT_IMAGES_DIR,
+            Path(gallery_path) if gallery_path else default_gallery_path()
+        )
+    if images_dir is None and gallery_path is None:
+        root = Path(tempfile.mkdtemp(prefix="warm_image_cache_stub_"))
+        return root / "generated_images", root / "gallery.json"
+    if images_dir is None or gallery_path is None:
+        return None
+    real = {DEFAULT_IMAGES_DIR.resolve(), default_gallery_path().resolve()}
+    if Path(images_dir).resolve() in real or Path(gallery_path).resolve() in real:
+        return None
+    return Path(images_dir), Path(gallery_path)
+
+
+def combinations(include_all: bool) -> List[Combination]:
+    """List preference combinations, the most common ones first."""
+    service = ImageGenerationService
+    if include_all:
+        return list(itertools.product(
+            service.COLOR_MAPPING, service.PERSONALITY_MAPPING,
+            service.APPEARANCE_MAPPING, service.ROLE_MAPPING
+        ))
+    return [
+        (color, personality, "无配饰", "陪伴式朋友")
+        for color, personality in itertools.product(
+            service.COLOR_MAPPING, service.PERSONALITY_MAPPING
+        )
+    ]
+
+
+def _placeholder_image(seed: int) -> bytes:
+    """Render a small placeholder JPEG (solid color if Pillow is available)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        # 最小的合法 JPEG 文件头 + 结束标记，足以作为占位
+        return bytes.fromhex("ffd8ffe000104a46494600010100000100010000ffd9")
+    buffer = io.BytesIO()
+    color = ((seed * 67) % 256, (seed * 131) % 256, (seed * 199) % 256)
+    Image.new("RGB", (512, 512), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def stub_transport() -> httpx.MockTransport:
+    """Build a transport that imitates the MiniMax API and its image CDN."""
+    counter = itertools.count(1)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            task = next(counter)
+            return httpx.Response(200, json={
+                "id": f"stub-{task}",
+                "data": {"image_urls": [f"https://stub.invalid/images/{task}.jpeg"]},
+                "metadata": {},
+                "base_resp": {"status_code": 0, "status_msg": "success"}
+            })
+        seed = int(Path(request.url.path).stem)
+        return httpx.Response(200, content=_placeholder_image(seed))
+
+    return httpx.MockTransport(handler)
+
+
+async def warm(
+    service: ImageGenerationService,
+    gallery: Gallery,
+    combos: List[Combination],
+    concurrency: int
+) -> Tuple[int, int, int]:
+    """Generate images for every combination without a cached image.
+
+    Returns:
+        Tuple of (generated, skipped, failed) counts
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+
+    async def warm_one(color: str, personality: str, appearance: str, role: str) -> None:
+        prompt = service.build_prompt(color, personality, appearance, role)
+        if gallery.find_by_prompt(prompt):
+            counts["skipped"] += 1
+            return
+        async with semaphore:
+            try:
+                result = await service.generate_image(color, personality, appearance, role)
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                path = gallery.images_dir / f"character_{color}_{personality}_{timestamp}.jpeg"
+                await service.download_image(result["url"], str(path))
+            except ImageGenerationError as e:
+                counts["failed"] += 1
+                print(f"❌ {color}/{personality}/{appearance}/{role}: {e.message}")
+                return
+        gallery.add(path, {
+            "color": color, "personality": personality,
+            "appearance": appearance, "role": role
+        }, result["prompt"])
+        counts["generated"] += 1
+        print(f"✅ {color}/{personality}/{appearance}/{role} -> {path.name}")
+
+    await asyncio.gather(*(warm_one(*combo) for combo in combos))
+    return counts["generated"], counts["skipped"], counts["failed"]
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    paths = resolve_paths(args.images_dir, args.gallery, args.stub)
+    if paths is None:
+        print("❌ --stub 只能写入临时目录：请同时指定 --images-dir 和 --gallery，且不能是默认的真实路径")
+        return 1
+    images_dir, gallery_path = paths
+    if args.stub:
+        print(f"桩模式：图片写入 {images_dir}，清单写入 {gallery_path}")
+
+    api_key = os.getenv("MINIMAX_API_KEY")
+    if args.stub:
+        client = httpx.AsyncClient(transport=stub_transport())
+        api_key = "stub-key"
+    elif not api_key:
+        print("❌ 未配置 MINIMAX_API_KEY（或使用 --stub 离线预热）")
+        return 1
+    else:
+        client = None
+
+    service = ImageGenerationService(api_key=api_key, client=client)
+    gallery = Gallery(images_dir, gallery_path)
+    gallery.images_dir.mkdir(parents=True, exist_ok=True)
+
+    combos = combinations(args.all)
+    if args.limit:
+        combos = combos[:args.limit]
+    try:
+        generated, skipped, failed = await warm(service, gallery, combos, args.concurrency)
+    finally:
+        await service.close()
+
+    print(f"完成：新生成 {generated}，已缓存跳过 {skipped}，失败 {failed}")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Pre-generate character images for common preference combinations")
+    parser.add_argument("--all", action="store_true", help="Warm all 720 combinations instead of the common ones")
+    parser.add_argument("--limit", type=int, default=0, help="Only warm the first N combinations")
+    parser.add_argument("--stub", action="store_true", help="Use a local stub instead of the MiniMax API")
+    parser.add_argument("--concurrency", type=int, default=2, help="Parallel generation requests")
+    parser.add_argument(
+        "--images-dir", default=None,
+        help="Directory for generated images (default: generated_images, or a temporary directory with --stub)"
+    )
+    parser.add_argument(
+        "--gallery", default=None,
+        help="Gallery manifest path (default: $DATA_DIR/gallery.json, or a temporary file with --stub)"
+    )
+    args = parser.parse_args()
+
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,8 @@ sys.path.insert(0, str(Path(__file__).parent))
 # 设置环境变量
 os.environ.setdefault("DATA_DIR", "data")
 os.environ.setdefault("LOG_LEVEL", "INFO")
+# 启用追加日志：新记录只追加到 *.tail.jsonl，由后台任务定期压缩进快照
+os.environ.setdefault("STORAGE_JOURNAL", "true")
 
 # 确保数据目录存在
 data_dir = Path("data")
@@ -339,3 +339,58 @@ async def test_close_client(asr_service):
     
     # Verify client is closed
     assert asr_service.client.is_closed
+
+
+def stream_service(asr_service, status_code, lines):
+    """Serve the ASR API from a stub returning server-sent event lines."""
+    def handler(request):
+        assert b'name="stream"\r\n\r\ntrue' in request.content
+        return httpx.Response(status_code, content="".join(line + "\n" for line in lines).encode("utf-8"))
+    asr_service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return asr_service
+
+
+@pytest.mark.asyncio
+async def test_transcribe_stream_yields_partial_transcripts(asr_service, mock_audio_file):
+    """Test that deltas produce growing partial transcripts and a final one."""
+    stream_service(asr_service, 200, [
+        'data: {"type": "transcript.text.delta", "delta": "今天"}',
+        '',
+        'data: {"type": "transcript.text.delta", "delta": "天气很好"}',
+        'data: not-json',
+        'data: {"type": "transcript.text.done", "text": "今天天气很好。"}',
+        'data: [DONE]',
+    ])
+    
+    updates = [update async for update in asr_service.transcribe_stream(mock_audio_file, "a.mp3")]
+    await asr_service.close()
+    
+    assert updates == [
+        {"text": "今天", "final": False},
+        {"text": "今天天气很好", "final": False},
+        {"text": "今天天气很好。", "final": True},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_transcribe_stream_without_done_event(asr_service, mock_audio_file):
+    """Test that the accumulated deltas are final when the stream just ends."""
+    stream_service(asr_service, 200, ['data: {"delta": "你好"}', 'data: [DONE]'])
+    
+    updates = [update async for update in asr_service.transcribe_stream(mock_audio_file)]
+    await asr_service.close()
+    
+    assert updates[-1] == {"text": "你好", "final": True}
+
+
+@pytest.mark.asyncio
+async def test_transcribe_stream_api_error(asr_service, mock_audio_file):
+    """Test that an error status raises ASRServiceError."""
+    stream_service(asr_service, 500, ['{"error": "boom"}'])
+    
+    with pytest.raises(ASRServiceError) as exc_info:
+        async for _ in asr_service.transcribe_stream(mock_audio_file):
+            pass
+    await asr_service.close()
+    
+    assert "500" in exc_info.value.message
@@ -0,0 +1,166 @@
+"""Tests for splitting long recordings and chunked transcription."""
+
+import asyncio
+import io
+import math
+import wave
+from array import array
+
+import pytest
+
+from app.asr_service import ASRService, ASRServiceError
+from app.audio_chunking import join_transcripts, split_audio, split_mp3, split_wav
+
+
+RATE = 8000
+
+
+def make_wav(segments) -> bytes:
+    """Build a 16-bit mono WAV from (seconds, loud) segments."""
+    samples = array("h")
+    for seconds, loud in segments:
+        for i in range(int(seconds * RATE)):
+            samples.append(int(8000 * math.sin(i / 5)) if loud else 0)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def wav_frames(audio: bytes) -> bytes:
+    with wave.open(io.BytesIO(audio), "rb") as reader:
+        return reader.readframes(reader.getnframes())
+
+
+# MPEG-1 Layer III, 44.1 kHz：码率索引 9 = 128 kbps（417 字节），1 = 32 kbps（104 字节）
+LOUD_FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\x55" * 413
+QUIET_FRAME = bytes([0xFF, 0xFB, 0x10, 0x00]) + b"\x00" * 100
+FRAME_SECONDS = 1152 / 44100
+
+
+class TestSplitWav:
+    """Tests for WAV splitting."""
+
+    def test_short_recording_is_one_chunk(self):
+        """Test that recordings below the limit are not split."""
+        audio = make_wav([(3, True)])
+        assert split_audio(audio, "memo.wav", max_seconds=10) == [(audio, "memo.wav")]
+
+    def test_cuts_at_pauses(self):
+        """Test that chunks end in the silent gaps and cover all frames."""
+        audio = make_wav([(7, True), (1, False), (7, True), (1, False), (6, True)])
+
+        chunks = split_wav(audio, max_seconds=10, min_seconds=4)
+
+        assert len(chunks) == 3
+        assert b"".join(wav_frames(chunk) for chunk in chunks) == wav_frames(audio)
+        boundaries = []
+        position = 0
+        for chunk in chunks[:-1]:
+            with wave.open(io.BytesIO(chunk), "rb") as reader:
+                assert reader.getnframes() <= 10 * RATE
+                position += reader.getnframes() / RATE
+            boundaries.append(position)
+        assert 7 <= boundaries[0] <= 8
+        assert 15 <= boundaries[1] <= 16
+
+    def test_split_audio_names_parts(self):
+        """Test that chunk file names keep order and extension."""
+        audio = make_wav([(7, True), (1, False), (7, True)])
+
+        names = [name for _, name in split_audio(audio, "memo.wav", max_seconds=10, min_seconds=4)]
+
+        assert names == ["memo.part0.wav", "memo.part1.wav"]
+
+    def test_unparseable_input_is_one_chunk(self):
+        """Test that invalid files fall back to a single request."""
+        assert split_audio(b"not a wav", "memo.wav") == [(b"not a wav", "memo.wav")]
+        assert split_audio(b"m4a data", "memo.m4a") == [(b"m4a data", "memo.m4a")]
+
+
+class TestSplitMp3:
+    """Tests for MP3 splitting."""
+
+    def test_cuts_on_low_bitrate_frames(self):
+        """Test that chunks start at frame boundaries, preferring quiet frames."""
+        loud_run = int(7 / FRAME_SECONDS)
+        frames = [LOUD_FRAME] * loud_run + [QUIET_FRAME] * 5 + [LOUD_FRAME] * loud_run
+        id3 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+        audio = id3 + b"".join(frames)
+
+        chunks = split_mp3(audio, max_seconds=10, min_seconds=4)
+
+        assert len(chunks) == 2
+        assert b"".join(chunks) == audio[len(id3):]
+        assert all(chunk[:2] == b"\xff\xfb" for chunk in chunks)
+        # 切点落在低码率（静音）帧上
+        assert chunks[1].startswith(QUIET_FRAME)
+
+
+class TestJoinTranscripts:
+    """Tests for join_transcripts."""
+
+    def test_joins_chinese_directly_and_latin_with_space(self):
+        """Test the separator between chunk transcripts."""
+        assert join_transcripts(["今天天气", " 很好。", "", "hello", "world"]) == "今天天气很好。hello world"
+
+
+class TestChunkedTranscription:
+    """Tests for ASRService.transcribe on long recordings."""
+
+    async def test_transcribes_chunks_concurrently_and_retries_failures(self, monkeypatch):
+        """Test ordering, the concurrency cap and per-chunk retries."""
+        monkeypatch.setattr("app.asr_service.CHUNK_RETRY_DELAY", 0)
+        audio = make_wav([(7, True), (1, False)] * 4)
+        service = ASRService(api_key="test", max_concurrency=2)
+        calls = []
+        running = 0
+        peak = 0
+
+        async def transcribe_once(chunk, name):
+            nonlocal running, peak
+            calls.append(name)
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if name.endswith("part1.wav") and calls.count(name) == 1:
+                raise ASRServiceError("temporary")
+            return f"第{name.split('part')[1][0]}段"
+
+        monkeypatch.setattr(service, "_transcribe_once", transcribe_once)
+        monkeypatch.setattr(
+            "app.asr_service.split_audio",
+            lambda audio, name: split_audio(audio, name, max_seconds=10, min_seconds=4)
+        )
+
+        text = await service.transcribe(audio, "memo.wav")
+        await service.close()
+
+        assert text == "第0段第1段第2段第3段"
+        assert calls.count("memo.part1.wav") == 2
+        assert all(calls.count(f"memo.part{i}.wav") == 1 for i in (0, 2, 3))
+        assert peak <= 2
+
+    async def test_gives_up_after_retries(self, monkeypatch):
+        """Test that a chunk failing every attempt fails the transcription."""
+        monkeypatch.setattr("app.asr_service.CHUNK_RETRY_DELAY", 0)
+        service = ASRService(api_key="test")
+
+        async def transcribe_once(chunk, name):
+            if "part1" in name:
+                raise ASRServiceError("down")
+            return "好"
+
+        monkeypatch.setattr(service, "_transcribe_once", transcribe_once)
+        monkeypatch.setattr(
+            "app.asr_service.split_audio",
+            lambda audio, name: split_audio(audio, name, max_seconds=10, min_seconds=4)
+        )
+
+        with pytest.raises(ASRServiceError):
+            await service.transcribe(make_wav([(7, True), (1, False), (7, True)]), "memo.wav")
+        await service.close()
@@ -0,0 +1,77 @@
+"""Tests for local audio preprocessing before transcription."""
+
+import io
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.audio_preprocessing import TARGET_RATE, preprocess_audio
+
+
+def make_wav(segments, rate: int = 44100, channels: int = 2) -> bytes:
+    """Build a 16-bit WAV from (seconds, loud) segments."""
+    parts = []
+    for seconds, loud in segments:
+        t = np.arange(int(seconds * rate)) / rate
+        tone = 0.3 * np.sin(2 * np.pi * 440 * t) if loud else np.zeros_like(t)
+        parts.append(tone)
+    mono = (np.concatenate(parts) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(np.repeat(mono, channels).tobytes())
+    return buffer.getvalue()
+
+
+def wav_info(audio: bytes):
+    with wave.open(io.BytesIO(audio), "rb") as reader:
+        return reader.getnchannels(), reader.getframerate(), reader.getnframes() / reader.getframerate()
+
+
+class TestPreprocessAudio:
+    """Tests for preprocess_audio."""
+
+    def test_downmixes_resamples_and_trims(self):
+        audio = make_wav([(2, False), (3, True), (2, False)])
+
+        processed, timings = preprocess_audio(audio, "memo.wav")
+
+        channels, rate, duration = wav_info(processed)
+        assert channels == 1
+        assert rate == TARGET_RATE
+        # 前后的静音被裁掉，只保留语音和少量余量
+        assert 3.0 <= duration <= 3.6
+        assert len(processed) < len(audio) / 5
+        assert set(timings) == {"decode", "downmix", "resample", "trim", "encode"}
+
+    def test_resampled_signal_keeps_its_pitch(self):
+        audio = make_wav([(1, True)])
+
+        processed, _ = preprocess_audio(audio, "memo.wav")
+
+        with wave.open(io.BytesIO(processed), "rb") as reader:
+            samples = np.frombuffer(reader.readframes(reader.getnframes()), dtype="<i2")
+        spectrum = np.abs(np.fft.rfft(samples))
+        peak = np.argmax(spectrum) * TARGET_RATE / len(samples)
+        assert abs(peak - 440) < 5
+
+    def test_silent_recording_is_not_emptied(self):
+        audio = make_wav([(2, False)], rate=TARGET_RATE, channels=1)
+
+        processed, _ = preprocess_audio(audio, "memo.wav")
+
+        # 没有检测到语音时保持原样（重新编码不会更小）
+        assert processed == audio
+
+    @pytest.mark.parametrize("audio,filename", [
+        (b"ID3fake mp3 content", "memo.mp3"),
+        (b"not a wav file", "memo.wav"),
+    ])
+    def test_other_input_passes_through(self, audio, filename):
+        processed, _ = preprocess_audio(audio, filename)
+
+        assert processed == audio
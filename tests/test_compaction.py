@@ -0,0 +1,292 @@
+"""Tests for the storage journal and background compaction.
+
+Covers tail-log appends, replay on read, snapshot compaction with
+de-duplication of derived moods, and the partition scan of the compactor.
+"""
+
+import json
+import multiprocessing
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.compaction import Compactor, iter_partitions
+from app.models import InspirationData, MoodData, ParsedData, RecordData, TodoData
+from app.storage import StorageService, tail_path
+
+
+@pytest.fixture
+def temp_data_dir():
+    """Create a temporary directory for test data."""
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+@pytest.fixture
+def journal_storage(temp_data_dir):
+    """Create a StorageService in journal mode with empty collections."""
+    storage = StorageService(temp_data_dir, journal=True)
+    for file_path in (
+        storage.records_file, storage.moods_file,
+        storage.inspirations_file, storage.todos_file
+    ):
+        file_path.write_text("[]", encoding="utf-8")
+    return storage
+
+
+def _update_todo(data_dir: str, todo_id: str, status: str) -> None:
+    """Worker entry point: update a todo from a separate process."""
+    StorageService(data_dir, journal=True).update_todo(todo_id, {"status": status})
+
+
+def make_record(text: str, mood_type: str = "开心") -> RecordData:
+    """Build a record with a mood."""
+    return RecordData(
+        record_id="",
+        timestamp="2024-01-01T12:00:00Z",
+        input_type="text",
+        original_text=text,
+        parsed_data=ParsedData(mood=MoodData(type=mood_type, intensity=6))
+    )
+
+
+def save_with_mood(storage: StorageService, text: str) -> str:
+    """Save a record and its mood the way the API does."""
+    record = make_record(text)
+    record_id = storage.save_record(record)
+    storage.append_mood(record.parsed_data.mood, record_id, record.timestamp)
+    return record_id
+
+
+class TestJournal:
+    """Tests for appends in journal mode."""
+
+    def test_appends_go_to_tail(self, journal_storage):
+        """Test that journal appends leave the snapshot untouched."""
+        record_id = journal_storage.save_record(make_record("你好"))
+
+        snapshot = json.loads(journal_storage.records_file.read_text(encoding="utf-8"))
+        assert snapshot == []
+        assert tail_path(journal_storage.records_file).exists()
+
+        records = journal_storage.read_collection(journal_storage.records_file)
+        assert [r["record_id"] for r in records] == [record_id]
+
+    def test_incremental_tail_reads(self, journal_storage):
+        """Test that reads see rows appended after the last read."""
+        first = journal_storage.save_record(make_record("一"))
+        before = [r["record_id"] for r in journal_storage.read_collection(journal_storage.records_file)]
+        second = journal_storage.save_record(make_record("二"))
+        after = journal_storage.read_collection(journal_storage.records_file)
+
+        assert before == [first]
+        assert [r["record_id"] for r in after] == [first, second]
+
+    def test_tail_is_applied_in_place(self, journal_storage):
+        """Test that new tail lines update the cached rows and index instead of copying them."""
+        journal_storage.append_todos([TodoData(task="买牛奶")], "r1", "2024-01-01T12:00:00Z")
+        rows = journal_storage.read_collection(journal_storage.todos_file)
+        index = journal_storage.index_by(journal_storage.todos_file, "todo_id")
+        todo_id = rows[0]["todo_id"]
+
+        journal_storage.update_todo(todo_id, {"status": "done"})
+        journal_storage.append_todos([TodoData(task="写日记")], "r2", "2024-01-01T12:00:00Z")
+
+        assert journal_storage.read_collection(journal_storage.todos_file) is rows
+        assert journal_storage.index_by(journal_storage.todos_file, "todo_id") is index
+        assert [t["status"] for t in rows] == ["done", "pending"]
+        assert index[todo_id]["status"] == "done"
+        assert index[rows[1]["todo_id"]] is rows[1]
+
+    def test_mood_timeline_sees_in_place_appends(self, journal_storage):
+        """Test that the cached mood timeline is rebuilt after rows are applied in place."""
+        save_with_mood(journal_storage, "一")
+        assert len(journal_storage.get_mood_timeline()) == 1
+
+        save_with_mood(journal_storage, "二")
+
+        assert len(journal_storage.get_mood_timeline()) == 2
+
+    def test_updates_from_another_process_reach_the_cache(self, journal_storage, temp_data_dir):
+        """Test that cached rows and indexes follow update_todo from another worker."""
+        journal_storage.append_todos(
+            [TodoData(task="买牛奶"), TodoData(task="写日记")], "r1", "2024-01-01T12:00:00Z"
+        )
+        rows = journal_storage.read_collection(journal_storage.todos_file)
+        index = journal_storage.index_by(journal_storage.todos_file, "todo_id")
+        first, second = (t["todo_id"] for t in rows)
+        snapshot = journal_storage.todos_file.read_bytes()
+
+        ctx = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        process = ctx.Process(target=_update_todo, args=(temp_data_dir, second, "done"))
+        process.start()
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+        todos = journal_storage.read_collection(journal_storage.todos_file)
+        assert todos is rows
+        assert [t["status"] for t in todos] == ["pending", "done"]
+        assert index[second] is todos[1]
+
+        assert journal_storage.update_todo(first, {"status": "done"})["status"] == "done"
+        assert [t["status"] for t in journal_storage.read_collection(journal_storage.todos_file)] == ["done", "done"]
+        assert index[first]["status"] == "done"
+        # 日志模式的更新只追加到追加日志，快照保持不变
+        assert journal_storage.todos_file.read_bytes() == snapshot
+
+    def test_other_instances_see_tail(self, journal_storage, temp_data_dir):
+        """Test that a non-journal instance reads rows written to the tail."""
+        journal_storage.append_todos([TodoData(task="买牛奶")], "r1", "2024-01-01T12:00:00Z")
+
+        plain = StorageService(temp_data_dir)
+        todos = plain.read_collection(plain.todos_file)
+        assert [t["task"] for t in todos] == ["买牛奶"]
+
+        # 非日志模式的写入会把追加日志合并进快照
+        plain.append_todos([TodoData(task="写日记")], "r2", "2024-01-01T12:00:00Z")
+        assert not tail_path(plain.todos_file).exists()
+        snapshot = json.loads(plain.todos_file.read_text(encoding="utf-8"))
+        assert [t["task"] for t in snapshot] == ["买牛奶", "写日记"]
+
+    def test_torn_and_corrupt_lines_are_skipped(self, journal_storage):
+        """Test that a partial last line and garbage lines are ignored."""
+        record_id = journal_storage.save_record(make_record("完整"))
+        with open(tail_path(journal_storage.records_file), "ab") as f:
+            f.write(b"not json\n")
+            f.write(b'{"op": "append", "row": {"record_id": "torn"')
+
+        records = journal_storage.read_collection(journal_storage.records_file)
+        assert [r["record_id"] for r in records] == [record_id]
+
+    def test_rows_in_both_snapshot_and_tail_are_not_duplicated(self, journal_storage):
+        """Test recovery from a crash between snapshot write and tail removal."""
+        journal_storage.save_record(make_record("一"))
+        records = journal_storage.read_collection(journal_storage.records_file)
+        # 模拟压缩写完快照后、删除追加日志前崩溃
+        journal_storage._write_json_file(journal_storage.records_file, list(records))
+
+        fresh = StorageService(str(journal_storage.data_dir), journal=True)
+        assert len(fresh.read_collection(fresh.records_file)) == 1
+
+
+class TestCompact:
+    """Tests for StorageService.compact."""
+
+    def test_compact_folds_tail_into_snapshot(self, journal_storage):
+        """Test that compaction writes all rows to the snapshot and drops the tail."""
+        ids = [journal_storage.save_record(make_record(str(i))) for i in range(3)]
+
+        compacted = journal_storage.compact()
+
+        assert "records.json" in compacted
+        assert not tail_path(journal_storage.records_file).exists()
+        snapshot = json.loads(journal_storage.records_file.read_text(encoding="utf-8"))
+        assert [r["record_id"] for r in snapshot] == ids
+        assert [
+            r["record_id"] for r in journal_storage.read_collection(journal_storage.records_file)
+        ] == ids
+
+    def test_compact_drops_moods_derived_from_records(self, journal_storage):
+        """Test that moods already carried by records are removed from moods.json."""
+        record_id = save_with_mood(journal_storage, "今天很开心")
+        journal_storage._append_rows(journal_storage.moods_file, [{
+            "record_id": "orphan", "timestamp": "2023-12-31T12:00:00Z",
+            "type": "平静", "intensity": 5, "keywords": []
+        }])
+        timeline_before = journal_storage.get_mood_timeline()
+
+        journal_storage.compact()
+
+        moods = json.loads(journal_storage.moods_file.read_text(encoding="utf-8"))
+        assert [m["record_id"] for m in moods] == ["orphan"]
+        assert journal_storage.get_mood_timeline() == timeline_before
+        assert [m["record_id"] for m in timeline_before] == [record_id, "orphan"]
+
+    def test_compact_deduplicates_rows(self, journal_storage):
+        """Test that duplicate rows keep their first position and last content."""
+        journal_storage.inspirations_file.write_text(json.dumps([
+            {"inspiration_id": "i1", "record_id": "r1", "core_idea": "a", "category": "生活"},
+            {"inspiration_id": "i2", "record_id": "r2", "core_idea": "b", "category": "生活"},
+            {"inspiration_id": "i1", "record_id": "r1", "core_idea": "a", "category": "工作"},
+        ]), encoding="utf-8")
+
+        assert journal_storage.compact() == ["inspirations.json"]
+
+        rows = journal_storage.read_collection(journal_storage.inspirations_file)
+        assert [(r["core_idea"], r["category"]) for r in rows] == [("a", "工作"), ("b", "生活")]
+
+    def test_inspirations_with_the_same_idea_are_kept(self, journal_storage):
+        """Test that two inspirations of one record with the same core idea survive replay and compaction."""
+        journal_storage.inspirations_file.write_text(json.dumps([
+            {"record_id": "old", "core_idea": "a", "category": "生活"},
+            {"record_id": "old", "core_idea": "a", "category": "工作"},
+        ]), encoding="utf-8")
+        journal_storage.append_inspirations([
+            InspirationData(core_idea="b", category="生活"),
+            InspirationData(core_idea="b", category="工作"),
+        ], "r1", "2024-01-01T12:00:00Z")
+
+        def ideas():
+            rows = journal_storage.read_collection(journal_storage.inspirations_file)
+            return [(r["inspiration_id"], r["core_idea"], r["category"]) for r in rows]
+
+        before = ideas()
+        assert [(idea, category) for _, idea, category in before] == [
+            ("a", "生活"), ("a", "工作"), ("b", "生活"), ("b", "工作")
+        ]
+        assert [i for i, _, _ in before[:2]] == ["old-0", "old-1"]
+
+        journal_storage.compact()
+
+        assert ideas() == before
+
+    def test_small_tails_are_left_alone(self, journal_storage):
+        """Test that tails below the threshold are not compacted."""
+        journal_storage.save_record(make_record("一"))
+
+        assert journal_storage.compact(min_tail_bytes=1024 * 1024) == []
+        assert tail_path(journal_storage.records_file).exists()
+
+
+class TestMoodTimeline:
+    """Tests for the cached mood timeline."""
+
+    def test_timeline_is_cached_until_data_changes(self, journal_storage):
+        """Test that the merged view is reused while nothing changes."""
+        save_with_mood(journal_storage, "一")
+        first = journal_storage.get_mood_timeline()
+        assert journal_storage.get_mood_timeline() is first
+
+        save_with_mood(journal_storage, "二")
+        assert len(journal_storage.get_mood_timeline()) == 2
+
+
+class TestCompactor:
+    """Tests for the partition-wide compactor."""
+
+    def test_iter_partitions_finds_user_partitions(self, temp_data_dir):
+        """Test that the default and user partitions are found, staging dirs skipped."""
+        root = Path(temp_data_dir)
+        (root / "users" / "alice").mkdir(parents=True)
+        (root / "users" / ".bob.moving").mkdir(parents=True)
+
+        assert list(iter_partitions(root)) == [root, root / "users" / "alice"]
+
+    def test_run_once_compacts_every_partition(self, temp_data_dir):
+        """Test that run_once compacts tails in all partitions with data."""
+        root = Path(temp_data_dir)
+        alice = StorageService(str(root / "users" / "alice"), journal=True)
+        alice.save_record(make_record("alice"))
+        (root / "users" / "empty").mkdir()
+
+        compactor = Compactor(root, [root], min_tail_bytes=0)
+        compacted = compactor.run_once()
+
+        assert compacted == [root / "users" / "alice"]
+        assert not tail_path(alice.records_file).exists()
+        assert not (root / "users" / "empty" / "records.json").exists()
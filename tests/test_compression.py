@@ -0,0 +1,98 @@
+"""Tests for the response compression middleware."""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import compression
+from app.compression import CompressionMiddleware, choose_encoding
+
+
+PAYLOAD = {"records": [{"content": "今天天气很好，心情愉快。" * 20, "index": i} for i in range(50)]}
+
+
+@pytest.fixture
+def client():
+    """Create an app with a few endpoints behind the middleware."""
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, offload_size=4096)
+
+    @app.get("/large")
+    async def large(response: Response):
+        response.headers["ETag"] = '"v1"'
+        return PAYLOAD
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(3):
+                yield f"data: {'x' * 2000}{i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\xff" * 4096, media_type="image/jpeg")
+
+    compression._cache.clear()
+    return TestClient(app)
+
+
+class TestChooseEncoding:
+    """Tests for choose_encoding."""
+
+    def test_prefers_gzip_without_brotli(self):
+        """Test the encoding chosen when brotli is unavailable."""
+        with patch.object(compression, "HAS_BROTLI", False):
+            assert choose_encoding("gzip, deflate, br") == "gzip"
+            assert choose_encoding("br") is None
+
+    def test_respects_zero_quality(self):
+        """Test that q=0 excludes an encoding."""
+        assert choose_encoding("gzip;q=0, identity") is None
+        assert choose_encoding("") is None
+
+
+class TestCompressionMiddleware:
+    """Tests for CompressionMiddleware."""
+
+    def test_compresses_large_json(self, client):
+        """Test that large JSON responses are gzip-compressed."""
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        plain = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert int(response.headers["content-length"]) < len(plain.content) / 5
+        assert response.json() == PAYLOAD
+        assert "Accept-Encoding" in response.headers["vary"]
+
+    def test_reuses_compressed_body_for_same_etag(self, client):
+        """Test that a response with the same ETag is compressed only once."""
+        client.get("/large", headers={"Accept-Encoding": "gzip"})
+        with patch.object(compression, "compress", side_effect=AssertionError("compressed again")):
+            response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.json() == PAYLOAD
+
+    def test_leaves_small_streaming_and_binary_responses(self, client):
+        """Test that small, streamed and image responses are not compressed."""
+        headers = {"Accept-Encoding": "gzip"}
+
+        assert "content-encoding" not in client.get("/small", headers=headers).headers
+        assert "content-encoding" not in client.get("/image", headers=headers).headers
+        stream = client.get("/stream", headers=headers)
+        assert "content-encoding" not in stream.headers
+        assert stream.text.count("data: ") == 3
+
+    def test_no_accept_encoding(self, client):
+        """Test that clients without compression support get the plain body."""
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+
+        assert "content-encoding" not in response.headers
+        assert response.json() == PAYLOAD
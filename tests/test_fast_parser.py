@@ -0,0 +1,93 @@
+"""Tests for the rule-based fast-path parser."""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.fast_parser import fast_parse
+from app.semantic_parser import SemanticParserService
+
+
+class TestFastParse:
+    """Tests for fast_parse."""
+
+    def test_todo_with_time(self):
+        parsed, confidence = fast_parse("明天买牛奶")
+
+        assert confidence >= 0.9
+        assert parsed.mood is None
+        assert [(todo.task, todo.time) for todo in parsed.todos] == [("买牛奶", "明天")]
+
+    def test_todo_with_location(self):
+        parsed, confidence = fast_parse("下周三下午3点去医院复查")
+
+        assert confidence >= 0.9
+        todo = parsed.todos[0]
+        assert (todo.task, todo.time, todo.location) == ("去医院复查", "下周三下午3点", "医院")
+
+    def test_mood_with_intensifier(self):
+        parsed, confidence = fast_parse("好累")
+
+        assert confidence >= 0.9
+        assert parsed.mood.type == "疲惫"
+        assert parsed.mood.intensity == 6
+        assert parsed.todos == []
+
+    def test_mood_and_todo_clauses(self):
+        parsed, confidence = fast_parse("今天心情不错，明天要去开会。")
+
+        assert confidence >= 0.9
+        assert parsed.mood.type == "开心"
+        assert [(todo.task, todo.time) for todo in parsed.todos] == [("去开会", "明天")]
+
+    @pytest.mark.parametrize("text", [
+        "不太开心",                          # 否定
+        "今天心情很好，想到了一个有趣的想法。",  # 灵感需要大模型提炼
+        "今天天气真好，阳光洒在窗台上",         # 无法识别的分句
+        "遇到困难了",                        # "困难"不是情绪
+        "",
+        "今天" * 30,                         # 过长
+    ])
+    def test_uncertain_inputs_have_low_confidence(self, text):
+        _, confidence = fast_parse(text)
+
+        assert confidence < 0.9
+
+    @pytest.mark.parametrize("text", [
+        "还好", "还行吧", "去死吧", "给力", "看开了", "带劲", "发呆", "买不起",
+        "交了朋友", "做梦", "取消会议", "还没吃饭", "看来要下雨了", "明天不去开会",
+    ])
+    def test_verb_like_phrases_are_not_todos(self, text):
+        """Idioms starting with a verb character and negated clauses are not todos."""
+        parsed, confidence = fast_parse(text)
+
+        assert parsed.todos == [] or confidence < 0.9
+
+    def test_single_character_verb_needs_time_or_modal(self):
+        assert fast_parse("买牛奶")[1] < 0.9
+        assert fast_parse("记得买牛奶")[0].todos[0].task == "买牛奶"
+        assert fast_parse("整理房间")[0].todos[0].task == "整理房间"
+
+
+class TestFastPath:
+    """Tests for the fast path in SemanticParserService.parse."""
+
+    async def test_confident_input_skips_api(self):
+        service = SemanticParserService(api_key="key", fast_path_threshold=0.9)
+        service.client.post = AsyncMock()
+
+        parsed = await service.parse("明天买牛奶")
+        await service.close()
+
+        service.client.post.assert_not_awaited()
+        assert parsed.todos[0].task == "买牛奶"
+
+    async def test_fast_path_is_disabled_by_default(self):
+        service = SemanticParserService(api_key="key")
+        service.client.post = AsyncMock(side_effect=RuntimeError("api called"))
+
+        with pytest.raises(Exception):
+            await service.parse("明天买牛奶")
+        await service.close()
+
+        service.client.post.assert_awaited_once()
@@ -0,0 +1,211 @@
+"""Tests for the character image gallery manifest."""
+
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.gallery import Gallery, parse_image_filename
+from app.tenancy import DEFAULT_USER_ID
+
+
+def make_image(images_dir: Path, name: str, content: bytes = b"jpeg") -> Path:
+    """Create a fake image file."""
+    images_dir.mkdir(parents=True, exist_ok=True)
+    path = images_dir / name
+    path.write_bytes(content)
+    return path
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    """Create a gallery over empty temporary directories."""
+    return Gallery(tmp_path / "generated_images", tmp_path / "data" / "gallery.json")
+
+
+class TestParseImageFilename:
+    """Tests for parse_image_filename."""
+
+    def test_parses_preferences(self):
+        """Test that color, personality and timestamp are extracted."""
+        assert parse_image_filename("character_天空蓝_活泼_20260101_120000.jpeg") == {
+            "color": "天空蓝", "personality": "活泼", "timestamp": "20260101_120000"
+        }
+
+    def test_rejects_other_names(self):
+        """Test that unrelated file names are ignored."""
+        assert parse_image_filename("default_character.jpeg") is None
+
+
+class TestGallery:
+    """Tests for the Gallery manifest."""
+
+    def test_first_use_indexes_existing_images(self, gallery):
+        """Test that images present before the manifest existed are picked up once."""
+        make_image(gallery.images_dir, "character_粉_温柔_20260101_120000.jpeg")
+
+        images, total = gallery.page()
+
+        assert total == 1
+        assert images[0]["color"] == "粉"
+        assert len(images[0]["sha256"]) == 64
+        assert gallery.manifest_file.exists()
+
+    def test_listing_does_not_rescan_directory(self, gallery):
+        """Test that later reads come from the manifest, not a glob."""
+        gallery.page()
+        with patch.object(Path, "glob", side_effect=AssertionError("glob called")):
+            assert gallery.page() == ([], 0)
+
+    def test_add_and_paginate_newest_first(self, gallery):
+        """Test that added images are listed newest first with pagination."""
+        names = [f"character_色{i}_性格_2026010{i}_120000.jpeg" for i in range(5)]
+        for name in names:
+            gallery.add(make_image(gallery.images_dir, name), {"color": "c", "role": "朋友"}, "prompt")
+
+        first_page, total = gallery.page(0, 2)
+        second_page, _ = gallery.page(2, 2)
+        last_page, _ = gallery.page(4, 2)
+
+        assert total == 5
+        assert [e["filename"] for e in first_page] == [names[4], names[3]]
+        assert [e["filename"] for e in second_page] == [names[2], names[1]]
+        assert [e["filename"] for e in last_page] == [names[0]]
+        assert gallery.latest()["filename"] == names[4]
+        assert gallery.get(names[0])["role"] == "朋友"
+
+    def test_manifest_shared_between_instances(self, gallery, tmp_path):
+        """Test that another instance (worker) sees added images."""
+        gallery.page()
+        gallery.add(make_image(gallery.images_dir, "character_a_b_20260101_120000.jpeg"))
+
+        other = Gallery(gallery.images_dir, gallery.manifest_file)
+        assert other.get("character_a_b_20260101_120000.jpeg") is not None
+
+    def test_partition_without_scan_starts_empty(self, gallery, tmp_path):
+        """Test that another user's manifest does not pick up images on disk."""
+        make_image(gallery.images_dir, "character_粉_温柔_20260101_120000.jpeg")
+        other = Gallery(gallery.images_dir, tmp_path / "users" / "bob" / "gallery.json", scan_existing=False)
+
+        assert other.page() == ([], 0)
+        assert gallery.page()[1] == 1
+
+    def test_writes_use_a_dedicated_lock(self, gallery):
+        """Test that the manifest lock is not the partition's storage lock."""
+        gallery.add(make_image(gallery.images_dir, "character_a_b_20260101_120000.jpeg"))
+
+        assert (gallery.manifest_file.parent / "gallery.lock").exists()
+        assert not (gallery.manifest_file.parent / ".storage.lock").exists()
+
+
+class TestPromptCache:
+    """Tests for prompt-keyed lookup of generated images."""
+
+    def test_find_by_prompt_returns_newest_existing_image(self, gallery):
+        """Test that the newest image for a prompt is found, missing files ignored."""
+        older = make_image(gallery.images_dir, "character_a_b_20260101_120000.jpeg")
+        newer = make_image(gallery.images_dir, "character_a_b_20260102_120000.jpeg")
+        gallery.add(older, prompt="same prompt")
+        gallery.add(newer, prompt="same prompt")
+
+        assert gallery.find_by_prompt("same prompt")["filename"] == newer.name
+        assert gallery.find_by_prompt("other prompt") is None
+
+        newer.unlink()
+        assert gallery.find_by_prompt("same prompt") is None
+
+
+class TestGalleryApi:
+    """Tests for the history and select endpoints."""
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        """Create a test client whose gallery lives in tmp_path."""
+        import app.config
+        import app.main
+        app.config._config = None
+        monkeypatch.setattr(app.main, "generated_images_dir", tmp_path / "generated_images")
+
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True):
+            with TestClient(app.main.app) as client:
+                yield client
+
+    def test_history_pagination(self, client, tmp_path):
+        """Test that history returns a page and the total count."""
+        for i in range(3):
+            make_image(tmp_path / "generated_images", f"character_c{i}_p_2026010{i}_120000.jpeg")
+
+        response = client.get("/api/character/history", params={"offset": 1, "limit": 1})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["total"] == 3
+        assert len(body["images"]) == 1
+        assert body["images"][0]["url"].endswith(body["images"][0]["filename"])
+
+    def test_select_uses_manifest_preferences(self, client, tmp_path):
+        """Test that selecting an image takes its preferences from the manifest."""
+        name = "character_薄荷绿_聪明_20260101_120000.jpeg"
+        make_image(tmp_path / "generated_images", name)
+
+        response = client.post("/api/character/select", data={"filename": name})
+
+        assert response.status_code == 200
+        assert response.json()["preferences"]["color"] == "薄荷绿"
+
+    def test_users_cannot_see_or_select_other_users_images(self, client, tmp_path):
+        """Test that one user's images stay out of another user's history and select."""
+        import app.main
+
+        name = "character_薄荷绿_聪明_20260101_120000.jpeg"
+        app.main.get_gallery("alice").add(make_image(tmp_path / "generated_images", name))
+
+        alice = client.get("/api/character/history", headers={"X-User-Id": "alice"}).json()
+        bob = client.get("/api/character/history", headers={"X-User-Id": "bob"}).json()
+
+        assert [image["filename"] for image in alice["images"]] == [name]
+        assert bob["total"] == 0
+        assert client.post(
+            "/api/character/select", data={"filename": name}, headers={"X-User-Id": "bob"}
+        ).status_code == 404
+        assert client.post(
+            "/api/character/select", data={"filename": name}, headers={"X-User-Id": "alice"}
+        ).status_code == 200
+
+    def test_select_rejects_unknown_or_unsafe_names(self, client):
+        """Test that only files inside the gallery directory can be selected."""
+        assert client.post(
+            "/api/character/select", data={"filename": "missing.jpeg"}
+        ).status_code == 404
+        assert client.post(
+            "/api/character/select", data={"filename": "../requirements.txt"}
+        ).status_code == 404
+
+    def test_generate_serves_cached_image(self, client, tmp_path):
+        """Test that generating known preferences reuses the cached image."""
+        import app.main
+        from app.image_service import ImageGenerationService
+
+        preferences = {"color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜", "role": "引导型老师"}
+        name = "character_天空蓝_聪明_20260101_120000.jpeg"
+        app.main.get_gallery(DEFAULT_USER_ID).add(
+            make_image(tmp_path / "generated_images", name),
+            preferences,
+            ImageGenerationService.build_prompt(**preferences)
+        )
+
+        # 未配置 MiniMax 也能直接返回缓存的图片
+        response = client.post("/api/character/generate", data=preferences)
+
+        assert response.status_code == 200
+        assert response.json()["cached"] is True
+        assert response.json()["image_url"].endswith(name)
+
+        forced = client.post("/api/character/generate", data={**preferences, "force_new": "true"})
+        assert forced.status_code == 400
@@ -0,0 +1,150 @@
+"""Tests for the idempotency key store."""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.idempotency import (
+    IdempotencyConflictError, IdempotencyKeyError, IdempotencyPendingError, IdempotencyStore, validate_key
+)
+from app.storage import StorageService
+
+
+def keep(value):
+    """Keep every response (as JSON)."""
+    return {"value": value}
+
+
+def rebuild(stored):
+    return stored["value"]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """Create the storage of one partition."""
+    return StorageService(str(tmp_path))
+
+
+class TestIdempotencyStore:
+    """Tests for IdempotencyStore."""
+
+    async def test_concurrent_attempts_wait_for_the_first(self, storage):
+        """Test that attempts overlapping the first one share its result."""
+        store = IdempotencyStore(storage)
+        release = asyncio.Event()
+        calls = []
+
+        async def handle():
+            calls.append(1)
+            await release.wait()
+            return "response"
+
+        tasks = [asyncio.create_task(store.run("key", "body", handle, keep, rebuild)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert len(calls) == 1
+        assert sorted(replayed for _, replayed in results) == [False, True, True]
+        assert await store.run("key", "body", handle, keep, rebuild) == ("response", True)
+
+    async def test_responses_are_shared_across_workers(self, storage):
+        """Test that another process (another store on the same partition) replays the response."""
+        handle = AsyncMock(return_value="response")
+        await IdempotencyStore(storage).run("key", "body", handle, keep, rebuild)
+
+        other_worker = IdempotencyStore(StorageService(str(storage.data_dir)))
+
+        assert await other_worker.run("key", "body", handle, keep, rebuild) == ("response", True)
+        handle.assert_awaited_once()
+
+    async def test_waits_for_a_claim_held_by_another_worker(self, storage):
+        """Test that an attempt polls while another worker holds the claim."""
+        first, second = IdempotencyStore(storage), IdempotencyStore(storage, poll_interval=0.01)
+        assert first.claim("key", "body") == ("run", None)
+        handle = AsyncMock(return_value="unused")
+
+        task = asyncio.create_task(second.run("key", "body", handle, keep, rebuild))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        first.complete("key", "body", keep("response"))
+
+        assert await task == ("response", True)
+        handle.assert_not_awaited()
+
+    async def test_waiting_gives_up_after_the_timeout(self, storage):
+        """Test that an attempt stops polling a claim that outlasts wait_timeout."""
+        IdempotencyStore(storage).claim("key", "body")
+        store = IdempotencyStore(storage, poll_interval=0.01, wait_timeout=0.05)
+        handle = AsyncMock(return_value="unused")
+
+        with pytest.raises(IdempotencyPendingError):
+            await asyncio.wait_for(store.run("key", "body", handle, keep, rebuild), 1)
+        handle.assert_not_awaited()
+
+    async def test_abandoned_claims_are_taken_over(self, storage):
+        """Test that a claim older than the lease no longer blocks retries."""
+        IdempotencyStore(storage).claim("key", "body")
+        store = IdempotencyStore(storage, lease=0)
+        handle = AsyncMock(return_value="response")
+
+        assert await store.run("key", "body", handle, keep, rebuild) == ("response", False)
+
+    async def test_key_reused_for_another_body_is_rejected(self, storage):
+        """Test that a different body with the same key raises a conflict."""
+        store = IdempotencyStore(storage)
+        handle = AsyncMock(return_value="response")
+        await store.run("key", "body", handle, keep, rebuild)
+
+        with pytest.raises(IdempotencyConflictError):
+            await store.run("key", "other body", handle, keep, rebuild)
+        handle.assert_awaited_once()
+
+    async def test_uncacheable_results_are_not_kept(self, storage):
+        """Test that results rejected by to_json run again on retry."""
+        store = IdempotencyStore(storage)
+        handle = AsyncMock(side_effect=["error", "ok", "unused"])
+
+        def to_json(value):
+            return keep(value) if value == "ok" else None
+
+        assert await store.run("key", "body", handle, to_json, rebuild) == ("error", False)
+        assert await store.run("key", "body", handle, to_json, rebuild) == ("ok", False)
+        assert await store.run("key", "body", handle, to_json, rebuild) == ("ok", True)
+
+    async def test_failed_attempts_release_the_claim(self, storage):
+        """Test that an exception releases the key for the next attempt."""
+        store = IdempotencyStore(storage)
+        handle = AsyncMock(side_effect=[RuntimeError("boom"), "ok"])
+
+        with pytest.raises(RuntimeError):
+            await store.run("key", "body", handle, keep, rebuild)
+        assert await store.run("key", "body", handle, keep, rebuild) == ("ok", False)
+
+    def test_entries_expire_and_are_bounded(self, storage, monkeypatch):
+        """Test the TTL and the maximum number of entries."""
+        now = [1000.0]
+        monkeypatch.setattr("app.idempotency.time.time", lambda: now[0])
+        store = IdempotencyStore(storage, max_entries=2, ttl=60, lease=60)
+
+        for key in ("a", "b", "c"):
+            store.claim(key, "body")
+            store.complete(key, "body", keep(key))
+        assert store.claim("a", "body") == ("run", None)
+        assert store.claim("c", "body") == ("done", keep("c"))
+
+        now[0] += 61
+        assert store.claim("c", "body") == ("run", None)
+
+
+class TestValidateKey:
+    """Tests for validate_key."""
+
+    def test_accepts_uuid(self):
+        assert validate_key(" 0b4e7a0e-5c1f-4c51-9a39-2f1d3c1f9b10 ") == "0b4e7a0e-5c1f-4c51-9a39-2f1d3c1f9b10"
+
+    @pytest.mark.parametrize("key", ["", "   ", "x" * 256, "键"])
+    def test_rejects_invalid_keys(self, key):
+        with pytest.raises(IdempotencyKeyError):
+            validate_key(key)
@@ -0,0 +1,289 @@
+"""Tests for image download and character generation persistence."""
+
+import json
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.image_service import ImageGenerationError, ImageGenerationService
+from app.user_config import UserConfig
+
+
+def make_service(handler) -> ImageGenerationService:
+    """Create a service whose HTTP client is served by ``handler``."""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return ImageGenerationService(api_key="test-key", client=client)
+
+
+def mock_service(download) -> MagicMock:
+    """Create a mock ImageGenerationService returning one image."""
+    service = MagicMock()
+    service.generate_image = AsyncMock(return_value={
+        "url": "https://cdn.invalid/a.jpeg", "prompt": "prompt", "task_id": "t1"
+    })
+    service.download_image = download
+    service.close = AsyncMock()
+    return service
+
+
+class TestDownloadImage:
+    """Tests for ImageGenerationService.download_image."""
+
+    async def test_streams_image_to_file(self, tmp_path):
+        """Test that the image is written completely and no temp file remains."""
+        content = os.urandom(300 * 1024)
+        service = make_service(lambda request: httpx.Response(200, content=content))
+
+        path = await service.download_image("https://cdn.invalid/a.jpeg", str(tmp_path / "a.jpeg"))
+        await service.close()
+
+        assert (tmp_path / "a.jpeg").read_bytes() == content
+        assert path == str((tmp_path / "a.jpeg").absolute())
+        assert [p.name for p in tmp_path.iterdir()] == ["a.jpeg"]
+
+    async def test_http_error_leaves_no_file(self, tmp_path):
+        """Test that a failed download raises and writes nothing."""
+        service = make_service(lambda request: httpx.Response(404))
+
+        with pytest.raises(ImageGenerationError):
+            await service.download_image("https://cdn.invalid/a.jpeg", str(tmp_path / "a.jpeg"))
+        await service.close()
+
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestGenerateCharacterDownload:
+    """Tests for the download step of POST /api/character/generate."""
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        """Create a test client with MiniMax configured and images in tmp_path."""
+        import app.config
+        import app.main
+        app.config._config = None
+        monkeypatch.setattr(app.main, "generated_images_dir", tmp_path / "generated_images")
+
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "MINIMAX_API_KEY": "minimax_test_key",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True):
+            with TestClient(app.main.app) as client:
+                yield client
+
+    def test_downloaded_image_is_saved_and_registered(self, client, tmp_path):
+        """Test that a successful download ends up in the config and gallery."""
+        async def download(url, save_path):
+            with open(save_path, "wb") as f:
+                f.write(b"jpeg")
+            return save_path
+
+        with patch("app.image_service.ImageGenerationService",
+                   return_value=mock_service(AsyncMock(side_effect=download))):
+            response = client.post("/api/character/generate", data={
+                "color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜",
+                "role": "引导型老师", "force_new": "true"
+            })
+
+        assert response.status_code == 200
+        filename = response.json()["image_url"].rsplit("/", 1)[-1]
+        assert (tmp_path / "generated_images" / filename).exists()
+        history = client.get("/api/character/history").json()
+        assert [image["filename"] for image in history["images"]] == [filename]
+
+    def test_failed_download_falls_back_to_remote_url(self, client, tmp_path):
+        """Test that the config points at the remote image if the download fails."""
+        failing = AsyncMock(side_effect=ImageGenerationError("boom"))
+        with patch("app.image_service.ImageGenerationService",
+                   return_value=mock_service(failing)):
+            response = client.post("/api/character/generate", data={
+                "color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜",
+                "role": "引导型老师", "force_new": "true"
+            })
+
+        assert response.status_code == 200
+        assert response.json()["image_url"] == "https://cdn.invalid/a.jpeg"
+        config = UserConfig(str(tmp_path / "data"))
+        assert config.get_character_image_url() == "https://cdn.invalid/a.jpeg"
+
+    async def test_cancelled_download_leaves_config_unchanged(self, client, tmp_path):
+        """Test that cancelling during the download does not save the unwritten path."""
+        import asyncio
+        from app.main import _create_character_image, get_user_data_dir
+        from app.tenancy import DEFAULT_USER_ID
+
+        started = asyncio.Event()
+
+        async def download(url, save_path):
+            # 给同时进行的其他步骤（如保存配置）留出完成的时间
+            await asyncio.sleep(0.2)
+            started.set()
+            await asyncio.Event().wait()
+
+        preferences = {"color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜", "role": "引导型老师"}
+        with patch("app.image_service.ImageGenerationService",
+                   return_value=mock_service(AsyncMock(side_effect=download))):
+            task = asyncio.create_task(_create_character_image("http://test", DEFAULT_USER_ID, preferences))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        config = UserConfig(str(get_user_data_dir(DEFAULT_USER_ID)), DEFAULT_USER_ID)
+        assert not config.get_character_image_url()
+
+
+class TestGenerateMultipleImages:
+    """Tests for ImageGenerationService.generate_multiple_images."""
+
+    async def test_issues_one_request_per_image(self):
+        """Test that each candidate is requested separately with n=1."""
+        payloads = []
+
+        def handler(request):
+            payload = json.loads(request.content)
+            payloads.append(payload)
+            return httpx.Response(200, json={
+                "id": f"task-{len(payloads)}",
+                "data": {"image_urls": [f"https://cdn.invalid/{len(payloads)}.jpeg"]},
+                "base_resp": {"status_code": 0, "status_msg": "success"}
+            })
+
+        service = make_service(handler)
+        images = await service.generate_multiple_images(count=3)
+        await service.close()
+
+        assert [payload["n"] for payload in payloads] == [1, 1, 1]
+        assert [image["index"] for image in images] == [0, 1, 2]
+        assert len({image["url"] for image in images}) == 3
+
+
+def parse_events(body: str) -> list:
+    """Parse a text/event-stream body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestGenerateCharacterBatch:
+    """Tests for POST /api/character/generate/batch."""
+
+    client = TestGenerateCharacterDownload.client
+
+    PREFERENCES = {"color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜", "role": "引导型老师"}
+
+    def _mock_service(self, fail_index=None):
+        calls = {"n": 0}
+
+        async def generate_image(**kwargs):
+            index = calls["n"]
+            calls["n"] += 1
+            if index == fail_index:
+                raise ImageGenerationError("boom")
+            return {"url": f"https://cdn.invalid/{index}.jpeg", "prompt": "prompt", "task_id": f"t{index}"}
+
+        async def download(url, save_path):
+            with open(save_path, "wb") as f:
+                f.write(url.encode())
+            return save_path
+
+        service = MagicMock()
+        service.generate_image = AsyncMock(side_effect=generate_image)
+        service.download_image = AsyncMock(side_effect=download)
+        service.close = AsyncMock()
+        return service
+
+    def test_streams_candidates_as_events(self, client, tmp_path):
+        """Test that each saved candidate is streamed and added to the gallery."""
+        service = self._mock_service(fail_index=1)
+        with patch("app.image_service.ImageGenerationService", return_value=service) as service_class:
+            service_class.build_prompt = ImageGenerationService.build_prompt
+            response = client.post("/api/character/generate/batch", data={**self.PREFERENCES, "count": "3"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_events(response.text)
+        names = [event for event, _ in events]
+        assert names[0] == "start" and names[-1] == "done"
+        assert sorted(names[1:-1]) == ["candidate", "candidate", "candidate_error"]
+        assert events[-1][1] == {"succeeded": 2, "failed": 1}
+
+        candidates = [data for event, data in events if event == "candidate"]
+        for candidate in candidates:
+            assert (tmp_path / "generated_images" / candidate["filename"]).exists()
+        history = client.get("/api/character/history").json()
+        assert history["total"] == 2
+        service.close.assert_awaited_once()
+
+    def test_rejects_invalid_count(self, client):
+        """Test that the candidate count is validated before streaming."""
+        response = client.post("/api/character/generate/batch", data={**self.PREFERENCES, "count": "5"})
+
+        assert response.status_code == 400
+
+    def test_generation_counts_against_job_limit(self, client):
+        """Test that inline and batch generation are refused once the user hit the job limit."""
+        import app.main
+        app.main.get_job_manager().max_per_user = 0
+
+        response = client.post("/api/character/generate", data={**self.PREFERENCES, "force_new": "true"})
+        assert response.status_code == 429
+        assert client.post("/api/character/generate/batch", data=self.PREFERENCES).status_code == 429
+
+
+class TestCharacterJobs:
+    """Tests for the /api/character/jobs endpoints."""
+
+    client = TestGenerateCharacterDownload.client
+
+    PREFERENCES = {"color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜", "role": "引导型老师"}
+
+    def _poll(self, client, job_id):
+        for _ in range(200):
+            job = client.get(f"/api/character/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed", "cancelled"):
+                return job
+            time.sleep(0.01)
+        raise AssertionError("job did not finish")
+
+    def test_job_generates_image(self, client, tmp_path):
+        """Test that a submitted job finishes with the generated image."""
+        async def download(url, save_path):
+            with open(save_path, "wb") as f:
+                f.write(b"jpeg")
+            return save_path
+
+        service = mock_service(AsyncMock(side_effect=download))
+        with patch("app.image_service.ImageGenerationService", return_value=service) as service_class:
+            service_class.build_prompt = ImageGenerationService.build_prompt
+            response = client.post("/api/character/jobs", data={**self.PREFERENCES, "force_new": "true"})
+            assert response.status_code == 202
+            job = self._poll(client, response.json()["job_id"])
+
+        assert job["status"] == "done"
+        filename = job["result"]["image_url"].rsplit("/", 1)[-1]
+        assert (tmp_path / "generated_images" / filename).exists()
+
+    def test_failed_job_reports_error(self, client):
+        """Test that a generation error fails the job with a readable message."""
+        service = mock_service(AsyncMock())
+        service.generate_image = AsyncMock(side_effect=ImageGenerationError("request timeout"))
+        with patch("app.image_service.ImageGenerationService", return_value=service) as service_class:
+            service_class.build_prompt = ImageGenerationService.build_prompt
+            job_id = client.post("/api/character/jobs", data=self.PREFERENCES).json()["job_id"]
+            job = self._poll(client, job_id)
+
+        assert job["status"] == "failed"
+        assert "超时" in job["error"]
+
+    def test_unknown_job(self, client):
+        """Test that unknown job ids return 404."""
+        assert client.get("/api/character/jobs/missing").status_code == 404
+        assert client.delete("/api/character/jobs/missing").status_code == 404
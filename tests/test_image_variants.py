@@ -0,0 +1,159 @@
+"""Tests for generated image derivatives and their content negotiation."""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import image_variants
+from app.image_variants import (
+    VariantStaticFiles,
+    generate_variants,
+    negotiate,
+    schedule_variants,
+    shutdown_pool,
+    supported_formats,
+    variant_path,
+)
+
+PIL = pytest.importorskip("PIL.Image")
+
+pytestmark = pytest.mark.skipif(
+    "webp" not in supported_formats(), reason="Pillow without WebP support"
+)
+
+NAME = "character_粉_温柔_20260101_120000.jpeg"
+
+
+@pytest.fixture
+def images_dir(tmp_path):
+    """Create an images directory with one 600x600 JPEG."""
+    PIL.new("RGB", (600, 600), (200, 150, 220)).save(tmp_path / NAME, format="JPEG")
+    return tmp_path
+
+
+class TestGenerateVariants:
+    """Tests for generate_variants."""
+
+    def test_writes_thumbnails_and_encodings(self, images_dir):
+        """Test that every width and supported encoding is rendered."""
+        written = generate_variants(str(images_dir / NAME), str(images_dir))
+
+        expected = len(supported_formats()) * (1 + len(image_variants.VARIANT_WIDTHS))
+        assert len(written) == expected
+        with PIL.open(variant_path(images_dir, NAME, "webp", 256)) as thumb:
+            assert thumb.size == (256, 256)
+        assert variant_path(images_dir, NAME, "webp", 128).stat().st_size < (images_dir / NAME).stat().st_size
+
+    def test_skips_widths_larger_than_original(self, tmp_path):
+        """Test that small images are not upscaled."""
+        PIL.new("RGB", (200, 100)).save(tmp_path / NAME, format="JPEG")
+
+        generate_variants(str(tmp_path / NAME), str(tmp_path))
+
+        assert variant_path(tmp_path, NAME, "webp", 128).exists()
+        assert not variant_path(tmp_path, NAME, "webp", 256).exists()
+
+    async def test_schedule_runs_in_process_pool(self, images_dir):
+        """Test that scheduled jobs render the variants off the event loop."""
+        try:
+            future = schedule_variants(images_dir / NAME, images_dir)
+            written = await future
+        finally:
+            shutdown_pool()
+        assert str(variant_path(images_dir, NAME, "webp")) in written
+
+
+class TestNegotiate:
+    """Tests for negotiate and VariantStaticFiles."""
+
+    def test_picks_smallest_sufficient_width(self, images_dir):
+        """Test width and encoding selection."""
+        generate_variants(str(images_dir / NAME), str(images_dir))
+
+        path, media_type = negotiate(images_dir, NAME, "image/webp,*/*", 200)
+        assert path == variant_path(images_dir, NAME, "webp", 256)
+        assert media_type == "image/webp"
+        assert negotiate(images_dir, NAME, "image/webp", 2000)[0] == variant_path(images_dir, NAME, "webp")
+
+    def test_original_without_support_or_variants(self, images_dir):
+        """Test that clients without WebP/AVIF, or missing variants, get the original."""
+        assert negotiate(images_dir, NAME, "image/webp", 256) is None
+        generate_variants(str(images_dir / NAME), str(images_dir))
+        assert negotiate(images_dir, NAME, "image/jpeg,*/*", 256) is None
+        assert negotiate(images_dir, NAME, "image/webp;q=0, image/jpeg", 256) is None
+
+    def test_static_files_negotiates(self, images_dir):
+        """Test that /generated_images serves variants by Accept and ?w=."""
+        generate_variants(str(images_dir / NAME), str(images_dir))
+        app = FastAPI()
+        app.mount("/generated_images", VariantStaticFiles(directory=str(images_dir)))
+        client = TestClient(app)
+
+        webp = client.get(f"/generated_images/{NAME}?w=128", headers={"Accept": "image/webp"})
+        jpeg = client.get(f"/generated_images/{NAME}?w=128", headers={"Accept": "image/jpeg"})
+
+        assert webp.headers["content-type"] == "image/webp"
+        assert webp.headers["vary"] == "Accept"
+        assert len(webp.content) < len(jpeg.content)
+        assert jpeg.headers["content-type"] == "image/jpeg"
+        assert jpeg.headers["vary"] == "Accept"
+
+    def test_cache_control(self, images_dir):
+        """Test that generated images are immutable unless a variant may still appear."""
+        app = FastAPI()
+        app.mount("/generated_images", VariantStaticFiles(directory=str(images_dir)))
+        client = TestClient(app)
+        PIL.new("RGB", (8, 8)).save(images_dir / "default_character.jpeg", format="JPEG")
+
+        pending = client.get(f"/generated_images/{NAME}?w=128", headers={"Accept": "image/webp"})
+        plain = client.get(f"/generated_images/{NAME}", headers={"Accept": "image/jpeg"})
+        default = client.get("/generated_images/default_character.jpeg")
+        generate_variants(str(images_dir / NAME), str(images_dir))
+        variant = client.get(f"/generated_images/{NAME}?w=128", headers={"Accept": "image/webp"})
+        revalidated = client.get(
+            f"/generated_images/{NAME}?w=128",
+            headers={"Accept": "image/webp", "If-None-Match": variant.headers["etag"]}
+        )
+
+        assert pending.headers["cache-control"] == image_variants.PENDING_CACHE_CONTROL
+        assert plain.headers["cache-control"] == image_variants.IMMUTABLE_CACHE_CONTROL
+        assert default.headers["cache-control"] == "no-cache"
+        assert variant.headers["cache-control"] == image_variants.IMMUTABLE_CACHE_CONTROL
+        assert revalidated.status_code == 304
+        assert revalidated.headers["cache-control"] == image_variants.IMMUTABLE_CACHE_CONTROL
+
+    def test_stand_in_variants_are_not_immutable(self, images_dir):
+        """Test that a fallback to a larger file or a worse encoding is only cached briefly."""
+        generate_variants(str(images_dir / NAME), str(images_dir))
+        # 模拟渲染中途：全尺寸已写入，128 宽的缩略图尚未生成
+        for name in supported_formats():
+            variant_path(images_dir, NAME, name, 128).unlink()
+        app = FastAPI()
+        app.mount("/generated_images", VariantStaticFiles(directory=str(images_dir)))
+        client = TestClient(app)
+
+        fallback = client.get(f"/generated_images/{NAME}?w=128", headers={"Accept": "image/webp"})
+        exact = client.get(f"/generated_images/{NAME}?w=256", headers={"Accept": "image/webp"})
+
+        assert fallback.headers["content-type"] == "image/webp"
+        assert fallback.headers["cache-control"] == image_variants.PENDING_CACHE_CONTROL
+        assert exact.headers["cache-control"] == image_variants.IMMUTABLE_CACHE_CONTROL
+        if "avif" in supported_formats():
+            variant_path(images_dir, NAME, "avif", 256).unlink()
+            webp_for_avif = client.get(
+                f"/generated_images/{NAME}?w=256", headers={"Accept": "image/avif,image/webp"}
+            )
+            assert webp_for_avif.headers["content-type"] == "image/webp"
+            assert webp_for_avif.headers["cache-control"] == image_variants.PENDING_CACHE_CONTROL
+
+    def test_full_size_is_final_for_small_originals(self, tmp_path):
+        """Test that full size is immutable when no thumbnail that wide will be rendered."""
+        PIL.new("RGB", (200, 100)).save(tmp_path / NAME, format="JPEG")
+        generate_variants(str(tmp_path / NAME), str(tmp_path))
+        app = FastAPI()
+        app.mount("/generated_images", VariantStaticFiles(directory=str(tmp_path)))
+
+        response = TestClient(app).get(f"/generated_images/{NAME}?w=256", headers={"Accept": "image/webp"})
+
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["cache-control"] == image_variants.IMMUTABLE_CACHE_CONTROL
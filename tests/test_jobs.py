@@ -0,0 +1,172 @@
+"""Tests for the background job manager."""
+
+import asyncio
+
+import pytest
+
+from app import jobs
+from app.jobs import JobLimitError, JobManager
+
+
+async def wait_finished(job: jobs.Job) -> None:
+    """Wait until a job reached a final state."""
+    while not job.finished:
+        await asyncio.sleep(0.001)
+
+
+class TestJobManager:
+    """Tests for JobManager."""
+
+    async def test_job_reports_progress_and_result(self):
+        """Test that a job goes through its states and keeps the result."""
+        manager = JobManager()
+        step = asyncio.Event()
+
+        async def work(job):
+            job.set_status(jobs.GENERATING)
+            await step.wait()
+            return {"value": 1}
+
+        job = manager.submit("alice", "test", work)
+        assert job.status == jobs.QUEUED
+        await asyncio.sleep(0)
+        assert job.status == jobs.GENERATING
+
+        step.set()
+        await wait_finished(job)
+        assert job.to_dict()["status"] == jobs.DONE
+        assert job.result == {"value": 1}
+
+    async def test_failure_is_recorded(self):
+        """Test that an exception fails the job with its message."""
+        manager = JobManager()
+
+        async def work(job):
+            raise ValueError("broken")
+
+        job = manager.submit("alice", "test", work)
+        await wait_finished(job)
+
+        assert job.status == jobs.FAILED
+        assert job.error == "broken"
+
+    async def test_concurrency_is_bounded(self):
+        """Test that at most max_concurrent jobs run at once."""
+        manager = JobManager(max_concurrent=2, max_per_user=10)
+        running = 0
+        peak = 0
+
+        async def work(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        submitted = [manager.submit("alice", "test", work) for _ in range(5)]
+        for job in submitted:
+            await wait_finished(job)
+
+        assert peak == 2
+        assert all(job.status == jobs.DONE for job in submitted)
+
+    async def test_per_user_limit(self):
+        """Test that a user cannot exceed max_per_user unfinished jobs."""
+        manager = JobManager(max_per_user=1)
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        first = manager.submit("alice", "test", work)
+        with pytest.raises(JobLimitError):
+            manager.submit("alice", "test", work)
+        # 其他用户不受影响
+        manager.submit("bob", "test", work)
+
+        release.set()
+        await wait_finished(first)
+        manager.submit("alice", "test", work)
+        await manager.shutdown()
+
+    async def test_cancel(self):
+        """Test that cancelling stops the job and frees the user's slot."""
+        manager = JobManager(max_per_user=1)
+        cleaned_up = asyncio.Event()
+
+        async def work(job):
+            try:
+                await asyncio.sleep(10)
+            finally:
+                cleaned_up.set()
+
+        job = manager.submit("alice", "test", work)
+        await asyncio.sleep(0)
+
+        assert manager.cancel(job.job_id, "bob") is None
+        assert manager.cancel(job.job_id, "alice").status == jobs.CANCELLED
+        await asyncio.wait_for(cleaned_up.wait(), 1)
+        manager.submit("alice", "test", work)
+        await manager.shutdown()
+
+    async def test_jobs_are_private_and_expire(self):
+        """Test that jobs are only visible to their owner until the TTL."""
+        manager = JobManager(ttl=0)
+
+        async def work(job):
+            return 1
+
+        job = manager.submit("alice", "test", work)
+        await wait_finished(job)
+
+        assert manager.get(job.job_id, "alice") is job
+        assert manager.get(job.job_id, "bob") is None
+        await asyncio.sleep(0.01)
+        manager.submit("alice", "test", work)
+        assert manager.get(job.job_id, "alice") is None
+
+    async def test_inline_work_shares_limits(self):
+        """Test that work held inside a request counts against the job limits."""
+        manager = JobManager(max_concurrent=1, max_per_user=1)
+
+        async def work(job):
+            return 1
+
+        with manager.hold("alice"):
+            with pytest.raises(JobLimitError):
+                manager.submit("alice", "test", work)
+            async with manager.slot():
+                job = manager.submit("bob", "test", work)
+                await asyncio.sleep(0.01)
+                assert job.status == jobs.QUEUED
+        await wait_finished(job)
+        manager.submit("alice", "test", work)
+        await manager.shutdown()
+
+    async def test_jobs_are_visible_to_other_workers(self, tmp_path):
+        """Test that another worker can poll and cancel a persisted job."""
+        def state_dir(user_id):
+            return tmp_path / user_id / "jobs"
+
+        owner = JobManager(state_dir=state_dir, poll_interval=0.01)
+        other = JobManager(state_dir=state_dir, poll_interval=0.01)
+        cancelled = asyncio.Event()
+
+        async def work(job):
+            job.set_status(jobs.GENERATING)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        job = owner.submit("alice", "test", work)
+        await asyncio.sleep(0.05)
+
+        assert (await other.find(job.job_id, "alice")).status == jobs.GENERATING
+        assert await other.find(job.job_id, "bob") is None
+        assert await other.find("../../alice", "alice") is None
+        assert (await other.request_cancel(job.job_id, "alice")).status == jobs.CANCELLED
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await owner.shutdown()
+        assert (await other.find(job.job_id, "alice")).status == jobs.CANCELLED
@@ -0,0 +1,91 @@
+"""Tests for extracting JSON from model output."""
+
+import json
+import re
+
+import pytest
+from hypothesis import given, settings, strategies as st
+
+from app.json_extract import JSONExtractError, extract_json
+
+
+# JSON 值（字符串可包含括号、引号和中文，用于检验字符串内的括号不被计数）
+json_values = st.recursive(
+    st.none() | st.booleans() | st.integers(-10**6, 10**6) | st.text(max_size=20),
+    lambda children: st.lists(children, max_size=4)
+    | st.dictionaries(st.text(max_size=8), children, max_size=4),
+    max_leaves=12
+)
+json_objects = st.dictionaries(st.text(max_size=8), json_values, max_size=5)
+
+# 说明文字中不含括号，否则其本身就可能是一个候选 JSON
+prose = st.text(alphabet=st.characters(blacklist_characters="{}[]\"", blacklist_categories=("Cs",)), max_size=30)
+
+
+def add_trailing_commas(document: str) -> str:
+    """Insert a comma before every closing bracket of a non-empty container."""
+    return re.sub(r'(?<=[^\[{\s,])(\s*[}\]])', r',\1', document)
+
+
+class TestExtractJsonProperties:
+    """Property-based tests for extract_json."""
+
+    @given(value=json_objects, before=prose, after=prose, fenced=st.booleans(), indent=st.sampled_from([None, 2]))
+    @settings(max_examples=200)
+    def test_finds_object_in_surrounding_text(self, value, before, after, fenced, indent):
+        """Any object is recovered whatever prose and fences surround it."""
+        document = json.dumps(value, ensure_ascii=False, indent=indent)
+        if fenced:
+            document = f"```json\n{document}\n```"
+
+        assert extract_json(before + document + after) == value
+
+    @given(value=json_objects)
+    @settings(max_examples=200)
+    def test_repairs_trailing_commas(self, value):
+        """Trailing commas outside strings are tolerated."""
+        keys_and_strings_plain = all(
+            not re.search(r'[\[\]{},"\\]', text)
+            for text in re.findall(r'"((?:[^"\\]|\\.)*)"', json.dumps(value, ensure_ascii=False))
+        )
+        document = json.dumps(value, ensure_ascii=False, indent=2)
+        if keys_and_strings_plain:
+            document = add_trailing_commas(document)
+
+        assert extract_json(document) == value
+
+    @given(content=st.text(max_size=200))
+    @settings(max_examples=300)
+    def test_never_raises_other_errors(self, content):
+        """Arbitrary text either yields a value or a JSONExtractError."""
+        try:
+            extract_json(content)
+        except JSONExtractError:
+            pass
+
+
+class TestExtractJson:
+    """Example-based tests for extract_json."""
+
+    def test_repairs_python_literals_and_full_width_punctuation(self):
+        content = '{"mood": None，"ok"： True, "note": "保留，字符串：None"}'
+
+        assert extract_json(content) == {"mood": None, "ok": True, "note": "保留，字符串：None"}
+
+    def test_closes_truncated_output(self):
+        content = '好的：{"todos": [{"task": "买牛奶", "time": "明'
+
+        assert extract_json(content) == {"todos": [{"task": "买牛奶", "time": "明"}]}
+
+    def test_skips_invalid_candidates(self):
+        content = "示例 {不是 JSON} 结果 ```json\n{\"mood\": null}\n```"
+
+        assert extract_json(content) == {"mood": None}
+
+    def test_objects_only(self):
+        assert extract_json('["x", {"a": 1}]', "{") == {"a": 1}
+
+    @pytest.mark.parametrize("content", ["", "没有 JSON", "{]", '{"a": }'])
+    def test_raises_when_nothing_decodes(self, content):
+        with pytest.raises(JSONExtractError):
+            extract_json(content)
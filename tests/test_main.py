@@ -37,6 +37,27 @@ class TestApplicationStartup:
                 assert response.status_code == 200
                 assert response.json()["status"] == "running"
     
+    @pytest.mark.parametrize("journal, started", [("false", False), ("true", True)])
+    def test_compactor_only_runs_in_journal_mode(self, tmp_path, journal, started):
+        """Test that background compaction is only started when STORAGE_JOURNAL is on."""
+        import app.config
+        app.config._config = None
+
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log"),
+            "STORAGE_JOURNAL": journal
+        }, clear=True), patch("app.main.Compactor") as mock_compactor_class:
+            mock_compactor_class.return_value.stop = AsyncMock()
+            from fastapi.testclient import TestClient
+            from app.main import app
+
+            with TestClient(app):
+                pass
+
+        assert mock_compactor_class.called is started
+
     @patch.dict(os.environ, {}, clear=True)
     def test_app_refuses_to_start_without_api_key(self):
         """Test that application refuses to start without API key.
@@ -503,3 +524,474 @@ class TestProcessEndpoint:
                 # Check todos
                 assert len(data["todos"]) == 1
                 assert data["todos"][0]["task"] == "完成报告"
+
+
+class TestTodoEndpoints:
+    """Test single and bulk todo updates."""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        """Create a test client with one record holding two todos."""
+        import app.config
+        app.config._config = None
+        
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True):
+            from fastapi.testclient import TestClient
+            from app.main import app
+            from app.models import TodoData
+            from app.storage import StorageService
+            
+            storage = StorageService(str(tmp_path / "data"))
+            storage.todos_file.write_text("[]", encoding="utf-8")
+            self.todo_ids = storage.append_todos(
+                [TodoData(task="买牛奶"), TodoData(task="写日记")],
+                "record-1", "2024-01-01T12:00:00Z"
+            )
+            
+            with TestClient(app) as client:
+                yield client
+    
+    def _statuses(self, client):
+        return {t["todo_id"]: t["status"] for t in client.get("/api/todos").json()["todos"]}
+    
+    def test_update_single_todo(self, client):
+        """Test that PATCH /api/todos/{todo_id} changes only that todo."""
+        first, second = self.todo_ids
+        
+        response = client.patch(f"/api/todos/{second}", data={"status": "completed"})
+        
+        assert response.status_code == 200
+        assert self._statuses(client) == {first: "pending", second: "completed"}
+    
+    def test_bulk_update(self, client):
+        """Test that PATCH /api/todos applies all changes and returns the rows."""
+        first, second = self.todo_ids
+        
+        response = client.patch("/api/todos", json=[
+            {"todo_id": first, "status": "completed"},
+            {"todo_id": second, "status": "completed", "location": "家"},
+        ])
+        
+        assert response.status_code == 200
+        todos = response.json()["todos"]
+        assert [t["todo_id"] for t in todos] == [first, second]
+        assert todos[1]["location"] == "家"
+        assert self._statuses(client) == {first: "completed", second: "completed"}
+    
+    def test_bulk_update_with_unknown_id_changes_nothing(self, client):
+        """Test that a batch with an unknown todo_id is rejected as a whole."""
+        first, second = self.todo_ids
+        
+        response = client.patch("/api/todos", json=[
+            {"todo_id": first, "status": "completed"},
+            {"todo_id": "missing", "status": "completed"},
+        ])
+        
+        assert response.status_code == 404
+        assert response.json()["missing"] == ["missing"]
+        assert self._statuses(client) == {first: "pending", second: "pending"}
+    
+    def test_storage_runs_off_the_event_loop(self, client):
+        """Test that the todo endpoints call the locking storage code in a thread."""
+        import asyncio
+        from app.storage import StorageService
+        
+        calls = []
+        
+        def off_loop(method):
+            def wrapper(*args, **kwargs):
+                with pytest.raises(RuntimeError):
+                    asyncio.get_running_loop()
+                calls.append(method.__name__)
+                return method(*args, **kwargs)
+            return wrapper
+        
+        first, second = self.todo_ids
+        with patch.object(StorageService, "read_collection", off_loop(StorageService.read_collection)), \
+                patch.object(StorageService, "update_todo", off_loop(StorageService.update_todo)), \
+                patch.object(StorageService, "update_todos", off_loop(StorageService.update_todos)):
+            assert client.patch(f"/api/todos/{first}", data={"status": "completed"}).status_code == 200
+            assert client.patch("/api/todos", json=[{"todo_id": second, "status": "completed"}]).status_code == 200
+            assert self._statuses(client) == {first: "completed", second: "completed"}
+        
+        assert {"read_collection", "update_todo", "update_todos"} <= set(calls)
+
+
+class TestSyncEndpoint:
+    """Test delta sync through GET /api/sync."""
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        """Create a test client with one record holding two todos."""
+        import app.config
+        app.config._config = None
+
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True):
+            from fastapi.testclient import TestClient
+            from app.main import app
+            from app.models import TodoData
+            from app.storage import StorageService
+
+            storage = StorageService(str(tmp_path / "data"))
+            storage.todos_file.write_text("[]", encoding="utf-8")
+            self.todo_ids = storage.append_todos(
+                [TodoData(task="买牛奶"), TodoData(task="写日记")],
+                "record-1", "2024-01-01T12:00:00Z"
+            )
+
+            with TestClient(app) as client:
+                yield client
+
+    def test_initial_sync_is_full(self, client):
+        """Test that since=0 returns every collection and the latest sequence."""
+        body = client.get("/api/sync").json()
+
+        assert (body["seq"], body["full"]) == (2, True)
+        assert [t["todo_id"] for t in body["todos"]] == self.todo_ids
+        assert body["records"] and body["moods"] and body["inspirations"]
+
+    def test_delta_contains_only_changed_rows(self, client):
+        """Test that later syncs return only the rows changed since the given sequence."""
+        first, second = self.todo_ids
+        seq = client.get("/api/sync").json()["seq"]
+
+        from app.models import ParsedData, MoodData
+        
+        client.patch("/api/todos", json=[{"todo_id": second, "status": "completed"}])
+        text = "今天很开心"
+        with patch("app.main.SemanticParserService") as mock_parser_class:
+            mock_parser = MagicMock()
+            mock_parser.parse = AsyncMock(return_value=ParsedData(
+                mood=MoodData(type="开心", intensity=8, keywords=[])
+            ))
+            mock_parser.close = AsyncMock()
+            mock_parser_class.return_value = mock_parser
+            record_id = client.post("/api/process", data={"text": text}).json()["record_id"]
+
+        body = client.get("/api/sync", params={"since": seq}).json()
+
+        assert body["full"] is False
+        assert body["seq"] > seq
+        assert [(t["todo_id"], t["status"]) for t in body["todos"]] == [(second, "completed")]
+        assert [r["record_id"] for r in body["records"]] == [record_id]
+        assert [(m["record_id"], m["original_text"]) for m in body["moods"]] == [(record_id, text)]
+        assert body["inspirations"] == []
+
+        unchanged = client.get("/api/sync", params={"since": body["seq"]}).json()
+        assert unchanged["todos"] == unchanged["records"] == unchanged["moods"] == []
+
+    def test_sequence_ahead_of_server_gets_full_copy(self, client):
+        """Test that a client ahead of the server (e.g. after a reset) starts over."""
+        body = client.get("/api/sync", params={"since": 1000}).json()
+
+        assert (body["seq"], body["full"]) == (2, True)
+
+    def test_negative_sequence_is_rejected(self, client):
+        assert client.get("/api/sync", params={"since": -1}).status_code == 422
+
+
+class TestConditionalRequests:
+    """Test ETag validation of the read endpoints."""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        """Create a test client over an empty data directory."""
+        import app.config
+        app.config._config = None
+        
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True):
+            from fastapi.testclient import TestClient
+            from app.main import app
+            
+            with TestClient(app) as client:
+                yield client
+    
+    @pytest.mark.parametrize("path", [
+        "/api/records", "/api/moods", "/api/inspirations", "/api/todos", "/api/user/config"
+    ])
+    def test_unchanged_collection_returns_304(self, client, path):
+        """Test that a matching If-None-Match skips the body."""
+        first = client.get(path)
+        etag = first.headers["ETag"]
+        
+        second = client.get(path, headers={"If-None-Match": etag})
+        
+        assert first.status_code == 200
+        assert etag.startswith('"') and etag.endswith('"')
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+    
+    def test_not_modified_skips_reading(self, client):
+        """Test that a 304 is answered without reading the collection."""
+        from app.storage import StorageService
+        
+        etag = client.get("/api/todos").headers["ETag"]
+        with patch.object(StorageService, "read_collection", side_effect=AssertionError("read")):
+            response = client.get("/api/todos", headers={"If-None-Match": f'W/{etag}'})
+        
+        assert response.status_code == 304
+    
+    def test_write_changes_etag(self, client):
+        """Test that a write invalidates the ETag of the changed collection only."""
+        todos_etag = client.get("/api/todos").headers["ETag"]
+        records_etag = client.get("/api/records").headers["ETag"]
+        todo_id = client.get("/api/todos").json()["todos"][0]["todo_id"]
+        
+        client.patch(f"/api/todos/{todo_id}", data={"status": "completed"})
+        
+        assert client.get("/api/todos", headers={"If-None-Match": todos_etag}).status_code == 200
+        assert client.get("/api/records", headers={"If-None-Match": records_etag}).status_code == 304
+    
+    def test_etag_depends_on_user(self, client):
+        """Test that users do not share ETags."""
+        default = client.get("/api/todos").headers["ETag"]
+        other = client.get("/api/todos", headers={"X-User-Id": "alice"})
+        
+        assert other.headers["ETag"] != default
+        assert "X-User-Id" in other.headers["Vary"]
+    
+    @pytest.fixture
+    def images_dir(self, tmp_path, monkeypatch):
+        """Serve character images from an empty generated_images/ in tmp_path."""
+        import app.main
+        monkeypatch.chdir(tmp_path)
+        images_dir = tmp_path / "generated_images"
+        images_dir.mkdir()
+        monkeypatch.setattr(app.main, "generated_images_dir", images_dir)
+        return images_dir
+    
+    def test_user_config_etag_follows_image_file(self, images_dir, client):
+        """Test that removing the configured image file changes the user config ETag."""
+        from app.main import get_user_data_dir
+        from app.tenancy import DEFAULT_USER_ID
+        from app.user_config import UserConfig
+        image = images_dir / "character_天空蓝_聪明_20240101_120000_000000.jpeg"
+        image.write_bytes(b"jpeg")
+        UserConfig(str(get_user_data_dir(DEFAULT_USER_ID)), DEFAULT_USER_ID).save_character_image(
+            image_url=str(image), prompt="prompt"
+        )
+        etag = client.get("/api/user/config").headers["ETag"]
+        assert client.get("/api/user/config", headers={"If-None-Match": etag}).status_code == 304
+        
+        image.unlink()
+        response = client.get("/api/user/config", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.json()["character"]["image_url"] == str(image)
+    
+    def test_user_config_etag_follows_gallery(self, images_dir, client):
+        """Test that a new gallery image changes the ETag while no image is set."""
+        from app.main import get_gallery
+        from app.tenancy import DEFAULT_USER_ID
+        etag = client.get("/api/user/config").headers["ETag"]
+        assert client.get("/api/user/config", headers={"If-None-Match": etag}).status_code == 304
+        
+        image = images_dir / "character_天空蓝_聪明_20240101_120000_000000.jpeg"
+        image.write_bytes(b"jpeg")
+        get_gallery(DEFAULT_USER_ID).add(image, {
+            "color": "天空蓝", "personality": "聪明", "appearance": "戴眼镜", "role": "引导型老师"
+        }, "prompt")
+        response = client.get("/api/user/config", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.json()["character"]["image_url"].endswith(image.name)
+
+
+class TestProcessStreamEndpoint:
+    """Test the streaming variant of /api/process."""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        """Create a test client with mocked ASR and parser services."""
+        import app.config
+        app.config._config = None
+        from app.models import ParsedData, MoodData
+        
+        async def transcribe_stream(audio, filename):
+            yield {"text": "今天", "final": False}
+            yield {"text": "今天很开心", "final": True}
+        
+        self.asr = MagicMock()
+        self.asr.transcribe_stream = transcribe_stream
+        self.asr.close = AsyncMock()
+        self.parser = MagicMock()
+        self.parser.parse = AsyncMock(return_value=ParsedData(
+            mood=MoodData(type="开心", intensity=7), inspirations=[], todos=[]
+        ))
+        self.parser.close = AsyncMock()
+        
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True), patch("app.main.ASRService", return_value=self.asr), \
+                patch("app.main.SemanticParserService", return_value=self.parser):
+            from fastapi.testclient import TestClient
+            from app.main import app
+            
+            with TestClient(app) as client:
+                yield client
+    
+    def _events(self, response):
+        import json
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((fields["event"], json.loads(fields["data"])))
+        return events
+    
+    def test_audio_streams_captions_then_result(self, client):
+        """Test that partial transcripts precede the stored result."""
+        files = {"audio": ("test.mp3", BytesIO(b"fake audio"), "audio/mpeg")}
+        
+        response = client.post("/api/process/stream", files=files)
+        
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = self._events(response)
+        assert [name for name, _ in events] == ["transcript", "transcript", "result"]
+        assert events[1][1] == {"text": "今天很开心", "final": True}
+        self.parser.parse.assert_awaited_once_with("今天很开心")
+        record_id = events[2][1]["record_id"]
+        records = client.get("/api/records").json()["records"]
+        assert any(r["record_id"] == record_id and r["input_type"] == "audio" for r in records)
+    
+    def test_text_input_and_parser_error(self, client):
+        """Test text input and that parser failures become an error event."""
+        from app.semantic_parser import SemanticParserError
+        self.parser.parse.side_effect = SemanticParserError("解析失败")
+        
+        events = self._events(client.post("/api/process/stream", data={"text": "你好"}))
+        
+        assert events == [("error", {
+            "error": "语义解析服务不可用", "detail": "解析失败", "timestamp": events[0][1]["timestamp"]
+        })]
+    
+    def test_invalid_input_is_rejected_before_streaming(self, client):
+        """Test that validation errors are plain 400 responses."""
+        files = {"audio": ("test.txt", BytesIO(b"x"), "text/plain")}
+        
+        assert client.post("/api/process/stream", files=files).status_code == 400
+        assert client.post("/api/process/stream").status_code == 400
+
+
+class TestIdempotencyKeys:
+    """Test Idempotency-Key handling of /api/process."""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        """Create a test client with a mocked parser and a fresh data directory."""
+        import app.config
+        app.config._config = None
+        from app.models import ParsedData
+        
+        self.parser = MagicMock()
+        self.parser.parse = AsyncMock(return_value=ParsedData(mood=None, inspirations=[], todos=[]))
+        self.parser.close = AsyncMock()
+        
+        with patch.dict(os.environ, {
+            "ZHIPU_API_KEY": "test_key_1234567890",
+            "DATA_DIR": str(tmp_path / "data"),
+            "LOG_FILE": str(tmp_path / "logs" / "app.log")
+        }, clear=True), patch("app.main.SemanticParserService", return_value=self.parser):
+            from fastapi.testclient import TestClient
+            from app.main import app
+            
+            with TestClient(app) as client:
+                yield client
+    
+    def test_retry_replays_first_response(self, client):
+        """Test that a retry with the same key neither parses nor stores again."""
+        headers = {"Idempotency-Key": "retry-1"}
+        before = len(client.get("/api/records").json()["records"])
+        
+        first = client.post("/api/process", data={"text": "今天心情很好"}, headers=headers)
+        second = client.post("/api/process", data={"text": "今天心情很好"}, headers=headers)
+        
+        assert first.status_code == second.status_code == 200
+        assert second.json() == first.json()
+        assert "idempotent-replayed" not in first.headers
+        assert second.headers["idempotent-replayed"] == "true"
+        assert self.parser.parse.await_count == 1
+        assert len(client.get("/api/records").json()["records"]) == before + 1
+    
+    def test_keys_are_scoped_per_user(self, client):
+        """Test that another user's request with the same key runs normally."""
+        client.post("/api/process", data={"text": "你好"}, headers={"Idempotency-Key": "k", "X-User-Id": "alice"})
+        response = client.post("/api/process", data={"text": "你好"}, headers={"Idempotency-Key": "k", "X-User-Id": "bob"})
+        
+        assert "idempotent-replayed" not in response.headers
+        assert self.parser.parse.await_count == 2
+    
+    def test_failures_are_not_replayed(self, client):
+        """Test that a retry after an upstream failure runs again."""
+        from app.models import ParsedData
+        from app.semantic_parser import SemanticParserError
+        self.parser.parse.side_effect = [
+            SemanticParserError("超时"),
+            ParsedData(mood=None, inspirations=[], todos=[])
+        ]
+        headers = {"Idempotency-Key": "retry-2"}
+        
+        assert client.post("/api/process", data={"text": "你好"}, headers=headers).status_code == 500
+        assert client.post("/api/process", data={"text": "你好"}, headers=headers).status_code == 200
+    
+    def test_key_reused_for_another_body_is_rejected(self, client):
+        """Test that reusing a key with a different body is a 422 error."""
+        headers = {"Idempotency-Key": "retry-3"}
+        
+        assert client.post("/api/process", data={"text": "你好"}, headers=headers).status_code == 200
+        response = client.post("/api/process", data={"text": "再见"}, headers=headers)
+        
+        assert response.status_code == 422
+        assert "error" in response.json()
+        assert self.parser.parse.await_count == 1
+    
+    def test_key_still_running_elsewhere_is_a_conflict(self, client):
+        """Test that waiting for another worker's attempt ends with 409."""
+        from functools import partial
+        from app.idempotency import IdempotencyStore
+        from app.main import get_storage_service, request_fingerprint
+        from app.tenancy import DEFAULT_USER_ID
+        import asyncio
+        
+        storage = get_storage_service(DEFAULT_USER_ID)
+        IdempotencyStore(storage).claim("retry-4", asyncio.run(request_fingerprint(None, "你好")))
+        impatient = partial(IdempotencyStore, poll_interval=0.01, wait_timeout=0.05)
+        
+        with patch("app.main.IdempotencyStore", impatient):
+            response = client.post("/api/process", data={"text": "你好"}, headers={"Idempotency-Key": "retry-4"})
+        
+        assert response.status_code == 409
+        assert "retry-after" in response.headers
+        self.parser.parse.assert_not_awaited()
+    
+    def test_stored_responses_omit_defaults(self, client, tmp_path):
+        """Test that kept responses are compact and replay unchanged."""
+        from app import serialization
+        headers = {"Idempotency-Key": "retry-5"}
+        
+        first = client.post("/api/process", data={"text": "你好"}, headers=headers).json()
+        stored = serialization.loads((tmp_path / "data" / "idempotency.json").read_bytes())
+        
+        assert set(stored["retry-5"]["response"]) == {"record_id", "timestamp"}
+        assert client.post("/api/process", data={"text": "你好"}, headers=headers).json() == first
+    
+    def test_invalid_key_is_rejected(self, client):
+        """Test that an over-long key is a 400 error."""
+        response = client.post("/api/process", data={"text": "你好"}, headers={"Idempotency-Key": "x" * 300})
+        
+        assert response.status_code == 400
+        self.parser.parse.assert_not_awaited()
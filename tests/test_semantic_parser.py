@@ -11,7 +11,7 @@ import json
 from unittest.mock import MagicMock
 import httpx
 
-from app.semantic_parser import SemanticParserService, SemanticParserError
+from app.semantic_parser import SemanticParserService, SemanticParserError, build_parsed_data
 from app.models import ParsedData, MoodData, InspirationData, TodoData
 
 
@@ -633,3 +633,94 @@ async def test_close_client(semantic_parser_service):
     
     # Verify client is closed
     assert semantic_parser_service.client.is_closed
+
+
+def _completion(content):
+    """Build a mocked GLM-4-Flash response with the given message content."""
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return mock_response
+
+
+@pytest.mark.asyncio
+async def test_parse_many_packs_texts_into_one_request(semantic_parser_service, mocker):
+    """Test that parse_many sends one request per batch and maps results by index."""
+    texts = ["今天很开心", "明天要开会", "好累"]
+    batch_result = [
+        {"index": 2, "mood": {"type": "疲惫", "intensity": 6, "keywords": ["累"]}, "inspirations": [], "todos": []},
+        {"index": 0, "mood": {"type": "开心", "intensity": 7, "keywords": ["开心"]}, "inspirations": [], "todos": []},
+        {"index": 1, "mood": None, "inspirations": [], "todos": [{"task": "开会", "time": "明天"}]},
+    ]
+    mock_post = mocker.patch.object(
+        semantic_parser_service.client,
+        'post',
+        return_value=_completion(json.dumps(batch_result, ensure_ascii=False))
+    )
+    
+    results = await semantic_parser_service.parse_many(texts)
+    
+    assert mock_post.call_count == 1
+    messages = mock_post.call_args.kwargs['json']['messages']
+    assert json.loads(messages[1]['content']) == [{"index": i, "text": text} for i, text in enumerate(texts)]
+    assert [result.mood.type if result.mood else None for result in results] == ["开心", None, "疲惫"]
+    assert results[1].todos[0].task == "开会"
+    
+    await semantic_parser_service.close()
+
+
+@pytest.mark.asyncio
+async def test_parse_many_falls_back_to_single_calls(semantic_parser_service, mocker):
+    """Test that texts missing from a batch result, or in a failed batch, are parsed one by one."""
+    single = json.dumps({"mood": None, "inspirations": [], "todos": [{"task": "单独解析"}]}, ensure_ascii=False)
+    batch = json.dumps([
+        {"index": 0, "mood": None, "inspirations": [], "todos": [{"task": "批量解析"}]}
+    ], ensure_ascii=False)
+    
+    async def post(url, headers, json):
+        content = json["messages"][1]["content"]
+        if content.startswith("["):
+            # 第一批缺少第二段的结果，第二批的响应无法解析
+            return _completion(batch if "第一" in content else "not json")
+        return _completion(single)
+    
+    mock_post = mocker.patch.object(semantic_parser_service.client, 'post', side_effect=post)
+    
+    results = await semantic_parser_service.parse_many(["第一段", "第二段", "第三段", "第四段"], batch_size=2)
+    
+    assert [result.todos[0].task for result in results] == ["批量解析", "单独解析", "单独解析", "单独解析"]
+    # 2 次批量请求 + 3 次单独请求
+    assert mock_post.call_count == 5
+    
+    await semantic_parser_service.close()
+
+
+def test_build_parsed_data_validates_whole_result():
+    """Test that a well-formed result equals the item-by-item construction."""
+    parsed_json = {
+        "mood": {"type": "开心", "intensity": 8, "keywords": ["愉快"]},
+        "inspirations": [{"core_idea": "新想法", "tags": ["工作"], "category": "工作"}],
+        "todos": [{"task": "开会", "time": "明天", "location": "办公室"}]
+    }
+    
+    assert build_parsed_data(parsed_json) == ParsedData(
+        mood=MoodData(type="开心", intensity=8, keywords=["愉快"]),
+        inspirations=[InspirationData(core_idea="新想法", tags=["工作"], category="工作")],
+        todos=[TodoData(task="开会", time="明天", location="办公室")]
+    )
+    assert build_parsed_data({"mood": {}, "inspirations": [], "todos": []}).mood is None
+
+
+def test_build_parsed_data_drops_invalid_items():
+    """Test that one invalid item only drops that item."""
+    parsed_json = {
+        "mood": {"type": "开心", "intensity": 99},
+        "inspirations": [{"core_idea": "缺少分类"}, {"core_idea": "超过二十个字的想法" * 3}, "not an object"],
+        "todos": [{"task": "有效"}, {"task": ["不是字符串"]}]
+    }
+    
+    parsed = build_parsed_data(parsed_json)
+    
+    assert parsed.mood is None
+    assert [(item.core_idea, item.category) for item in parsed.inspirations] == [("缺少分类", "生活")]
+    assert [todo.task for todo in parsed.todos] == ["有效"]
@@ -0,0 +1,98 @@
+"""Unit tests for the JSON serialization layer.
+
+Requirements: 7.1, 7.6
+"""
+
+import io
+import json
+
+import pytest
+
+from app import serialization
+from app.storage import StorageService
+from app.models import RecordData, ParsedData, MoodData
+
+
+SAMPLE = {
+    "record_id": "r-1",
+    "original_text": "今天天气真好，心情也跟着明朗起来",
+    "parsed_data": {"mood": {"type": "喜悦", "intensity": 8, "keywords": ["阳光"]}},
+    "todos": [],
+    "score": None,
+}
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    """Run each test with the orjson fast path and with the stdlib fallback."""
+    if request.param == "orjson":
+        if not serialization.HAS_ORJSON:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+class TestEncoding:
+    """Tests for dumps/loads."""
+
+    def test_round_trip(self, backend):
+        """Test that encoding then decoding returns the original object."""
+        assert serialization.loads(serialization.dumps(SAMPLE)) == SAMPLE
+
+    def test_output_is_compact_utf8(self, backend):
+        """Test that output has no indentation and keeps CJK as UTF-8."""
+        encoded = serialization.dumps(SAMPLE)
+        assert b"\n" not in encoded
+        assert b", " not in encoded and b": " not in encoded
+        assert "今天天气真好".encode("utf-8") in encoded
+        assert b"\\u" not in encoded
+
+    def test_output_is_standard_json(self, backend):
+        """Test that output can be read by the standard library."""
+        assert json.loads(serialization.dumps(SAMPLE).decode("utf-8")) == SAMPLE
+
+    def test_loads_accepts_text(self, backend):
+        """Test that loads accepts both bytes and str input."""
+        assert serialization.loads('{"a": [1, 2]}') == {"a": [1, 2]}
+
+    def test_dump_and_load_file_objects(self, backend):
+        """Test the binary file helpers."""
+        buffer = io.BytesIO()
+        serialization.dump(SAMPLE, buffer)
+        buffer.seek(0)
+        assert serialization.load(buffer) == SAMPLE
+
+    def test_invalid_json_raises_value_error(self, backend):
+        """Test that malformed input raises ValueError."""
+        with pytest.raises(ValueError):
+            serialization.loads(b'{"incomplete": ')
+
+
+class TestStorageFiles:
+    """Tests that storage files are written through the compact encoder."""
+
+    def test_storage_files_are_compact(self, tmp_path):
+        """Test that records.json is written without indentation."""
+        storage = StorageService(str(tmp_path))
+        storage.save_record(RecordData(
+            record_id="r-1",
+            timestamp="2024-01-01T00:00:00Z",
+            input_type="text",
+            original_text="测试",
+            parsed_data=ParsedData(mood=MoodData(type="平静", intensity=5))
+        ))
+
+        raw = storage.records_file.read_bytes()
+        assert b"\n  " not in raw
+        assert "测试".encode("utf-8") in raw
+
+    def test_legacy_indented_files_are_readable(self, tmp_path):
+        """Test that files written by the old indent=2 writer still load."""
+        storage = StorageService(str(tmp_path))
+        legacy = [{"record_id": "old", "original_text": "旧数据"}]
+        storage.records_file.write_text(
+            json.dumps(legacy, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+        assert storage._read_json_file(storage.records_file) == legacy
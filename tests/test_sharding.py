@@ -0,0 +1,141 @@
+"""Tests for consistent-hash sharding of user partitions."""
+
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from app.config import Config, parse_data_roots
+from app.sharding import HashRing, move_partition, plan_rebalance, rebalance, ring_for_roots
+from app.storage import StorageService
+from app.tenancy import DEFAULT_USER_ID, partition_dir
+
+
+USER_IDS = [f"user-{i}" for i in range(2000)]
+
+
+class TestHashRing:
+    """Tests for HashRing."""
+
+    def test_mapping_is_deterministic(self):
+        """Test that two rings with the same nodes agree on every key."""
+        first = HashRing(["a", "b", "c"])
+        second = HashRing(["c", "b", "a"])
+        assert all(first.node_for(k) == second.node_for(k) for k in USER_IDS)
+
+    def test_keys_are_spread_over_nodes(self):
+        """Test that every node receives a reasonable share of keys."""
+        ring = HashRing(["a", "b", "c", "d"])
+        counts = Counter(ring.node_for(k) for k in USER_IDS)
+        assert set(counts) == {"a", "b", "c", "d"}
+        assert min(counts.values()) > len(USER_IDS) / 4 * 0.6
+
+    def test_adding_a_node_moves_few_keys(self):
+        """Test that adding a fifth node moves roughly a fifth of the keys."""
+        before = HashRing(["a", "b", "c", "d"])
+        after = HashRing(["a", "b", "c", "d", "e"])
+        moved = [k for k in USER_IDS if before.node_for(k) != after.node_for(k)]
+        # 只有分配到新节点的 key 会移动
+        assert all(after.node_for(k) == "e" for k in moved)
+        assert len(moved) < len(USER_IDS) * 0.3
+
+    def test_root_spellings_share_nodes(self, tmp_path, monkeypatch):
+        """Test that relative and non-normalized roots map users like absolute ones."""
+        monkeypatch.chdir(tmp_path)
+        absolute = ring_for_roots([tmp_path / "r1", tmp_path / "r2"])
+        relative = ring_for_roots(["r1", Path("x") / ".." / "r2"])
+
+        assert absolute.nodes == relative.nodes
+        assert all(absolute.node_for(u) == relative.node_for(u) for u in USER_IDS[:50])
+
+    def test_requires_nodes(self):
+        """Test that an empty ring is rejected."""
+        with pytest.raises(ValueError):
+            HashRing([])
+
+
+class TestConfigRoots:
+    """Tests for data root configuration."""
+
+    def test_parse_data_roots(self):
+        """Test parsing of the DATA_ROOTS value."""
+        assert parse_data_roots(" /a, /b ,,/a") == ["/a", "/b"]
+        assert parse_data_roots("") == []
+
+    def test_partition_roots_default_to_data_dir(self):
+        """Test that without DATA_ROOTS only data_dir is used."""
+        config = Config(zhipu_api_key="test_api_key_1234567890")
+        assert config.partition_roots == [Path("data")]
+
+        config = Config(zhipu_api_key="test_api_key_1234567890", data_roots=["/a", "/b"])
+        assert config.partition_roots == [Path("/a"), Path("/b")]
+
+
+class TestPartitionRouting:
+    """Tests for routing partitions through the ring."""
+
+    def test_partition_dir_uses_ring(self, tmp_path):
+        """Test that partitions land on the root chosen by the ring."""
+        roots = [tmp_path / "r1", tmp_path / "r2"]
+        ring = ring_for_roots(roots)
+        for user_id in USER_IDS[:50]:
+            expected_root = Path(ring.node_for(user_id))
+            assert partition_dir(tmp_path, user_id, ring) == expected_root / "users" / user_id
+
+    def test_default_user_stays_in_data_dir(self, tmp_path):
+        """Test that the default user keeps the legacy location."""
+        ring = ring_for_roots([tmp_path / "r1", tmp_path / "r2"])
+        assert partition_dir(tmp_path, DEFAULT_USER_ID, ring) == tmp_path
+
+
+class TestRebalance:
+    """Tests for moving partitions after roots are added."""
+
+    def test_rebalance_moves_partitions_to_new_root(self, tmp_path):
+        """Test that adding a root moves exactly the partitions it now owns."""
+        old_roots = [tmp_path / "r1", tmp_path / "r2"]
+        new_roots = old_roots + [tmp_path / "r3"]
+        old_ring = ring_for_roots(old_roots)
+        new_ring = ring_for_roots(new_roots)
+
+        users = USER_IDS[:60]
+        for user_id in users:
+            storage = StorageService(str(partition_dir(tmp_path, user_id, old_ring)))
+            storage._write_json_file(storage.records_file, [{"record_id": user_id}])
+
+        planned = plan_rebalance(new_roots)
+        moved = rebalance(new_roots)
+        assert [m[0] for m in moved] == [m[0] for m in planned]
+        assert 0 < len(moved) < len(users)
+        assert plan_rebalance(new_roots) == []
+
+        for user_id in users:
+            storage = StorageService(str(partition_dir(tmp_path, user_id, new_ring)))
+            assert storage.read_collection(storage.records_file) == [{"record_id": user_id}]
+
+    def test_move_locks_outside_the_partition(self, tmp_path):
+        """Test that the move lock is a sibling of the partition, not inside it."""
+        source = tmp_path / "r1" / "users" / "someone"
+        target = tmp_path / "r2" / "users" / "someone"
+        storage = StorageService(str(source))
+        storage._write_json_file(storage.records_file, [{"record_id": "r"}])
+        with storage.write_lock():
+            pass
+
+        move_partition(source, target)
+
+        assert not source.exists()
+        assert (tmp_path / "r1" / "users" / ".someone.lock").exists()
+        assert not (target / ".storage.lock").exists()
+        assert (target / "records.json").exists()
+
+    def test_dry_run_moves_nothing(self, tmp_path):
+        """Test that a dry run only reports moves."""
+        roots = [tmp_path / "r1", tmp_path / "r2"]
+        (tmp_path / "r1" / "users" / "someone").mkdir(parents=True)
+        (tmp_path / "r2" / "users" / "someone-else").mkdir(parents=True)
+
+        planned = rebalance(roots, dry_run=True)
+        assert rebalance(roots, dry_run=True) == planned
+        for _, source, _ in planned:
+            assert source.exists()
@@ -0,0 +1,145 @@
+"""Tests for coalescing identical concurrent upstream calls."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from app.semantic_parser import SemanticParserService
+from app.singleflight import SingleFlight, make_key, normalize_text
+
+
+class TestSingleFlight:
+    """Tests for SingleFlight."""
+
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test that callers with the same key await one call."""
+        group = SingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"value": 1}
+
+        tasks = [asyncio.create_task(group.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert group.in_flight("key")
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert not group.in_flight("key")
+
+    async def test_different_keys_and_later_calls_run_separately(self):
+        """Test that only overlapping calls with equal keys are coalesced."""
+        group = SingleFlight()
+        work = AsyncMock(side_effect=[1, 2, 3])
+
+        assert await asyncio.gather(group.do("a", work), group.do("b", work)) == [1, 2]
+        assert await group.do("a", work) == 3
+
+    async def test_error_is_shared(self):
+        """Test that every waiting caller receives the error."""
+        group = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            raise ValueError("boom")
+
+        tasks = [asyncio.create_task(group.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert not group.in_flight("key")
+
+    async def test_cancelled_caller_does_not_cancel_waiters(self):
+        """Test that a waiter runs the call itself when the first caller is cancelled."""
+        group = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(10)
+            return "done"
+
+        first = asyncio.create_task(group.do("key", work))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(group.do("key", work))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        assert await second == "done"
+        assert len(calls) == 2
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    async def test_cancelled_waiter_does_not_cancel_call(self):
+        """Test that a waiter leaving does not affect the running call."""
+        group = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(group.do("key", work))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(group.do("key", work))
+        await asyncio.sleep(0)
+
+        second.cancel()
+        release.set()
+        assert await first == "done"
+
+
+class TestKeys:
+    """Tests for make_key and normalize_text."""
+
+    def test_normalize_text(self):
+        assert normalize_text("  今天\n\n  很开心 ") == normalize_text("今天 很开心")
+
+    def test_key_parts_are_delimited(self):
+        assert make_key("ab", "c") != make_key("a", "bc")
+        assert make_key("a", b"b") == make_key("a", "b")
+
+
+class TestParserCoalescing:
+    """Tests for coalescing in SemanticParserService.parse."""
+
+    async def test_identical_texts_share_one_request(self):
+        """Test that two services parsing the same text concurrently call the API once."""
+        release = asyncio.Event()
+
+        async def post(*args, **kwargs):
+            await release.wait()
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {
+                "choices": [{"message": {"content": '{"mood": null, "inspirations": [], "todos": []}'}}]
+            }
+            return response
+
+        services = [SemanticParserService(api_key="key") for _ in range(2)]
+        for service in services:
+            service.client = MagicMock(spec=httpx.AsyncClient)
+            service.client.post = AsyncMock(side_effect=post)
+
+        tasks = [
+            asyncio.create_task(services[0].parse("明天 开会")),
+            asyncio.create_task(services[1].parse(" 明天  开会\n")),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        first, second = await asyncio.gather(*tasks)
+
+        assert first == second
+        calls = services[0].client.post.await_count + services[1].client.post.await_count
+        assert calls == 1
@@ -13,7 +13,7 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 
-from app.storage import StorageService, StorageError
+from app.storage import StorageService, StorageError, parsed_data_row, tail_path
 from app.models import (
     RecordData,
     ParsedData,
@@ -202,6 +202,40 @@ class TestSaveRecord:
         assert saved_record["parsed_data"]["mood"]["type"] == "开心"
         assert len(saved_record["parsed_data"]["inspirations"]) == 1
         assert len(saved_record["parsed_data"]["todos"]) == 1
+    
+    def test_save_record_accepts_validated_dict(self, storage_service):
+        """Test that a dict is stored exactly like the equivalent RecordData."""
+        record = RecordData(
+            record_id="dict-id",
+            timestamp="2024-01-01T12:00:00Z",
+            input_type="text",
+            original_text="今天很开心",
+            parsed_data=ParsedData(
+                mood=MoodData(type="开心", intensity=8, keywords=["愉快"]),
+                todos=[TodoData(task="完成任务")]
+            )
+        )
+        
+        record_id = storage_service.save_record(record.model_dump())
+        parsed = parsed_data_row(record.parsed_data)
+        storage_service.append_mood(parsed["mood"], record_id, record.timestamp)
+        storage_service.append_todos(parsed["todos"], record_id, record.timestamp)
+        
+        assert record_id == "dict-id"
+        assert storage_service.read_collection(storage_service.records_file)[-1] == record.model_dump()
+        assert storage_service.read_collection(storage_service.moods_file)[-1]["type"] == "开心"
+        assert storage_service.read_collection(storage_service.todos_file)[-1]["task"] == "完成任务"
+    
+    def test_parsed_data_row_matches_model_dump(self):
+        """Test that rows built from the model fields equal a full dump."""
+        parsed = ParsedData(
+            mood=MoodData(type="开心", intensity=8, keywords=["愉快"]),
+            inspirations=[InspirationData(core_idea="想法", tags=["创意"], category="创意")],
+            todos=[TodoData(task="完成任务", time="明天")]
+        )
+        
+        assert parsed_data_row(parsed) == parsed.model_dump()
+        assert parsed_data_row(ParsedData()) == ParsedData().model_dump()
 
 
 class TestAppendMood:
@@ -402,14 +436,14 @@ class TestErrorHandling:
             parsed_data=ParsedData()
         )
         
-        # Mock json.dump to raise an exception
+        # Mock the JSON encoder to raise an exception
         import json
         original_dump = json.dump
         
         def mock_dump_error(*args, **kwargs):
             raise IOError("Disk full")
         
-        monkeypatch.setattr("json.dump", mock_dump_error)
+        monkeypatch.setattr("app.serialization.dumps", mock_dump_error)
         
         with pytest.raises(StorageError) as exc_info:
             storage_service.save_record(record)
@@ -421,13 +455,13 @@ class TestErrorHandling:
         """Test that append_mood raises StorageError when file writing fails."""
         mood = MoodData(type="开心", intensity=8, keywords=["愉快"])
         
-        # Mock json.dump to raise an exception
+        # Mock the JSON encoder to raise an exception
         import json
         
         def mock_dump_error(*args, **kwargs):
             raise IOError("Disk full")
         
-        monkeypatch.setattr("json.dump", mock_dump_error)
+        monkeypatch.setattr("app.serialization.dumps", mock_dump_error)
         
         with pytest.raises(StorageError) as exc_info:
             storage_service.append_mood(mood, "record-1", "2024-01-01T12:00:00Z")
@@ -439,13 +473,13 @@ class TestErrorHandling:
         """Test that append_inspirations raises StorageError when file writing fails."""
         inspirations = [InspirationData(core_idea="想法", category="工作")]
         
-        # Mock json.dump to raise an exception
+        # Mock the JSON encoder to raise an exception
         import json
         
         def mock_dump_error(*args, **kwargs):
             raise IOError("Disk full")
         
-        monkeypatch.setattr("json.dump", mock_dump_error)
+        monkeypatch.setattr("app.serialization.dumps", mock_dump_error)
         
         with pytest.raises(StorageError) as exc_info:
             storage_service.append_inspirations(inspirations, "record-1", "2024-01-01T12:00:00Z")
@@ -457,13 +491,13 @@ class TestErrorHandling:
         """Test that append_todos raises StorageError when file writing fails."""
         todos = [TodoData(task="任务1")]
         
-        # Mock json.dump to raise an exception
+        # Mock the JSON encoder to raise an exception
         import json
         
         def mock_dump_error(*args, **kwargs):
             raise IOError("Disk full")
         
-        monkeypatch.setattr("json.dump", mock_dump_error)
+        monkeypatch.setattr("app.serialization.dumps", mock_dump_error)
         
         with pytest.raises(StorageError) as exc_info:
             storage_service.append_todos(todos, "record-1", "2024-01-01T12:00:00Z")
@@ -737,3 +771,204 @@ class TestConcurrentWriteSafety:
         assert len(final_records) == 2
         assert final_records[0]["record_id"] == "initial-id"
         assert final_records[1]["record_id"] == "second-id"
+
+
+class TestReadCache:
+    """Tests for the cached read path used by the API."""
+    
+    def test_read_collection_reuses_parsed_data(self, storage_service):
+        """Test that unchanged files are not parsed again."""
+        first = storage_service.read_collection(storage_service.records_file)
+        second = storage_service.read_collection(storage_service.records_file)
+        assert first is second
+    
+    def test_read_collection_sees_external_changes(self, storage_service):
+        """Test that a file changed behind the cache is parsed again."""
+        storage_service.read_collection(storage_service.records_file)
+        
+        with open(storage_service.records_file, 'w', encoding='utf-8') as f:
+            json.dump([{"record_id": "rewritten"}], f)
+        
+        records = storage_service.read_collection(storage_service.records_file)
+        assert [r["record_id"] for r in records] == ["rewritten"]
+    
+    def test_writes_do_not_mutate_cached_lists(self, storage_service):
+        """Test that writers build new lists instead of mutating cached ones."""
+        before = storage_service.read_collection(storage_service.todos_file)
+        count = len(before)
+        
+        storage_service.append_todos(
+            [TodoData(task="新任务")], "record-1", "2024-01-01T12:00:00Z"
+        )
+        
+        assert len(before) == count
+        after = storage_service.read_collection(storage_service.todos_file)
+        assert len(after) == count + 1
+    
+    def test_index_by(self, storage_service):
+        """Test that index_by maps a field to its row."""
+        index = storage_service.index_by(storage_service.records_file, "record_id")
+        records = storage_service.read_collection(storage_service.records_file)
+        assert set(index) == {r["record_id"] for r in records}
+        assert storage_service.index_by(storage_service.records_file, "record_id") is index
+
+
+class TestTodoIds:
+    """Tests for stable todo ids and in-place todo updates."""
+    
+    @pytest.fixture(params=[False, True], ids=["rewrite", "journal"])
+    def storage(self, request, temp_data_dir):
+        """Create a StorageService with an empty todos.json."""
+        service = StorageService(temp_data_dir, journal=request.param)
+        service.todos_file.write_text("[]", encoding="utf-8")
+        return service
+    
+    def test_each_todo_gets_unique_id(self, storage):
+        """Test that todos of the same record get distinct ids."""
+        ids = storage.append_todos(
+            [TodoData(task="买牛奶"), TodoData(task="写日记")],
+            "record-1", "2024-01-01T12:00:00Z"
+        )
+        
+        assert len(set(ids)) == 2
+        todos = storage.read_collection(storage.todos_file)
+        assert [t["todo_id"] for t in todos] == ids
+    
+    def test_update_targets_single_todo(self, storage, temp_data_dir):
+        """Test that an update changes only the addressed todo, durably."""
+        first, second = storage.append_todos(
+            [TodoData(task="买牛奶"), TodoData(task="写日记")],
+            "record-1", "2024-01-01T12:00:00Z"
+        )
+        
+        updated = storage.update_todo(second, {"status": "done"})
+        
+        assert updated["todo_id"] == second and updated["status"] == "done"
+        reloaded = StorageService(temp_data_dir).index_by(storage.todos_file, "todo_id")
+        assert reloaded[first]["status"] == "pending"
+        assert reloaded[second]["status"] == "done"
+    
+    def test_update_unknown_todo_returns_none(self, storage):
+        """Test that updating a missing todo reports it."""
+        assert storage.update_todo("missing", {"status": "done"}) is None
+    
+    def test_legacy_todos_get_stable_ids(self, storage, temp_data_dir):
+        """Test that todos without ids get deterministic ones that can be updated."""
+        storage.todos_file.write_text(json.dumps([
+            {"record_id": "r1", "task": "a", "status": "pending"},
+            {"record_id": "r1", "task": "b", "status": "pending"},
+        ]), encoding="utf-8")
+        
+        todos = storage.read_collection(storage.todos_file)
+        assert [t["todo_id"] for t in todos] == ["r1-0", "r1-1"]
+        
+        storage.update_todo("r1-1", {"status": "done"})
+        todos = StorageService(temp_data_dir).read_collection(storage.todos_file)
+        assert [(t["todo_id"], t["status"]) for t in todos] == [
+            ("r1-0", "pending"), ("r1-1", "done")
+        ]
+    
+    def test_update_todos_applies_batch_in_one_write(self, storage, temp_data_dir):
+        """Test that a batch merges repeated changes and is all-or-nothing."""
+        first, second = storage.append_todos(
+            [TodoData(task="买牛奶"), TodoData(task="写日记")],
+            "record-1", "2024-01-01T12:00:00Z"
+        )
+        
+        updated, missing = storage.update_todos([(first, {"status": "x"}), ("nope", {})])
+        assert (updated, missing) == ([], ["nope"])
+        
+        updated, missing = storage.update_todos([
+            (first, {"status": "done"}),
+            (second, {"location": "家"}),
+            (first, {"time": "明天"}),
+        ])
+        assert missing == []
+        assert [t["todo_id"] for t in updated] == [first, second]
+        
+        reloaded = StorageService(temp_data_dir).index_by(storage.todos_file, "todo_id")
+        assert (reloaded[first]["status"], reloaded[first]["time"]) == ("done", "明天")
+        assert reloaded[second]["location"] == "家"
+
+
+class TestChangeSequence:
+    """Tests for the change sequence and changes_since."""
+    
+    @pytest.fixture(params=[False, True], ids=["rewrite", "journal"])
+    def storage(self, request, temp_data_dir):
+        """Create a StorageService with empty collections."""
+        service = StorageService(temp_data_dir, journal=request.param)
+        for file_path in (
+            service.records_file, service.moods_file,
+            service.inspirations_file, service.todos_file
+        ):
+            file_path.write_text("[]", encoding="utf-8")
+        return service
+    
+    def test_sequence_starts_at_zero(self, storage):
+        """Test that a partition without changes is at sequence 0."""
+        assert storage.sequence() == 0
+        assert storage.changes_since(0) == (0, {
+            "records.json": [], "moods.json": [], "inspirations.json": [], "todos.json": []
+        })
+    
+    def test_changes_since_returns_current_rows_once(self, storage, temp_data_dir):
+        """Test that inserted and updated rows are returned once, in their latest version."""
+        storage.save_record(RecordData(
+            record_id="r1", timestamp="2024-01-01T12:00:00Z", input_type="text",
+            original_text="文本", parsed_data=ParsedData()
+        ))
+        storage.append_inspirations(
+            [InspirationData(core_idea="新想法", category="工作")], "r1", "2024-01-01T12:00:00Z"
+        )
+        first, second = storage.append_todos(
+            [TodoData(task="买牛奶"), TodoData(task="写日记")], "r1", "2024-01-01T12:00:00Z"
+        )
+        assert storage.sequence() == 4
+        
+        storage.update_todos([(first, {"status": "done"}), (first, {"time": "明天"})])
+        
+        seq, changes = StorageService(temp_data_dir).changes_since(3)
+        assert seq == 5
+        assert changes["records.json"] == changes["inspirations.json"] == []
+        assert [(t["todo_id"], t["status"], t["time"]) for t in changes["todos.json"]] == [
+            (second, "pending", None), (first, "done", "明天")
+        ]
+        assert storage.changes_since(5)[1]["todos.json"] == []
+    
+    def test_compaction_keeps_latest_sequence_per_row(self, storage):
+        """Test that compacting the change log keeps the sequence and the latest changes."""
+        (todo_id,) = storage.append_todos([TodoData(task="买牛奶")], "r1", "2024-01-01T12:00:00Z")
+        storage.append_mood(MoodData(type="开心", intensity=7), "r1", "2024-01-01T12:00:00Z")
+        storage.update_todo(todo_id, {"status": "done"})
+        
+        storage.compact()
+        
+        changes = storage.read_collection(storage.changes_file)
+        assert [(c["collection"], c["seq"]) for c in changes] == [("moods.json", 2), ("todos.json", 3)]
+        assert storage.sequence() == 3
+        assert storage.changes_since(2)[1]["todos.json"][0]["status"] == "done"
+    
+    def test_changes_are_appended_without_rewriting(self, storage):
+        """Test that logging a change only appends to the change log's tail."""
+        storage.append_todos([TodoData(task="买牛奶")], "r1", "2024-01-01T12:00:00Z")
+        snapshot = storage.changes_file.read_bytes()
+        
+        storage.append_todos([TodoData(task="写日记")], "r1", "2024-01-01T12:00:00Z")
+        
+        assert storage.changes_file.read_bytes() == snapshot
+        assert tail_path(storage.changes_file).read_text(encoding="utf-8").count("\n") == 2
+    
+    def test_clients_behind_trimmed_log_must_resync(self, storage, monkeypatch):
+        """Test that trimming keeps the newest entries and marks older clients for a full resync."""
+        monkeypatch.setattr("app.storage.CHANGE_LOG_MAX_ENTRIES", 2)
+        storage.append_todos(
+            [TodoData(task=str(i)) for i in range(4)], "r1", "2024-01-01T12:00:00Z"
+        )
+        
+        assert "changes.json" in storage.compact()
+        
+        assert storage.sequence() == 4
+        assert storage.changes_since(1) == (4, None)
+        seq, changes = storage.changes_since(2)
+        assert [t["task"] for t in changes["todos.json"]] == ["2", "3"]
@@ -0,0 +1,141 @@
+"""Concurrency stress tests for storage service.
+
+This module spawns several worker processes that append to the same data
+directory at the same time and verifies that no write is lost.
+
+Requirements: 7.1, 7.6
+"""
+
+import json
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.file_lock import FileLock, get_lock, atomic_open
+from app.storage import StorageService
+from app.models import RecordData, ParsedData, TodoData
+
+
+NUM_PROCESSES = 6
+RECORDS_PER_PROCESS = 15
+
+
+def _append_records(data_dir: str, worker: int, count: int) -> None:
+    """Worker entry point: append records and todos from a separate process."""
+    storage = StorageService(data_dir)
+    for i in range(count):
+        record_id = f"worker-{worker}-{i}"
+        storage.save_record(RecordData(
+            record_id=record_id,
+            timestamp="2024-01-01T00:00:00Z",
+            input_type="text",
+            original_text=f"进程 {worker} 的第 {i} 条记录",
+            parsed_data=ParsedData()
+        ))
+        storage.append_todos(
+            [TodoData(task=f"任务 {worker}-{i}")],
+            record_id,
+            "2024-01-01T00:00:00Z"
+        )
+
+
+@pytest.fixture
+def temp_data_dir():
+    """Create a temporary directory for test data."""
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+class TestMultiProcessWrites:
+    """Stress tests with several processes sharing one data directory."""
+
+    def test_no_records_lost_across_processes(self, temp_data_dir):
+        """Test that concurrent appends from N processes are all persisted."""
+        ctx = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        processes = [
+            ctx.Process(
+                target=_append_records,
+                args=(temp_data_dir, worker, RECORDS_PER_PROCESS)
+            )
+            for worker in range(NUM_PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=120)
+            assert process.exitcode == 0
+
+        storage = StorageService(temp_data_dir)
+        expected_ids = {
+            f"worker-{worker}-{i}"
+            for worker in range(NUM_PROCESSES)
+            for i in range(RECORDS_PER_PROCESS)
+        }
+
+        records = storage._read_json_file(storage.records_file)
+        record_ids = [r["record_id"] for r in records]
+        assert expected_ids <= set(record_ids)
+        # 每条记录只写入一次
+        assert len(record_ids) == len(set(record_ids))
+
+        todos = storage._read_json_file(storage.todos_file)
+        todo_record_ids = {t["record_id"] for t in todos}
+        assert expected_ids <= todo_record_ids
+
+    def test_no_records_lost_across_threads(self, temp_data_dir):
+        """Test that concurrent appends from threads of one process are persisted."""
+        threads = [
+            threading.Thread(
+                target=_append_records,
+                args=(temp_data_dir, worker, RECORDS_PER_PROCESS)
+            )
+            for worker in range(NUM_PROCESSES)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        storage = StorageService(temp_data_dir)
+        records = storage._read_json_file(storage.records_file)
+        record_ids = {r["record_id"] for r in records}
+        assert len([r for r in record_ids if r.startswith("worker-")]) == (
+            NUM_PROCESSES * RECORDS_PER_PROCESS
+        )
+
+
+class TestFileLock:
+    """Tests for the FileLock primitives."""
+
+    def test_lock_is_reentrant(self, temp_data_dir):
+        """Test that the same thread can acquire the lock several times."""
+        lock = FileLock(Path(temp_data_dir) / ".lock")
+        with lock:
+            with lock:
+                assert lock.path.exists()
+
+    def test_get_lock_returns_shared_instance(self, temp_data_dir):
+        """Test that get_lock returns one instance per lock file."""
+        path = Path(temp_data_dir) / ".lock"
+        assert get_lock(path) is get_lock(str(path))
+
+    def test_atomic_open_keeps_original_on_failure(self, temp_data_dir):
+        """Test that a failed atomic write leaves the old content untouched."""
+        target = Path(temp_data_dir) / "data.json"
+        target.write_text(json.dumps([1, 2, 3]), encoding="utf-8")
+
+        with pytest.raises(RuntimeError):
+            with atomic_open(target) as f:
+                f.write("[4, 5")
+                raise RuntimeError("boom")
+
+        assert json.loads(target.read_text(encoding="utf-8")) == [1, 2, 3]
+        # 临时文件已清理
+        assert [p.name for p in Path(temp_data_dir).iterdir()] == ["data.json"]
@@ -0,0 +1,142 @@
+"""Tests for multi-tenant data partitioning.
+
+Covers user id resolution, partition directory mapping and isolation of
+user data through the API.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.tenancy import (
+    DEFAULT_USER_ID,
+    InvalidUserIdError,
+    partition_dir,
+    resolve_user_id,
+    user_id_from_token,
+)
+from app.models import ParsedData, MoodData
+
+
+class TestResolveUserId:
+    """Tests for resolve_user_id."""
+
+    def test_defaults_to_default_user(self):
+        """Test that requests without identity belong to the default user."""
+        assert resolve_user_id() == DEFAULT_USER_ID
+        assert resolve_user_id("  ", None) == DEFAULT_USER_ID
+
+    def test_header_takes_precedence(self):
+        """Test that X-User-Id wins over the Authorization header."""
+        assert resolve_user_id("alice", "Bearer token-123") == "alice"
+
+    def test_bearer_token_is_hashed(self):
+        """Test that bearer tokens map to a stable, hashed user id."""
+        user_id = resolve_user_id(None, "Bearer secret-token")
+        assert user_id == user_id_from_token("secret-token")
+        assert "secret" not in user_id
+        assert resolve_user_id(None, "Bearer secret-token") == user_id
+
+    def test_non_bearer_authorization_is_ignored(self):
+        """Test that other authorization schemes fall back to the default user."""
+        assert resolve_user_id(None, "Basic dXNlcjpwYXNz") == DEFAULT_USER_ID
+
+    @pytest.mark.parametrize("bad_id", ["../etc", "a/b", "x" * 65, "用户"])
+    def test_rejects_unsafe_user_ids(self, bad_id):
+        """Test that ids unusable as directory names are rejected."""
+        with pytest.raises(InvalidUserIdError):
+            resolve_user_id(bad_id)
+
+
+class TestPartitionDir:
+    """Tests for partition_dir."""
+
+    def test_default_user_uses_data_dir(self, tmp_path):
+        """Test that the default user keeps the legacy layout."""
+        assert partition_dir(tmp_path, DEFAULT_USER_ID) == tmp_path
+
+    def test_other_users_get_own_directory(self, tmp_path):
+        """Test that each user gets a separate directory."""
+        assert partition_dir(tmp_path, "alice") == tmp_path / "users" / "alice"
+        assert partition_dir(tmp_path, "alice") != partition_dir(tmp_path, "bob")
+
+
+@pytest.fixture
+def temp_data_dir():
+    """Create a temporary directory for test data."""
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    import logging
+    for handler in logging.root.handlers[:]:
+        handler.close()
+        logging.root.removeHandler(handler)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def test_client(temp_data_dir):
+    """Create a test client with temporary data directory."""
+    import app.config
+    app.config._config = None
+
+    with patch.dict(os.environ, {
+        "ZHIPU_API_KEY": "test_key_1234567890",
+        "DATA_DIR": temp_data_dir,
+        "LOG_FILE": str(Path(temp_data_dir) / "test.log")
+    }, clear=True):
+        from app.main import app
+        with TestClient(app) as client:
+            yield client
+
+
+class TestPartitionedApi:
+    """Tests that API requests only see their own user's data."""
+
+    @patch("app.main.SemanticParserService")
+    def test_records_are_isolated_per_user(
+        self, mock_parser_class, test_client, temp_data_dir
+    ):
+        """Test that a record saved by one user is invisible to others."""
+        mock_parser = MagicMock()
+        mock_parser.parse = AsyncMock(return_value=ParsedData(
+            mood=MoodData(type="开心", intensity=7)
+        ))
+        mock_parser.close = AsyncMock()
+        mock_parser_class.return_value = mock_parser
+
+        response = test_client.post(
+            "/api/process",
+            data={"text": "今天很开心"},
+            headers={"X-User-Id": "alice"}
+        )
+        assert response.status_code == 200
+        record_id = response.json()["record_id"]
+
+        alice_records = test_client.get(
+            "/api/records", headers={"X-User-Id": "alice"}
+        ).json()["records"]
+        bob_records = test_client.get(
+            "/api/records", headers={"X-User-Id": "bob"}
+        ).json()["records"]
+        default_records = test_client.get("/api/records").json()["records"]
+
+        assert record_id in [r["record_id"] for r in alice_records]
+        assert record_id not in [r["record_id"] for r in bob_records]
+        assert record_id not in [r["record_id"] for r in default_records]
+        assert (Path(temp_data_dir) / "users" / "alice" / "records.json").exists()
+
+    def test_user_config_is_per_user(self, test_client, temp_data_dir):
+        """Test that each user gets a configuration with their own id."""
+        response = test_client.get("/api/user/config", headers={"X-User-Id": "carol"})
+        assert response.status_code == 200
+        assert response.json()["user_id"] == "carol"
+
+    def test_invalid_user_id_is_rejected(self, test_client):
+        """Test that an unsafe user id yields HTTP 400."""
+        response = test_client.get("/api/records", headers={"X-User-Id": "../x"})
+        assert response.status_code == 400